@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Counters of the analyses of each AR by state, with their due dates
+
+The AR listing reads the progress and the lateness of the ARs from these
+counters instead of waking up their analyses. Each AR keeps the states, the
+due date and the result capture date of its analyses in an annotation, an
+OOBTree keyed by the UID of the analysis, so that the analyses of the same AR
+submitted at the same time don't conflict. The
+subscribers in bika.lims.subscribers.analysiscounters update the entry of an
+analysis when it is transitioned or removed, and the analysis updates it when
+its due date or its result change.
+
+The summary of the counters is exposed to the catalog by the getAnalysesNum,
+getDueDate and getLateDate methods of the AR.
+"""
+
+import transaction
+
+from Acquisition import aq_base
+from BTrees.OOBTree import OOBTree
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.interfaces import IAnalysisRequest
+
+STORAGE_KEY = "bika.lims.analysis_counters"
+
+# States of the ARs whose analyses are never late
+NOT_LATE_STATES = ("to_be_sampled", "to_be_preserved", "sample_due",
+                   "published")
+
+# Indexes of the AR reindexed, along with its metadata, in bika_catalog when
+# the counters change
+COUNTERS_INDEXES = ["getDueDate", "getLateDate"]
+
+# ARs counted between two savepoints of a rebuild
+REBUILD_SAVEPOINT_SIZE = 500
+
+
+def get_storage(ar, create=False):
+    """Returns the entries of the analyses of the AR by UID, or None if they
+    were not counted yet. With create, the entries kept in a mapping by
+    previous versions are replaced by an empty tree
+    """
+    annotations = IAnnotations(aq_base(ar))
+    storage = annotations.get(STORAGE_KEY)
+    if create and not isinstance(storage, OOBTree):
+        storage = annotations[STORAGE_KEY] = OOBTree()
+    return storage
+
+
+def get_entry(analysis):
+    """Returns the counted (review_state, cancellation_state, due date, result
+    capture date) of the analysis
+    """
+    workflow = api.get_tool("portal_workflow")
+    return (workflow.getInfoFor(analysis, "review_state", ""),
+            workflow.getInfoFor(analysis, "cancellation_state", "active"),
+            analysis.getDueDate() or None,
+            analysis.getResultCaptureDate() or None)
+
+
+def reindex_ar(ar):
+    """Reindexes the counters of the AR in bika_catalog, the only catalog
+    with the counters metadata
+    """
+    api.get_tool("bika_catalog").catalog_object(ar, idxs=COUNTERS_INDEXES)
+
+
+def get_counted_ar(analysis):
+    """Returns the AR of the analysis, or None if it is not counted
+    """
+    if getattr(analysis, "portal_type", None) != "Analysis":
+        return None
+    portal_factory = api.get_tool("portal_factory")
+    if portal_factory.isTemporary(analysis):
+        return None
+    ar = api.get_parent(analysis)
+    if not IAnalysisRequest.providedBy(ar):
+        return None
+    return ar
+
+
+def update_analysis(analysis):
+    """Updates the entry of the analysis in the counters of its AR
+    """
+    ar = get_counted_ar(analysis)
+    if ar is None:
+        return
+    storage = get_storage(ar)
+    if not isinstance(storage, OOBTree):
+        # not counted yet, or counted in a mapping by a previous version
+        rebuild_ar_counters(ar)
+    else:
+        entry = get_entry(analysis)
+        uid = api.get_uid(analysis)
+        if storage.get(uid) == entry:
+            return
+        storage[uid] = entry
+    reindex_ar(ar)
+
+
+def remove_analysis(analysis, ar):
+    """Removes the entry of the analysis from the counters of the AR
+    """
+    if not IAnalysisRequest.providedBy(ar):
+        return
+    storage = get_storage(ar)
+    if storage is None:
+        return
+    uid = api.get_uid(analysis)
+    if not isinstance(storage, OOBTree):
+        # counted in a mapping by a previous version, the analysis is gone
+        rebuild_ar_counters(ar)
+    elif uid in storage:
+        del storage[uid]
+    else:
+        return
+    reindex_ar(ar)
+
+
+def rebuild_ar_counters(ar):
+    """Counts the analyses of the AR from scratch
+    """
+    storage = get_storage(ar, create=True)
+    storage.clear()
+    for analysis in ar.objectValues("Analysis"):
+        storage[api.get_uid(analysis)] = get_entry(analysis)
+    return storage
+
+
+def summarize(entries):
+    """Returns the number of analyses by review state, of all the analyses
+    and of the not cancelled ones, the earliest due date of the analyses
+    without result and the date the analyses are late from.
+
+    Cancelled and published analyses are never late.
+    """
+    states = {}
+    active_states = {}
+    due_date = None
+    late_date = None
+    for review_state, cancellation_state, due, result in entries:
+        states[review_state] = states.get(review_state, 0) + 1
+        if cancellation_state == "cancelled":
+            continue
+        active_states[review_state] = active_states.get(review_state, 0) + 1
+        if not due or review_state == "published":
+            continue
+        if result is None:
+            if due_date is None or due < due_date:
+                due_date = due
+        elif result <= due:
+            continue
+        if late_date is None or due < late_date:
+            late_date = due
+    return {
+        "states": states,
+        "active_states": active_states,
+        "due_date": due_date,
+        "late_date": late_date,
+    }
+
+
+def get_summary(ar):
+    """Returns the summary of the analyses of the AR, see `summarize`
+    """
+    storage = get_storage(ar)
+    if storage is None:
+        # Not counted yet, read from the analyses
+        entries = map(get_entry, ar.objectValues("Analysis"))
+    else:
+        entries = storage.values()
+    return summarize(entries)
+
+
+def rebuild_counters():
+    """Counts the analyses of all the ARs
+    """
+    bc = api.get_tool("bika_catalog")
+    brains = bc(portal_type="AnalysisRequest")
+    for num, brain in enumerate(brains, 1):
+        ar = api.get_object(brain)
+        rebuild_ar_counters(ar)
+        reindex_ar(ar)
+        if num % REBUILD_SAVEPOINT_SIZE == 0:
+            transaction.savepoint(optimistic=True)
+    logger.info("Counted the analyses of {} ARs".format(len(brains)))
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Process-level cache of the assets fetched to render the PDFs
+
+WeasyPrint fetches every image and stylesheet of a report from the portal,
+which loops back into the Zope clients, maybe the busy one rendering the
+report. The cache keeps the assets in memory, so they are fetched once per
+process:
+
+- The ++resource++ files of bika.lims are read from disk, without HTTP, and
+  kept until the modification time of the file changes.
+- Other URLs are fetched once, and served from memory for max_age seconds.
+  Then they are revalidated with their Last-Modified date, and fetched
+  again only if they changed. The assets of the portal are cached for each
+  authenticated user, as they may be private.
+
+The cache is bounded in size, the least recently used assets are dropped
+first. It is configured in zope.conf, sizes in MB:
+
+    <product-config bika.lims>
+        asset_cache_size 32
+        asset_cache_max_age 300
+    </product-config>
+
+The PDF workers have a cache of their own. The hits and misses they count
+are added to the counters of the Zope process as their PDFs are collected.
+"""
+
+import mimetypes
+import os
+import threading
+import time
+import urllib2
+import urlparse
+from collections import OrderedDict
+
+from bika.lims import logger
+
+# Directories of the ++resource++ of bika.lims, read from disk
+BROWSER_DIR = os.path.join(os.path.dirname(__file__), "browser")
+RESOURCE_DIRECTORIES = {
+    "bika.lims.images": os.path.join(BROWSER_DIR, "images"),
+    "bika.lims.css": os.path.join(BROWSER_DIR, "css"),
+    "bika.lims.js": os.path.join(BROWSER_DIR, "js"),
+}
+
+# Default MB of assets kept in memory
+DEFAULT_SIZE = 32
+
+# Default seconds the fetched assets are served without revalidation
+DEFAULT_MAX_AGE = 300
+
+# Seconds to wait for an asset
+FETCH_TIMEOUT = 30
+
+COUNTERS = ["hits", "misses", "files", "revalidated"]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class Asset(object):
+    """The data of an asset and the information to revalidate it
+    """
+
+    def __init__(self, url, data, mime_type=None, encoding=None,
+                 last_modified=None):
+        self.url = url
+        self.data = data
+        self.mime_type = mime_type
+        self.encoding = encoding
+        self.last_modified = last_modified
+        self.checked = time.time()
+
+    def to_fetch_result(self):
+        """Returns the asset as a WeasyPrint url fetcher result
+        """
+        return dict(string=self.data,
+                    mime_type=self.mime_type,
+                    encoding=self.encoding,
+                    redirected_url=self.url)
+
+
+def register_resource_directory(name, directory):
+    """Serves the ++resource++name files of the PDFs from the directory
+    """
+    RESOURCE_DIRECTORIES[name] = os.path.abspath(directory)
+
+
+def get_resource_path(url):
+    """Returns the path of the file of a ++resource++ URL, or None if the
+    resource is not in a registered directory
+    """
+    path = urlparse.urlparse(url).path
+    if "++resource++" not in path:
+        return None
+    resource = path.split("++resource++", 1)[1]
+    if "/" not in resource:
+        return None
+    name, subpath = resource.split("/", 1)
+    directory = RESOURCE_DIRECTORIES.get(name)
+    if directory is None:
+        return None
+    filename = os.path.normpath(os.path.join(directory, subpath))
+    if not filename.startswith(directory + os.sep):
+        return None
+    if not os.path.isfile(filename):
+        return None
+    return filename
+
+
+class AssetCache(object):
+    """Assets by URL, with the least recently used dropped first once the
+    cache is bigger than max_size bytes
+    """
+
+    def __init__(self, max_size=DEFAULT_SIZE * 1024 * 1024,
+                 max_age=DEFAULT_MAX_AGE):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.assets = OrderedDict()
+        self.size = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def get(self, key):
+        with self.lock:
+            asset = self.assets.pop(key, None)
+            if asset is not None:
+                self.assets[key] = asset
+            return asset
+
+    def set(self, key, asset):
+        size = len(asset.data)
+        if size > self.max_size:
+            return
+        with self.lock:
+            old = self.assets.pop(key, None)
+            if old is not None:
+                self.size -= len(old.data)
+            self.assets[key] = asset
+            self.size += size
+            while self.size > self.max_size:
+                dropped_key, dropped = self.assets.popitem(last=False)
+                self.size -= len(dropped.data)
+
+    def fetch(self, url, headers=None, scope=""):
+        """Returns the Asset of the URL. The scope keeps apart the assets
+        fetched with different credentials
+        """
+        filename = get_resource_path(url)
+        if filename is not None:
+            return self.fetch_file(url, filename)
+        key = (url, scope)
+        asset = self.get(key)
+        if asset is not None and time.time() - asset.checked < self.max_age:
+            self.count("hits")
+            return asset
+
+        request = urllib2.Request(url, headers=headers or {})
+        if asset is not None and asset.last_modified:
+            request.add_header("If-Modified-Since", asset.last_modified)
+        try:
+            response = urllib2.urlopen(request, timeout=FETCH_TIMEOUT)
+        except urllib2.HTTPError as e:
+            if e.code != 304 or asset is None:
+                raise
+            asset.checked = time.time()
+            self.count("hits")
+            self.count("revalidated")
+            return asset
+        try:
+            info = response.info()
+            asset = Asset(response.geturl(), response.read(),
+                          mime_type=info.gettype(),
+                          encoding=info.getparam("charset"),
+                          last_modified=info.getheader("Last-Modified"))
+        finally:
+            response.close()
+        self.count("misses")
+        self.set(key, asset)
+        return asset
+
+    def fetch_file(self, url, filename):
+        """Returns the Asset of a resource file, read again when the file is
+        modified
+        """
+        key = (filename, os.path.getmtime(filename))
+        asset = self.get(key)
+        if asset is not None:
+            self.count("hits")
+            return asset
+        with open(filename, "rb") as f:
+            data = f.read()
+        mime_type, encoding = mimetypes.guess_type(filename)
+        asset = Asset(url, data, mime_type=mime_type)
+        self.count("misses")
+        self.count("files")
+        self.set(key, asset)
+        return asset
+
+    def clear(self):
+        with self.lock:
+            self.assets.clear()
+            self.size = 0
+
+    def get_counters(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def add_counters(self, counters):
+        """Adds the counters of another process, e.g. a PDF worker
+        """
+        for name, value in (counters or {}).items():
+            self.count(name, value)
+
+    def get_stats(self):
+        stats = self.get_counters()
+        with self.lock:
+            stats.update({
+                "assets": len(self.assets),
+                "size": self.size,
+                "max_size": self.max_size,
+                "max_age": self.max_age,
+            })
+        return stats
+
+
+def get_cache():
+    """Returns the asset cache of this process
+    """
+    global _cache
+    # Imported here, the PDF pool imports this module
+    from bika.lims.pdfpool import get_config
+    with _cache_lock:
+        if _cache is None:
+            size = get_config("asset_cache_size", DEFAULT_SIZE)
+            max_age = get_config("asset_cache_max_age", DEFAULT_MAX_AGE)
+            _cache = AssetCache(size * 1024 * 1024, max_age)
+            logger.info("Asset cache of %s MB, assets revalidated after "
+                        "%ss" % (size, max_age))
+        return _cache
+
+
+def fetch(url, headers=None, scope=""):
+    """Returns the Asset of the URL from the cache of this process
+    """
+    return get_cache().fetch(url, headers, scope)
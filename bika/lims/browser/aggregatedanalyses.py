@@ -7,6 +7,7 @@
 
 from AccessControl import getSecurityManager
 from Products.CMFPlone.utils import safe_unicode
+from bika.lims import api
 from bika.lims import bikaMessageFactory as _
 from bika.lims.utils import t, dicts_to_dict, format_supsub
 from bika.lims.utils.analysis import format_uncertainty
@@ -126,6 +127,10 @@ class AggregatedAnalysesView(AnalysesView):
         return result
 
     def folderitem(self, obj, item, index):
+        item = super(AggregatedAnalysesView, self).folderitem(obj, item, index)
+        if not item:
+            return None
+        obj = api.get_object(obj)
         parent = obj.aq_parent
         # Analysis Request
         item['AnalysisRequest'] = parent.Title()
@@ -293,11 +293,11 @@ class AnalysesView(BikaListingView):
                 cookie_dep_uid.split(',') else False
         return result
 
-    def folderitems(self):
+    def before_folderitems(self):
+        super(AnalysesView, self).before_folderitems()
         bsc = getToolByName(self.context, 'bika_setup_catalog')
         analysis_categories = bsc(portal_type="AnalysisCategory", sort_on="sortable_title")
-        analysis_categories_order = dict([(b.Title, "{:04}".format(a)) for a, b in enumerate(analysis_categories)])
-        workflow = getToolByName(self.context, 'portal_workflow')
+        self.analysis_categories_order = dict([(b.Title, "{:04}".format(a)) for a, b in enumerate(analysis_categories)])
         mtool = getToolByName(self.context, 'portal_membership')
         checkPermission = mtool.checkPermission
         if not self.allow_edit:
@@ -309,482 +309,501 @@ class AnalysesView(BikaListingView):
                 can_edit_analyses = checkPermission(EditResults, self.context)
             self.allow_edit = can_edit_analyses
         self.show_select_column = self.allow_edit
-        context_active = isActive(self.context)
+        self.context_active = isActive(self.context)
+        self.can_view_retracted = checkPermission(ViewRetractedAnalyses, self.context)
+        self.can_manage_bika = checkPermission(ManageBika, self.context)
+        self.member = mtool.getAuthenticatedMember()
+        self.dmk = self.context.bika_setup.getResultsDecimalMark()
+        self.report_dry_matter = \
+            hasattr(self.context, 'getReportDryMatter') and \
+            self.context.getReportDryMatter()
 
         self.categories = []
-        items = super(AnalysesView, self).folderitems(full_objects=True)
-
-        member = mtool.getAuthenticatedMember()
-
         self.interim_fields = {}
         self.interim_columns = {}
         self.specs = {}
-        show_methodinstr_columns = False
-        dmk = self.context.bika_setup.getResultsDecimalMark()
+        self.show_methodinstr_columns = False
 
-        for item in items:
-            if 'obj' not in item:
-                logger.warn("Missing 'obj' key in Analysis item '{}'".format(item))
-                continue
-
-            # self.contentsMethod may return brains or objects.
-            obj = api.get_object(item["obj"])
-
-            if workflow.getInfoFor(obj, 'review_state') == 'retracted' \
-               and not checkPermission(ViewRetractedAnalyses, self.context):
-                logger.info("Skipping retracted analysis {}".format(obj.getId()))
-                continue
-
-            result = obj.getResult()
-            service = obj.getService()
-            calculation = service.getCalculation()
-            unit = service.getUnit()
-            keyword = service.getKeyword()
-
-            if self.show_categories:
-                cat = obj.getService().getCategoryTitle()
-                cat_order = analysis_categories_order.get(cat)
-                item['category'] = cat
-                if (cat, cat_order) not in self.categories:
-                    self.categories.append((cat, cat_order))
-
-            # Check for InterimFields attribute on our object,
-            interim_fields = hasattr(obj, 'getInterimFields') \
-                and obj.getInterimFields() or []
-            # kick some pretty display values in.
-            for x in range(len(interim_fields)):
-                interim_fields[x]['formatted_value'] = \
-                    formatDecimalMark(interim_fields[x]['value'], dmk)
-            self.interim_fields[obj.UID()] = interim_fields
-            item['service_uid'] = service.UID()
-            item['Service'] = service.Title()
-            item['Keyword'] = keyword
-            item['Unit'] = format_supsub(unit) if unit else ''
-            item['Result'] = ''
-            item['formatted_result'] = ''
-            item['interim_fields'] = interim_fields
-            item['Remarks'] = obj.getRemarks()
-            item['Uncertainty'] = ''
-            item['DetectionLimit'] = ''
-            item['retested'] = obj.getRetested()
-            item['class']['retested'] = 'center'
-            item['result_captured'] = self.ulocalized_time(
-                obj.getResultCaptureDate(), long_format=0)
-            item['calculation'] = calculation and True or False
-            try:
-                item['Partition'] = obj.getSamplePartition().getId()
-            except AttributeError:
-                item['Partition'] = ''
-            if obj.portal_type == "ReferenceAnalysis":
-                item['DueDate'] = self.ulocalized_time(obj.aq_parent.getExpiryDate(), long_format=0)
-            else:
-                item['DueDate'] = self.ulocalized_time(obj.getDueDate(), long_format=1)
-            cd = obj.getResultCaptureDate()
-            item['CaptureDate'] = cd and self.ulocalized_time(cd, long_format=1) or ''
-            item['Attachments'] = ''
-
-            item['allow_edit'] = []
-
-            tblrowclass = item.get('table_row_class')
-            if obj.portal_type == 'ReferenceAnalysis':
-                item['st_uid'] = obj.aq_parent.UID()
-                item['table_row_class'] = ' '.join([tblrowclass, 'qc-analysis'])
-            elif obj.portal_type == 'DuplicateAnalysis' and \
-                    obj.getAnalysis().portal_type == 'ReferenceAnalysis':
-                item['st_uid'] = obj.aq_parent.UID()
-                item['table_row_class'] = ' '.join([tblrowclass, 'qc-analysis'])
-            else:
-                sample = None
-                if self.context.portal_type == 'AnalysisRequest':
-                    sample = self.context.getSample()
-                elif self.context.portal_type == 'Worksheet':
-                    if obj.portal_type in ('DuplicateAnalysis', 'RejectAnalysis'):
-                        sample = obj.getAnalysis().getSample()
-                    else:
-                        sample = obj.aq_parent.getSample()
-                elif self.context.portal_type == 'Sample':
-                    sample = self.context
-                st_uid = sample.getSampleType().UID() if sample else ''
-                item['st_uid'] = st_uid
-
-            if checkPermission(ManageBika, self.context):
-                # service_uid = service.UID()
-                # latest = rc.lookupObject(service_uid).version_id
-                item['Service'] = service.Title()
-                item['class']['Service'] = "service_title"
-
-            # Show version number of out-of-date objects
-            # No: This should be done in another column, if at all.
-            # The (vX) value confuses some more fragile forms.
-            #     if hasattr(obj, 'reference_versions') and \
-            #        service_uid in obj.reference_versions and \
-            #        latest != obj.reference_versions[service_uid]:
-            #         items[i]['after']['Service'] = "(v%s)" % \
-            #              (obj.reference_versions[service_uid])
-
-            # choices defined on Service apply to result fields.
-            choices = service.getResultOptions()
-            if choices:
-                item['choices']['Result'] = choices
-
-            # permission to view this item's results
-            can_view_result = \
-                getSecurityManager().checkPermission(ViewResults, obj)
-
-            # permission to edit this item's results
-            # Editing Field Results is possible while in Sample Due.
-            poc = self.contentFilter.get("getPointOfCapture", 'lab')
-            can_edit_analysis = self.allow_edit and context_active and \
-                ((poc == 'field' and getSecurityManager().checkPermission(EditFieldResults, obj)) or
-                 (poc != 'field' and getSecurityManager().checkPermission(EditResults, obj)))
-
-            allowed_method_states = [
-                'to_be_sampled',
-                'to_be_preserved',
-                'sample_received',
-                'sample_registered',
-                'sampled',
-                'assigned',
-            ]
-
-            # Prevent from being edited if the instrument assigned
-            # is not valid (out-of-date or uncalibrated), except if
-            # the analysis is a QC with assigned status
-            can_edit_analysis = can_edit_analysis \
-                and (obj.isInstrumentValid() or
-                     (obj.portal_type == 'ReferenceAnalysis' and
-                      item['review_state'] in allowed_method_states))
+    def folderitem(self, obj, item, index):
+        item = super(AnalysesView, self).folderitem(obj, item, index)
+        if not item:
+            return None
 
-            if can_edit_analysis:
-                item['allow_edit'].extend(['Analyst',
-                                           'Result',
-                                           'Remarks'])
-                # if the Result field is editable, our interim fields are too
-                for f in self.interim_fields[obj.UID()]:
-                    item['allow_edit'].append(f['keyword'])
-
-                # if there isn't a calculation then result must be re-testable,
-                # and if there are interim fields, they too must be re-testable.
-                if not item['calculation'] or \
-                   (item['calculation'] and self.interim_fields[obj.UID()]):
-                    item['allow_edit'].append('retested')
-
-            # TODO: Only the labmanager must be able to change the method
-            # can_set_method = getSecurityManager().checkPermission(SetAnalysisMethod, obj)
-            can_set_method = can_edit_analysis \
-                and item['review_state'] in allowed_method_states
-            method = obj.getMethod() \
-                if hasattr(obj, 'getMethod') and obj.getMethod() else service.getMethod()
-
-            # Display the methods selector if the AS has at least one
-            # method assigned
-            item['Method'] = ''
-            item['replace']['Method'] = ''
-            if can_set_method:
-                voc = self.get_methods_vocabulary(obj)
-                if voc:
-                    # The service has at least one method available
-                    item['Method'] = method.UID() if method else ''
-                    item['choices']['Method'] = voc
-                    item['allow_edit'].append('Method')
-                    show_methodinstr_columns = True
+        # self.contentsMethod may return brains or objects.
+        obj = api.get_object(obj)
+        workflow = getToolByName(self.context, 'portal_workflow')
 
-                elif method:
-                    # This should never happen
-                    # The analysis has set a method, but its parent
-                    # service hasn't any method available O_o
-                    item['Method'] = method.Title()
-                    item['replace']['Method'] = "<a href='%s'>%s</a>" % \
-                        (method.absolute_url(), method.Title())
-                    show_methodinstr_columns = True
+        if workflow.getInfoFor(obj, 'review_state') == 'retracted' \
+           and not self.can_view_retracted:
+            logger.info("Skipping retracted analysis {}".format(obj.getId()))
+            return None
+
+        result = obj.getResult()
+        service = obj.getService()
+        calculation = service.getCalculation()
+        unit = service.getUnit()
+        keyword = service.getKeyword()
+
+        if self.show_categories:
+            cat = obj.getService().getCategoryTitle()
+            cat_order = self.analysis_categories_order.get(cat)
+            item['category'] = cat
+            if (cat, cat_order) not in self.categories:
+                self.categories.append((cat, cat_order))
+
+        # Check for InterimFields attribute on our object,
+        interim_fields = hasattr(obj, 'getInterimFields') \
+            and obj.getInterimFields() or []
+        # kick some pretty display values in.
+        for x in range(len(interim_fields)):
+            interim_fields[x]['formatted_value'] = \
+                formatDecimalMark(interim_fields[x]['value'], self.dmk)
+        self.interim_fields[obj.UID()] = interim_fields
+        item['service_uid'] = service.UID()
+        item['Service'] = service.Title()
+        item['Keyword'] = keyword
+        item['Unit'] = format_supsub(unit) if unit else ''
+        item['Result'] = ''
+        item['formatted_result'] = ''
+        item['interim_fields'] = interim_fields
+        item['Remarks'] = obj.getRemarks()
+        item['Uncertainty'] = ''
+        item['DetectionLimit'] = ''
+        item['retested'] = obj.getRetested()
+        item['class']['retested'] = 'center'
+        item['result_captured'] = self.ulocalized_time(
+            obj.getResultCaptureDate(), long_format=0)
+        item['calculation'] = calculation and True or False
+        try:
+            item['Partition'] = obj.getSamplePartition().getId()
+        except AttributeError:
+            item['Partition'] = ''
+        if obj.portal_type == "ReferenceAnalysis":
+            item['DueDate'] = self.ulocalized_time(obj.aq_parent.getExpiryDate(), long_format=0)
+        else:
+            item['DueDate'] = self.ulocalized_time(obj.getDueDate(), long_format=1)
+        cd = obj.getResultCaptureDate()
+        item['CaptureDate'] = cd and self.ulocalized_time(cd, long_format=1) or ''
+        item['Attachments'] = ''
+
+        item['allow_edit'] = []
+
+        tblrowclass = item.get('table_row_class')
+        if obj.portal_type == 'ReferenceAnalysis':
+            item['st_uid'] = obj.aq_parent.UID()
+            item['table_row_class'] = ' '.join([tblrowclass, 'qc-analysis'])
+        elif obj.portal_type == 'DuplicateAnalysis' and \
+                obj.getAnalysis().portal_type == 'ReferenceAnalysis':
+            item['st_uid'] = obj.aq_parent.UID()
+            item['table_row_class'] = ' '.join([tblrowclass, 'qc-analysis'])
+        else:
+            sample = None
+            if self.context.portal_type == 'AnalysisRequest':
+                sample = self.context.getSample()
+            elif self.context.portal_type == 'Worksheet':
+                if obj.portal_type in ('DuplicateAnalysis', 'RejectAnalysis'):
+                    sample = obj.getAnalysis().getSample()
+                else:
+                    sample = obj.aq_parent.getSample()
+            elif self.context.portal_type == 'Sample':
+                sample = self.context
+            st_uid = sample.getSampleType().UID() if sample else ''
+            item['st_uid'] = st_uid
+
+        if self.can_manage_bika:
+            # service_uid = service.UID()
+            # latest = rc.lookupObject(service_uid).version_id
+            item['Service'] = service.Title()
+            item['class']['Service'] = "service_title"
+
+        # Show version number of out-of-date objects
+        # No: This should be done in another column, if at all.
+        # The (vX) value confuses some more fragile forms.
+        #     if hasattr(obj, 'reference_versions') and \
+        #        service_uid in obj.reference_versions and \
+        #        latest != obj.reference_versions[service_uid]:
+        #         items[i]['after']['Service'] = "(v%s)" % \
+        #              (obj.reference_versions[service_uid])
+
+        # choices defined on Service apply to result fields.
+        choices = service.getResultOptions()
+        if choices:
+            item['choices']['Result'] = choices
+
+        # permission to view this item's results
+        can_view_result = \
+            getSecurityManager().checkPermission(ViewResults, obj)
+
+        # permission to edit this item's results
+        # Editing Field Results is possible while in Sample Due.
+        poc = self.contentFilter.get("getPointOfCapture", 'lab')
+        can_edit_analysis = self.allow_edit and self.context_active and \
+            ((poc == 'field' and getSecurityManager().checkPermission(EditFieldResults, obj)) or
+             (poc != 'field' and getSecurityManager().checkPermission(EditResults, obj)))
+
+        allowed_method_states = [
+            'to_be_sampled',
+            'to_be_preserved',
+            'sample_received',
+            'sample_registered',
+            'sampled',
+            'assigned',
+        ]
+
+        # Prevent from being edited if the instrument assigned
+        # is not valid (out-of-date or uncalibrated), except if
+        # the analysis is a QC with assigned status
+        can_edit_analysis = can_edit_analysis \
+            and (obj.isInstrumentValid() or
+                 (obj.portal_type == 'ReferenceAnalysis' and
+                  item['review_state'] in allowed_method_states))
+
+        if can_edit_analysis:
+            item['allow_edit'].extend(['Analyst',
+                                       'Result',
+                                       'Remarks'])
+            # if the Result field is editable, our interim fields are too
+            for f in self.interim_fields[obj.UID()]:
+                item['allow_edit'].append(f['keyword'])
+
+            # if there isn't a calculation then result must be re-testable,
+            # and if there are interim fields, they too must be re-testable.
+            if not item['calculation'] or \
+               (item['calculation'] and self.interim_fields[obj.UID()]):
+                item['allow_edit'].append('retested')
+
+        # TODO: Only the labmanager must be able to change the method
+        # can_set_method = getSecurityManager().checkPermission(SetAnalysisMethod, obj)
+        can_set_method = can_edit_analysis \
+            and item['review_state'] in allowed_method_states
+        method = obj.getMethod() \
+            if hasattr(obj, 'getMethod') and obj.getMethod() else service.getMethod()
+
+        # Display the methods selector if the AS has at least one
+        # method assigned
+        item['Method'] = ''
+        item['replace']['Method'] = ''
+        if can_set_method:
+            voc = self.get_methods_vocabulary(obj)
+            if voc:
+                # The service has at least one method available
+                item['Method'] = method.UID() if method else ''
+                item['choices']['Method'] = voc
+                item['allow_edit'].append('Method')
+                self.show_methodinstr_columns = True
 
             elif method:
-                # Edition not allowed, but method set
+                # This should never happen
+                # The analysis has set a method, but its parent
+                # service hasn't any method available O_o
                 item['Method'] = method.Title()
                 item['replace']['Method'] = "<a href='%s'>%s</a>" % \
                     (method.absolute_url(), method.Title())
-                show_methodinstr_columns = True
-
-            # TODO: Instrument selector dynamic behavior in worksheet Results
-            # Only the labmanager must be able to change the instrument to be used. Also,
-            # the instrument selection should be done in accordance with the method selected
-            # can_set_instrument = service.getInstrumentEntryOfResults() and getSecurityManager().checkPermission(SetAnalysisInstrument, obj)
-            can_set_instrument = service.getInstrumentEntryOfResults() \
-                and can_edit_analysis \
-                and item['review_state'] in allowed_method_states
-
-            item['Instrument'] = ''
-            item['replace']['Instrument'] = ''
-            if service.getInstrumentEntryOfResults():
-                instrument = None
-
-                # If the analysis has an instrument already assigned, use it
-                if service.getInstrumentEntryOfResults() \
-                    and hasattr(obj, 'getInstrument') \
-                        and obj.getInstrument():
-                        instrument = obj.getInstrument()
-
-                # Otherwise, use the Service's default instrument
-                elif service.getInstrumentEntryOfResults():
-                        instrument = service.getInstrument()
-
-                if can_set_instrument:
-                    # Edition allowed
-                    voc = self.get_instruments_vocabulary(obj)
-                    if voc:
-                        # The service has at least one instrument available
-                        item['Instrument'] = instrument.UID() if instrument else ''
-                        item['choices']['Instrument'] = voc
-                        item['allow_edit'].append('Instrument')
-                        show_methodinstr_columns = True
-
-                    elif instrument:
-                        # This should never happen
-                        # The analysis has an instrument set, but the
-                        # service hasn't any available instrument
-                        item['Instrument'] = instrument.Title()
-                        item['replace']['Instrument'] = "<a href='%s'>%s</a>" % \
-                            (instrument.absolute_url(), instrument.Title())
-                        show_methodinstr_columns = True
+                self.show_methodinstr_columns = True
+
+        elif method:
+            # Edition not allowed, but method set
+            item['Method'] = method.Title()
+            item['replace']['Method'] = "<a href='%s'>%s</a>" % \
+                (method.absolute_url(), method.Title())
+            self.show_methodinstr_columns = True
+
+        # TODO: Instrument selector dynamic behavior in worksheet Results
+        # Only the labmanager must be able to change the instrument to be used. Also,
+        # the instrument selection should be done in accordance with the method selected
+        # can_set_instrument = service.getInstrumentEntryOfResults() and getSecurityManager().checkPermission(SetAnalysisInstrument, obj)
+        can_set_instrument = service.getInstrumentEntryOfResults() \
+            and can_edit_analysis \
+            and item['review_state'] in allowed_method_states
+
+        item['Instrument'] = ''
+        item['replace']['Instrument'] = ''
+        if service.getInstrumentEntryOfResults():
+            instrument = None
+
+            # If the analysis has an instrument already assigned, use it
+            if service.getInstrumentEntryOfResults() \
+                and hasattr(obj, 'getInstrument') \
+                    and obj.getInstrument():
+                    instrument = obj.getInstrument()
+
+            # Otherwise, use the Service's default instrument
+            elif service.getInstrumentEntryOfResults():
+                    instrument = service.getInstrument()
+
+            if can_set_instrument:
+                # Edition allowed
+                voc = self.get_instruments_vocabulary(obj)
+                if voc:
+                    # The service has at least one instrument available
+                    item['Instrument'] = instrument.UID() if instrument else ''
+                    item['choices']['Instrument'] = voc
+                    item['allow_edit'].append('Instrument')
+                    self.show_methodinstr_columns = True
 
                 elif instrument:
-                    # Edition not allowed, but instrument set
+                    # This should never happen
+                    # The analysis has an instrument set, but the
+                    # service hasn't any available instrument
                     item['Instrument'] = instrument.Title()
                     item['replace']['Instrument'] = "<a href='%s'>%s</a>" % \
                         (instrument.absolute_url(), instrument.Title())
-                    show_methodinstr_columns = True
+                    self.show_methodinstr_columns = True
 
-            else:
-                # Manual entry of results, instrument not allowed
-                item['Instrument'] = _('Manual')
-                msgtitle = t(_(
-                    "Instrument entry of results not allowed for ${service}",
-                    mapping={"service": safe_unicode(service.Title())},
-                ))
-                item['replace']['Instrument'] = \
-                    '<a href="#" title="%s">%s</a>' % (msgtitle, t(_('Manual')))
-
-            # Sets the analyst assigned to this analysis
+            elif instrument:
+                # Edition not allowed, but instrument set
+                item['Instrument'] = instrument.Title()
+                item['replace']['Instrument'] = "<a href='%s'>%s</a>" % \
+                    (instrument.absolute_url(), instrument.Title())
+                self.show_methodinstr_columns = True
+
+        else:
+            # Manual entry of results, instrument not allowed
+            item['Instrument'] = _('Manual')
+            msgtitle = t(_(
+                "Instrument entry of results not allowed for ${service}",
+                mapping={"service": safe_unicode(service.Title())},
+            ))
+            item['replace']['Instrument'] = \
+                '<a href="#" title="%s">%s</a>' % (msgtitle, t(_('Manual')))
+
+        # Sets the analyst assigned to this analysis
+        if can_edit_analysis:
+            analyst = obj.getAnalyst()
+            # widget default: current user
+            if not analyst:
+                analyst = mtool.getAuthenticatedMember().getUserName()
+            item['Analyst'] = analyst
+            item['choices']['Analyst'] = self.getAnalysts()
+        else:
+            item['Analyst'] = obj.getAnalystName()
+
+        # If the user can attach files to analyses, show the attachment col
+        can_add_attachment = \
+            getSecurityManager().checkPermission(AddAttachment, obj)
+        if can_add_attachment or can_view_result:
+            attachments = ""
+            if hasattr(obj, 'getAttachment'):
+                for attachment in obj.getAttachment():
+                    af = attachment.getAttachmentFile()
+                    icon = af.icon
+                    # handle blob icons
+                    if callable(icon):
+                        icon = icon()
+                    attachments += "<span class='attachment' attachment_uid='%s'>" % (attachment.UID())
+                    if icon:
+                        attachments += "<img src='%s/%s'/>" % (self.portal_url, icon)
+                    attachments += '<a href="%s/at_download/AttachmentFile"/>%s</a>' % (attachment.absolute_url(), af.filename)
+                    if can_edit_analysis:
+                        attachments += "<img class='deleteAttachmentButton' attachment_uid='%s' src='%s'/>" % (attachment.UID(), "++resource++bika.lims.images/delete.png")
+                    attachments += "</br></span>"
+            item['replace']['Attachments'] = attachments[:-12] + "</span>"
+
+        # Only display data bearing fields if we have ViewResults
+        # permission, otherwise just put an icon in Result column.
+        if can_view_result:
+            item['Result'] = result
+            scinot = self.context.bika_setup.getScientificNotationResults()
+            item['formatted_result'] = obj.getFormattedResult(sciformat=int(scinot),
+                                                              decimalmark=self.dmk)
+
+            # LIMS-1379 Allow manual uncertainty value input
+            # https://jira.bikalabs.com/browse/LIMS-1379
+            fu = format_uncertainty(obj, result, decimalmark=self.dmk, sciformat=int(scinot))
+            fu = fu if fu else ''
+            if can_edit_analysis and service.getAllowManualUncertainty() is True:
+                unc = obj.getUncertainty(result)
+                item['allow_edit'].append('Uncertainty')
+                item['Uncertainty'] = unc if unc else ''
+                item['before']['Uncertainty'] = '&plusmn;&nbsp;'
+                item['after']['Uncertainty'] = '<em class="discreet" style="white-space:nowrap;"> %s</em>' % item['Unit']
+                item['structure'] = False
+            elif fu:
+                item['Uncertainty'] = fu
+                item['before']['Uncertainty'] = '&plusmn;&nbsp;'
+                item['after']['Uncertainty'] = '<em class="discreet" style="white-space:nowrap;"> %s</em>' % item['Unit']
+                item['structure'] = True
+
+            # LIMS-1700. Allow manual input of Detection Limits
+            # LIMS-1775. Allow to select LDL or UDL defaults in results with readonly mode
+            # https://jira.bikalabs.com/browse/LIMS-1700
+            # https://jira.bikalabs.com/browse/LIMS-1775
+            if can_edit_analysis and \
+                hasattr(obj, 'getDetectionLimitOperand') and \
+                hasattr(service, 'getDetectionLimitSelector') and \
+                    service.getDetectionLimitSelector() is True:
+                isldl = obj.isBelowLowerDetectionLimit()
+                isudl = obj.isAboveUpperDetectionLimit()
+                dlval = ''
+                if isldl or isudl:
+                    dlval = '<' if isldl else '>'
+                item['allow_edit'].append('DetectionLimit')
+                item['DetectionLimit'] = dlval
+                choices = [{'ResultValue': '<', 'ResultText': '<'},
+                           {'ResultValue': '>', 'ResultText': '>'}]
+                item['choices']['DetectionLimit'] = choices
+                self.columns['DetectionLimit']['toggle'] = True
+                srv = obj.getService()
+                defdls = {'min': srv.getLowerDetectionLimit(),
+                          'max': srv.getUpperDetectionLimit(),
+                          'manual': srv.getAllowManualDetectionLimit()}
+                defin = '<input type="hidden" id="DefaultDLS.%s" value=\'%s\'/>'
+                defin = defin % (obj.UID(), json.dumps(defdls))
+                item['after']['DetectionLimit'] = defin
+
+            # LIMS-1769. Allow to use LDL and UDL in calculations.
+            # https://jira.bikalabs.com/browse/LIMS-1769
+            # Since LDL, UDL, etc. are wildcards that can be used
+            # in calculations, these fields must be loaded always
+            # for 'live' calculations.
             if can_edit_analysis:
-                analyst = obj.getAnalyst()
-                # widget default: current user
-                if not analyst:
-                    analyst = mtool.getAuthenticatedMember().getUserName()
-                item['Analyst'] = analyst
-                item['choices']['Analyst'] = self.getAnalysts()
-            else:
-                item['Analyst'] = obj.getAnalystName()
-
-            # If the user can attach files to analyses, show the attachment col
-            can_add_attachment = \
-                getSecurityManager().checkPermission(AddAttachment, obj)
-            if can_add_attachment or can_view_result:
-                attachments = ""
-                if hasattr(obj, 'getAttachment'):
-                    for attachment in obj.getAttachment():
-                        af = attachment.getAttachmentFile()
-                        icon = af.icon
-                        # handle blob icons
-                        if callable(icon):
-                            icon = icon()
-                        attachments += "<span class='attachment' attachment_uid='%s'>" % (attachment.UID())
-                        if icon:
-                            attachments += "<img src='%s/%s'/>" % (self.portal_url, icon)
-                        attachments += '<a href="%s/at_download/AttachmentFile"/>%s</a>' % (attachment.absolute_url(), af.filename)
-                        if can_edit_analysis:
-                            attachments += "<img class='deleteAttachmentButton' attachment_uid='%s' src='%s'/>" % (attachment.UID(), "++resource++bika.lims.images/delete.png")
-                        attachments += "</br></span>"
-                item['replace']['Attachments'] = attachments[:-12] + "</span>"
-
-            # Only display data bearing fields if we have ViewResults
-            # permission, otherwise just put an icon in Result column.
-            if can_view_result:
-                item['Result'] = result
-                scinot = self.context.bika_setup.getScientificNotationResults()
-                item['formatted_result'] = obj.getFormattedResult(sciformat=int(scinot),
-                                                                  decimalmark=dmk)
-
-                # LIMS-1379 Allow manual uncertainty value input
-                # https://jira.bikalabs.com/browse/LIMS-1379
-                fu = format_uncertainty(obj, result, decimalmark=dmk, sciformat=int(scinot))
-                fu = fu if fu else ''
-                if can_edit_analysis and service.getAllowManualUncertainty() is True:
-                    unc = obj.getUncertainty(result)
-                    item['allow_edit'].append('Uncertainty')
-                    item['Uncertainty'] = unc if unc else ''
-                    item['before']['Uncertainty'] = '&plusmn;&nbsp;'
-                    item['after']['Uncertainty'] = '<em class="discreet" style="white-space:nowrap;"> %s</em>' % item['Unit']
-                    item['structure'] = False
-                elif fu:
-                    item['Uncertainty'] = fu
-                    item['before']['Uncertainty'] = '&plusmn;&nbsp;'
-                    item['after']['Uncertainty'] = '<em class="discreet" style="white-space:nowrap;"> %s</em>' % item['Unit']
-                    item['structure'] = True
-
-                # LIMS-1700. Allow manual input of Detection Limits
-                # LIMS-1775. Allow to select LDL or UDL defaults in results with readonly mode
-                # https://jira.bikalabs.com/browse/LIMS-1700
-                # https://jira.bikalabs.com/browse/LIMS-1775
-                if can_edit_analysis and \
-                    hasattr(obj, 'getDetectionLimitOperand') and \
-                    hasattr(service, 'getDetectionLimitSelector') and \
-                        service.getDetectionLimitSelector() is True:
-                    isldl = obj.isBelowLowerDetectionLimit()
-                    isudl = obj.isAboveUpperDetectionLimit()
-                    dlval = ''
-                    if isldl or isudl:
-                        dlval = '<' if isldl else '>'
-                    item['allow_edit'].append('DetectionLimit')
-                    item['DetectionLimit'] = dlval
-                    choices = [{'ResultValue': '<', 'ResultText': '<'},
-                               {'ResultValue': '>', 'ResultText': '>'}]
-                    item['choices']['DetectionLimit'] = choices
-                    self.columns['DetectionLimit']['toggle'] = True
-                    srv = obj.getService()
-                    defdls = {'min': srv.getLowerDetectionLimit(),
-                              'max': srv.getUpperDetectionLimit(),
-                              'manual': srv.getAllowManualDetectionLimit()}
-                    defin = '<input type="hidden" id="DefaultDLS.%s" value=\'%s\'/>'
-                    defin = defin % (obj.UID(), json.dumps(defdls))
-                    item['after']['DetectionLimit'] = defin
-
-                # LIMS-1769. Allow to use LDL and UDL in calculations.
-                # https://jira.bikalabs.com/browse/LIMS-1769
-                # Since LDL, UDL, etc. are wildcards that can be used
-                # in calculations, these fields must be loaded always
-                # for 'live' calculations.
-                if can_edit_analysis:
-                    dls = {'default_ldl': 'none',
-                           'default_udl': 'none',
-                           'below_ldl': False,
-                           'above_udl': False,
-                           'is_ldl': False,
-                           'is_udl': False,
-                           'manual_allowed': False,
-                           'dlselect_allowed': False}
-                    if hasattr(obj, 'getDetectionLimits'):
-                        dls['below_ldl'] = obj.isBelowLowerDetectionLimit()
-                        dls['above_udl'] = obj.isBelowLowerDetectionLimit()
-                        dls['is_ldl'] = obj.isLowerDetectionLimit()
-                        dls['is_udl'] = obj.isUpperDetectionLimit()
-                        dls['default_ldl'] = service.getLowerDetectionLimit()
-                        dls['default_udl'] = service.getUpperDetectionLimit()
-                        dls['manual_allowed'] = service.getAllowManualDetectionLimit()
-                        dls['dlselect_allowed'] = service.getDetectionLimitSelector()
-                    dlsin = '<input type="hidden" id="AnalysisDLS.%s" value=\'%s\'/>'
-                    dlsin = dlsin % (obj.UID(), json.dumps(dls))
-                    item['after']['Result'] = dlsin
+                dls = {'default_ldl': 'none',
+                       'default_udl': 'none',
+                       'below_ldl': False,
+                       'above_udl': False,
+                       'is_ldl': False,
+                       'is_udl': False,
+                       'manual_allowed': False,
+                       'dlselect_allowed': False}
+                if hasattr(obj, 'getDetectionLimits'):
+                    dls['below_ldl'] = obj.isBelowLowerDetectionLimit()
+                    dls['above_udl'] = obj.isBelowLowerDetectionLimit()
+                    dls['is_ldl'] = obj.isLowerDetectionLimit()
+                    dls['is_udl'] = obj.isUpperDetectionLimit()
+                    dls['default_ldl'] = service.getLowerDetectionLimit()
+                    dls['default_udl'] = service.getUpperDetectionLimit()
+                    dls['manual_allowed'] = service.getAllowManualDetectionLimit()
+                    dls['dlselect_allowed'] = service.getDetectionLimitSelector()
+                dlsin = '<input type="hidden" id="AnalysisDLS.%s" value=\'%s\'/>'
+                dlsin = dlsin % (obj.UID(), json.dumps(dls))
+                item['after']['Result'] = dlsin
 
-            else:
-                item['Specification'] = ""
-                if 'Result' in item['allow_edit']:
-                    item['allow_edit'].remove('Result')
-                item['before']['Result'] = \
-                    '<img width="16" height="16" ' + \
-                    'src="%s/++resource++bika.lims.images/to_follow.png"/>' % \
-                    (self.portal_url)
-            # Everyone can see valid-ranges
-            spec = self.get_analysis_spec(obj)
-            if spec:
-                min_val = spec.get('min', '')
-                min_str = ">{0}".format(min_val) if min_val else ''
-                max_val = spec.get('max', '')
-                max_str = "<{0}".format(max_val) if max_val else ''
-                error_val = spec.get('error', '')
-                error_str = "{0}%".format(error_val) if error_val else ''
-                rngstr = ",".join([x for x in [min_str, max_str, error_str] if x])
-            else:
-                rngstr = ""
-            item['Specification'] = rngstr
-            # Add this analysis' interim fields to the interim_columns list
-            for f in self.interim_fields[obj.UID()]:
-                if f['keyword'] not in self.interim_columns and not f.get('hidden', False):
-                    self.interim_columns[f['keyword']] = f['title']
-                # and to the item itself
-                item[f['keyword']] = f
-                item['class'][f['keyword']] = 'interim'
-
-            # check if this analysis is late/overdue
-
-            resultdate = obj.aq_parent.getDateSampled() \
-                if obj.portal_type == 'ReferenceAnalysis' \
-                else obj.getResultCaptureDate()
-
-            duedate = obj.aq_parent.getExpiryDate() \
-                if obj.portal_type == 'ReferenceAnalysis' \
-                else obj.getDueDate()
-
-            item['replace']['DueDate'] = \
-                self.ulocalized_time(duedate, long_format=1)
-
-            if item['review_state'] not in ['to_be_sampled',
-                                            'to_be_preserved',
-                                            'sample_due',
-                                            'published']:
-
-                if (resultdate and resultdate > duedate) \
-                   or (not resultdate and DateTime() > duedate):
-
-                    item['replace']['DueDate'] = '%s <img width="16" height="16" src="%s/++resource++bika.lims.images/late.png" title="%s"/>' % \
-                        (self.ulocalized_time(duedate, long_format=1),
-                         self.portal_url,
-                         t(_("Late Analysis")))
-
-            after_icons = []
-            # Submitting user may not verify results unless the user is labman
-            # or manager and the AS has isSelfVerificationEnabled set to True
-            if item['review_state'] == 'to_be_verified':
-                # If multi-verification required, place an informative icon
-                numverifications = obj.getNumberOfRequiredVerifications()
-                if numverifications > 1:
-                    # More than one verification required, place an icon
-                    # Get the number of verifications already done:
-                    done = obj.getNumberOfVerifications()
-                    pending = numverifications - done
-                    ratio = float(done) / float(numverifications) \
-                        if done > 0 else 0
-                    scale = '' if ratio < 0.25 else '25' \
-                            if ratio < 0.50 else '50' \
-                            if ratio < 0.75 else '75'
-                    anchor = "<a href='#' title='%s &#13;%s %s' " \
-                             "class='multi-verification scale-%s'>%s/%s</a>"
-                    anchor = anchor % (t(_("Multi-verification required")),
-                                       str(pending),
-                                       t(_("verification(s) pending")),
-                                       scale, str(done), str(numverifications))
-                    after_icons.append(anchor)
-
-                username = member.getUserName()
-                allowed = ploneapi.user.has_permission(VerifyPermission, username=username)
-                if allowed and not obj.isUserAllowedToVerify(member):
-                    after_icons.append(
-                        "<img src='++resource++bika.lims.images/submitted-by-current-user.png' title='%s'/>" %
-                        (t(_("Cannot verify, submitted or verified by current user before"))))
-                elif allowed:
-                    if obj.getSubmittedBy() == member.getUser().getId():
-                        after_icons.append(
-                            "<img src='++resource++bika.lims.images/warning.png' title='%s'/>" %
-                            (t(_("Can verify, but submitted by current user"))))
-            # If analysis Submitted and Verified by the same person, then warning icon will appear.
-            submitter = obj.getSubmittedBy()
-            if submitter and obj.wasVerifiedByUser(submitter):
+        else:
+            item['Specification'] = ""
+            if 'Result' in item['allow_edit']:
+                item['allow_edit'].remove('Result')
+            item['before']['Result'] = \
+                '<img width="16" height="16" ' + \
+                'src="%s/++resource++bika.lims.images/to_follow.png"/>' % \
+                (self.portal_url)
+        # Everyone can see valid-ranges
+        spec = self.get_analysis_spec(obj)
+        if spec:
+            min_val = spec.get('min', '')
+            min_str = ">{0}".format(min_val) if min_val else ''
+            max_val = spec.get('max', '')
+            max_str = "<{0}".format(max_val) if max_val else ''
+            error_val = spec.get('error', '')
+            error_str = "{0}%".format(error_val) if error_val else ''
+            rngstr = ",".join([x for x in [min_str, max_str, error_str] if x])
+        else:
+            rngstr = ""
+        item['Specification'] = rngstr
+        # Add this analysis' interim fields to the interim_columns list
+        for f in self.interim_fields[obj.UID()]:
+            if f['keyword'] not in self.interim_columns and not f.get('hidden', False):
+                self.interim_columns[f['keyword']] = f['title']
+            # and to the item itself
+            item[f['keyword']] = f
+            item['class'][f['keyword']] = 'interim'
+
+        # check if this analysis is late/overdue
+
+        resultdate = obj.aq_parent.getDateSampled() \
+            if obj.portal_type == 'ReferenceAnalysis' \
+            else obj.getResultCaptureDate()
+
+        duedate = obj.aq_parent.getExpiryDate() \
+            if obj.portal_type == 'ReferenceAnalysis' \
+            else obj.getDueDate()
+
+        item['replace']['DueDate'] = \
+            self.ulocalized_time(duedate, long_format=1)
+
+        if item['review_state'] not in ['to_be_sampled',
+                                        'to_be_preserved',
+                                        'sample_due',
+                                        'published']:
+
+            if (resultdate and resultdate > duedate) \
+               or (not resultdate and DateTime() > duedate):
+
+                item['replace']['DueDate'] = '%s <img width="16" height="16" src="%s/++resource++bika.lims.images/late.png" title="%s"/>' % \
+                    (self.ulocalized_time(duedate, long_format=1),
+                     self.portal_url,
+                     t(_("Late Analysis")))
+
+        after_icons = []
+        # Submitting user may not verify results unless the user is labman
+        # or manager and the AS has isSelfVerificationEnabled set to True
+        if item['review_state'] == 'to_be_verified':
+            # If multi-verification required, place an informative icon
+            numverifications = obj.getNumberOfRequiredVerifications()
+            if numverifications > 1:
+                # More than one verification required, place an icon
+                # Get the number of verifications already done:
+                done = obj.getNumberOfVerifications()
+                pending = numverifications - done
+                ratio = float(done) / float(numverifications) \
+                    if done > 0 else 0
+                scale = '' if ratio < 0.25 else '25' \
+                        if ratio < 0.50 else '50' \
+                        if ratio < 0.75 else '75'
+                anchor = "<a href='#' title='%s &#13;%s %s' " \
+                         "class='multi-verification scale-%s'>%s/%s</a>"
+                anchor = anchor % (t(_("Multi-verification required")),
+                                   str(pending),
+                                   t(_("verification(s) pending")),
+                                   scale, str(done), str(numverifications))
+                after_icons.append(anchor)
+
+            username = self.member.getUserName()
+            allowed = ploneapi.user.has_permission(VerifyPermission, username=username)
+            if allowed and not obj.isUserAllowedToVerify(self.member):
                 after_icons.append(
-                    "<img src='++resource++bika.lims.images/warning.png' title='%s'/>" %
-                    (t(_("Submited and verified by the same user- " + submitter))))
+                    "<img src='++resource++bika.lims.images/submitted-by-current-user.png' title='%s'/>" %
+                    (t(_("Cannot verify, submitted or verified by current user before"))))
+            elif allowed:
+                if obj.getSubmittedBy() == self.member.getUser().getId():
+                    after_icons.append(
+                        "<img src='++resource++bika.lims.images/warning.png' title='%s'/>" %
+                        (t(_("Can verify, but submitted by current user"))))
+        # If analysis Submitted and Verified by the same person, then warning icon will appear.
+        submitter = obj.getSubmittedBy()
+        if submitter and obj.wasVerifiedByUser(submitter):
+            after_icons.append(
+                "<img src='++resource++bika.lims.images/warning.png' title='%s'/>" %
+                (t(_("Submited and verified by the same user- " + submitter))))
+
+        # add icon for assigned analyses in AR views
+        if self.context.portal_type == 'AnalysisRequest':
+            if obj.portal_type in ['ReferenceAnalysis',
+                                   'DuplicateAnalysis'] or \
+               workflow.getInfoFor(obj, 'worksheetanalysis_review_state') == 'assigned':
+                br = obj.getBackReferences('WorksheetAnalysis')
+                if len(br) > 0:
+                    ws = br[0]
+                    after_icons.append("<a href='%s'><img src='++resource++bika.lims.images/worksheet.png' title='%s'/></a>" %
+                                       (ws.absolute_url(),
+                                        t(_("Assigned to: ${worksheet_id}", mapping={'worksheet_id': safe_unicode(ws.id)}))))
+        item['after']['state_title'] = '&nbsp;'.join(after_icons)
 
-            # add icon for assigned analyses in AR views
-            if self.context.portal_type == 'AnalysisRequest':
-                obj = item['obj']
-                if obj.portal_type in ['ReferenceAnalysis',
-                                       'DuplicateAnalysis'] or \
-                   workflow.getInfoFor(obj, 'worksheetanalysis_review_state') == 'assigned':
-                    br = obj.getBackReferences('WorksheetAnalysis')
-                    if len(br) > 0:
-                        ws = br[0]
-                        after_icons.append("<a href='%s'><img src='++resource++bika.lims.images/worksheet.png' title='%s'/></a>" %
-                                           (ws.absolute_url(),
-                                            t(_("Assigned to: ${worksheet_id}", mapping={'worksheet_id': safe_unicode(ws.id)}))))
-            item['after']['state_title'] = '&nbsp;'.join(after_icons)
+        # Dry Matter.
+        # The Dry Matter column is never enabled for reference sample contexts
+        # and refers to getReportDryMatter in ARs.
+        # If the item's Service supports ReportDryMatter, add getResultDM().
+        if self.report_dry_matter:
+            if obj.getService().getReportDryMatter():
+                item['ResultDM'] = obj.getResultDM()
+            else:
+                item['ResultDM'] = ''
+            if item['ResultDM']:
+                item['after']['ResultDM'] = "<em class='discreet'>%</em>"
+
+        return item
+
+    def after_folderitems(self, items):
+        items = super(AnalysesView, self).after_folderitems(items)
 
         # the TAL requires values for all interim fields on all
         # items, so we set blank values in unused cells
@@ -807,7 +826,7 @@ class AnalysesView(BikaListingView):
                     'sortable': False
                 }
 
-        if can_edit_analyses:
+        if self.allow_edit:
             new_states = []
             for state in self.review_states:
                 # InterimFields are displayed in review_state
@@ -829,22 +848,7 @@ class AnalysesView(BikaListingView):
             self.show_select_column = True
 
         # Dry Matter.
-        # The Dry Matter column is never enabled for reference sample contexts
-        # and refers to getReportDryMatter in ARs.
-        if items and \
-            (hasattr(self.context, 'getReportDryMatter') and
-             self.context.getReportDryMatter()):
-
-            # look through all items
-            # if the item's Service supports ReportDryMatter, add getResultDM().
-            for item in items:
-                if item['obj'].getService().getReportDryMatter():
-                    item['ResultDM'] = item['obj'].getResultDM()
-                else:
-                    item['ResultDM'] = ''
-                if item['ResultDM']:
-                    item['after']['ResultDM'] = "<em class='discreet'>%</em>"
-
+        if items and self.report_dry_matter:
             # modify the review_states list to include the ResultDM column
             new_states = []
             for state in self.review_states:
@@ -867,8 +871,8 @@ class AnalysesView(BikaListingView):
         # same time, because the value assigned to one causes
         # a value reassignment to the other (one method can be performed
         # by different instruments)
-        self.columns['Method']['toggle'] = show_methodinstr_columns
-        self.columns['Instrument']['toggle'] = show_methodinstr_columns
+        self.columns['Method']['toggle'] = self.show_methodinstr_columns
+        self.columns['Instrument']['toggle'] = self.show_methodinstr_columns
 
         return items
 
@@ -907,34 +911,38 @@ class QCAnalysesView(AnalysesView):
                               'sort_on': 'sortable_title'}
         self.icon = self.portal_url + "/++resource++bika.lims.images/referencesample.png"
 
-    def folderitems(self):
-        items = AnalysesView.folderitems(self)
+    def folderitem(self, obj, item, index):
+        item = super(QCAnalysesView, self).folderitem(obj, item, index)
+        if not item:
+            return None
+        obj = api.get_object(obj)
         # Group items by RefSample - Worksheet - Position
-        for i in range(len(items)):
-            obj = items[i]['obj']
-            wss = obj.getBackReferences('WorksheetAnalysis')
-            wsid = wss[0].id if wss and len(wss) > 0 else ''
-            wshref = wss[0].absolute_url() if wss and len(wss) > 0 else None
-            if wshref:
-                items[i]['replace']['Worksheet'] = "<a href='%s'>%s</a>" % (wshref, wsid)
-
-            imgtype = ""
-            if obj.portal_type == 'ReferenceAnalysis':
-                antype = QCANALYSIS_TYPES.getValue(obj.getReferenceType())
-                if obj.getReferenceType() == 'c':
-                    imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/control.png'/>&nbsp;" % (antype, self.context.absolute_url())
-                if obj.getReferenceType() == 'b':
-                    imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/blank.png'/>&nbsp;" % (antype, self.context.absolute_url())
-                items[i]['replace']['Partition'] = "<a href='%s'>%s</a>" % (obj.aq_parent.absolute_url(), obj.aq_parent.id)
-            elif obj.portal_type == 'DuplicateAnalysis':
-                antype = QCANALYSIS_TYPES.getValue('d')
-                imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/duplicate.png'/>&nbsp;" % (antype, self.context.absolute_url())
-                items[i]['sortcode'] = '%s_%s' % (obj.getSample().id, obj.getService().getKeyword())
-
-            items[i]['before']['Service'] = imgtype
-            items[i]['sortcode'] = '%s_%s' % (obj.getReferenceAnalysesGroupID(),
-                                              obj.getService().getKeyword())
-
+        wss = obj.getBackReferences('WorksheetAnalysis')
+        wsid = wss[0].id if wss and len(wss) > 0 else ''
+        wshref = wss[0].absolute_url() if wss and len(wss) > 0 else None
+        if wshref:
+            item['replace']['Worksheet'] = "<a href='%s'>%s</a>" % (wshref, wsid)
+
+        imgtype = ""
+        if obj.portal_type == 'ReferenceAnalysis':
+            antype = QCANALYSIS_TYPES.getValue(obj.getReferenceType())
+            if obj.getReferenceType() == 'c':
+                imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/control.png'/>&nbsp;" % (antype, self.context.absolute_url())
+            if obj.getReferenceType() == 'b':
+                imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/blank.png'/>&nbsp;" % (antype, self.context.absolute_url())
+            item['replace']['Partition'] = "<a href='%s'>%s</a>" % (obj.aq_parent.absolute_url(), obj.aq_parent.id)
+        elif obj.portal_type == 'DuplicateAnalysis':
+            antype = QCANALYSIS_TYPES.getValue('d')
+            imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/duplicate.png'/>&nbsp;" % (antype, self.context.absolute_url())
+            item['sortcode'] = '%s_%s' % (obj.getSample().id, obj.getService().getKeyword())
+
+        item['before']['Service'] = imgtype
+        item['sortcode'] = '%s_%s' % (obj.getReferenceAnalysesGroupID(),
+                                      obj.getService().getKeyword())
+        return item
+
+    def after_folderitems(self, items):
+        items = super(QCAnalysesView, self).after_folderitems(items)
         # Sort items
         items = sorted(items, key=itemgetter('sortcode'))
         return items
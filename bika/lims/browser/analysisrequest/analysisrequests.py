@@ -10,10 +10,11 @@ from AccessControl import getSecurityManager
 from Products.CMFCore.permissions import ModifyPortalContent
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import bikaMessageFactory as _
+from bika.lims.analysiscounters import NOT_LATE_STATES
 from bika.lims.utils import t
 from bika.lims.browser.bika_listing import BikaListingView
 from bika.lims.utils import getUsers
-from bika.lims.workflow import getTransitionDate
+from bika.lims.workflow import getTransitionDateTime
 from bika.lims.permissions import *
 from bika.lims.permissions import Verify as VerifyPermission
 from bika.lims.utils import to_utf8, getUsers
@@ -31,6 +32,8 @@ class AnalysisRequestsView(BikaListingView):
     ar_add = ViewPageTemplateFile("templates/ar_add.pt")
     implements(IViewView)
 
+    metadata_only = True
+
     def __init__(self, context, request):
         super(AnalysisRequestsView, self).__init__(context, request)
 
@@ -80,12 +83,18 @@ class AnalysisRequestsView(BikaListingView):
                                      'toggle': True},
             'Created': {'title': PMF('Date Created'),
                         'index': 'created',
+                        'metadata': 'created',
                         'toggle': False},
             'getSample': {'title': _("Sample"),
+                          'metadata': 'getSampleID',
                           'toggle': True, },
-            'BatchID': {'title': _("Batch ID"), 'toggle': True},
-            'SubGroup': {'title': _('Sub-group')},
+            'BatchID': {'title': _("Batch ID"),
+                        'metadata': 'getBatchID',
+                        'toggle': True},
+            'SubGroup': {'title': _('Sub-group'),
+                         'metadata': 'getSubGroupTitle'},
             'Client': {'title': _('Client'),
+                       'metadata': 'getClientTitle',
                        'toggle': True},
             'getClientReference': {'title': _('Client Ref'),
                                    'index': 'getClientReference',
@@ -94,7 +103,8 @@ class AnalysisRequestsView(BikaListingView):
                                   'index': 'getClientSampleID',
                                   'toggle': True},
             'ClientContact': {'title': _('Contact'),
-                                 'toggle': False},
+                              'metadata': 'getContactTitle',
+                              'toggle': False},
             'getSampleTypeTitle': {'title': _('Sample Type'),
                                    'index': 'getSampleTypeTitle',
                                    'toggle': True},
@@ -102,17 +112,21 @@ class AnalysisRequestsView(BikaListingView):
                                     'index': 'getSamplePointTitle',
                                     'toggle': False},
             'getStorageLocation': {'title': _('Storage Location'),
-                                    'toggle': False},
+                                   'metadata': 'getStorageLocationTitle',
+                                   'toggle': False},
             'SamplingDeviation': {'title': _('Sampling Deviation'),
+                                  'metadata': 'getSamplingDeviationTitle',
                                   'toggle': False},
             'Priority': {'title': _('Priority'),
                             'toggle': True,
                             'index': 'Priority',
                             'sortable': True},
             'AdHoc': {'title': _('Ad-Hoc'),
+                      'metadata': 'getAdHoc',
                       'toggle': False},
             'SamplingDate': {'title': _('Sampling Date'),
                              'index': 'getSamplingDate',
+                             'metadata': 'getSamplingDate',
                              'toggle': True},
             'getDateSampled': {'title': _('Date Sampled'),
                                'index': 'getDateSampled',
@@ -120,6 +134,7 @@ class AnalysisRequestsView(BikaListingView):
                                'input_class': 'datetimepicker_nofuture',
                                'input_width': '10'},
             'getDateVerified': {'title': _('Date Verified'),
+                                'index': 'getDateVerified',
                                 'input_width': '10'},
             'getSampler': {'title': _('Sampler'),
                            'toggle': SamplingWorkflowEnabled},
@@ -692,14 +707,19 @@ class AnalysisRequestsView(BikaListingView):
         on the department filter. It checks the department of each analysis
         service from each analysis belonguing to the given analysis request.
         If department filtering is disabled in bika_setup, will return True.
-        @Obj: it is an analysis request object.
+        @Obj: it is an analysis request brain or object.
         @return: boolean
         """
         if not self.context.bika_setup.getAllowDepartmentFiltering():
             return True
         # Gettin the department from analysis service
-        ans = [an.getObject() for an in obj.getAnalyses()]
-        deps = [an.getService().getDepartment().UID() for an in ans if an.getService().getDepartment()]
+        if self.has_metadata(obj, 'getDepartmentUIDs'):
+            deps = self.get_metadata(obj, 'getDepartmentUIDs') or []
+        else:
+            obj = self.get_object(obj)
+            ans = [an.getObject() for an in obj.getAnalyses()]
+            deps = [an.getService().getDepartment().UID() for an in ans
+                    if an.getService().getDepartment()]
         result = True
         if deps:
             # Getting the cookie value
@@ -711,9 +731,16 @@ class AnalysisRequestsView(BikaListingView):
             result = len(matches) > 0
         return result
 
+    def get_path_url(self, path):
+        """Returns the url of the object at the physical path
+        """
+        return self.request.physicalPathToURL(path)
+
     def folderitem(self, obj, item, index):
         # Additional info from AnalysisRequest to be added in the item generated
         # by default by bikalisting.
+        # The values are read from the catalog metadata of the brain, the
+        # AR is only woken up for the inline edits and verification checks.
 
         # Call the folderitem method from the base class
         item = BikaListingView.folderitem(self, obj, item, index)
@@ -727,103 +754,110 @@ class AnalysisRequestsView(BikaListingView):
             and 'LabManager' not in roles \
             and 'LabClerk' not in roles
 
-        sample = obj.getSample()
-        url = obj.absolute_url()
-        if getSecurityManager().checkPermission(EditResults, obj):
+        get_value = self.get_value
+        url = item['url']
+        # ARs are stored in their client, like their samples
+        client_url = url.rsplit('/', 1)[0]
+        if self.check_permission(EditResults, obj):
             url += "/manage_results"
 
-        item['Client'] = obj.aq_parent.Title()
+        item['Client'] = get_value(obj, 'getClientTitle')
         if (hideclientlink == False):
             item['replace']['Client'] = "<a href='%s'>%s</a>" % \
-                (obj.aq_parent.absolute_url(), obj.aq_parent.Title())
-        item['Creator'] = self.user_fullname(obj.Creator())
-        item['getRequestID'] = obj.getRequestID()
+                (client_url, item['Client'])
+        item['Creator'] = self.user_fullname(get_value(obj, 'Creator'))
+        item['getRequestID'] = get_value(obj, 'getRequestID')
         item['replace']['getRequestID'] = "<a href='%s'>%s</a>" % \
              (url, item['getRequestID'])
-        item['getSample'] = sample
+        sample_id = get_value(obj, 'getSampleID')
+        item['getSample'] = sample_id
         item['replace']['getSample'] = \
-            "<a href='%s'>%s</a>" % (sample.absolute_url(), sample.Title())
+            "<a href='%s/%s'>%s</a>" % (client_url, sample_id, sample_id)
 
         item['replace']['getProfilesTitle'] = ", ".join(
-            [p.Title() for p in obj.getProfiles()])
+            get_value(obj, 'getProfilesTitle') or [])
 
-        analysesnum = obj.getAnalysesNum()
+        analysesnum = get_value(obj, 'getAnalysesNum')
         if analysesnum:
             item['getAnalysesNum'] = str(analysesnum[0]) + '/' + str(analysesnum[1])
         else:
             item['getAnalysesNum'] = ''
 
-        batch = obj.getBatch()
-        if batch:
-            item['BatchID'] = batch.getBatchID()
+        batch_id = get_value(obj, 'getBatchID')
+        if batch_id:
+            item['BatchID'] = batch_id
             item['replace']['BatchID'] = "<a href='%s'>%s</a>" % \
-                 (batch.absolute_url(), item['BatchID'])
+                 (self.get_path_url(get_value(obj, 'getBatchPath')),
+                  item['BatchID'])
         else:
             item['BatchID'] = ''
 
-        val = obj.Schema().getField('SubGroup').get(obj)
-        item['SubGroup'] = val.Title() if val else ''
+        item['SubGroup'] = get_value(obj, 'getSubGroupTitle') or ''
 
-        sd = obj.getSample().getSamplingDate()
+        sd = get_value(obj, 'getSamplingDate')
         item['SamplingDate'] = \
             self.ulocalized_time(sd, long_format=1) if sd else ''
         item['getDateReceived'] = \
-            self.ulocalized_time(obj.getDateReceived())
+            self.ulocalized_time(get_value(obj, 'getDateReceived'))
         item['getDatePublished'] = \
-            self.ulocalized_time(getTransitionDate(obj, 'publish'))
+            self.ulocalized_time(get_value(obj, 'getDatePublished'))
         item['getDateVerified'] = \
-            self.ulocalized_time(getTransitionDate(obj, 'verify'))
+            self.ulocalized_time(get_value(obj, 'getDateVerified'))
 
-        deviation = sample.getSamplingDeviation()
-        item['SamplingDeviation'] = deviation and deviation.Title() or ''
-        priority = obj.getPriority()
+        item['SamplingDeviation'] = \
+            get_value(obj, 'getSamplingDeviationTitle') or ''
         item['Priority'] = '' # priority.Title()
 
-        item['getStorageLocation'] = sample.getStorageLocation() and sample.getStorageLocation().Title() or ''
-        item['AdHoc'] = sample.getAdHoc() and True or ''
+        item['getStorageLocation'] = \
+            get_value(obj, 'getStorageLocationTitle') or ''
+        item['AdHoc'] = get_value(obj, 'getAdHoc') and True or ''
 
         after_icons = ""
-        state = self.workflow.getInfoFor(obj, 'worksheetanalysis_review_state')
+        review_state = item['review_state']
+        state = item['states'].get('worksheetanalysis_review_state')
         if state == 'assigned':
             after_icons += "<img src='%s/++resource++bika.lims.images/worksheet.png' title='%s'/>" % \
                 (self.portal_url, t(_("All analyses assigned")))
-        if self.workflow.getInfoFor(obj, 'review_state') == 'invalid':
+        if review_state == 'invalid':
             after_icons += "<img src='%s/++resource++bika.lims.images/delete.png' title='%s'/>" % \
                 (self.portal_url, t(_("Results have been withdrawn")))
-        if obj.getLate():
+        late_date = get_value(obj, 'getLateDate')
+        if review_state not in NOT_LATE_STATES \
+                and late_date and DateTime() > late_date:
             after_icons += "<img src='%s/++resource++bika.lims.images/late.png' title='%s'>" % \
                 (self.portal_url, t(_("Late Analyses")))
         if sd and sd > DateTime():
             after_icons += "<img src='%s/++resource++bika.lims.images/calendar.png' title='%s'>" % \
                 (self.portal_url, t(_("Future dated sample")))
-        if obj.getInvoiceExclude():
+        if get_value(obj, 'getInvoiceExclude'):
             after_icons += "<img src='%s/++resource++bika.lims.images/invoice_exclude.png' title='%s'>" % \
                 (self.portal_url, t(_("Exclude from invoice")))
-        if sample.getSampleType().getHazardous():
+        if get_value(obj, 'getHazardous'):
             after_icons += "<img src='%s/++resource++bika.lims.images/hazardous.png' title='%s'>" % \
                 (self.portal_url, t(_("Hazardous")))
         if after_icons:
             item['after']['getRequestID'] = after_icons
 
-        item['Created'] = self.ulocalized_time(obj.created())
+        item['Created'] = self.ulocalized_time(get_value(obj, 'created'))
 
-        contact = obj.getContact()
+        contact = get_value(obj, 'getContactTitle')
         if contact:
-            item['ClientContact'] = contact.Title()
+            item['ClientContact'] = contact
             item['replace']['ClientContact'] = "<a href='%s'>%s</a>" % \
-                (contact.absolute_url(), contact.Title())
+                (self.get_path_url(get_value(obj, 'getContactPath')),
+                 contact)
         else:
             item['ClientContact'] = ""
 
-        SamplingWorkflowEnabled = sample.getSamplingWorkflowEnabled()
+        SamplingWorkflowEnabled = get_value(obj, 'isSamplingWorkflowEnabled')
         if SamplingWorkflowEnabled and (not sd or not sd > DateTime()):
             datesampled = self.ulocalized_time(
-                sample.getDateSampled(), long_format=True)
+                get_value(obj, 'getDateSampled'), long_format=True)
             if not datesampled:
                 datesampled = self.ulocalized_time(
                     DateTime(), long_format=True)
                 item['class']['getDateSampled'] = 'provisional'
-            sampler = sample.getSampler().strip()
+            sampler = (get_value(obj, 'getSampler') or '').strip()
             if sampler:
                 item['replace']['getSampler'] = self.user_fullname(sampler)
             if 'Sampler' in member.getRoles() and not sampler:
@@ -836,14 +870,13 @@ class AnalysisRequestsView(BikaListingView):
         item['getSampler'] = sampler
 
         # sampling workflow - inline edits for Sampler and Date Sampled
-        checkPermission = self.context.portal_membership.checkPermission
-        state = self.workflow.getInfoFor(obj, 'review_state')
-        if state == 'to_be_sampled' \
-                and checkPermission(SampleSample, obj) \
+        if review_state == 'to_be_sampled' \
+                and self.check_permission(SampleSample, obj) \
                 and (not sd or not sd > DateTime()):
             item['required'] = ['getSampler', 'getDateSampled']
             item['allow_edit'] = ['getSampler', 'getDateSampled']
-            samplers = getUsers(sample, ['Sampler', 'LabManager', 'Manager'])
+            samplers = getUsers(self.context,
+                                ['Sampler', 'LabManager', 'Manager'])
             username = member.getUserName()
             users = [({'ResultValue': u, 'ResultText': samplers.getValue(u)})
                      for u in samplers]
@@ -858,11 +891,11 @@ class AnalysisRequestsView(BikaListingView):
         item['getDatePreserved'] = ''
 
         # inline edits for Preserver and Date Preserved
-        checkPermission = self.context.portal_membership.checkPermission
-        if checkPermission(PreserveSample, obj):
+        if self.check_permission(PreserveSample, obj):
             item['required'] = ['getPreserver', 'getDatePreserved']
             item['allow_edit'] = ['getPreserver', 'getDatePreserved']
-            preservers = getUsers(obj, ['Preserver', 'LabManager', 'Manager'])
+            preservers = getUsers(self.context,
+                                  ['Preserver', 'LabManager', 'Manager'])
             username = member.getUserName()
             users = [({'ResultValue': u, 'ResultText': preservers.getValue(u)})
                      for u in preservers]
@@ -880,7 +913,8 @@ class AnalysisRequestsView(BikaListingView):
             username = member.getUserName()
             allowed = api.user.has_permission(VerifyPermission,
                                               username=username)
-            if allowed and not obj.isUserAllowedToVerify(member):
+            if allowed and \
+                    not self.get_object(obj).isUserAllowedToVerify(member):
                 item['after']['state_title'] = \
                      "<img src='++resource++bika.lims.images/submitted-by-current-user.png' title='%s'/>" % \
                      t(_("Cannot verify: Submitted by current user"))
@@ -6,12 +6,12 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from AccessControl import ClassSecurityInfo
-from smtplib import SMTPServerDisconnected, SMTPRecipientsRefused
 from Products.CMFCore.WorkflowCore import WorkflowException
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formataddr
 from bika.lims import bikaMessageFactory as _
+from bika.lims import mailqueue
 from bika.lims.utils import t
 from bika.lims.browser import BrowserView
 from bika.lims.config import VERIFIED_STATES
@@ -231,8 +231,6 @@ class InvoiceCreate(InvoiceView):
         :param to: A list with the addresses to send the invoice.
         """
         ar = self.aq_parent
-        # SMTP errors are silently ignored if server is in debug mode
-        debug_mode = App.config.getConfiguration().debug_mode
         # Useful variables
         lab = ar.bika_setup.laboratory
         # Compose and send email.
@@ -260,12 +258,4 @@ class InvoiceCreate(InvoiceView):
         if len(to) > 0:
             # Send the emails
             mime_msg['To'] = ','.join(to)
-            try:
-                host = getToolByName(ar, 'MailHost')
-                host.send(mime_msg.as_string(), immediate=True)
-            except SMTPServerDisconnected as msg:
-                pass
-                if not debug_mode:
-                    raise SMTPServerDisconnected(msg)
-            except SMTPRecipientsRefused as msg:
-                raise WorkflowException(str(msg))
+            mailqueue.queue_mail(ar, mime_msg)
@@ -7,7 +7,10 @@
 
 from bika.lims import bikaMessageFactory as _, t
 from bika.lims import logger
+from bika.lims import mailqueue
+from bika.lims import pdfpool
 from bika.lims.browser import BrowserView
+from bika.lims.cache import get_request_cache
 from bika.lims.config import POINTS_OF_CAPTURE
 from bika.lims.idserver import renameAfterCreation
 from bika.lims.interfaces import IAnalysisRequest
@@ -15,6 +18,8 @@ from bika.lims.interfaces import IResultOutOfRange
 from bika.lims.utils import isnumber
 from bika.lims.utils import to_utf8, encode_header, createPdf, attachPdf
 from bika.lims.utils import to_utf8, formatDecimalMark, format_supsub
+from bika.lims.utils import get_request_fetch_options
+from bika.lims.utils.digest import data_digest, text_digest
 from bika.lims.utils.analysis import format_uncertainty
 from bika.lims.vocabularies import getARReportTemplates
 from DateTime import DateTime
@@ -28,7 +33,6 @@ from Products.CMFCore.utils import getToolByName
 from Products.CMFCore.WorkflowCore import WorkflowException
 from Products.CMFPlone.utils import safe_unicode, _createObjectByType
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
-from smtplib import SMTPServerDisconnected, SMTPRecipientsRefused
 from zope.component import getAdapters, getUtility
 
 from plone.registry import Record
@@ -36,9 +40,19 @@ from plone.registry import field
 from plone import api
 
 import App
+import multiprocessing
 import os, traceback
 import re
 import tempfile
+import time
+
+
+# Request cache of the data shared by the ARs published together
+PUBLISH_CACHE_KEY = "bika.lims.publish"
+
+
+def debug_mode():
+    return App.config.getConfiguration().debug_mode
 
 
 class AnalysisRequestPublishView(BrowserView):
@@ -62,6 +76,19 @@ class AnalysisRequestPublishView(BrowserView):
             '_qcanalyses_data': {},
             '_ar_data': {}
         }
+        # Data of the laboratory, reporter, managers, specifications and
+        # services is the same for many ARs. It is built once per request,
+        # so the views publishing each AR of the batch share it too
+        self._shared = get_request_cache(PUBLISH_CACHE_KEY, request)
+
+    def _shared_data(self, name, key, builder, *args):
+        """Returns the data built by builder(*args), computed once per
+        request for each name and key
+        """
+        cache = self._shared.setdefault(name, {})
+        if key not in cache:
+            cache[key] = builder(*args)
+        return cache[key]
 
     @property
     def _DEFAULT_TEMPLATE(self):
@@ -180,14 +207,65 @@ class AnalysisRequestPublishView(BrowserView):
         """ Returns the html template to be rendered in accordance with the
             template specified in the request ('template' parameter)
         """
+        embedt, path = self._getTemplatePath()
+        embed = ViewPageTemplateFile(path)
+        return embedt, embed(self)
+
+    def _getTemplatePath(self):
+        """ Returns the name and the path of the template specified in the
+            request ('template' parameter)
+        """
         templates_dir = 'templates/reports'
         embedt = self.request.form.get('template', self._DEFAULT_TEMPLATE)
         if embedt.find(':') >= 0:
             prefix, template = embedt.split(':')
             templates_dir = queryResourceDirectory('reports', prefix).directory
             embedt = template
-        embed = ViewPageTemplateFile(os.path.join(templates_dir, embedt))
-        return embedt, embed(self)
+        if not os.path.isabs(templates_dir):
+            templates_dir = os.path.join(os.path.dirname(__file__),
+                                         templates_dir)
+        return embedt, os.path.join(templates_dir, embedt)
+
+    def getContentDigest(self, ar, uids=None):
+        """ Returns the digest of the data the report of the AR is rendered
+            from, along with the UIDs of all the ARs rendered in the same
+            report, so the PDF of a multi-AR report is never reused for a
+            report with other ARs
+        """
+        uids = sorted(set(filter(None, uids or []))) or [ar.UID()]
+        return data_digest({'uids': uids, 'data': self._ar_data(ar)})
+
+    def getTemplateDigest(self, style=''):
+        """ Returns the digest of the template selected in the request, its
+            source, the style and the report options
+        """
+        embedt, path = self._getTemplatePath()
+        try:
+            source = open(path, 'rb').read()
+        except IOError:
+            source = ''
+        form = self.request.form
+        return text_digest(form.get('template', self._DEFAULT_TEMPLATE),
+                           source, style, self.isQCAnalysesVisible(),
+                           self.isHiddenAnalysesVisible(), self.isLandscape(),
+                           self.getDimension())
+
+    def getReusableReport(self, ar, content_digest, template_digest):
+        """ Returns the last report of the AR rendered from the same data and
+            template, whose PDF can be reused, or None
+        """
+        for report in reversed(ar.objectValues('ARReport')):
+            if report.getContentDigest() != content_digest \
+                    or report.getTemplateDigest() != template_digest:
+                continue
+            try:
+                pdf = report.getPdf()
+                if pdf and pdf.get_size():
+                    return report
+            except Exception:
+                # POSKeyError: 'No blob file'
+                continue
+        return None
 
     def getReportTemplate(self):
         """ Returns the html template for the current ar and moves to
@@ -375,10 +453,8 @@ class AnalysisRequestPublishView(BrowserView):
             data['categorized_analyses'][poc] = pocdict
 
             # Group by department too
-            anobj = an['obj']
-            dept = anobj.getService().getDepartment() if anobj.getService() else None
+            dept = an['department_uid']
             if dept:
-                dept = dept.UID()
                 dep = data['department_analyses'].get(dept, {})
                 dep_pocdict = dep.get(poc, {})
                 dep_catlist = dep_pocdict.get(cat, [])
@@ -494,8 +570,14 @@ class AnalysisRequestPublishView(BrowserView):
         return self._sorted_attachments(ar, attachments)
 
     def _batch_data(self, ar):
-        data = {}
         batch = ar.getBatch()
+        if not batch:
+            return {}
+        return self._shared_data('batch', batch.UID(),
+                                 self._build_batch_data, batch)
+
+    def _build_batch_data(self, batch):
+        data = {}
         if batch:
             data = {'obj': batch,
                     'id': batch.id,
@@ -535,10 +617,14 @@ class AnalysisRequestPublishView(BrowserView):
         return data
 
     def _sampler_data(self, sample=None):
-        data = {}
         if not sample or not sample.getSampler():
-            return data
-        sampler = sample.getSampler()
+            return {}
+        return self._shared_data('sampler', sample.getSampler(),
+                                 self._build_sampler_data,
+                                 sample.getSampler())
+
+    def _build_sampler_data(self, sampler):
+        data = {}
         mtool = getToolByName(self, 'portal_membership')
         member = mtool.getMemberById(sampler)
         if member:
@@ -599,6 +685,9 @@ class AnalysisRequestPublishView(BrowserView):
         return self.format_address(lab_address)
 
     def _lab_data(self):
+        return self._shared_data('laboratory', None, self._build_lab_data)
+
+    def _build_lab_data(self):
         portal = self.context.portal_url.getPortalObject()
         lab = self.context.bika_setup.laboratory
 
@@ -651,11 +740,16 @@ class AnalysisRequestPublishView(BrowserView):
         return data
 
     def _specs_data(self, ar):
-        data = {}
         specs = ar.getPublicationSpecification()
         if not specs:
             specs = ar.getSpecification()
+        if not specs:
+            return {}
+        return self._shared_data('specifications', specs.UID(),
+                                 self._build_specs_data, specs)
 
+    def _build_specs_data(self, specs):
+        data = {}
         if specs:
             data['obj'] = specs
             data['id'] = specs.id
@@ -711,19 +805,20 @@ class AnalysisRequestPublishView(BrowserView):
             return self._cache['_analysis_data'][analysis.UID()]
 
         keyword = analysis.getKeyword()
-        service = analysis.getService()
+        service = self._service_data(analysis.getService())
         andict = {'obj': analysis,
                   'id': analysis.id,
                   'title': analysis.Title(),
                   'keyword': keyword,
-                  'scientific_name': service.getScientificName(),
-                  'accredited': service.getAccredited(),
-                  'point_of_capture': to_utf8(POINTS_OF_CAPTURE.getValue(service.getPointOfCapture())),
-                  'category': to_utf8(service.getCategoryTitle()),
+                  'scientific_name': service['scientific_name'],
+                  'accredited': service['accredited'],
+                  'point_of_capture': service['point_of_capture'],
+                  'category': service['category'],
+                  'department_uid': service['department_uid'],
                   'result': analysis.getResult(),
                   'isnumber': isnumber(analysis.getResult()),
-                  'unit': to_utf8(service.getUnit()),
-                  'formatted_unit': format_supsub(to_utf8(service.getUnit())),
+                  'unit': service['unit'],
+                  'formatted_unit': service['formatted_unit'],
                   'capture_date': analysis.getResultCaptureDate(),
                   'request_id': analysis.aq_parent.getId(),
                   'formatted_result': '',
@@ -798,6 +893,36 @@ class AnalysisRequestPublishView(BrowserView):
         self._cache['_analysis_data'][analysis.UID()]  = andict
         return andict
 
+    def _service_data(self, service):
+        """Returns the data of the service shown with each of its analyses.
+        Analyses may refer to different versions of the same service
+        """
+        if not service:
+            return self._build_service_data(service)
+        key = (service.UID(), getattr(service, 'version_id', None))
+        return self._shared_data('services', key,
+                                 self._build_service_data, service)
+
+    def _build_service_data(self, service):
+        if not service:
+            return {'scientific_name': False,
+                    'accredited': False,
+                    'point_of_capture': '',
+                    'category': '',
+                    'department_uid': None,
+                    'unit': '',
+                    'formatted_unit': ''}
+        department = service.getDepartment()
+        unit = to_utf8(service.getUnit())
+        return {'scientific_name': service.getScientificName(),
+                'accredited': service.getAccredited(),
+                'point_of_capture': to_utf8(POINTS_OF_CAPTURE.getValue(
+                    service.getPointOfCapture())),
+                'category': to_utf8(service.getCategoryTitle()),
+                'department_uid': department.UID() if department else None,
+                'unit': unit,
+                'formatted_unit': format_supsub(unit)}
+
     def _qcanalyses_data(self, ar, analysis_states=['verified', 'published']):
         if ar.UID() in self._cache['_qcanalyses_data']:
             return self._cache['_qcanalyses_data'][ar.UID()]
@@ -819,11 +944,16 @@ class AnalysisRequestPublishView(BrowserView):
         return analyses
 
     def _reporter_data(self, ar):
-        data = {}
         member = self.context.portal_membership.getAuthenticatedMember()
-        if member:
-            username = member.getUserName()
-            data['username'] = username
+        if not member:
+            return {}
+        return self._shared_data('reporter', member.getUserName(),
+                                 self._build_reporter_data,
+                                 member.getUserName())
+
+    def _build_reporter_data(self, username):
+        data = {'username': username}
+        if username:
             data['fullname'] = to_utf8(self.user_fullname(username))
             data['email'] = to_utf8(self.user_email(username))
 
@@ -837,6 +967,17 @@ class AnalysisRequestPublishView(BrowserView):
         return data
 
     def _managers_data(self, ar):
+        # The managers only depend on the departments of the analyses, in
+        # the order they are found, as AnalysisRequest.getResponsible does
+        departments = []
+        for analysis in ar.objectValues('Analysis'):
+            dept = self._service_data(analysis.getService())['department_uid']
+            if dept and dept not in departments:
+                departments.append(dept)
+        return self._shared_data('managers', tuple(departments),
+                                 self._build_managers_data, ar)
+
+    def _build_managers_data(self, ar):
         managers = {'ids': [], 'dict': {}}
         departments = {}
         ar_mngrs = ar.getResponsible()
@@ -896,18 +1037,72 @@ class AnalysisRequestPublishView(BrowserView):
         style = self.request.form.get('style')
         uids = self.request.form.get('uid').split(':')
         reporthtml = "<html><head>%s</head><body><div id='report'>%s</body></html>" % (style, html)
+        reporthtml = safe_unicode(reporthtml).encode('utf-8')
+
+        # Send the PDF conversions to the pool first, the ARs are published
+        # in order as their PDFs come back
+        ars = [self.getPublishableAR(uid) for uid in uids]
+        ars = [ar for ar in ars if ar is not None]
+        for ar in ars:
+            self.writeDebugHTML(ar, reporthtml)
+
+        # The PDF of the ARs republished without changes is reused
+        template_digest = self.getTemplateDigest(style)
+        digests = {}
+        reused = {}
+        for ar in ars:
+            digests[ar.UID()] = self.getContentDigest(ar, uids)
+            report = self.getReusableReport(ar, digests[ar.UID()],
+                                            template_digest)
+            if report is not None:
+                reused[ar.UID()] = report
+        render = [ar for ar in ars if ar.UID() not in reused]
+        fetch_options = get_request_fetch_options(self.request)
+        results = pdfpool.submit_many([reporthtml for ar in render],
+                                      fetch_options, keep_files=debug_mode())
+        results = dict(zip([ar.UID() for ar in render], results))
+        timeout = pdfpool.get_timeout()
+
         publishedars = []
-        for uid in uids:
-            ars = self.publishFromHTML(uid, safe_unicode(reporthtml).encode('utf-8'))
-            publishedars.extend(ars)
+        for ar in ars:
+            report = reused.get(ar.UID())
+            if report is not None:
+                start = time.time()
+                publishedars.extend(self.publishFromPDF(
+                    ar, report.getHtml(), report.getPdf().data,
+                    digests[ar.UID()], template_digest))
+                logger.info("Published %s: PDF of %s reused, published in "
+                            "%.2fs" % (ar.getId(), report.getId(),
+                                       time.time() - start))
+                continue
+            result = results[ar.UID()]
+            start = time.time()
+            try:
+                pdf_report, render_time, pdf_fn = result.get(timeout)
+            except multiprocessing.TimeoutError:
+                logger.error("PDF of %s not rendered in %ss" %
+                             (ar.getId(), timeout))
+                raise
+            waited = time.time() - start
+            if pdf_fn:
+                logger.debug("Writing PDF for %s to %s" % (ar.Title(), pdf_fn))
+            start = time.time()
+            publishedars.extend(self.publishFromPDF(
+                ar, reporthtml, pdf_report, digests[ar.UID()],
+                template_digest))
+            logger.info("Published %s: PDF rendered in %.2fs, waited %.2fs, "
+                        "published in %.2fs" % (ar.getId(), render_time,
+                                                waited, time.time() - start))
         return publishedars
 
-    def publishFromHTML(self, aruid, results_html):
+    def getPublishableAR(self, aruid):
+        """Returns the AR with the given UID if it can be published, or None
+        """
         # The AR can be published only and only if allowed
         uc = getToolByName(self.context, 'uid_catalog')
         ars = uc(UID=aruid)
         if not ars or len(ars) != 1:
-            return []
+            return None
 
         ar = ars[0].getObject();
         wf = getToolByName(ar, 'portal_workflow')
@@ -916,26 +1111,52 @@ class AnalysisRequestPublishView(BrowserView):
         if wf.getInfoFor(ar, 'review_state') not in allowed_states:
             # Pre-publish allowed?
             if not ar.getAnalyses(review_state=allowed_states):
-                return []
+                return None
+        return ar
 
+    def writeDebugHTML(self, ar, results_html):
         # HTML written to debug file
-        debug_mode = App.config.getConfiguration().debug_mode
-        if debug_mode:
+        if debug_mode():
             tmp_fn = tempfile.mktemp(suffix=".html")
             logger.debug("Writing HTML for %s to %s" % (ar.Title(), tmp_fn))
             open(tmp_fn, "wb").write(results_html)
 
+    def publishFromHTML(self, aruid, results_html):
+        ar = self.getPublishableAR(aruid)
+        if ar is None:
+            return []
+        self.writeDebugHTML(ar, results_html)
+
+        content_digest = self.getContentDigest(ar)
+        template_digest = self.getTemplateDigest()
+        report = self.getReusableReport(ar, content_digest, template_digest)
+        if report is not None:
+            return self.publishFromPDF(ar, report.getHtml(),
+                                       report.getPdf().data, content_digest,
+                                       template_digest)
+
         # Create the pdf report (will always be attached to the AR)
         # we must supply the file ourself so that createPdf leaves it alone.
         pdf_fn = tempfile.mktemp(suffix=".pdf")
         pdf_report = createPdf(htmlreport=results_html, outfile=pdf_fn)
 
         # PDF written to debug file
-        if debug_mode:
+        if debug_mode():
             logger.debug("Writing PDF for %s to %s" % (ar.Title(), pdf_fn))
         else:
             os.remove(pdf_fn)
 
+        return self.publishFromPDF(ar, results_html, pdf_report,
+                                   content_digest, template_digest)
+
+    def publishFromPDF(self, ar, results_html, pdf_report,
+                       content_digest=None, template_digest=None):
+        """Creates the ARReport with the PDF, transitions the AR and emails
+        the report to the managers and the recipients. The digests of the
+        data and template the report was rendered from are stored with it
+        """
+        wf = getToolByName(ar, 'portal_workflow')
+        debug = debug_mode()
         recipients = []
         contact = ar.getContact()
         lab = ar.bika_setup.laboratory
@@ -954,7 +1175,9 @@ class AnalysisRequestPublishView(BrowserView):
                 AnalysisRequest=ar.UID(),
                 Pdf=pdf_report,
                 Html=results_html,
-                Recipients=recipients
+                Recipients=recipients,
+                ContentDigest=content_digest or '',
+                TemplateDigest=template_digest or ''
             )
             report.unmarkCreationFlag()
             renameAfterCreation(report)
@@ -994,13 +1217,7 @@ class AnalysisRequestPublishView(BrowserView):
                 mime_msg['To'] = ','.join(to)
                 attachPdf(mime_msg, pdf_report, ar.id)
 
-                try:
-                    host = getToolByName(ar, 'MailHost')
-                    host.send(mime_msg.as_string(), immediate=True)
-                except SMTPServerDisconnected as msg:
-                    logger.warn("SMTPServerDisconnected: %s." % msg)
-                except SMTPRecipientsRefused as msg:
-                    raise WorkflowException(str(msg))
+                mailqueue.queue_mail(ar, mime_msg)
 
         # Send report to recipients
         recips = self.get_recipients(ar)
@@ -1035,18 +1252,12 @@ class AnalysisRequestPublishView(BrowserView):
             msg_string = mime_msg.as_string()
 
             # content of outgoing email written to debug file
-            if debug_mode:
+            if debug:
                 tmp_fn = tempfile.mktemp(suffix=".email")
                 logger.debug("Writing MIME message for %s to %s" % (ar.Title(), tmp_fn))
                 open(tmp_fn, "wb").write(msg_string)
 
-            try:
-                host = getToolByName(ar, 'MailHost')
-                host.send(msg_string, immediate=True)
-            except SMTPServerDisconnected as msg:
-                logger.warn("SMTPServerDisconnected: %s." % msg)
-            except SMTPRecipientsRefused as msg:
-                raise WorkflowException(str(msg))
+            mailqueue.queue_mail(ar, msg_string)
 
         return [ar]
 
@@ -1185,10 +1396,14 @@ class AnalysisRequestPublishView(BrowserView):
 
     def sorted_by_sort_key(self, category_keys):
         """ Sort categories via catalog lookup on title. """
+        sort_keys = self._shared_data('category_sort_keys', None,
+                                      self._build_category_sort_keys)
+        return sorted(category_keys, key=lambda title, sk=sort_keys: sk.get(title))
+
+    def _build_category_sort_keys(self):
         bsc = getToolByName(self.context, "bika_setup_catalog")
         analysis_categories = bsc(portal_type="AnalysisCategory", sort_on="sortable_title")
-        sort_keys = dict([(b.Title, "{:04}".format(a)) for a, b in enumerate(analysis_categories)])
-        return sorted(category_keys, key=lambda title, sk=sort_keys: sk.get(title))
+        return dict([(b.Title, "{:04}".format(a)) for a, b in enumerate(analysis_categories)])
 
     def getAnaysisBasedTransposedMatrix(self, ars):
         """ Returns a dict with the following structure:
@@ -37,6 +37,7 @@ from bika.lims.utils import isActive
 from bika.lims.utils import t
 from bika.lims.utils import tmpID
 from bika.lims.workflow import doActionFor
+from bika.lims.workflow import doActionsFor
 
 
 class AnalysisRequestWorkflowAction(WorkflowAction):
@@ -486,9 +487,9 @@ class AnalysisRequestWorkflowAction(WorkflowAction):
             #             break
             if can_submit and analysis not in submissable:
                 submissable.append(analysis)
-        # and then submit them.
-        for analysis in submissable:
-            doActionFor(analysis, 'submit')
+        # and then submit them. The AR and worksheets are promoted once, after
+        # all the analyses are submitted.
+        doActionsFor(submissable, 'submit')
 
         # LIMS-2366: Finally, when we are done processing all applicable
         # analyses, we must attempt to initiate the submit transition on the
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import json
+
+from bika.lims import assetcache
+from bika.lims.browser import BrowserView
+
+
+class AssetCacheView(BrowserView):
+    """Hits, misses and size of the asset cache of this Zope process, as
+    JSON. The counters include the PDFs rendered by the workers of the pool.
+    With clear=1 in the request, the cached assets are dropped first
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        cache = assetcache.get_cache()
+        if self.request.form.get("clear") == "1":
+            cache.clear()
+        return json.dumps(cache.get_stats())
@@ -132,36 +132,31 @@ class BatchFolderContentsView(BikaListingView):
                 return True
         return False
 
-    def folderitems(self):
+    def before_folderitems(self):
         self.filter_indexes = None
 
-        items = BikaListingView.folderitems(self)
-        for x in range(len(items)):
-            if 'obj' not in items[x]:
-                continue
-            obj = items[x]['obj']
-
-            bid = obj.getBatchID()
-            items[x]['BatchID'] = bid
-            items[x]['replace']['BatchID'] = "<a href='%s/%s'>%s</a>" % (items[x]['url'], 'analysisrequests', bid)
+    def folderitem(self, obj, item, index):
+        bid = obj.getBatchID()
+        item['BatchID'] = bid
+        item['replace']['BatchID'] = "<a href='%s/%s'>%s</a>" % (item['url'], 'analysisrequests', bid)
 
-            title = obj.Title()
-            items[x]['Title'] = title
-            items[x]['replace']['Title'] = "<a href='%s/%s'>%s</a>" % (items[x]['url'], 'analysisrequests', title)
+        title = obj.Title()
+        item['Title'] = title
+        item['replace']['Title'] = "<a href='%s/%s'>%s</a>" % (item['url'], 'analysisrequests', title)
 
-            if obj.getClient():
-                items[x]['Client'] = obj.getClient().Title()
-                items[x]['replace']['Client'] = "<a href='%s'>%s</a>" % ( obj.getClient().absolute_url(), obj.getClient().Title())
-            else:
-                items[x]['Client'] = ''
+        if obj.getClient():
+            item['Client'] = obj.getClient().Title()
+            item['replace']['Client'] = "<a href='%s'>%s</a>" % ( obj.getClient().absolute_url(), obj.getClient().Title())
+        else:
+            item['Client'] = ''
 
-            date = obj.Schema().getField('BatchDate').get(obj)
-            if callable(date):
-                date = date()
-            items[x]['BatchDate'] = date
-            items[x]['replace']['BatchDate'] = self.ulocalized_time(date)
+        date = obj.Schema().getField('BatchDate').get(obj)
+        if callable(date):
+            date = date()
+        item['BatchDate'] = date
+        item['replace']['BatchDate'] = self.ulocalized_time(date)
 
-        return items
+        return item
 
 
 class ajaxGetBatches(BrowserView):
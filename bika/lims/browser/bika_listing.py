@@ -9,10 +9,12 @@ import json
 import copy
 import collections
 
+import Missing
 from DateTime import DateTime
 
 from Products.AdvancedQuery import And, Or, MatchRegexp, Between, Generic, Eq
 from Products.CMFCore.utils import getToolByName
+from Products.DCWorkflow.Transitions import TRIGGER_USER_ACTION
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 
 from zope.component import getAdapters
@@ -20,6 +22,7 @@ from zope.component import getAdapters
 import plone
 from plone import api as ploneapi
 from plone.app.content.browser import tableview
+from plone.memoize.volatile import ATTR as MEMOIZE_ATTR
 from plone.memoize.volatile import cache
 from plone.memoize.volatile import store_on_context
 try:
@@ -36,10 +39,30 @@ from bika.lims.browser import BrowserView
 from bika.lims.interfaces import IFieldIcons
 from bika.lims.subscribers import doActionFor
 from bika.lims.subscribers import skip
+from bika.lims.workflow import BulkTransition
 from bika.lims.utils import getFromString
 from bika.lims.utils import isActive, getHiddenAttributesForClass
 from bika.lims.utils import t
 from bika.lims.utils import to_utf8
+from bika.lims.utils.export import stream_rows
+
+# request key holding the number of objects woken up by listings
+WOKEN_OBJECTS_KEY = "bika_listing_woken_objects"
+
+# Number of exported items after which the caches are pruned
+EXPORT_CHUNK_SIZE = 500
+
+# Guard expressions which only check the workflow states the listed items
+# are grouped by (see `get_transitions_for_items`), e.g. the cancellation
+# state, and the permissions of the transition. Any other guard expression
+# is evaluated for every listed object until one allows the transition.
+STATE_GUARD_EXPRESSIONS = frozenset([
+    "python:here.guard_cancelled_object()",
+    "python:here.guard_import_transition()",
+    "python:here.guard_publish_transition()",
+    "python:here.guard_receive_transition()",
+    "python:here.guard_retract_transition()",
+])
 
 
 class WorkflowAction:
@@ -226,40 +249,42 @@ class WorkflowAction:
         transitioned = []
         workflow = getToolByName(self.context, 'portal_workflow')
 
-        # transition selected items from the bika_listing/Table.
-        for item in items:
-            # the only actions allowed on inactive/cancelled
-            # items are "reinstate" and "activate"
-            if not isActive(item) and action not in ('reinstate', 'activate'):
-                continue
-            if not skip(item, action, peek=True):
-                allowed_transitions = [it['id'] for it in workflow.getTransitionsFor(item)]
-                if action in allowed_transitions:
-                    success = False
-                    # if action is "verify" and the item is an analysis or
-                    # reference analysis, check if the if the required number
-                    # of verifications done for the analysis is, at least,
-                    # the number of verifications performed previously+1
-                    if (action == 'verify' and
-                            hasattr(item, 'getNumberOfVerifications') and
-                            hasattr(item, 'getNumberOfRequiredVerifications')):
-
-                        success = True
-                        revers = item.getNumberOfRequiredVerifications()
-                        nmvers = item.getNumberOfVerifications()
-                        username = getToolByName(self.context, 'portal_membership').getAuthenticatedMember().getUserName()
-                        item.addVerificator(username)
-                        if revers - nmvers <= 1:
+        # transition selected items from the bika_listing/Table. The
+        # parents of the items are promoted once, after all the items.
+        with BulkTransition(self.request):
+            for item in items:
+                # the only actions allowed on inactive/cancelled
+                # items are "reinstate" and "activate"
+                if not isActive(item) and action not in ('reinstate', 'activate'):
+                    continue
+                if not skip(item, action, peek=True):
+                    allowed_transitions = [it['id'] for it in workflow.getTransitionsFor(item)]
+                    if action in allowed_transitions:
+                        success = False
+                        # if action is "verify" and the item is an analysis or
+                        # reference analysis, check if the if the required number
+                        # of verifications done for the analysis is, at least,
+                        # the number of verifications performed previously+1
+                        if (action == 'verify' and
+                                hasattr(item, 'getNumberOfVerifications') and
+                                hasattr(item, 'getNumberOfRequiredVerifications')):
+
+                            success = True
+                            revers = item.getNumberOfRequiredVerifications()
+                            nmvers = item.getNumberOfVerifications()
+                            username = getToolByName(self.context, 'portal_membership').getAuthenticatedMember().getUserName()
+                            item.addVerificator(username)
+                            if revers - nmvers <= 1:
+                                success, message = doActionFor(item, action)
+                                if not success:
+                                    # If failed, delete last verificator.
+                                    item.deleteLastVerificator()
+                        else:
                             success, message = doActionFor(item, action)
-                            if not success:
-                                # If failed, delete last verificator.
-                                item.deleteLastVerificator()
-                    else:
-                        success, message = doActionFor(item, action)
-                    if success:
-                        transitioned.append(item.id)
-                    else:
-                        self.context.plone_utils.addPortalMessage(message, 'error')
+                        if success:
+                            transitioned.append(item.id)
+                        else:
+                            self.context.plone_utils.addPortalMessage(message, 'error')
 
         # automatic label printing
         if transitioned and action == 'receive' and 'receive' in self.portal.bika_setup.getAutoPrintStickers():
@@ -379,6 +404,13 @@ class BikaListingView(BrowserView):
     # it only searches visible items
     manual_sort_on = None
 
+    # Build the listing items straight from the catalog brains instead of
+    # waking up every listed object. In this mode, `isItemAllowed` and
+    # `folderitem` receive the brain and must call `self.get_object(brain)`
+    # when they really need the object. Only enable it for views whose
+    # columns are covered by catalog metadata.
+    metadata_only = False
+
     # Column definitions:
     #
     # The keys of the columns dictionary must all exist in all
@@ -408,6 +440,12 @@ class BikaListingView(BrowserView):
     #               the system will save the value after been
     #               introduced via ajax.
     # - input_width: size attribute applied to input widget in edit mode
+    # - metadata: name of the catalog metadata column the value is read from
+    #             when the view lists in metadata-only mode. Columns without
+    #             this key are read from the metadata column named as their
+    #             'attr' or column id, if any. The object is never woken up
+    #             to fill the columns in this mode, `folderitem` must set the
+    #             values the catalog does not provide.
     columns = {
         'obj_type': {'title': _('Type')},
         'id': {'title': _('ID')},
@@ -477,6 +515,14 @@ class BikaListingView(BrowserView):
         self.show_all = False
         self.show_more = False
         self.limit_from = 0
+        # number of objects woken up by this view
+        self.woken_objects = 0
+        # workflow state variables by portal type
+        self.state_variables = {}
+        # roles granted a permission by (portal type, review state)
+        self.state_permission_roles = {}
+        # roles of the current user by container path
+        self.container_roles = {}
 
     @property
     def review_state(self):
@@ -787,6 +833,11 @@ class BikaListingView(BrowserView):
         self.save_filter_bar_values(cookie_data)
         self._process_request()
 
+        # <form_id>_export streams all the items of the listing as csv/xlsx
+        export_format = self.request.get('%s_export' % self.form_id, '')
+        if export_format in ('csv', 'xlsx'):
+            return self.export(export_format)
+
         # ajax_category_expand is included in the form if this form submission
         # is an asynchronous one triggered by a category being expanded.
         if self.request.get('ajax_category_expand', False):
@@ -845,9 +896,135 @@ class BikaListingView(BrowserView):
         """
         return item
 
+    def before_folderitems(self):
+        """ Service triggered once before the items are iterated, by
+            folderitems and by the export. Prepares what the folderitem
+            service of child objects needs for all the items, e.g. tools,
+            permissions or vocabularies.
+        """
+        pass
+
+    def after_folderitems(self, items):
+        """ Service triggered once with the list of items built by
+            folderitems. Child objects post-process the whole list here,
+            e.g. to sort the items or to add columns. The export streams the
+            items and doesn't call it, so the values of the exported columns
+            must be set in folderitem.
+            :items: the list of items to be returned by folderitems
+        """
+        return items
+
+    def get_object(self, brain_or_object):
+        """Wake up the object behind the brain and count it.
+
+        The counter is kept on the view and summed up for all listings
+        rendered in the current request under `bika_listing_woken_objects`.
+        """
+        if not api.is_brain(brain_or_object):
+            return brain_or_object
+        obj = api.get_object(brain_or_object)
+        self.woken_objects += 1
+        woken = self.request.get(WOKEN_OBJECTS_KEY, 0) + 1
+        self.request.set(WOKEN_OBJECTS_KEY, woken)
+        return obj
+
+    def has_metadata(self, brain_or_object, name):
+        """Checks if the catalog provides a metadata column `name`
+        """
+        if not api.is_brain(brain_or_object):
+            return False
+        schema = getattr(brain_or_object, "__record_schema__", {})
+        return name in schema
+
+    def get_metadata(self, brain, name, default=None):
+        """Returns the value of the metadata column `name` of the brain
+        """
+        if not self.has_metadata(brain, name):
+            return default
+        value = getattr(brain, name, default)
+        if value is Missing.Value:
+            return default
+        return value
+
+    def get_value(self, brain_or_object, name):
+        """Get the value of `name` from the brain's metadata, falling back to
+        the woken up object when the name is not a metadata column
+        """
+        if self.has_metadata(brain_or_object, name):
+            return self.get_metadata(brain_or_object, name)
+        return getFromString(self.get_object(brain_or_object), name)
+
+    def get_user_roles(self, brain):
+        """Returns the roles of the current user in the container of the
+        item, e.g. the client of an AR, without waking up the item
+
+        Bika grants the local roles on the containers, the clients. The
+        roles of the container path are computed once per listing.
+        """
+        path = api.get_parent_path(brain)
+        if path not in self.container_roles:
+            container = api.get_portal().unrestrictedTraverse(path, None)
+            roles = None
+            if container is not None:
+                mtool = api.get_tool("portal_membership")
+                member = mtool.getAuthenticatedMember()
+                roles = set(member.getRolesInContext(container))
+            self.container_roles[path] = roles
+        return self.container_roles[path]
+
+    def get_state_permission_roles(self, permission, portal_type,
+                                   review_state):
+        """Returns the roles granted the permission in the review state of
+        the type, or None when the review state alone does not set it
+        """
+        key = (permission, portal_type, review_state)
+        if key not in self.state_permission_roles:
+            roles = None
+            workflow = api.get_tool("portal_workflow")
+            managers = [wf for wf in workflow.getWorkflowsFor(portal_type)
+                        if permission in wf.permissions]
+            # other workflows of the type, e.g. the cancellation one, may
+            # set the permission as well
+            if len(managers) == 1 and \
+                    managers[0].state_var == "review_state":
+                state = managers[0].states.get(review_state)
+                if state is not None:
+                    info = state.getPermissionInfo(permission)
+                    if not info["acquired"]:
+                        roles = set(info["roles"])
+            self.state_permission_roles[key] = roles
+        return self.state_permission_roles[key]
+
+    def check_permission(self, permission, brain_or_object):
+        """Checks if the current user has the permission on the item
+
+        For brains, the roles the workflow grants the permission in the review
+        state of the item are compared with the roles of the user in the
+        container of the item. The object is only woken up when the
+        permission is not set by the review state alone, or is granted to
+        roles the user may only have on the item itself, like its owner.
+        """
+        mtool = api.get_tool("portal_membership")
+        if not api.is_brain(brain_or_object):
+            return mtool.checkPermission(permission, brain_or_object)
+        roles = self.get_state_permission_roles(
+            permission,
+            api.get_portal_type(brain_or_object),
+            self.get_metadata(brain_or_object, "review_state"))
+        user_roles = self.get_user_roles(brain_or_object)
+        if roles is not None and user_roles is not None:
+            if roles & (user_roles - set(["Owner"])):
+                return True
+            if "Owner" not in roles:
+                return False
+        obj = self.get_object(brain_or_object)
+        return mtool.checkPermission(permission, obj)
+
     def get_icon(self, obj):
+        # plone_layout handles brains too, but needs a real context
+        context = self.context if api.is_brain(obj) else obj
         plone_layout = api.get_view(
-            "plone_layout", context=obj, request=self.request)
+            "plone_layout", context=context, request=self.request)
         return plone_layout.getIcon(obj)
 
     def get_workflow_info(self, obj):
@@ -983,6 +1160,92 @@ class BikaListingView(BrowserView):
             "replace": {},
         }
 
+    @cache(api.bika_cache_key_decorator, store_on_context)
+    def make_listing_item_from_brain(self, brain):
+        """Returns a listing item dictionary built from catalog metadata only.
+
+        The returned dictionary has the same keys as `make_listing_item`, but
+        `obj` holds the brain and field icons are not collected, because the
+        `IFieldIcons` adapters need the object.
+        """
+        id = api.get_id(brain)
+        uid = api.get_uid(brain)
+        url = api.get_url(brain)
+        relative_url = brain.getURL(relative=1)
+        title = api.get_title(brain)
+        description = api.get_description(brain)
+        portal_type = api.get_portal_type(brain)
+        path = api.get_path(brain)
+        fti = self.get_fti(brain)
+        icon = self.get_icon(brain)
+        created = self.ulocalized_time(self.get_metadata(brain, "created"))
+        modified = self.ulocalized_time(self.get_metadata(brain, "modified"))
+
+        # the workflow states we can get from the metadata
+        states = {}
+        for state_var in self.get_state_variables(portal_type):
+            state = self.get_metadata(brain, state_var)
+            if state:
+                states[state_var] = state
+        state_class = ""
+        for state in states.values():
+            state_class += "state-{} ".format(state)
+
+        type_title_msgid = self.get_type_title(brain)
+        url_href_title = '%s at %s: %s' % (
+            t(type_title_msgid), path, to_utf8(description))
+
+        plone_utils = api.get_tool('plone_utils')
+        type_class = 'contenttype-' + \
+            plone_utils.normalizeString(portal_type)
+
+        workflow = api.get_tool("portal_workflow")
+        review_state = states.get("review_state")
+        if review_state:
+            wf_state_title = workflow.getTitleForStateOnType(
+                review_state, portal_type)
+            state_title = _(wf_state_title)
+        else:
+            review_state = "active"
+            state_title = _("Active")
+
+        return {
+            "obj": brain,
+            "id": id,
+            "uid": uid,
+            "url": url,
+            "relative_url": relative_url,
+            "title": title,
+            "description": description,
+            "portal_type": portal_type,
+            "path": path,
+            "parent_id": path.split("/")[-2],
+            "icon": icon.html_tag(),
+            "created": created,
+            "modified": modified,
+            "review_state": review_state,
+            "state_title": state_title,
+            "states": states,
+            "state_class": state_class,
+            "url_href_title": url_href_title,
+            "class": {},
+            "item_data": "[]",
+            "table_row_class": "",
+            "category": "None",
+            "fti": fti,
+            "obj_type": self.get_metadata(brain, "Type", ""),
+            "size": self.get_metadata(brain, "getObjSize", ""),
+            "type_class": type_class,
+            "view_url": url,
+            "choices": {},
+            "field": {},
+            "allow_edit": [],
+            "required": [],
+            "before": {},
+            "after": {},
+            "replace": {},
+        }
+
     def folderitems(self, full_objects=False):
         """
         >>> portal = layer['portal']
@@ -999,10 +1262,7 @@ class BikaListingView(BrowserView):
         >>> browser.contents
         '...Apple Pulp...'
         """
-
-        # self.contentsMethod = self.context.getFolderContents
-        if not hasattr(self, 'contentsMethod'):
-            self.contentsMethod = getToolByName(self.context, self.catalog)
+        self.before_folderitems()
 
         if self.request.get('show_all', '').lower() == 'true' \
                 or self.show_all is True \
@@ -1011,6 +1271,51 @@ class BikaListingView(BrowserView):
         else:
             show_all = False
 
+        brains = self.get_brains()
+
+        # idx increases one unit each time an object is added to the 'items'
+        # dictionary to be returned. Note that if the item is not rendered,
+        # the idx will not increase.
+        idx = 0
+        results = []
+        self.show_more = False
+
+        brains = brains[self.limit_from:]
+        for i, brain in enumerate(brains):
+
+            # avoid creating unnecessary info for items outside the current
+            # batch;  only the path is needed for the "select all" case...
+            # we only take allowed items into account
+            if not show_all and idx >= self.pagesize:
+                # Maximum number of items to be shown reached!
+                self.show_more = True
+                break
+
+            item = self.build_folderitem(brain, idx)
+            if item:
+                results.append(item)
+                idx += 1
+
+        # Need manual_sort?
+        # Note that the order has already been set in contentFilter, so
+        # there is no need to reverse
+        if self.manual_sort_on:
+            results.sort(lambda x, y: cmp(x.get(self.manual_sort_on, ''),
+                                          y.get(self.manual_sort_on, '')))
+
+        logger.debug("{}: {} items listed, {} objects woken up".format(
+            self.__class__.__name__, len(results), self.woken_objects))
+
+        return self.after_folderitems(results)
+
+    def get_brains(self):
+        """Returns the catalog results of the listing for the current review
+        state and filter bar values
+        """
+        # self.contentsMethod = self.context.getFolderContents
+        if not hasattr(self, 'contentsMethod'):
+            self.contentsMethod = getToolByName(self.context, self.catalog)
+
         contentFilterTemp = copy.deepcopy(self.contentFilter)
         addition = self.get_filter_bar_queryaddition()
 
@@ -1039,76 +1344,137 @@ class BikaListingView(BrowserView):
         else:
             logger.debug("Bika Listing Table Query={}".format(contentFilterTemp))
             brains = self.contentsMethod(contentFilterTemp)
+        return brains
 
-        # idx increases one unit each time an object is added to the 'items'
-        # dictionary to be returned. Note that if the item is not rendered,
-        # the idx will not increase.
-        idx = 0
-        results = []
-        self.show_more = False
-
-        brains = brains[self.limit_from:]
-        for i, brain in enumerate(brains):
-
-            # avoid creating unnecessary info for items outside the current
-            # batch;  only the path is needed for the "select all" case...
-            # we only take allowed items into account
-            if not show_all and idx >= self.pagesize:
-                # Maximum number of items to be shown reached!
-                self.show_more = True
-                break
-
-            # This item must be rendered, we need the object instead of a brain
-            obj = api.get_object(brain)
+    def build_folderitem(self, brain, idx):
+        """Returns the listing item of the brain at position idx, or None if
+        the item is not allowed
+        """
+        # contentsMethod may return objects, these are listed as usual
+        metadata_only = self.metadata_only and api.is_brain(brain)
+        if metadata_only:
+            # The brain is enough, the object is woken up on demand
+            obj = brain
+        else:
+            # This item must be rendered, we need the object instead of
+            # a brain
+            obj = self.get_object(brain)
 
-            # check if the item must be rendered or not (prevents from
-            # doing it later in folderitems) and dealing with paging
-            if not obj or not self.isItemAllowed(obj):
-                continue
+        # check if the item must be rendered or not (prevents from
+        # doing it later in folderitems) and dealing with paging
+        if not obj or not self.isItemAllowed(obj):
+            return None
 
-            # create a listing item
+        # create a listing item
+        if metadata_only:
+            results_dict = self.make_listing_item_from_brain(obj)
+        else:
             results_dict = self.make_listing_item(obj)
 
-            # Search for values for all columns in obj
-            for key in self.columns.keys():
-                # if the key is already in the results dict
-                # then we don't replace it's value
-                value = results_dict.get(key, '')
-                if key not in results_dict:
-                    attrobj = getFromString(obj, key)
+        # Search for values for all columns in obj
+        for key in self.columns.keys():
+            # if the key is already in the results dict
+            # then we don't replace it's value
+            value = results_dict.get(key, '')
+            if key not in results_dict:
+                if metadata_only:
+                    # Only the catalog metadata is read
+                    metadata = self.columns[key].get('metadata') or \
+                        self.columns[key].get('attr') or key
+                    attrobj = self.get_metadata(obj, metadata)
+                    value = attrobj if attrobj else value
+                else:
+                    attrobj = self.get_value(obj, key)
                     value = attrobj if attrobj else value
 
                     # Custom attribute? Inspect to set the value
                     # for the current column dinamically
                     vattr = self.columns[key].get('attr', None)
                     if vattr:
-                        attrobj = getFromString(obj, vattr)
+                        attrobj = self.get_value(obj, vattr)
                         value = attrobj if attrobj else value
-                    results_dict[key] = value
-
-                # Replace with an url?
-                replace_url = self.columns[key].get('replace_url', None)
-                if replace_url:
-                    attrobj = getFromString(obj, replace_url)
-                    if attrobj:
-                        results_dict['replace'][key] = \
-                            '<a href="%s">%s</a>' % (attrobj, value)
-
-            # The item basics filled. Delegate additional actions to folderitem
-            # service. folderitem service is frequently overriden by child objects
-            item = self.folderitem(obj, results_dict, idx)
-            if item:
-                results.append(item)
-                idx += 1
+                results_dict[key] = value
 
-        # Need manual_sort?
-        # Note that the order has already been set in contentFilter, so
-        # there is no need to reverse
-        if self.manual_sort_on:
-            results.sort(lambda x, y: cmp(x.get(self.manual_sort_on, ''),
-                                          y.get(self.manual_sort_on, '')))
+            # Replace with an url?
+            replace_url = self.columns[key].get('replace_url', None)
+            if replace_url:
+                if metadata_only:
+                    attrobj = self.get_metadata(obj, replace_url)
+                else:
+                    attrobj = self.get_value(obj, replace_url)
+                if attrobj:
+                    results_dict['replace'][key] = \
+                        '<a href="%s">%s</a>' % (attrobj, value)
+
+        # The item basics filled. Delegate additional actions to folderitem
+        # service. folderitem service is frequently overriden by child objects
+        return self.folderitem(obj, results_dict, idx)
+
+    def iter_folderitems(self):
+        """Yields the listing items of all the catalog results, one at a
+        time, regardless of the page size
+
+        Volatile caches and the ZODB cache are pruned every
+        EXPORT_CHUNK_SIZE items, so the memory used by an export doesn't grow
+        with the number of items.
+
+        The items are post-processed by folderitem() only, after_folderitems()
+        is not called. Views that still build their items in their own
+        folderitems(), e.g. from the layout of a worksheet instead of the
+        catalog, and manually sorted listings are built in one go instead.
+        """
+        self.limit_from = 0
+        self.show_all = True
+        overridden = getattr(self.folderitems, 'im_func', None) is not \
+            BikaListingView.folderitems.im_func
+        if overridden or self.manual_sort_on:
+            for item in self.folderitems():
+                yield item
+            return
 
-        return results
+        self.before_folderitems()
+        idx = 0
+        for brain in self.get_brains():
+            item = self.build_folderitem(brain, idx)
+            if not item:
+                continue
+            yield item
+            idx += 1
+            if idx % EXPORT_CHUNK_SIZE == 0:
+                self.context.__dict__.pop(MEMOIZE_ATTR, None)
+                self.context._p_jar.cacheGC()
+
+    def show_export(self):
+        """Returns whether the export links are shown. Only the listing
+        published in the request can export its items, not the listings
+        embedded in other views with contents_table()
+        """
+        return self.request.get('PUBLISHED') is self
+
+    def get_export_columns(self):
+        """Returns the ids of the columns exported for the current review
+        state
+        """
+        columns = self.review_state.get('columns') or self.columns.keys()
+        return [column for column in columns if column in self.columns]
+
+    def export(self, format):
+        """Streams all the items of the listing to the response as CSV or
+        XLSX rows
+        """
+        columns = self.get_export_columns()
+        header = [t(self.columns[column].get('title', column))
+                  for column in columns]
+
+        def rows():
+            for item in self.iter_folderitems():
+                yield [item.get(column, '') for column in columns]
+
+        filename = "%s-%s" % (self.context.getId(),
+                              DateTime().strftime("%Y%m%d%H%M"))
+        stream_rows(self.request.response, format, filename, header, rows())
+        logger.info("{}: export done, {} objects woken up".format(
+            self.__class__.__name__, self.woken_objects))
 
     def contents_table(self, table_only=False):
         """ If you set table_only to true, then nothing outside of the
@@ -1136,26 +1502,106 @@ class BikaListingView(BrowserView):
         data = self.render_items()
         return data
 
+    def get_state_variables(self, portal_type):
+        """Returns the state variables of the workflows bound to the type,
+        e.g. review_state and cancellation_state
+        """
+        if portal_type not in self.state_variables:
+            workflow = api.get_tool("portal_workflow")
+            state_variables = []
+            for wf_id in workflow.getChainForPortalType(portal_type):
+                wf = workflow.getWorkflowById(wf_id)
+                if wf is not None:
+                    state_variables.append(wf.state_var)
+            self.state_variables[portal_type] = state_variables
+        return self.state_variables[portal_type]
+
+    def get_transition_group(self, brain_or_object):
+        """Returns the portal type and the workflow states of the item.
+
+        The states are read from the catalog metadata, the object is only
+        woken up when a state variable is not a metadata column.
+        """
+        portal_type = api.get_portal_type(brain_or_object)
+        group = [portal_type]
+        for state_var in self.get_state_variables(portal_type):
+            if self.has_metadata(brain_or_object, state_var):
+                state = self.get_metadata(brain_or_object, state_var, "")
+            else:
+                obj = self.get_object(brain_or_object)
+                workflow = api.get_tool("portal_workflow")
+                state = workflow.getInfoFor(obj, state_var, "")
+            group.append(state)
+        return tuple(group)
+
+    def is_object_guarded(self, tdef):
+        """Checks if the guard of the transition depends on the object, and
+        not only on the workflow states and the permissions of the user
+        """
+        guard = tdef.getGuard()
+        expr = guard.getExprText().strip()
+        return bool(expr) and expr not in STATE_GUARD_EXPRESSIONS
+
+    def get_object_guarded_transitions(self, obj):
+        """Returns the (workflow, transition) pairs of the user transitions
+        leaving the current states of the object with an object guard
+        """
+        workflow = api.get_tool("portal_workflow")
+        out = []
+        for wf in workflow.getWorkflowsFor(obj):
+            sdef = wf._getWorkflowStateOf(obj)
+            if sdef is None:
+                continue
+            for tid in sdef.transitions:
+                tdef = wf.transitions.get(tid, None)
+                if tdef is None or not tdef.actbox_name:
+                    continue
+                if tdef.trigger_type != TRIGGER_USER_ACTION:
+                    continue
+                if self.is_object_guarded(tdef):
+                    out.append((wf, tdef))
+        return out
+
     def get_transitions_for_items(self, items):
         """Extract Worfklow transitions for the bika listing items
+
+        The items are grouped by portal type and workflow states, and the
+        transitions of each group are evaluated on its first object only.
+        The transitions whose guard depends on the object are evaluated on
+        the next objects of the group, until one of them allows them.
         """
         workflow = ploneapi.portal.get_tool('portal_workflow')
         out = {}
 
-        # helper method to extract the object from an bika listing item
-        def get_object_from_item(item):
+        groups = collections.OrderedDict()
+        for item in items:
             obj = item.get("obj")
-            if hasattr(obj, "getObject") and callable(obj.getObject):
-                return obj.getObject()
-            return obj
-
-        # extract all objects from the items
-        objects = map(get_object_from_item, self.items)
+            groups.setdefault(self.get_transition_group(obj), []).append(obj)
 
-        for obj in objects:
+        for members in groups.values():
+            obj = self.get_object(members[0])
             for transition in workflow.getTransitionsFor(obj):
                 # append the transition by its id to the transitions dictionary
                 out[transition['id']] = transition
+            pending = [(wf, tdef) for wf, tdef
+                       in self.get_object_guarded_transitions(obj)
+                       if tdef.id not in out]
+            for member in members[1:]:
+                if not pending:
+                    break
+                obj = self.get_object(member)
+                for wf, tdef in pending:
+                    if wf._checkTransitionGuard(tdef, obj):
+                        out[tdef.id] = {
+                            'id': tdef.id,
+                            'title': tdef.title,
+                            'title_or_id': tdef.title_or_id(),
+                            'description': tdef.description,
+                            'name': tdef.actbox_name,
+                            'url': '',
+                        }
+                pending = [(wf, tdef) for wf, tdef in pending
+                           if tdef.id not in out]
         return out
 
     def get_workflow_actions(self):
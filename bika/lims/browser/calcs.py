@@ -6,7 +6,6 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 import json
-import math
 
 from zope.component import adapts
 from zope.component import getAdapters
@@ -21,10 +20,14 @@ from Products.PythonScripts.standard import html_quote
 from bika.lims import bikaMessageFactory as _
 from bika.lims.browser import BrowserView
 from bika.lims.interfaces import IAnalysis
+from bika.lims.interfaces import IAnalysisRequest
 from bika.lims.interfaces import IFieldIcons
+from bika.lims.interfaces import IWorksheet
 from bika.lims.utils import isnumber
 from bika.lims.utils import t
 from bika.lims.utils.analysis import format_numeric_result
+from bika.lims.utils.calculationgraph import CalculationGraph
+from bika.lims.utils.calculationgraph import WorksheetCalculationGraph
 
 
 class CalculationResultAlerts(object):
@@ -75,15 +78,33 @@ class ajaxCalculateAnalysisEntry(BrowserView):
         self.context = context
         self.request = request
 
+    def get_graph(self, analysis):
+        """Returns the calculation graph the analysis belongs to: the graph
+        of the worksheet for results entered in a worksheet, the graph of its
+        AR otherwise. Returns None for reference analyses
+        """
+        if analysis.portal_type == 'ReferenceAnalysis':
+            return None
+        if IWorksheet.providedBy(self.context):
+            graph = WorksheetCalculationGraph.get(self.context)
+            if analysis.UID() in graph.analyses:
+                return graph
+        if IAnalysisRequest.providedBy(analysis.aq_parent):
+            return CalculationGraph.get(analysis.aq_parent)
+        return None
+
     def calculate(self, uid=None):
         analysis = self.analyses[uid]
         form_result = self.current_results[uid]['result']
         service = analysis.getService()
         calculation = service.getCalculation()
-        if analysis.portal_type == 'ReferenceAnalysis':
-            deps = {}
-        else:
-            deps = {}
+        graph = self.get_graph(analysis)
+        deps = {}
+        if graph is not None:
+            for dep in graph.get_dependencies(analysis):
+                deps[dep.UID()] = dep
+        elif analysis.portal_type != 'ReferenceAnalysis':
+            # duplicates out of the worksheet graph
             for dep in analysis.getDependencies():
                 deps[dep.UID()] = dep
         path = '++resource++bika.lims.images'
@@ -211,17 +232,11 @@ class ajaxCalculateAnalysisEntry(BrowserView):
                     except ValueError:
                         pass
 
-            # convert formula to a valid python string, ready for interpolation
+            # the formula is parsed once and evaluated with the mapping
             formula = calculation.getMinifiedFormula()
-            formula = formula.replace('[', '%(').replace(']', ')f')
             try:
-                formula = eval("'%s'%%mapping" % formula,
-                               {"__builtins__": None,
-                                'math': math,
-                                'context': self.context},
-                               {'mapping': mapping})
                 # calculate
-                result = eval(formula)
+                result = calculation.evaluateFormula(mapping)
                 Result['result'] = result
                 self.current_results[uid]['result'] = result
             except TypeError as e:
@@ -340,20 +355,6 @@ class ajaxCalculateAnalysisEntry(BrowserView):
             if not (belowldl or aboveudl):
                 self.uncertainties.append({'uid': uid, 'uncertainty': unc})
 
-        # maybe a service who depends on us must be recalculated.
-        if analysis.portal_type == 'ReferenceAnalysis':
-            dependents = []
-        else:
-            dependents = analysis.getDependents()
-        if dependents:
-            for dependent in dependents:
-                dependent_uid = dependent.UID()
-                # ignore analyses that no longer exist.
-                if dependent_uid in self.ignore_uids or \
-                   dependent_uid not in self.analyses:
-                    continue
-                self.calculate(dependent_uid)
-
         # These self.alerts are just for the json return.
         # we're placing the entire form's results in kwargs.
         adapters = getAdapters((analysis, ), IFieldIcons)
@@ -365,6 +366,43 @@ class ajaxCalculateAnalysisEntry(BrowserView):
                 else:
                     self.alerts[analysis.UID()] = alerts[analysis.UID()]
 
+        # the services who depend on us must be recalculated
+        return True
+
+    def calculate_with_dependents(self, uid):
+        """Calculates the analysis and then the analyses depending on it,
+        directly or not. Each analysis is calculated once, after all its
+        dependencies, and only if one of them was calculated.
+        """
+        analysis = self.analyses[uid]
+        if analysis.portal_type == 'ReferenceAnalysis':
+            self.calculate(uid)
+            return
+        graph = self.get_graph(analysis)
+        if graph is None:
+            # duplicates out of the worksheet graph, their dependents are
+            # looked up one by one
+            if not self.calculate(uid):
+                return
+            for dependent in analysis.getDependents():
+                dependent_uid = dependent.UID()
+                # ignore analyses that no longer exist.
+                if dependent_uid in self.ignore_uids or \
+                   dependent_uid not in self.analyses:
+                    continue
+                self.calculate_with_dependents(dependent_uid)
+            return
+        calculated = set()
+        for an_uid in graph.sorted_uids([uid]):
+            # ignore analyses that no longer exist.
+            if an_uid in self.ignore_uids or an_uid not in self.analyses:
+                continue
+            if an_uid != uid and \
+               not calculated.intersection(graph.dependencies[an_uid]):
+                continue
+            if self.calculate(an_uid):
+                calculated.add(an_uid)
+
     def __call__(self):
         """Endpoint for `listing_string_entry` view
         """
@@ -401,7 +439,7 @@ class ajaxCalculateAnalysisEntry(BrowserView):
             self.analyses[analysis_uid] = analysis
 
         if uid not in self.ignore_uids:
-            self.calculate(uid)
+            self.calculate_with_dependents(uid)
 
         results = []
         for result in self.results:
@@ -160,33 +160,28 @@ class ClientFolderContentsView(BikaListingView):
 
         return clients
 
-    def folderitems(self):
+    def before_folderitems(self):
         self.contentsMethod = self.getClientList
-        items = BikaListingView.folderitems(self)
         registry = getUtility(IRegistry)
         if 'bika.lims.client.default_landing_page' in registry:
-            landing_page = registry['bika.lims.client.default_landing_page']
+            self.landing_page = registry['bika.lims.client.default_landing_page']
         else:
-            landing_page = 'analysisrequests'
-
-        for item in items:
-            if "obj" not in item:
-                continue
-            obj = item['obj']
-
-            item['replace']['title'] = "<a href='%s/%s'>%s</a>" % \
-                (item['url'], landing_page.encode('ascii'), item['title'])
-
-            item['EmailAddress'] = obj.getEmailAddress()
-            item['replace']['EmailAddress'] = "<a href='%s'>%s</a>" % \
-                ('mailto:%s' % obj.getEmailAddress(), obj.getEmailAddress())
-            item['Phone'] = obj.getPhone()
-            item['Fax'] = obj.getFax()
-            item['ClientID'] = obj.getClientID()
-            item['BulkDiscount'] = obj.getBulkDiscount() and 'Y' or 'N'
-            item['MemberDiscountApplies'] = obj.getMemberDiscountApplies() and 'Y' or 'N'
-
-        return items
+            self.landing_page = 'analysisrequests'
+
+    def folderitem(self, obj, item, index):
+        item['replace']['title'] = "<a href='%s/%s'>%s</a>" % \
+            (item['url'], self.landing_page.encode('ascii'), item['title'])
+
+        item['EmailAddress'] = obj.getEmailAddress()
+        item['replace']['EmailAddress'] = "<a href='%s'>%s</a>" % \
+            ('mailto:%s' % obj.getEmailAddress(), obj.getEmailAddress())
+        item['Phone'] = obj.getPhone()
+        item['Fax'] = obj.getFax()
+        item['ClientID'] = obj.getClientID()
+        item['BulkDiscount'] = obj.getBulkDiscount() and 'Y' or 'N'
+        item['MemberDiscountApplies'] = obj.getMemberDiscountApplies() and 'Y' or 'N'
+
+        return item
 
 
 def client_match(client, search_term):
@@ -9,6 +9,8 @@ from Products.CMFCore.utils import getToolByName
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims.browser import BrowserView
 from bika.lims import bikaMessageFactory as _
+from bika.lims import statecounters
+from bika.lims.utils import catalogcount
 from calendar import monthrange
 from DateTime import DateTime
 import plone, json
@@ -140,27 +142,19 @@ class DashboardView(BrowserView):
         bc = getToolByName(self.context, "bika_catalog")
 
         query_dic = {'portal_type':"AnalysisRequest",
-                     'created':self.date_range,
                      'cancellation_state':['active']}
         if filtering_allowed:
             query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        numars = len(bc(query_dic))
-        query_dic = {'portal_type':"AnalysisRequest",
-                     'review_state':active_rs,
-                     'created':self.base_date_range,
-                     'cancellation_state':['active']}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        numars += len(bc(query_dic))
+        numars = catalogcount.count(bc, dict(query_dic, created=self.date_range))
+        numars += catalogcount.count(bc, dict(query_dic,
+                                              review_state=active_rs,
+                                              created=self.base_date_range))
+        # Number of active ARs in each review state, counted at once
+        ars_by_state = catalogcount.count_by(bc, query_dic, 'review_state', active_rs)
+
         if (sampenabled):
             # Analysis Requests awaiting to be sampled or scheduled
-            review_state = ['to_be_sampled',]
-            query_dic = {'portal_type':"AnalysisRequest",
-                     'review_state':review_state,
-                     'cancellation_state':['active']}
-            if filtering_allowed:
-                query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-            ars = len(bc(query_dic))
+            ars = ars_by_state['to_be_sampled']
             ratio = (float(ars)/float(numars))*100 if ars > 0 and numars > 0 else 0
             ratio = str("%%.%sf" % 1) % ratio
             msg = _("To be sampled")
@@ -174,13 +168,7 @@ class DashboardView(BrowserView):
                         'link':        self.portal_url + '/samples?samples_review_state=to_be_sampled'})
 
             # Analysis Requests awaiting to be preserved
-            review_state = ['to_be_preserved',]
-            query_dic = {'portal_type':"AnalysisRequest",
-                     'review_state':review_state,
-                     'cancellation_state':['active']}
-            if filtering_allowed:
-                query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-            ars = len(bc(query_dic))
+            ars = ars_by_state['to_be_preserved']
             ratio = (float(ars)/float(numars))*100 if ars > 0 and numars > 0 else 0
             ratio = str("%%.%sf" % 1) % ratio
             msg = _("To be preserved")
@@ -194,13 +182,7 @@ class DashboardView(BrowserView):
                         'link':         self.portal_url + '/analysisrequests?analysisrequests_review_state=to_be_preserved'})
 
             # Analysis Requests awaiting to be sampled
-            review_state = ['scheduled_sampling',]
-            query_dic = {'portal_type':"AnalysisRequest",
-                     'review_state':review_state,
-                     'cancellation_state':['active']}
-            if filtering_allowed:
-                query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-            ars = len(bc(query_dic))
+            ars = ars_by_state['scheduled_sampling']
             ratio = (float(ars)/float(numars))*100 if ars > 0 and numars > 0 else 0
             ratio = str("%%.%sf" % 1) % ratio
             msg = _("Scheduled sampling")
@@ -214,13 +196,7 @@ class DashboardView(BrowserView):
                         'link':          self.portal_url + '/samples?samples_review_state=to_be_sampled'})
 
         # Analysis Requests awaiting for reception
-        review_state = ['sample_due',]
-        query_dic = {'portal_type':"AnalysisRequest",
-                 'review_state':review_state,
-                 'cancellation_state':['active']}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        ars = len(bc(query_dic))
+        ars = ars_by_state['sample_due']
         ratio = (float(ars)/float(numars))*100 if ars > 0 and numars > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("Reception pending")
@@ -234,13 +210,7 @@ class DashboardView(BrowserView):
                     'link':         self.portal_url + '/analysisrequests?analysisrequests_review_state=sample_due'})
 
         # Analysis Requests under way
-        review_state = ['attachment_due', 'sample_received', 'assigned']
-        query_dic = {'portal_type':"AnalysisRequest",
-                 'review_state':review_state,
-                 'cancellation_state':['active']}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        ars = len(bc(query_dic))
+        ars = sum([ars_by_state[state] for state in ['attachment_due', 'sample_received', 'assigned']])
         ratio = (float(ars)/float(numars))*100 if ars > 0 and numars > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("Results pending")
@@ -254,13 +224,7 @@ class DashboardView(BrowserView):
                     'link':         self.portal_url + '/analysisrequests?analysisrequests_review_state=sample_received'})
 
         # Analysis Requests to be verified
-        review_state = ['to_be_verified',]
-        query_dic = {'portal_type':"AnalysisRequest",
-                 'review_state':review_state,
-                 'cancellation_state':['active']}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        ars = len(bc(query_dic))
+        ars = ars_by_state['to_be_verified']
         ratio = (float(ars)/float(numars))*100 if ars > 0 and numars > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("To be verified")
@@ -274,13 +238,7 @@ class DashboardView(BrowserView):
                     'link':         self.portal_url + '/analysisrequests?analysisrequests_review_state=to_be_verified'})
 
         # Analysis Requests to be published
-        review_state = ['verified',]
-        query_dic = {'portal_type':"AnalysisRequest",
-                 'review_state':review_state,
-                 'cancellation_state':['active']}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        ars = len(bc(query_dic))
+        ars = ars_by_state['verified']
         ratio = (float(ars)/float(numars))*100 if ars > 0 and numars > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("To be published")
@@ -295,45 +253,14 @@ class DashboardView(BrowserView):
 
         # Chart with the evolution of ARs over a period, grouped by
         # periodicity
-        workflow = getToolByName(self.context, 'portal_workflow')
-        query_dic = {'portal_type':"AnalysisRequest",
-                     'sort_on':"created",
-                     'created':self.min_date_range}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        allars = bc(query_dic)
-        outevo = []
-        for ar in allars:
-            ar = ar.getObject()
-            state = 'other_status'
-            try:
-                state = workflow.getInfoFor(ar, 'cancellation_state')
-                if (state == 'active'):
-                    state = workflow.getInfoFor(ar, 'review_state')
-                else:
-                    state = 'inactive'
-            except:
-                pass
-
-            created = self._getDateStr(self.periodicity, ar.created())
-            state = 'sample_due' if state in ['to_be_sampled', 'to_be_preserved'] else state
-            state = 'sample_received' if state in ['assigned', 'attachment_due'] else state
-            if (len(outevo) > 0 and outevo[-1]['date'] == created):
-                key = state if _(state) in outevo[-1] else 'other_status'
-                outevo[-1][_(key)] += 1
-            else:
-                currow = {'date': created,
-                   _('sample_due'): 0,
-                   _('sample_received'): 0,
-                   _('to_be_verified'): 0,
-                   _('verified'): 0,
-                   _('published'): 0,
-                   _('inactive'): 0,
-                   _('other_status'): 0,
-                   }
-                key = state if _(state) in currow else 'other_status'
-                currow[_(key)] += 1
-                outevo.append(currow);
+        outevo = self._get_evolution(
+            "AnalysisRequest", bc, 'getDepartmentUIDs', cookie_dep_uid,
+            ['sample_due', 'sample_received', 'to_be_verified', 'verified',
+             'published'],
+            {'to_be_sampled': 'sample_due',
+             'to_be_preserved': 'sample_due',
+             'assigned': 'sample_received',
+             'attachment_due': 'sample_received'})
 
         out.append({'type':         'bar-chart-panel',
                     'name':         _('Evolution of Analysis Requests'),
@@ -356,27 +283,19 @@ class DashboardView(BrowserView):
         cookie_dep_uid = self.request.get('filter_by_department_info', '').split(',') if filtering_allowed else ''
         active_ws = ['open', 'to_be_verified', 'attachment_due']
 
-        query_dic = {'portal_type':"Worksheet",
-                 'created':self.date_range}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        numws = len(bc(query_dic))
-
-        query_dic = {'portal_type':"Worksheet",
-                 'review_state':active_ws,
-                 'created':self.base_date_range}
+        query_dic = {'portal_type':"Worksheet"}
         if filtering_allowed:
             query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        numws += len(bc(query_dic))
+        numws = catalogcount.count(bc, dict(query_dic, created=self.date_range))
+        # Number of active worksheets created before the date range in each
+        # review state, counted at once
+        ws_by_state = catalogcount.count_by(
+            bc, dict(query_dic, created=self.base_date_range),
+            'review_state', active_ws)
+        numws += sum(ws_by_state.values())
 
         # Open worksheets
-        review_state = ['open', 'attachment_due']
-        query_dic = {'portal_type':"Worksheet",
-                 'review_state':review_state,
-                   'created':self.base_date_range}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        ws = len(bc(query_dic))
+        ws = ws_by_state['open'] + ws_by_state['attachment_due']
         ratio = (float(ws)/float(numws))*100 if ws > 0 and numws > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("Results pending")
@@ -390,12 +309,7 @@ class DashboardView(BrowserView):
                     'link':         self.portal_url + '/worksheets?list_review_state=open'})
 
         # Worksheets to be verified
-        review_state = ['to_be_verified', ]
-        query_dic = {'portal_type':"Worksheet",
-                 'review_state':review_state}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        ws = len(bc(query_dic))
+        ws = catalogcount.count(bc, dict(query_dic, review_state=['to_be_verified']))
         ratio = (float(ws)/float(numws))*100 if ws > 0 and numws > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("To be verified")
@@ -410,43 +324,9 @@ class DashboardView(BrowserView):
 
         # Chart with the evolution of WSs over a period, grouped by
         # periodicity
-        workflow = getToolByName(self.context, 'portal_workflow')
-        query_dic = {'portal_type':"Worksheet",
-                 'sort_on':"created",
-                 'created':self.min_date_range}
-        if filtering_allowed:
-            query_dic['getDepartmentUIDs'] = { "query":cookie_dep_uid,"operator":"or" }
-        allws = bc(query_dic)
-        outevo = []
-        for ws in allws:
-            ws = ws.getObject()
-            state = 'other_status'
-            try:
-                state = workflow.getInfoFor(ws, 'cancellation_state')
-                if (state == 'active'):
-                    state = workflow.getInfoFor(ws, 'review_state')
-                else:
-                    state = 'inactive'
-            except:
-                pass
-
-            created = self._getDateStr(self.periodicity, ws.created())
-
-            if (len(outevo) > 0 and outevo[-1]['date'] == created):
-                key = state if _(state) in outevo[-1] else 'other_status'
-                outevo[-1][_(key)] += 1
-            else:
-                currow = {'date': created,
-                   _('open'): 0,
-                   _('to_be_verified'): 0,
-                   _('attachment_due'): 0,
-                   _('verified'): 0,
-                   _('inactive'): 0,
-                   _('other_status'): 0,
-                   }
-                key = state if _(state) in currow else 'other_status'
-                currow[_(key)] += 1
-                outevo.append(currow);
+        outevo = self._get_evolution(
+            "Worksheet", bc, 'getDepartmentUIDs', cookie_dep_uid,
+            ['open', 'to_be_verified', 'attachment_due', 'verified'])
 
         out.append({'type':         'bar-chart-panel',
                     'name':         _('Evolution of Worksheets'),
@@ -478,31 +358,26 @@ class DashboardView(BrowserView):
         filtering_allowed=self.context.bika_setup.getAllowDepartmentFiltering()
         cookie_dep_uid = self.request.get('filter_by_department_info', '').split(',') if filtering_allowed else ''
 
-        query_dic = {'portal_type':"Analysis",
-                 'created':self.date_range,
-                 'cancellation_state':['active']}
-        if filtering_allowed:
-            query_dic['getDepartmentUID'] = { "query":cookie_dep_uid,"operator":"or" }
-        numans = len(bac(query_dic))
-
-        query_dic = {'portal_type':"Analysis",
-                 'created':self.base_date_range,
-                 'review_state':active_rs,
-                 'cancellation_state':['active']}
+        query_dic = {'portal_type':"Analysis"}
         if filtering_allowed:
             query_dic['getDepartmentUID'] = { "query":cookie_dep_uid,"operator":"or" }
-        numans += len(bac(query_dic))
-
-        # Analyses pending
+        numans = catalogcount.count(bac, dict(query_dic,
+                                              created=self.date_range,
+                                              cancellation_state=['active']))
+        numans += catalogcount.count(bac, dict(query_dic,
+                                               created=self.base_date_range,
+                                               review_state=active_rs,
+                                               cancellation_state=['active']))
+
+        # Number of analyses in each review state, counted at once
         review_state = ['sample_received',
                         'assigned',
                         'attachment_due',
                         'to_be_verified']
-        query_dic = {'portal_type':"Analysis",
-                 'review_state':review_state}
-        if filtering_allowed:
-            query_dic['getDepartmentUID'] = { "query":cookie_dep_uid,"operator":"or" }
-        ans = len(bac(query_dic))
+        ans_by_state = catalogcount.count_by(bac, query_dic, 'review_state', review_state)
+
+        # Analyses pending
+        ans = sum(ans_by_state.values())
         ratio = (float(ans)/float(numans))*100 if ans > 0 and numans > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("Analyses pending")
@@ -516,12 +391,7 @@ class DashboardView(BrowserView):
                     'link':         self.portal_url + '/aggregatedanalyses'})
 
         # Analyses to be verified
-        review_state = ['to_be_verified', ]
-        query_dic = {'portal_type':"Analysis",
-                 'review_state':review_state}
-        if filtering_allowed:
-            query_dic['getDepartmentUID'] = { "query":cookie_dep_uid,"operator":"or" }
-        ans = len(bac(query_dic))
+        ans = ans_by_state['to_be_verified']
         ratio = (float(ans)/float(numans))*100 if ans > 0 and numans > 0 else 0
         ratio = str("%%.%sf" % 1) % ratio
         msg = _("To be verified")
@@ -534,45 +404,11 @@ class DashboardView(BrowserView):
                     'legend':       _('of') + " " + str(numans) + ' (' + ratio +'%)',
                     'link':         self.portal_url + '/worksheets?list_review_state=to_be_verified'})
 
-        # Chart with the evolution of WSs over a period, grouped by
+        # Chart with the evolution of Analyses over a period, grouped by
         # periodicity
-        workflow = getToolByName(self.context, 'portal_workflow')
-        query_dic = {'portal_type':"Analysis",
-                 'sort_on':"created",
-                 "created":self.min_date_range}
-        if filtering_allowed:
-            query_dic['getDepartmentUID'] = { "query":cookie_dep_uid,"operator":"or" }
-        allans = bac(query_dic)
-        outevo = []
-        for an in allans:
-            an = an.getObject()
-            state = 'other_status'
-            try:
-                state = workflow.getInfoFor(an, 'cancellation_state')
-                if (state == 'active'):
-                    state = workflow.getInfoFor(an, 'review_state')
-                else:
-                    state = 'inactive'
-            except:
-                pass
-
-            created = self._getDateStr(self.periodicity, an.created())
-
-            if (len(outevo) > 0 and outevo[-1]['date'] == created):
-                key = state if _(state) in outevo[-1] else 'other_status'
-                outevo[-1][_(key)] += 1
-            else:
-                currow = {'date': created,
-                   _('assigned'): 0,
-                   _('to_be_verified'): 0,
-                   _('attachment_due'): 0,
-                   _('verified'): 0,
-                   _('inactive'): 0,
-                   _('other_status'): 0,
-                   }
-                key = state if _(state) in currow else 'other_status'
-                currow[_(key)] += 1
-                outevo.append(currow)
+        outevo = self._get_evolution(
+            "Analysis", bac, 'getDepartmentUID', cookie_dep_uid,
+            ['assigned', 'to_be_verified', 'attachment_due', 'verified'])
 
         out.append({'type':         'bar-chart-panel',
                     'name':         _('Evolution of Analyses'),
@@ -583,6 +419,63 @@ class DashboardView(BrowserView):
                 'title': _('Analyses'),
                 'panels': out}
 
+    def _get_evolution(self, portal_type, catalog, department_index,
+                       department_uids, states, aliases=None):
+        """ Returns the rows of an evolution chart: the number of objects
+            of the portal type created within the min date range, grouped
+            by periodicity and state.
+            The numbers are read from the state counters. The catalog is
+            only searched when filtering by department or when the counters
+            were not built yet, using the indexed data of the brains.
+        """
+        aliases = aliases or {}
+        if department_uids or statecounters.get_storage() is None:
+            counts = self._get_catalog_counts(
+                portal_type, catalog, department_index, department_uids)
+        else:
+            counts = statecounters.get_counts(
+                portal_type, self.min_date, self.date_to)
+
+        outevo = []
+        for day, state, number in counts:
+            created = self._getDateStr(self.periodicity, DateTime(day))
+            state = aliases.get(state, state)
+            if len(outevo) == 0 or outevo[-1]['date'] != created:
+                currow = {'date': created,
+                          _('inactive'): 0,
+                          _('other_status'): 0}
+                for column in states:
+                    currow[_(column)] = 0
+                outevo.append(currow)
+            key = state if state and _(state) in outevo[-1] else 'other_status'
+            outevo[-1][_(key)] += number
+        return outevo
+
+    def _get_catalog_counts(self, portal_type, catalog, department_index,
+                            department_uids):
+        """ Returns (day, state, 1) tuples for the objects of the portal
+            type created within the min date range, sorted by creation
+        """
+        query_dic = {'portal_type': portal_type,
+                     'sort_on': "created",
+                     'created': self.min_date_range}
+        if department_uids:
+            query_dic[department_index] = {"query": department_uids,
+                                           "operator": "or"}
+        for brain in catalog(query_dic):
+            day = statecounters.get_indexed_day(catalog, brain)
+            if day is None:
+                continue
+            state = statecounters.get_state(
+                brain.review_state, getattr(brain, 'cancellation_state', None))
+            yield day, state, 1
+
+    def rebuild_counters(self):
+        """ Rebuild the counters the evolution charts are read from
+        """
+        storage = statecounters.rebuild_counters()
+        return "Dashboard: %s state counters rebuilt" % len(storage)
+
     def _getDateStr(self, period, created):
         if period == 'y':
             created = created.year()
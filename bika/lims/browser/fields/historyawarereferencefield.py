@@ -18,11 +18,27 @@ import sys
 from Products.CMFEditions.Permissions import SaveNewVersion
 from Products.CMFEditions.Permissions import AccessPreviousVersions
 from Products.Archetypes.config import REFERENCE_CATALOG
+from Acquisition import aq_base, aq_inner, aq_parent
 from bika.lims import bikaMessageFactory as _
+from bika.lims.cache import LRUCache
+from bika.lims.cache import get_request_cache
 from bika.lims.utils import t
 from bika.lims import logger
 from bika.lims.utils import to_utf8
 
+# Process wide cache of retrieved revisions, keyed by (UID, version_id).
+# Retrieving a revision unpickles it from the repository, which is expensive.
+revision_cache = LRUCache(maxsize=500)
+
+# Request annotation key for the memo of resolved references
+REQUEST_CACHE_KEY = "bika.lims.historyawarereferencefield"
+
+
+def invalidate_revisions(uid):
+    """Drop all the cached revisions of the object with the given UID
+    """
+    revision_cache.invalidate(predicate=lambda key: key[0] == uid)
+
 
 class HistoryAwareReferenceField(ReferenceField):
     """ Version aware references.
@@ -125,23 +141,77 @@ class HistoryAwareReferenceField(ReferenceField):
             #e.g. if i want to store the reference UIDs into an SQL field
             ObjectField.set(self, instance, self.getRaw(instance), **kwargs)
 
+        # the references changed, forget what was resolved in this request
+        memo = get_request_cache(REQUEST_CACHE_KEY)
+        for key in memo.keys():
+            if key[:2] == (instance.UID(), self.relationship):
+                del memo[key]
+
+    def _get_memo_key(self, instance):
+        """Key for the per-request memo of the resolved references.
+
+        The pinned versions are part of the key, so the memo invalidates when
+        the instance is pinned to another version of its references.
+        """
+        versions = getattr(aq_base(instance), 'reference_versions', {})
+        return (instance.UID(), self.relationship,
+                tuple(sorted(versions.items())))
+
+    def _retrieve_revision(self, instance, obj, version_id):
+        """Returns the revision `version_id` of obj, from the revisions cache
+        if possible
+        """
+        uid = obj.UID()
+        key = (uid, version_id)
+        revision = revision_cache.get(key)
+        if revision is None:
+            pr = getToolByName(instance, 'portal_repository')
+            try:
+                revision = pr._retrieve(obj,
+                                        selector=version_id,
+                                        preserve=(),
+                                        countPurged=True).object
+            except ArchivistRetrieveError:
+                return obj
+            # cache the unwrapped revision only, wrappers are request bound
+            revision = aq_base(revision)
+            revision_cache.set(key, revision)
+        return revision.__of__(aq_parent(aq_inner(obj)))
+
     security.declarePrivate('get')
 
     def get(self, instance, aslist=False, **kwargs):
         """get() returns the list of objects referenced under the relationship.
         """
+        memo = get_request_cache(REQUEST_CACHE_KEY)
+        memo_key = self._get_memo_key(instance)
+        rd = memo.get(memo_key)
+        if rd is None:
+            rd = self._resolve(instance)
+            if rd is None:
+                return []
+            memo[memo_key] = rd
+        # callers get their own copy, the memo must stay untouched
+        rd = rd.copy()
+
+        return self._format(instance, rd, aslist)
+
+    def _resolve(self, instance):
+        """Returns a dictionary of UID -> referenced object, where each object
+        is the revision the instance is pinned to
+        """
         try:
             uc = getToolByName(instance, "uid_catalog")
         except AttributeError as err:
             logger.error("AttributeError: {0}".format(err))
-            return []
+            return None
 
         try:
             res = instance.getRefs(relationship=self.relationship)
         except:
-            pass
+            res = []
 
-        pr = getToolByName(instance, 'portal_repository')
+        versions = getattr(aq_base(instance), 'reference_versions', {})
 
         rd = {}
         for r in res:
@@ -149,24 +219,20 @@ class HistoryAwareReferenceField(ReferenceField):
                 continue
             uid = r.UID()
             r = uc(UID=uid)[0].getObject()
-            if hasattr(instance, 'reference_versions') and \
-               hasattr(r, 'version_id') and \
-               uid in instance.reference_versions and \
-               instance.reference_versions[uid] != r.version_id and \
+            if hasattr(r, 'version_id') and \
+               uid in versions and \
+               versions[uid] != r.version_id and \
                r.version_id is not None:
-
-                version_id = instance.reference_versions[uid]
-                try:
-                    o = pr._retrieve(r,
-                                     selector=version_id,
-                                     preserve=(),
-                                     countPurged=True).object
-                except ArchivistRetrieveError:
-                    o = r
+                o = self._retrieve_revision(instance, r, versions[uid])
             else:
                 o = r
             rd[uid] = o
+        return rd
 
+    def _format(self, instance, rd, aslist):
+        """Returns the resolved references in the form the field is
+        configured to return them
+        """
         # singlevalued ref fields return only the object, not a list,
         # unless explicitely specified by the aslist option
 
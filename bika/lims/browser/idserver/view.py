@@ -14,6 +14,7 @@ from bika.lims import api
 from bika.lims import logger
 from bika.lims.idserver import get_config
 from bika.lims.idserver import get_current_year
+from bika.lims.idserver import rebuild_sequence_index
 from bika.lims import bikaMessageFactory as _
 from bika.lims.numbergenerator import INumberGenerator
 
@@ -90,8 +91,7 @@ class IDServerView(BrowserView):
 
     @property
     def storage(self):
-        number_generator = getUtility(INumberGenerator)
-        return number_generator.storage
+        return getUtility(INumberGenerator)
 
     def to_int(self, number, default=0):
         """Returns an integer
@@ -138,3 +138,10 @@ class IDServerView(BrowserView):
         number_generator = getUtility(INumberGenerator)
         number_generator.flush()
         return "IDServerView: Number storage flushed!"
+
+    def rebuild_index(self):
+        """ Rebuild the index of the highest sequence numbers in use, which
+            seeds the number generator keys missing in the storage
+        """
+        index = rebuild_sequence_index()
+        return "IDServerView: Sequence index rebuilt with %s keys" % len(index)
@@ -6,6 +6,7 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from Products.CMFPlone.utils import safe_unicode
+from bika.lims import api
 from bika.lims import bikaMessageFactory as _, logger
 from bika.lims.utils import t
 from bika.lims.browser.bika_listing import BikaListingView
@@ -100,42 +101,37 @@ class InstrumentMaintenanceView(BikaListingView):
     def contentsMethod(self, *args, **kw):
         return self.context.getMaintenanceTasks()
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        outitems = []
-        toshow = []
-        for man in self.context.getMaintenanceTasks():
-            toshow.append(man.UID())
-        for x in range (len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-            if obj.UID() in toshow:
-                items[x]['getType'] = safe_unicode(_(obj.getType()[0])).encode('utf-8')
-                items[x]['getDownFrom'] = obj.getDownFrom() and self.ulocalized_time(obj.getDownFrom(), long_format=1) or ''
-                items[x]['getDownTo'] = obj.getDownTo() and self.ulocalized_time(obj.getDownTo(), long_format=1) or ''
-                items[x]['getMaintainer'] = safe_unicode(_(obj.getMaintainer())).encode('utf-8')
-                items[x]['replace']['Title'] = "<a href='%s'>%s</a>" % \
-                     (items[x]['url'], safe_unicode(items[x]['Title']).encode('utf-8'))
-
-                status = obj.getCurrentState();
-                statustext = obj.getCurrentStateI18n();
-                statusimg = "";
-                if status == mstatus.CLOSED:
-                    statusimg = "instrumentmaintenance_closed.png"
-                elif status == mstatus.CANCELLED:
-                    statusimg = "instrumentmaintenance_cancelled.png"
-                elif status == mstatus.INQUEUE:
-                    statusimg = "instrumentmaintenance_inqueue.png"
-                elif status == mstatus.OVERDUE:
-                    statusimg = "instrumentmaintenance_overdue.png"
-                elif status == mstatus.PENDING:
-                    statusimg = "instrumentmaintenance_pending.png"
-
-                items[x]['replace']['getCurrentState'] = \
-                    "<img title='%s' src='%s/++resource++bika.lims.images/%s'/>" % \
-                    (statustext, self.portal_url, statusimg)
-                outitems.append(items[x])
-        return outitems
+    def before_folderitems(self):
+        self.toshow = [man.UID() for man in self.context.getMaintenanceTasks()]
+
+    def folderitem(self, obj, item, index):
+        if obj.UID() not in self.toshow:
+            return None
+        item['getType'] = safe_unicode(_(obj.getType()[0])).encode('utf-8')
+        item['getDownFrom'] = obj.getDownFrom() and self.ulocalized_time(obj.getDownFrom(), long_format=1) or ''
+        item['getDownTo'] = obj.getDownTo() and self.ulocalized_time(obj.getDownTo(), long_format=1) or ''
+        item['getMaintainer'] = safe_unicode(_(obj.getMaintainer())).encode('utf-8')
+        item['replace']['Title'] = "<a href='%s'>%s</a>" % \
+             (item['url'], safe_unicode(item['Title']).encode('utf-8'))
+
+        status = obj.getCurrentState();
+        statustext = obj.getCurrentStateI18n();
+        statusimg = "";
+        if status == mstatus.CLOSED:
+            statusimg = "instrumentmaintenance_closed.png"
+        elif status == mstatus.CANCELLED:
+            statusimg = "instrumentmaintenance_cancelled.png"
+        elif status == mstatus.INQUEUE:
+            statusimg = "instrumentmaintenance_inqueue.png"
+        elif status == mstatus.OVERDUE:
+            statusimg = "instrumentmaintenance_overdue.png"
+        elif status == mstatus.PENDING:
+            statusimg = "instrumentmaintenance_pending.png"
+
+        item['replace']['getCurrentState'] = \
+            "<img title='%s' src='%s/++resource++bika.lims.images/%s'/>" % \
+            (statustext, self.portal_url, statusimg)
+        return item
 
 class InstrumentCalibrationsView(BikaListingView):
     implements(IFolderContentsView, IViewView)
@@ -179,23 +175,18 @@ class InstrumentCalibrationsView(BikaListingView):
     def contentsMethod(self, *args, **kw):
         return self.context.getCalibrations()
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        outitems = []
-        toshow = []
-        for cal in self.context.getCalibrations():
-            toshow.append(cal.UID())
-        for x in range (len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-            if obj.UID() in toshow:
-                items[x]['getDownFrom'] = obj.getDownFrom()
-                items[x]['getDownTo'] = obj.getDownTo()
-                items[x]['getCalibrator'] = obj.getCalibrator()
-                items[x]['replace']['Title'] = "<a href='%s'>%s</a>" % \
-                     (items[x]['url'], items[x]['Title'])
-                outitems.append(items[x])
-        return outitems
+    def before_folderitems(self):
+        self.toshow = [cal.UID() for cal in self.context.getCalibrations()]
+
+    def folderitem(self, obj, item, index):
+        if obj.UID() not in self.toshow:
+            return None
+        item['getDownFrom'] = obj.getDownFrom()
+        item['getDownTo'] = obj.getDownTo()
+        item['getCalibrator'] = obj.getCalibrator()
+        item['replace']['Title'] = "<a href='%s'>%s</a>" % \
+             (item['url'], item['Title'])
+        return item
 
 class InstrumentValidationsView(BikaListingView):
     implements(IFolderContentsView, IViewView)
@@ -239,23 +230,18 @@ class InstrumentValidationsView(BikaListingView):
     def contentsMethod(self, *args, **kw):
         return self.context.getValidations()
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        outitems = []
-        toshow = []
-        for val in self.context.getValidations():
-            toshow.append(val.UID())
-        for x in range (len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-            if obj.UID() in toshow:
-                items[x]['getDownFrom'] = obj.getDownFrom()
-                items[x]['getDownTo'] = obj.getDownTo()
-                items[x]['getValidator'] = obj.getValidator()
-                items[x]['replace']['Title'] = "<a href='%s'>%s</a>" % \
-                     (items[x]['url'], items[x]['Title'])
-                outitems.append(items[x])
-        return outitems
+    def before_folderitems(self):
+        self.toshow = [val.UID() for val in self.context.getValidations()]
+
+    def folderitem(self, obj, item, index):
+        if obj.UID() not in self.toshow:
+            return None
+        item['getDownFrom'] = obj.getDownFrom()
+        item['getDownTo'] = obj.getDownTo()
+        item['getValidator'] = obj.getValidator()
+        item['replace']['Title'] = "<a href='%s'>%s</a>" % \
+             (item['url'], item['Title'])
+        return item
 
 class InstrumentScheduleView(BikaListingView):
     implements(IFolderContentsView, IViewView)
@@ -323,24 +309,18 @@ class InstrumentScheduleView(BikaListingView):
     def contentsMethod(self, *args, **kw):
         return self.context.getSchedule()
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        outitems = []
-        toshow = []
-        for sch in self.context.getSchedule():
-            toshow.append(sch.UID())
-
-        for x in range (len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-            if obj.UID() in toshow:
-                items[x]['created'] = self.ulocalized_time(obj.created())
-                items[x]['creator'] = obj.Creator()
-                items[x]['getType'] = safe_unicode(_(obj.getType()[0])).encode('utf-8')
-                items[x]['replace']['Title'] = "<a href='%s'>%s</a>" % \
-                     (items[x]['url'], items[x]['Title'])
-                outitems.append(items[x])
-        return outitems
+    def before_folderitems(self):
+        self.toshow = [sch.UID() for sch in self.context.getSchedule()]
+
+    def folderitem(self, obj, item, index):
+        if obj.UID() not in self.toshow:
+            return None
+        item['created'] = self.ulocalized_time(obj.created())
+        item['creator'] = obj.Creator()
+        item['getType'] = safe_unicode(_(obj.getType()[0])).encode('utf-8')
+        item['replace']['Title'] = "<a href='%s'>%s</a>" % \
+             (item['url'], item['Title'])
+        return item
 
 
 class InstrumentReferenceAnalysesViewView(BrowserView):
@@ -421,88 +401,94 @@ class InstrumentReferenceAnalysesView(AnalysesView):
         self.contentFilter = {'UID': asuids}
         self.anjson = {}
 
-    def folderitems(self):
-        items = AnalysesView.folderitems(self)
-        items.sort(key=itemgetter('CaptureDate'), reverse=True)
-        for i in range(len(items)):
-            obj = items[i]['obj']
-            imgtype = ""
-            if obj.portal_type == 'ReferenceAnalysis':
-                antype = QCANALYSIS_TYPES.getValue(obj.getReferenceType())
-                if obj.getReferenceType() == 'c':
-                    imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/control.png'/>&nbsp;" % (antype, self.context.absolute_url())
-                if obj.getReferenceType() == 'b':
-                    imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/blank.png'/>&nbsp;" % (antype, self.context.absolute_url())
-                items[i]['replace']['Partition'] = "<a href='%s'>%s</a>" % (obj.aq_parent.absolute_url(), obj.aq_parent.id)
-            elif obj.portal_type == 'DuplicateAnalysis':
-                antype = QCANALYSIS_TYPES.getValue('d')
-                imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/duplicate.png'/>&nbsp;" % (antype, self.context.absolute_url())
-                items[i]['sortcode'] = '%s_%s' % (obj.getSample().id, obj.getService().getKeyword())
-            else:
-                items[i]['sortcode'] = '%s_%s' % (obj.getSample().id, obj.getService().getKeyword())
-
-            items[i]['before']['Service'] = imgtype
-
-            # Get retractions field
-            pdf = obj.getRetractedAnalysesPdfReport()
-            title = ''
-            anchor = ''
+    def folderitem(self, obj, item, index):
+        item = super(InstrumentReferenceAnalysesView, self).folderitem(
+            obj, item, index)
+        if not item:
+            return None
+        obj = api.get_object(obj)
+        imgtype = ""
+        if obj.portal_type == 'ReferenceAnalysis':
+            antype = QCANALYSIS_TYPES.getValue(obj.getReferenceType())
+            if obj.getReferenceType() == 'c':
+                imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/control.png'/>&nbsp;" % (antype, self.context.absolute_url())
+            if obj.getReferenceType() == 'b':
+                imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/blank.png'/>&nbsp;" % (antype, self.context.absolute_url())
+            item['replace']['Partition'] = "<a href='%s'>%s</a>" % (obj.aq_parent.absolute_url(), obj.aq_parent.id)
+        elif obj.portal_type == 'DuplicateAnalysis':
+            antype = QCANALYSIS_TYPES.getValue('d')
+            imgtype = "<img title='%s' src='%s/++resource++bika.lims.images/duplicate.png'/>&nbsp;" % (antype, self.context.absolute_url())
+            item['sortcode'] = '%s_%s' % (obj.getSample().id, obj.getService().getKeyword())
+        else:
+            item['sortcode'] = '%s_%s' % (obj.getSample().id, obj.getService().getKeyword())
+
+        item['before']['Service'] = imgtype
+
+        # Get retractions field
+        pdf = obj.getRetractedAnalysesPdfReport()
+        title = ''
+        anchor = ''
+        try:
+            if pdf:
+                filesize = 0
+                title = _('Retractions')
+                anchor = "<a class='pdf' target='_blank' href='%s/at_download/RetractedAnalysesPdfReport'>%s</a>" % \
+                         (obj.absolute_url(), _("Retractions"))
+                filesize = pdf.get_size()
+                filesize = filesize / 1024 if filesize > 0 else 0
+        except:
+            # POSKeyError: 'No blob file'
+            # Show the record, but not the link
+            title = _('Retraction report unavailable')
+            anchor = title
+        item['Retractions'] = title
+        item['replace']['Retractions'] = anchor
+
+        # Create json
+        qcid = obj.aq_parent.id;
+        serviceref = "%s (%s)" % (item['Service'], item['Keyword'])
+        trows = self.anjson.get(serviceref, {});
+        anrows = trows.get(qcid, []);
+        anid = '%s.%s' % (item['getReferenceAnalysesGroupID'],
+                          item['id'])
+
+        rr = obj.aq_parent.getResultsRangeDict()
+        uid = obj.getServiceUID()
+        if uid in rr:
+            specs = rr[uid];
             try:
-                if pdf:
-                    filesize = 0
-                    title = _('Retractions')
-                    anchor = "<a class='pdf' target='_blank' href='%s/at_download/RetractedAnalysesPdfReport'>%s</a>" % \
-                             (obj.absolute_url(), _("Retractions"))
-                    filesize = pdf.get_size()
-                    filesize = filesize / 1024 if filesize > 0 else 0
+                smin  = float(specs.get('min', 0))
+                smax = float(specs.get('max', 0))
+                error  = float(specs.get('error', 0))
+                target = float(specs.get('result', 0))
+                result = float(item['Result'])
+                error_amount = ((target / 100) * error) if target > 0 else 0
+                upper  = smax + error_amount
+                lower   = smin - error_amount
+
+                anrow = { 'date': item['CaptureDate'],
+                          'min': smin,
+                          'max': smax,
+                          'target': target,
+                          'error': error,
+                          'erroramount': error_amount,
+                          'upper': upper,
+                          'lower': lower,
+                          'result': result,
+                          'unit': item['Unit'],
+                          'id': item['uid'] }
+                anrows.append(anrow);
+                trows[qcid] = anrows;
+                self.anjson[serviceref] = trows
             except:
-                # POSKeyError: 'No blob file'
-                # Show the record, but not the link
-                title = _('Retraction report unavailable')
-                anchor = title
-            items[i]['Retractions'] = title
-            items[i]['replace']['Retractions'] = anchor
-
-
-            # Create json
-            qcid = obj.aq_parent.id;
-            serviceref = "%s (%s)" % (items[i]['Service'], items[i]['Keyword'])
-            trows = self.anjson.get(serviceref, {});
-            anrows = trows.get(qcid, []);
-            anid = '%s.%s' % (items[i]['getReferenceAnalysesGroupID'],
-                              items[i]['id'])
-
-            rr = obj.aq_parent.getResultsRangeDict()
-            uid = obj.getServiceUID()
-            if uid in rr:
-                specs = rr[uid];
-                try:
-                    smin  = float(specs.get('min', 0))
-                    smax = float(specs.get('max', 0))
-                    error  = float(specs.get('error', 0))
-                    target = float(specs.get('result', 0))
-                    result = float(items[i]['Result'])
-                    error_amount = ((target / 100) * error) if target > 0 else 0
-                    upper  = smax + error_amount
-                    lower   = smin - error_amount
-
-                    anrow = { 'date': items[i]['CaptureDate'],
-                              'min': smin,
-                              'max': smax,
-                              'target': target,
-                              'error': error,
-                              'erroramount': error_amount,
-                              'upper': upper,
-                              'lower': lower,
-                              'result': result,
-                              'unit': items[i]['Unit'],
-                              'id': items[i]['uid'] }
-                    anrows.append(anrow);
-                    trows[qcid] = anrows;
-                    self.anjson[serviceref] = trows
-                except:
-                    pass
+                pass
 
+        return item
+
+    def after_folderitems(self, items):
+        items = super(InstrumentReferenceAnalysesView, self).after_folderitems(
+            items)
+        items.sort(key=itemgetter('CaptureDate'), reverse=True)
         return items
 
     def get_analyses_json(self):
@@ -580,55 +566,53 @@ class InstrumentCertificationsView(BikaListingView):
         self.catalog = 'portal_catalog'
         self.contentFilter = {'UID': uids, 'sort_on': 'sortable_title'}
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        valid  = [c.UID() for c in self.context.getValidCertifications()]
+    def before_folderitems(self):
+        self.valid = [c.UID() for c in self.context.getValidCertifications()]
         latest = self.context.getLatestValidCertification()
-        latest = latest.UID() if latest else ''
-        for x in range (len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-           # items[x]['getAgency'] = obj.getAgency()
-            items[x]['getDate'] = self.ulocalized_time(obj.getDate(), long_format=0)
-            items[x]['getValidFrom'] = self.ulocalized_time(obj.getValidFrom(), long_format=0)
-            items[x]['getValidTo'] = self.ulocalized_time(obj.getValidTo(), long_format=0)
-            items[x]['replace']['Title'] = "<a href='%s'>%s</a>" % \
-                 (items[x]['url'], items[x]['Title'])
-            if obj.getInternal() == True:
-                items[x]['replace']['getAgency'] = ""
-                items[x]['state_class'] = '%s %s' % (items[x]['state_class'], 'internalcertificate')
-
-            items[x]['getDocument'] = ""
-            items[x]['replace']['getDocument'] = ""
-            try:
-                doc = obj.getDocument()
-                if doc and doc.get_size() > 0:
-                    anchor = "<a href='%s/at_download/Document'>%s</a>" % \
-                            (obj.absolute_url(), doc.filename)
-                    items[x]['getDocument'] = doc.filename
-                    items[x]['replace']['getDocument'] = anchor
-            except:
-                # POSKeyError: 'No blob file'
-                # Show the record, but not the link
-                title = _('Not available')
-                items[x]['getDocument'] = _('Not available')
-                items[x]['replace']['getDocument'] = _('Not available')
-
-            uid = obj.UID()
-            if uid in valid:
-                # Valid calibration.
-                items[x]['state_class'] = '%s %s' % (items[x]['state_class'], 'active')
-            elif uid == latest:
-                # Latest valid certificate
-                img = "<img title='%s' src='%s/++resource++bika.lims.images/exclamation.png'/>&nbsp;" \
-                % (t(_('Out of date')), self.portal_url)
-                items[x]['replace']['getValidTo'] = '%s %s' % (items[x]['getValidTo'], img)
-                items[x]['state_class'] = '%s %s' % (items[x]['state_class'], 'inactive outofdate')
-            else:
-                # Old and further calibrations
-                items[x]['state_class'] = '%s %s' % (items[x]['state_class'], 'inactive')
+        self.latest = latest.UID() if latest else ''
+
+    def folderitem(self, obj, item, index):
+        # item['getAgency'] = obj.getAgency()
+        item['getDate'] = self.ulocalized_time(obj.getDate(), long_format=0)
+        item['getValidFrom'] = self.ulocalized_time(obj.getValidFrom(), long_format=0)
+        item['getValidTo'] = self.ulocalized_time(obj.getValidTo(), long_format=0)
+        item['replace']['Title'] = "<a href='%s'>%s</a>" % \
+             (item['url'], item['Title'])
+        if obj.getInternal() == True:
+            item['replace']['getAgency'] = ""
+            item['state_class'] = '%s %s' % (item['state_class'], 'internalcertificate')
+
+        item['getDocument'] = ""
+        item['replace']['getDocument'] = ""
+        try:
+            doc = obj.getDocument()
+            if doc and doc.get_size() > 0:
+                anchor = "<a href='%s/at_download/Document'>%s</a>" % \
+                        (obj.absolute_url(), doc.filename)
+                item['getDocument'] = doc.filename
+                item['replace']['getDocument'] = anchor
+        except:
+            # POSKeyError: 'No blob file'
+            # Show the record, but not the link
+            title = _('Not available')
+            item['getDocument'] = _('Not available')
+            item['replace']['getDocument'] = _('Not available')
+
+        uid = obj.UID()
+        if uid in self.valid:
+            # Valid calibration.
+            item['state_class'] = '%s %s' % (item['state_class'], 'active')
+        elif uid == self.latest:
+            # Latest valid certificate
+            img = "<img title='%s' src='%s/++resource++bika.lims.images/exclamation.png'/>&nbsp;" \
+            % (t(_('Out of date')), self.portal_url)
+            item['replace']['getValidTo'] = '%s %s' % (item['getValidTo'], img)
+            item['state_class'] = '%s %s' % (item['state_class'], 'inactive outofdate')
+        else:
+            # Old and further calibrations
+            item['state_class'] = '%s %s' % (item['state_class'], 'inactive')
 
-        return items
+        return item
 
 
 class InstrumentMultifileView(MultifileView):
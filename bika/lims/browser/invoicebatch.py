@@ -76,38 +76,38 @@ class InvoiceBatchInvoicesView(BikaListingView):
     def getInvoices(self, contentFilter):
         return self.context.objectValues('Invoice')
 
-    def folderitems(self, full_objects=False):
-        currency = currency_format(self.context, 'en')
+    def before_folderitems(self):
+        self.currency = currency_format(self.context, 'en')
         self.show_all = True
         self.contentsMethod = self.getInvoices
-        items = BikaListingView.folderitems(self, full_objects)
-        for item in items:
-            obj = item['obj']
-            item['replace']['id'] = \
-                "<a href='%s'>%s</a>" % (item['url'], obj.getId())
 
-            client = obj.getClient()
-            if client:
-                item['client'] = client.Title()
-                item['replace']['client'] = "<a href='%s'>%s</a>" % (
-                    (client.absolute_url(), client.Title()))
-                item['email'] = client.getEmailAddress()
-                item['replace']['email'] = "<a href='%s'>%s</a>" % (
-                    'mailto:%s' % client.getEmailAddress(),
-                    client.getEmailAddress())
-                item['phone'] = client.getPhone()
-            else:
-                item['client'] = ''
-                item['email'] = ''
-                item['phone'] = ''
-            item['Created'] = self.ulocalized_time(obj.created())
-            item['invoicedate'] = self.ulocalized_time(obj.getInvoiceDate())
-            item['startdate'] = self.ulocalized_time(obj.getBatchStartDate())
-            item['enddate'] = self.ulocalized_time(obj.getBatchEndDate())
-            item['subtotal'] = currency(obj.getSubtotal())
-            item['vatamount'] = currency(obj.getVATAmount())
-            item['total'] = currency(obj.getTotal())
-        return items
+    def folderitem(self, obj, item, index):
+        currency = self.currency
+        item['replace']['id'] = \
+            "<a href='%s'>%s</a>" % (item['url'], obj.getId())
+
+        client = obj.getClient()
+        if client:
+            item['client'] = client.Title()
+            item['replace']['client'] = "<a href='%s'>%s</a>" % (
+                (client.absolute_url(), client.Title()))
+            item['email'] = client.getEmailAddress()
+            item['replace']['email'] = "<a href='%s'>%s</a>" % (
+                'mailto:%s' % client.getEmailAddress(),
+                client.getEmailAddress())
+            item['phone'] = client.getPhone()
+        else:
+            item['client'] = ''
+            item['email'] = ''
+            item['phone'] = ''
+        item['Created'] = self.ulocalized_time(obj.created())
+        item['invoicedate'] = self.ulocalized_time(obj.getInvoiceDate())
+        item['startdate'] = self.ulocalized_time(obj.getBatchStartDate())
+        item['enddate'] = self.ulocalized_time(obj.getBatchEndDate())
+        item['subtotal'] = currency(obj.getSubtotal())
+        item['vatamount'] = currency(obj.getVATAmount())
+        item['total'] = currency(obj.getTotal())
+        return item
 
 
 class BatchFolderExportCSV(InvoiceBatchInvoicesView):
@@ -72,16 +72,12 @@ class InvoiceFolderContentsView(BikaListingView):
         return [ib for ib in values if
                 wf.getInfoFor(ib, 'cancellation_state') == desired_state]
 
-    def folderitems(self):
+    def before_folderitems(self):
         self.contentsMethod = self.getInvoiceBatches
-        items = BikaListingView.folderitems(self)
-        for x, item in enumerate(items):
-            if 'obj' not in item:
-                continue
-            obj = item['obj']
-            title_link = "<a href='%s'>%s</a>" % (item['url'], item['title'])
-            items[x]['replace']['title'] = title_link
-            items[x]['start'] = self.ulocalized_time(obj.getBatchStartDate())
-            items[x]['end'] = self.ulocalized_time(obj.getBatchEndDate())
 
-        return items
+    def folderitem(self, obj, item, index):
+        title_link = "<a href='%s'>%s</a>" % (item['url'], item['title'])
+        item['replace']['title'] = title_link
+        item['start'] = self.ulocalized_time(obj.getBatchStartDate())
+        item['end'] = self.ulocalized_time(obj.getBatchEndDate())
+        return item
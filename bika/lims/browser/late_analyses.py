@@ -70,49 +70,45 @@ class LateAnalysesView(BikaListingView):
              },
         ]
 
-    def folderitems(self):
-        items = super(LateAnalysesView, self).folderitems()
+    def before_folderitems(self):
         mtool = getToolByName(self.context, 'portal_membership')
         member = mtool.getAuthenticatedMember()
         roles = member.getRoles()
-        hideclientlink = 'RegulatoryInspector' in roles \
+        self.hideclientlink = 'RegulatoryInspector' in roles \
             and 'Manager' not in roles \
             and 'LabManager' not in roles \
             and 'LabClerk' not in roles
 
-        for x in range(len(items)):
-            if not items[x].has_key('obj'):
-                continue
-            obj = items[x]['obj']
-            ar = obj.aq_parent
-            sample = ar.getSample()
-            client = ar.aq_parent
-            contact = ar.getContact()
-            items[x]['Analysis'] = obj.Title()
-            items[x]['RequestID'] = ''
-            items[x]['replace']['RequestID'] = "<a href='%s'>%s</a>" % \
-                 (ar.absolute_url(), ar.Title())
-            items[x]['Client'] = ''
-            if hideclientlink == False:
-                items[x]['replace']['Client'] = "<a href='%s'>%s</a>" % \
-                     (client.absolute_url(), client.Title())
-            items[x]['Contact'] = ''
-            if contact:
-                items[x]['replace']['Contact'] = "<a href='mailto:%s'>%s</a>" % \
-                                                 (contact.getEmailAddress(),
-                                                  contact.getFullname())
-            items[x]['DateReceived'] = self.ulocalized_time(sample.getDateReceived())
-            items[x]['DueDate'] = self.ulocalized_time(obj.getDueDate())
+    def folderitem(self, obj, item, index):
+        ar = obj.aq_parent
+        sample = ar.getSample()
+        client = ar.aq_parent
+        contact = ar.getContact()
+        item['Analysis'] = obj.Title()
+        item['RequestID'] = ''
+        item['replace']['RequestID'] = "<a href='%s'>%s</a>" % \
+             (ar.absolute_url(), ar.Title())
+        item['Client'] = ''
+        if self.hideclientlink == False:
+            item['replace']['Client'] = "<a href='%s'>%s</a>" % \
+                 (client.absolute_url(), client.Title())
+        item['Contact'] = ''
+        if contact:
+            item['replace']['Contact'] = "<a href='mailto:%s'>%s</a>" % \
+                                         (contact.getEmailAddress(),
+                                          contact.getFullname())
+        item['DateReceived'] = self.ulocalized_time(sample.getDateReceived())
+        item['DueDate'] = self.ulocalized_time(obj.getDueDate())
 
-            late = DateTime() - obj.getDueDate()
-            days = int(late / 1)
-            hours = int((late % 1 ) * 24)
-            mins = int((((late % 1) * 24) % 1) * 60)
-            late_str = days and "%s day%s" % (days, days > 1 and 's' or '') or ""
-            if days < 2:
-                late_str += hours and " %s hour%s" % (hours, hours > 1 and 's' or '') or ""
-            if not days and not hours:
-                late_str = "%s min%s" % (mins, mins > 1 and 's' or '')
+        late = DateTime() - obj.getDueDate()
+        days = int(late / 1)
+        hours = int((late % 1 ) * 24)
+        mins = int((((late % 1) * 24) % 1) * 60)
+        late_str = days and "%s day%s" % (days, days > 1 and 's' or '') or ""
+        if days < 2:
+            late_str += hours and " %s hour%s" % (hours, hours > 1 and 's' or '') or ""
+        if not days and not hours:
+            late_str = "%s min%s" % (mins, mins > 1 and 's' or '')
 
-            items[x]['Late'] = late_str
-        return items
+        item['Late'] = late_str
+        return item
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import json
+
+from bika.lims import mailqueue
+from bika.lims.browser import BrowserView
+
+
+class MailQueueView(BrowserView):
+    """Delivery status of the queued emails, as JSON
+
+    With an id in the request, the status of that message is returned.
+    Otherwise the number of messages by status and the messages not sent yet
+    are listed.
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        storage = mailqueue.get_storage() or {}
+        mail_id = self.request.form.get("id")
+        if mail_id:
+            mail = storage.get(mail_id)
+            if mail is None:
+                self.request.response.setStatus(404)
+                return json.dumps({"error": "Message not found"})
+            return json.dumps(mail.to_dict())
+
+        counts = {}
+        pending = []
+        for mail in storage.values():
+            counts[mail.status] = counts.get(mail.status, 0) + 1
+            if mail.status != mailqueue.SENT:
+                pending.append(mail.to_dict())
+        return json.dumps({"counts": counts, "pending": pending})
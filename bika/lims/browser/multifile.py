@@ -59,24 +59,19 @@ class MultifileView(BikaListingView):
                          'FileDownload']},
         ]
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        outitems = []
-        toshow = []
-        for val in self.context.getDocuments():
-            toshow.append(val.UID())
-        for x in range (len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-            if obj.UID() in toshow:
-                items[x]['replace']['DocumentID'] = "<a href='%s'>%s</a>" % \
-                    (items[x]['url'], items[x]['DocumentID'])
-                items[x]['FileDownload'] = obj.getFile().filename
-                filename = obj.getFile().filename if obj.getFile().filename != '' else 'File'
-                items[x]['replace']['FileDownload'] = "<a href='%s'>%s</a>" % \
-                    (obj.getFile().absolute_url_path(), filename)
-                items[x]['DocumentVersion'] = obj.getDocumentVersion()
-                items[x]['DocumentLocation'] = obj.getDocumentLocation()
-                items[x]['DocumentType'] = obj.getDocumentType()
-                outitems.append(items[x])
-        return outitems
+    def before_folderitems(self):
+        self.toshow = [val.UID() for val in self.context.getDocuments()]
+
+    def folderitem(self, obj, item, index):
+        if obj.UID() not in self.toshow:
+            return None
+        item['replace']['DocumentID'] = "<a href='%s'>%s</a>" % \
+            (item['url'], item['DocumentID'])
+        item['FileDownload'] = obj.getFile().filename
+        filename = obj.getFile().filename if obj.getFile().filename != '' else 'File'
+        item['replace']['FileDownload'] = "<a href='%s'>%s</a>" % \
+            (obj.getFile().absolute_url_path(), filename)
+        item['DocumentVersion'] = obj.getDocumentVersion()
+        item['DocumentLocation'] = obj.getDocumentLocation()
+        item['DocumentType'] = obj.getDocumentType()
+        return item
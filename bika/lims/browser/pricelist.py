@@ -86,18 +86,12 @@ class PricelistsView(BikaListingView):
         now = DateTime()
         return super(PricelistsView, self).__call__()
 
-    def folderitems(self):
-
-        items = BikaListingView.folderitems(self)
-        for x in range(len(items)):
-            if 'obj' not in items[x]:
-                continue
-            items[x]['replace']['Title'] = "<a href='%s'>%s</a>" % \
-                 (items[x]['url'], items[x]['Title'])
-            items[x]['getEffectiveDate'] = self.ulocalized_time(items[x]['obj'].getEffectiveDate())
-            items[x]['getExpirationDate'] = self.ulocalized_time(items[x]['obj'].getExpirationDate())
-
-        return items
+    def folderitem(self, obj, item, index):
+        item['replace']['Title'] = "<a href='%s'>%s</a>" % \
+             (item['url'], item['Title'])
+        item['getEffectiveDate'] = self.ulocalized_time(obj.getEffectiveDate())
+        item['getExpirationDate'] = self.ulocalized_time(obj.getExpirationDate())
+        return item
 
 
 class PricelistView(BrowserView):
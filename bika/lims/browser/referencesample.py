@@ -191,7 +191,7 @@ class ReferenceAnalysesView(AnalysesView):
             smax = float(specs.get('max', 0))
             error = float(specs.get('error', 0))
             target = float(specs.get('result', 0))
-            result = float(item['Result'])
+            result = float(analysis.getResult())
             error_amount = ((target / 100) * error) if target > 0 else 0
             upper = smax + error_amount
             lower = smin - error_amount
@@ -8,12 +8,16 @@
 import json
 
 from Products.CMFPlone.utils import _createObjectByType
+from bika.lims import api
 from bika.lims import bikaMessageFactory as _
+from bika.lims import reportjobs
 from bika.lims.utils import isAttributeHidden
 from bika.lims.browser import BrowserView
 from bika.lims.browser.bika_listing import BikaListingView
 from bika.lims.browser.reports.selection_macros import SelectionMacrosView
 from bika.lims.utils import createPdf
+from bika.lims.utils import t
+from bika.lims.utils.export import stream_rows
 from bika.lims.utils import getUsers, logged_in_client
 from bika.lims.utils import to_unicode as _u
 from bika.lims.utils import to_utf8 as _c
@@ -26,6 +30,7 @@ from Products.CMFCore.utils import getToolByName
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from zope.component import getAdapters
 from zope.interface import implements
+import itertools
 import os
 import plone
 
@@ -175,31 +180,24 @@ class ReportHistoryView(BikaListingView):
         else:
             return name
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        props = self.context.portal_properties.site_properties
-        for x in range(len(items)):
-            if 'obj' not in items[x]:
-                continue
-            obj = items[x]['obj']
-            obj_url = obj.absolute_url()
-            file = obj.getReportFile()
-            icon = file.icon
-
-            items[x]['Client'] = ''
-            client = obj.getClient()
-            if client:
-                items[x]['replace']['Client'] = "<a href='%s'>%s</a>" % \
-                                                (client.absolute_url(),
-                                                 client.Title())
-            items[x]['FileSize'] = '%sKb' % (file.get_size() / 1024)
-            items[x]['Created'] = self.ulocalized_time(obj.created())
-            items[x]['By'] = self.user_fullname(obj.Creator())
-
-            items[x]['replace']['Title'] = \
-                "<a href='%s/at_download/ReportFile'>%s</a>" % \
-                (obj_url, items[x]['Title'])
-        return items
+    def folderitem(self, obj, item, index):
+        obj_url = obj.absolute_url()
+        file = obj.getReportFile()
+
+        item['Client'] = ''
+        client = obj.getClient()
+        if client:
+            item['replace']['Client'] = "<a href='%s'>%s</a>" % \
+                                        (client.absolute_url(),
+                                         client.Title())
+        item['FileSize'] = '%sKb' % (file.get_size() / 1024)
+        item['Created'] = self.ulocalized_time(obj.created())
+        item['By'] = self.user_fullname(obj.Creator())
+
+        item['replace']['Title'] = \
+            "<a href='%s/at_download/ReportFile'>%s</a>" % \
+            (obj_url, item['Title'])
+        return item
 
 
 class SubmitForm(BrowserView):
@@ -230,6 +228,72 @@ class SubmitForm(BrowserView):
             self.context.plone_utils.addPortalMessage(message, 'error')
             return self.template()
 
+        Report = self.get_report_class(report_id)
+        if Report is None:
+            return self.template()
+
+        if self.request.get('output_format', '') == reportjobs.JOB_FORMAT:
+            return self.submit_job(report_id)
+
+        self.setup_report()
+
+        # Report must return dict with:
+        # - report_title - title string for pdf/history listing
+        # - report_data - rendered report
+        report_view = Report(self.context, self.request)
+        output = report_view()
+
+        # if CSV output is chosen, report returns None
+        if not output:
+            return
+
+        if type(output) in (str, unicode, bytes):
+            # remove temporary files
+            for f in self.request['to_remove']:
+                os.remove(f)
+            return output
+
+        if self.request.get('output_format', '') == 'XLSX':
+            return self.export_report(report_view, output)
+
+        result, report = self.store_report(output)
+
+        if result:
+            fn = "%s - %s" % (self.date.strftime(self.date_format_short),
+                              _u(output['report_title']))
+
+            setheader = self.request.RESPONSE.setHeader
+            setheader('Content-Type', 'application/pdf')
+            setheader("Content-Disposition",
+                      "attachment;filename=\"%s\"" % _c(fn))
+            self.request.RESPONSE.write(result)
+
+        return
+
+    def get_report_class(self, report_id):
+        """Returns the Report view class of the report, or None if the report
+        module can't be imported
+        """
+        if "report_module" in self.request:
+            module = self.request["report_module"]
+        else:
+            module = "bika.lims.browser.reports.%s" % report_id
+        try:
+            exec ("from %s import Report" % module)
+            # required during error redirect: the report must have a copy of
+            # additional_reports, because it is used as a surrogate view.
+            Report.additional_reports = self.additional_reports
+        except ImportError:
+            message = "Report %s.Report not found (shouldn't happen)" % module
+            self.logger.error(message)
+            self.context.plone_utils.addPortalMessage(message, 'error')
+            return None
+        return Report
+
+    def setup_report(self):
+        """Sets the reporter, laboratory and client details the report frame
+        renders
+        """
         self.date = DateTime()
         username = self.context.portal_membership.getAuthenticatedMember().getUserName()
         self.reporter = self.user_fullname(username)
@@ -253,50 +317,23 @@ class SubmitForm(BrowserView):
 
         client = logged_in_client(self.context)
         if client:
-            clientuid = client.UID()
+            self.client_uid = client.UID()
             self.client_title = client.Title()
             self.client_address = client.getPrintAddress()
         else:
-            clientuid = None
+            self.client_uid = None
             self.client_title = None
             self.client_address = None
 
-        # Render form output
-
         # the report can add file names to this list; they will be deleted
         # once the PDF has been generated.  temporary plot image files, etc.
         self.request['to_remove'] = []
 
-        if "report_module" in self.request:
-            module = self.request["report_module"]
-        else:
-            module = "bika.lims.browser.reports.%s" % report_id
-        try:
-            exec ("from %s import Report" % module)
-            # required during error redirect: the report must have a copy of
-            # additional_reports, because it is used as a surrogate view.
-            Report.additional_reports = self.additional_reports
-        except ImportError:
-            message = "Report %s.Report not found (shouldn't happen)" % module
-            self.logger.error(message)
-            self.context.plone_utils.addPortalMessage(message, 'error')
-            return self.template()
-
-        # Report must return dict with:
-        # - report_title - title string for pdf/history listing
-        # - report_data - rendered report
-        output = Report(self.context, self.request)()
-
-        # if CSV output is chosen, report returns None
-        if not output:
-            return
-
-        if type(output) in (str, unicode, bytes):
-            # remove temporary files
-            for f in self.request['to_remove']:
-                os.remove(f)
-            return output
-
+    def store_report(self, output):
+        """Renders the output of the report as a PDF and stores it as a new
+        Report object. Returns the PDF and the Report, or (None, None) if the
+        PDF could not be created
+        """
         # The report output gets pulled through report_frame.pt
         self.reportout = output['report_data']
         framed_output = self.frame_template()
@@ -308,27 +345,78 @@ class SubmitForm(BrowserView):
         for f in self.request['to_remove']:
             os.remove(f)
 
-        if result:
-            # Create new report object
-            reportid = self.aq_parent.generateUniqueId('Report')
-            report = _createObjectByType("Report", self.aq_parent, reportid)
-            report.edit(Client=clientuid)
-            report.processForm()
+        if not result:
+            return None, None
 
-            # write pdf to report object
-            report.edit(title=output['report_title'], ReportFile=result)
-            report.reindexObject()
+        # Create new report object
+        reportid = self.context.generateUniqueId('Report')
+        report = _createObjectByType("Report", self.context, reportid)
+        report.edit(Client=self.client_uid)
+        report.processForm()
 
-            fn = "%s - %s" % (self.date.strftime(self.date_format_short),
-                              _u(output['report_title']))
+        # write pdf to report object
+        report.edit(title=output['report_title'], ReportFile=result)
+        report.reindexObject()
+        return result, report
 
-            setheader = self.request.RESPONSE.setHeader
-            setheader('Content-Type', 'application/pdf')
-            setheader("Content-Disposition",
-                      "attachment;filename=\"%s\"" % _c(fn))
-            self.request.RESPONSE.write(result)
+    def export_report(self, report_view, output):
+        """Streams the lines of the report as XLSX rows instead of rendering
+        the PDF
+        """
+        for f in self.request['to_remove']:
+            os.remove(f)
+        content = getattr(report_view, 'report_content', None)
+        if not content or 'datalines' not in content:
+            message = _("This report can not be exported as a spreadsheet")
+            self.context.plone_utils.addPortalMessage(message, 'error')
+            return self.template()
 
-        return
+        header = [t(heading) for heading in
+                  content.get('formats', {}).get('col_heads', [])]
+
+        def rows():
+            # the lines may be generators that build them while streaming
+            lines = itertools.chain(content['datalines'],
+                                    content.get('footings', []))
+            for line in lines:
+                yield [cell.get('value', '') if isinstance(cell, dict)
+                       else cell for cell in line]
+
+        filename = "%s-%s" % (api.normalize_id(t(output['report_title'])),
+                              self.date.strftime("%Y%m%d%H%M"))
+        stream_rows(self.request.response, 'xlsx', filename, header, rows())
+
+    def submit_job(self, report_id):
+        """Queues the report to be generated in background and redirects to
+        the reports history, where it shows up once ready
+        """
+        plone.protect.CheckAuthenticator(self.request)
+        member = self.context.portal_membership.getAuthenticatedMember()
+        job = reportjobs.submit(self.portal, report_id, member.getId(),
+                                self.request.form)
+        message = _("The report is being generated in background. You will "
+                    "be notified by email once it is ready (job ${job_id})",
+                    mapping={'job_id': job.id})
+        self.context.plone_utils.addPortalMessage(message, 'info')
+        self.request.response.redirect(
+            "%s/history" % self.context.absolute_url())
+        return job.id
+
+
+class ReportJobStatus(BrowserView):
+    """Status, progress and timing of a report generated in background, as
+    JSON
+    """
+
+    def __call__(self):
+        self.request.response.setHeader("Content-Type", "application/json")
+        job = reportjobs.get_job(self.request.form.get("job_id", ""))
+        member = self.context.portal_membership.getAuthenticatedMember()
+        if job is None or (job.userid != member.getId() and
+                           not member.has_role("Manager")):
+            self.request.response.setStatus(404)
+            return json.dumps({"error": "Job not found"})
+        return json.dumps(job.to_dict())
 
 
 class ReferenceAnalysisQC_Samples(BrowserView):
@@ -26,7 +26,6 @@ class Report(BrowserView):
         BrowserView.__init__(self, context, request)
 
     def __call__(self):
-        bc = getToolByName(self.context, 'bika_catalog')
         self.report_content = {}
         parm_lines = {}
         parms = []
@@ -35,8 +34,6 @@ class Report(BrowserView):
         headings['subheader'] = _(
             "Published Analysis Requests which have not been invoiced")
 
-        count_all = 0
-
         query = {'portal_type': 'AnalysisRequest',
                  'getInvoiced': False,
                  'review_state': 'published',
@@ -78,13 +75,31 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        datalines = []
-        clients = {}
-        sampletypes = {}
-        samplepoints = {}
-        categories = {}
-        services = {}
+        self.report_content = {
+            'headings': headings,
+            'parms': parms,
+            'formats': formats,
+            'datalines': self.get_datalines(query),
+            'footings': self.get_footlines()}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        self.report_content['datalines'] = \
+            list(self.report_content['datalines'])
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
+
+        return {'report_title': title,
+                'report_data': self.template()}
 
+    def get_datalines(self, query):
+        """Yields the report lines, one per analysis request
+        """
+        bc = getToolByName(self.context, 'bika_catalog')
+        self.count_all = 0
         for ar_proxy in bc(query):
             ar = ar_proxy.getObject()
 
@@ -110,27 +125,18 @@ class Report(BrowserView):
             dataitem = {'value': ar.getTotalPrice()}
             dataline.append(dataitem)
 
-            datalines.append(dataline)
+            yield dataline
 
-            count_all += 1
+            self.count_all += 1
 
-        # table footer data
-        footlines = []
+    def get_footlines(self):
+        """Yields the table footer lines, once all the report lines are built
+        """
         footline = []
         footitem = {'value': _('Number of analyses retested for period'),
                     'colspan': 5,
                     'class': 'total_label'}
         footline.append(footitem)
-        footitem = {'value': count_all}
+        footitem = {'value': self.count_all}
         footline.append(footitem)
-        footlines.append(footline)
-
-        self.report_content = {
-            'headings': headings,
-            'parms': parms,
-            'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
-
-        return {'report_title': t(headings['header']),
-                'report_data': self.template()}
+        yield footline
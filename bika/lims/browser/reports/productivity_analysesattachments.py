@@ -26,7 +26,6 @@ class Report(BrowserView):
     def __call__(self):
         # get all the data into datalines
 
-        pc = getToolByName(self.context, 'portal_catalog')
         rc = getToolByName(self.context, 'reference_catalog')
         self.report_content = {}
         parms = []
@@ -35,7 +34,6 @@ class Report(BrowserView):
         headings['subheader'] = _(
             "The attachments linked to analysis requests and analyses")
 
-        count_all = 0
         query = {'portal_type': 'Attachment'}
         if 'ClientUID' in self.request.form:
             client_uid = self.request.form['ClientUID']
@@ -75,7 +73,58 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        datalines = []
+        self.report_content = {
+            'headings': headings,
+            'parms': parms,
+            'formats': formats,
+            'datalines': self.get_datalines(query),
+            'footings': self.get_footlines()}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        datalines = list(self.report_content['datalines'])
+        self.report_content['datalines'] = datalines
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
+
+        if self.request.get('output_format', '') == 'CSV':
+            import csv
+            import StringIO
+            import datetime
+
+            fieldnames = [
+                _('Request'),
+                _('File'),
+                _('Attachment type'),
+                _('Content type'),
+                _('Size'),
+                _('Loaded'),
+            ]
+            output = StringIO.StringIO()
+            dw = csv.DictWriter(output, fieldnames=fieldnames)
+            dw.writerow(dict((fn, fn) for fn in fieldnames))
+            for row in datalines:
+                dw.writerow(row)
+            report_data = output.getvalue()
+            output.close()
+            date = datetime.datetime.now().strftime("%Y%m%d%H%M")
+            setheader = self.request.RESPONSE.setHeader
+            setheader('Content-Type', 'text/csv')
+            setheader("Content-Disposition",
+                      "attachment;filename=\"analysesattachments_%s.csv\"" % date)
+            self.request.RESPONSE.write(report_data)
+        else:
+            return {'report_title': title,
+                    'report_data': self.template()}
+
+    def get_datalines(self, query):
+        """Yields the report lines, one per attachment
+        """
+        pc = getToolByName(self.context, 'portal_catalog')
+        self.count_all = 0
         attachments = pc(query)
         for a_proxy in attachments:
             attachment = a_proxy.getObject()
@@ -106,54 +155,18 @@ class Report(BrowserView):
             dataitem = {'value': self.ulocalized_time(dateloaded)}
             dataline.append(dataitem)
 
-            datalines.append(dataline)
+            yield dataline
 
-            count_all += 1
+            self.count_all += 1
 
-        # footer data
-        footlines = []
+    def get_footlines(self):
+        """Yields the footer lines, once all the report lines are built
+        """
         footline = []
         footitem = {'value': _('Total'),
                     'colspan': 5,
                     'class': 'total_label'}
         footline.append(footitem)
-        footitem = {'value': count_all}
+        footitem = {'value': self.count_all}
         footline.append(footitem)
-        footlines.append(footline)
-
-        self.report_content = {
-            'headings': headings,
-            'parms': parms,
-            'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
-
-        if self.request.get('output_format', '') == 'CSV':
-            import csv
-            import StringIO
-            import datetime
-
-            fieldnames = [
-                _('Request'),
-                _('File'),
-                _('Attachment type'),
-                _('Content type'),
-                _('Size'),
-                _('Loaded'),
-            ]
-            output = StringIO.StringIO()
-            dw = csv.DictWriter(output, fieldnames=fieldnames)
-            dw.writerow(dict((fn, fn) for fn in fieldnames))
-            for row in datalines:
-                dw.writerow(row)
-            report_data = output.getvalue()
-            output.close()
-            date = datetime.datetime.now().strftime("%Y%m%d%H%M")
-            setheader = self.request.RESPONSE.setHeader
-            setheader('Content-Type', 'text/csv')
-            setheader("Content-Disposition",
-                      "attachment;filename=\"analysesattachments_%s.csv\"" % date)
-            self.request.RESPONSE.write(report_data)
-        else:
-            return {'report_title': t(headings['header']),
-                    'report_data': self.template()}
+        yield footline
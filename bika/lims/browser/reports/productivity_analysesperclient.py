@@ -11,6 +11,7 @@ from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import bikaMessageFactory as _
 from bika.lims.utils import t
 from bika.lims.utils import formatDateQuery, formatDateParms, logged_in_client
+from bika.lims.utils import catalogcount
 from plone.app.layout.globals.interfaces import IViewView
 from zope.interface import implements
 
@@ -26,17 +27,12 @@ class Report(BrowserView):
     def __call__(self):
         # get all the data into datalines
 
-        pc = getToolByName(self.context, 'portal_catalog')
-        bac = getToolByName(self.context, 'bika_analysis_catalog')
-        bc = getToolByName(self.context, 'bika_catalog')
         rc = getToolByName(self.context, 'reference_catalog')
 
         self.report_content = {}
         parm_lines = {}
         parms = []
         headings = {}
-        count_all_ars = 0
-        count_all_analyses = 0
         query = {}
 
         this_client = logged_in_client(self.context)
@@ -107,54 +103,22 @@ class Report(BrowserView):
                                  _('Number of analyses')],
                    'class': ''}
 
-        datalines = []
-
-        if this_client:
-            c_proxies = pc(portal_type="Client", UID=this_client.UID())
-        else:
-            c_proxies = pc(portal_type="Client", sort_on='sortable_title')
-
-        for client in c_proxies:
-            query['getClientUID'] = client.UID
-            dataline = [{'value': client.Title}, ]
-            query['portal_type'] = 'AnalysisRequest'
-            ars = bc(query)
-            count_ars = len(ars)
-            dataitem = {'value': count_ars}
-            dataline.append(dataitem)
-
-            query['portal_type'] = 'Analysis'
-            analyses = bac(query)
-            count_analyses = len(analyses)
-            dataitem = {'value': count_analyses}
-            dataline.append(dataitem)
-
-            datalines.append(dataline)
-
-            count_all_analyses += count_analyses
-            count_all_ars += count_ars
-
-        # footer data
-        footlines = []
-        if not this_client:
-            footline = []
-            footitem = {'value': _('Total'),
-                        'class': 'total_label'}
-            footline.append(footitem)
-
-            footitem = {'value': count_all_ars}
-            footline.append(footitem)
-            footitem = {'value': count_all_analyses}
-            footline.append(footitem)
-
-            footlines.append(footline)
-
         self.report_content = {
             'headings': headings,
             'parms': parms,
             'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
+            'datalines': self.get_datalines(query, this_client),
+            'footings': self.get_footlines(this_client)}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        datalines = list(self.report_content['datalines'])
+        self.report_content['datalines'] = datalines
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
 
         if self.request.get('output_format', '') == 'CSV':
             import csv
@@ -185,5 +149,59 @@ class Report(BrowserView):
                       "attachment;filename=\"analysesperclient_%s.csv\"" % date)
             self.request.RESPONSE.write(report_data)
         else:
-            return {'report_title': t(headings['header']),
+            return {'report_title': title,
                     'report_data': self.template()}
+
+    def get_datalines(self, query, this_client):
+        """Yields the report lines, one per client
+        """
+        pc = getToolByName(self.context, 'portal_catalog')
+        bac = getToolByName(self.context, 'bika_analysis_catalog')
+        bc = getToolByName(self.context, 'bika_catalog')
+        self.count_all_ars = 0
+        self.count_all_analyses = 0
+
+        if this_client:
+            c_proxies = pc(portal_type="Client", UID=this_client.UID())
+        else:
+            c_proxies = pc(portal_type="Client", sort_on='sortable_title')
+
+        # Number of requests and analyses of each client, aggregated at once
+        client_uids = [client.UID for client in c_proxies]
+        ar_counts = catalogcount.aggregate(
+            bc, dict(query, portal_type='AnalysisRequest'), 'getClientUID',
+            values={'getClientUID': client_uids})
+        analysis_counts = catalogcount.aggregate(
+            bac, dict(query, portal_type='Analysis'), 'getClientUID',
+            values={'getClientUID': client_uids})
+
+        for client in c_proxies:
+            dataline = [{'value': client.Title}, ]
+            count_ars = ar_counts[client.UID]['count']
+            dataitem = {'value': count_ars}
+            dataline.append(dataitem)
+
+            count_analyses = analysis_counts[client.UID]['count']
+            dataitem = {'value': count_analyses}
+            dataline.append(dataitem)
+
+            yield dataline
+
+            self.count_all_analyses += count_analyses
+            self.count_all_ars += count_ars
+
+    def get_footlines(self, this_client):
+        """Yields the footer lines, once all the report lines are built
+        """
+        if not this_client:
+            footline = []
+            footitem = {'value': _('Total'),
+                        'class': 'total_label'}
+            footline.append(footitem)
+
+            footitem = {'value': self.count_all_ars}
+            footline.append(footitem)
+            footitem = {'value': self.count_all_analyses}
+            footline.append(footitem)
+
+            yield footline
@@ -5,11 +5,12 @@
 # Copyright 2011-2017 by it's authors.
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
-from Products.CMFCore.utils import getToolByName
+from DateTime import DateTime
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import bikaMessageFactory as _
 from bika.lims.browser import BrowserView
 from bika.lims.browser.reports.selection_macros import SelectionMacrosView
+from bika.lims.utils import catalogcount
 from plone.app.layout.globals.interfaces import IViewView
 from zope.interface import implements
 
@@ -50,8 +51,9 @@ class Report(BrowserView):
             titles.append(val['titles'])
 
         # Query the catalog and store results in a dictionary
-        analyses = self.bika_analysis_catalog(self.contentFilter)
-        if not analyses:
+        bac = self.bika_analysis_catalog
+        totalcount = catalogcount.count(bac, self.contentFilter)
+        if not totalcount:
             message = _("No analyses matched your query")
             self.context.plone_utils.addPortalMessage(message, "error")
             return self.default_template()
@@ -60,93 +62,51 @@ class Report(BrowserView):
         if (groupby != ''):
             parms.append({"title": _("Grouping period"), "value": _(groupby)})
 
+        # Number of analyses requested, performed and published per grouping
+        # period and department, aggregated from the catalog indexes. The
+        # analyses without department are grouped under '', so the
+        # department lines add up to the totals
+        performed = {'getResultCaptureDate': {'query': DateTime('1900-01-01'),
+                                              'range': 'min'}}
+        published = {'review_state': 'published'}
+        results = catalogcount.aggregate(
+            bac, self.contentFilter, ('created', 'getDepartmentUID'),
+            keys={'created': lambda value: self.get_group(groupby, value)},
+            filters={'Performed': performed, 'Published': published},
+            missing={'getDepartmentUID': ''})
+
+        departments = {}
+        for department in self.bika_setup_catalog(portal_type='Department'):
+            departments[department.UID] = department.Title
+
         datalines = {}
         footlines = {}
-        totalcount = len(analyses)
         totalpublishedcount = 0
         totalperformedcount = 0
-        for analysis in analyses:
-            analysis = analysis.getObject()
-            analysisservice = analysis.getService()
-            department = analysisservice.getDepartment()
-            department = department.Title() if department else ''
-            daterequested = analysis.created()
-
-            group = ''
-            if groupby == 'Day':
-                group = self.ulocalized_time(daterequested)
-            elif groupby == 'Week':
-                group = daterequested.strftime(
-                    "%Y") + ", " + daterequested.strftime("%U")
-            elif groupby == 'Month':
-                group = daterequested.strftime(
-                    "%B") + " " + daterequested.strftime("%Y")
-            elif groupby == 'Year':
-                group = daterequested.strftime("%Y")
-            else:
-                group = ''
-
-            dataline = {'Group': group, 'Requested': 0, 'Performed': 0,
-                        'Published': 0, 'Departments': {}}
-            deptline = {'Department': department, 'Requested': 0, 'Performed': 0,
-                        'Published': 0}
-            if (group in datalines):
-                dataline = datalines[group]
-                if (department in dataline['Departments']):
-                    deptline = dataline['Departments'][department]
-
-            grouptotalcount = dataline['Requested'] + 1
-            groupperformedcount = dataline['Performed']
-            grouppublishedcount = dataline['Published']
-
-            depttotalcount = deptline['Requested'] + 1
-            deptperformedcount = deptline['Performed']
-            deptpubishedcount = deptline['Published']
-
-            workflow = getToolByName(self.context, 'portal_workflow')
-            arstate = workflow.getInfoFor(analysis.aq_parent, 'review_state', '')
-            if (arstate == 'published'):
-                deptpubishedcount += 1
-                grouppublishedcount += 1
-                totalpublishedcount += 1
-
-            if (analysis.getResult()):
-                deptperformedcount += 1
-                groupperformedcount += 1
-                totalperformedcount += 1
-
-            group_performedrequested_ratio = float(groupperformedcount) / float(
-                grouptotalcount)
-            group_publishedperformed_ratio = groupperformedcount > 0 and float(
-                grouppublishedcount) / float(groupperformedcount) or 0
-
-            anl_performedrequested_ratio = float(deptperformedcount) / float(
-                depttotalcount)
-            anl_publishedperformed_ratio = deptperformedcount > 0 and float(
-                deptpubishedcount) / float(deptperformedcount) or 0
-
-            dataline['Requested'] = grouptotalcount
-            dataline['Performed'] = groupperformedcount
-            dataline['Published'] = grouppublishedcount
-            dataline['PerformedRequestedRatio'] = group_performedrequested_ratio
-            dataline['PerformedRequestedRatioPercentage'] = ('{0:.0f}'.format(
-                group_performedrequested_ratio * 100)) + "%"
-            dataline['PublishedPerformedRatio'] = group_publishedperformed_ratio
-            dataline['PublishedPerformedRatioPercentage'] = ('{0:.0f}'.format(
-                group_publishedperformed_ratio * 100)) + "%"
-
-            deptline['Requested'] = depttotalcount
-            deptline['Performed'] = deptperformedcount
-            deptline['Published'] = deptpubishedcount
-            deptline['PerformedRequestedRatio'] = anl_performedrequested_ratio
-            deptline['PerformedRequestedRatioPercentage'] = ('{0:.0f}'.format(
-                anl_performedrequested_ratio * 100)) + "%"
-            deptline['PublishedPerformedRatio'] = anl_publishedperformed_ratio
-            deptline['PublishedPerformedRatioPercentage'] = ('{0:.0f}'.format(
-                anl_publishedperformed_ratio * 100)) + "%"
-
-            dataline['Departments'][department] = deptline
-            datalines[group] = dataline
+        for (group, department_uid), result in results.items():
+            department = departments.get(department_uid, '')
+            dataline = datalines.get(group)
+            if dataline is None:
+                dataline = {'Group': group, 'Requested': 0, 'Performed': 0,
+                            'Published': 0, 'Departments': {}}
+                datalines[group] = dataline
+            deptline = dataline['Departments'].get(department)
+            if deptline is None:
+                deptline = {'Department': department, 'Requested': 0,
+                            'Performed': 0, 'Published': 0}
+                dataline['Departments'][department] = deptline
+
+            for line in (dataline, deptline):
+                line['Requested'] += result['count']
+                line['Performed'] += result['filters']['Performed']
+                line['Published'] += result['filters']['Published']
+            totalperformedcount += result['filters']['Performed']
+            totalpublishedcount += result['filters']['Published']
+
+        for dataline in datalines.values():
+            self.set_ratios(dataline)
+            for deptline in dataline['Departments'].values():
+                self.set_ratios(deptline)
 
         # Footer total data
         total_performedrequested_ratio = float(totalperformedcount) / float(
@@ -206,3 +166,35 @@ class Report(BrowserView):
         else:
             return {'report_title': _('Analyses summary per department'),
                     'report_data': self.template()}
+
+    def get_group(self, groupby, value):
+        """ Returns the grouping period of a `created` DateIndex value
+        """
+        daterequested = catalogcount.get_indexed_date(value).toZone(
+            DateTime().timezone())
+        if groupby == 'Day':
+            return self.ulocalized_time(daterequested)
+        elif groupby == 'Week':
+            return daterequested.strftime(
+                "%Y") + ", " + daterequested.strftime("%U")
+        elif groupby == 'Month':
+            return daterequested.strftime(
+                "%B") + " " + daterequested.strftime("%Y")
+        elif groupby == 'Year':
+            return daterequested.strftime("%Y")
+        return ''
+
+    def set_ratios(self, line):
+        """ Sets the performed/requested and published/performed ratios of
+            a report line
+        """
+        performedrequested_ratio = line['Requested'] > 0 and float(
+            line['Performed']) / float(line['Requested']) or 0
+        publishedperformed_ratio = line['Performed'] > 0 and float(
+            line['Published']) / float(line['Performed']) or 0
+        line['PerformedRequestedRatio'] = performedrequested_ratio
+        line['PerformedRequestedRatioPercentage'] = ('{0:.0f}'.format(
+            performedrequested_ratio * 100)) + "%"
+        line['PublishedPerformedRatio'] = publishedperformed_ratio
+        line['PublishedPerformedRatioPercentage'] = ('{0:.0f}'.format(
+            publishedperformed_ratio * 100)) + "%"
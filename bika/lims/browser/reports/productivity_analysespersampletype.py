@@ -11,6 +11,7 @@ from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import bikaMessageFactory as _
 from bika.lims.utils import t
 from bika.lims.utils import formatDateQuery, formatDateParms, logged_in_client
+from bika.lims.utils import catalogcount
 from plone.app.layout.globals.interfaces import IViewView
 from zope.interface import implements
 
@@ -26,8 +27,6 @@ class Report(BrowserView):
     def __call__(self):
 
         # get all the data into datalines
-        sc = getToolByName(self.context, 'bika_setup_catalog')
-        bac = getToolByName(self.context, 'bika_analysis_catalog')
         rc = getToolByName(self.context, 'reference_catalog')
         self.report_content = {}
         parm_lines = {}
@@ -36,7 +35,6 @@ class Report(BrowserView):
         headings['header'] = _("Analyses per sample type")
         headings['subheader'] = _("Number of analyses requested per sample type")
 
-        count_all = 0
         query = {'portal_type': 'Analysis'}
         client_title = None
         if 'ClientUID' in self.request.form:
@@ -100,40 +98,22 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        datalines = []
-        for sampletype in sc(portal_type="SampleType",
-                             sort_on='sortable_title'):
-            query['getSampleTypeUID'] = sampletype.UID
-            analyses = bac(query)
-            count_analyses = len(analyses)
-
-            dataline = []
-            dataitem = {'value': sampletype.Title}
-            dataline.append(dataitem)
-            dataitem = {'value': count_analyses}
-
-            dataline.append(dataitem)
-
-            datalines.append(dataline)
-
-            count_all += count_analyses
-
-        # footer data
-        footlines = []
-        footline = []
-        footitem = {'value': _('Total'),
-                    'class': 'total_label'}
-        footline.append(footitem)
-        footitem = {'value': count_all}
-        footline.append(footitem)
-        footlines.append(footline)
-
         self.report_content = {
             'headings': headings,
             'parms': parms,
             'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
+            'datalines': self.get_datalines(query),
+            'footings': self.get_footlines()}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        datalines = list(self.report_content['datalines'])
+        self.report_content['datalines'] = datalines
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
 
         if self.request.get('output_format', '') == 'CSV':
             import csv
@@ -162,5 +142,41 @@ class Report(BrowserView):
                       "attachment;filename=\"analysespersampletype_%s.csv\"" % date)
             self.request.RESPONSE.write(report_data)
         else:
-            return {'report_title': t(headings['header']),
+            return {'report_title': title,
                     'report_data': self.template()}
+
+    def get_datalines(self, query):
+        """Yields the report lines, one per sample type
+        """
+        sc = getToolByName(self.context, 'bika_setup_catalog')
+        bac = getToolByName(self.context, 'bika_analysis_catalog')
+        self.count_all = 0
+
+        # Number of analyses of each sample type, aggregated at once
+        counts = catalogcount.aggregate(bac, query, 'getSampleTypeUID')
+
+        for sampletype in sc(portal_type="SampleType",
+                             sort_on='sortable_title'):
+            count_analyses = counts.get(sampletype.UID, {}).get('count', 0)
+
+            dataline = []
+            dataitem = {'value': sampletype.Title}
+            dataline.append(dataitem)
+            dataitem = {'value': count_analyses}
+
+            dataline.append(dataitem)
+
+            yield dataline
+
+            self.count_all += count_analyses
+
+    def get_footlines(self):
+        """Yields the footer lines, once all the report lines are built
+        """
+        footline = []
+        footitem = {'value': _('Total'),
+                    'class': 'total_label'}
+        footline.append(footitem)
+        footitem = {'value': self.count_all}
+        footline.append(footitem)
+        yield footline
@@ -11,6 +11,7 @@ from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import bikaMessageFactory as _
 from bika.lims.utils import t
 from bika.lims.utils import formatDateQuery, formatDateParms, logged_in_client
+from bika.lims.utils import catalogcount
 from plone.app.layout.globals.interfaces import IViewView
 from zope.interface import implements
 
@@ -27,8 +28,6 @@ class Report(BrowserView):
     def __call__(self):
         # get all the data into datalines
 
-        sc = getToolByName(self.context, 'bika_setup_catalog')
-        bc = getToolByName(self.context, 'bika_analysis_catalog')
         rc = getToolByName(self.context, 'reference_catalog')
         self.report_content = {}
         parms = []
@@ -98,50 +97,22 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        datalines = []
-        count_all = 0
-        for cat in sc(portal_type="AnalysisCategory",
-                      sort_on='sortable_title'):
-            dataline = [{'value': cat.Title,
-                         'class': 'category_heading',
-                         'colspan': 2}, ]
-            datalines.append(dataline)
-            for service in sc(portal_type="AnalysisService",
-                              getCategoryUID=cat.UID,
-                              sort_on='sortable_title'):
-                query['getServiceUID'] = service.UID
-                analyses = bc(query)
-                count_analyses = len(analyses)
-
-                dataline = []
-                dataitem = {'value': service.Title}
-                dataline.append(dataitem)
-                dataitem = {'value': count_analyses}
-
-                dataline.append(dataitem)
-
-                datalines.append(dataline)
-
-                count_all += count_analyses
-
-        # footer data
-        footlines = []
-        footline = []
-        footitem = {'value': _('Total'),
-                    'class': 'total_label'}
-        footline.append(footitem)
-        footitem = {'value': count_all}
-        footline.append(footitem)
-        footlines.append(footline)
-
         self.report_content = {
             'headings': headings,
             'parms': parms,
             'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
+            'datalines': self.get_datalines(query),
+            'footings': self.get_footlines()}
 
         title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        datalines = list(self.report_content['datalines'])
+        self.report_content['datalines'] = datalines
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
 
         if self.request.get('output_format', '') == 'CSV':
             import csv
@@ -175,3 +146,47 @@ class Report(BrowserView):
         else:
             return {'report_title': title,
                     'report_data': self.template()}
+
+    def get_datalines(self, query):
+        """Yields the report lines, a heading per category followed by one
+           line per analysis service
+        """
+        sc = getToolByName(self.context, 'bika_setup_catalog')
+        bc = getToolByName(self.context, 'bika_analysis_catalog')
+        self.count_all = 0
+
+        # Number of analyses of each service, aggregated at once
+        counts = catalogcount.aggregate(bc, query, 'getServiceUID')
+
+        for cat in sc(portal_type="AnalysisCategory",
+                      sort_on='sortable_title'):
+            dataline = [{'value': cat.Title,
+                         'class': 'category_heading',
+                         'colspan': 2}, ]
+            yield dataline
+            for service in sc(portal_type="AnalysisService",
+                              getCategoryUID=cat.UID,
+                              sort_on='sortable_title'):
+                count_analyses = counts.get(service.UID, {}).get('count', 0)
+
+                dataline = []
+                dataitem = {'value': service.Title}
+                dataline.append(dataitem)
+                dataitem = {'value': count_analyses}
+
+                dataline.append(dataitem)
+
+                yield dataline
+
+                self.count_all += count_analyses
+
+    def get_footlines(self):
+        """Yields the footer lines, once all the report lines are built
+        """
+        footline = []
+        footitem = {'value': _('Total'),
+                    'class': 'total_label'}
+        footline.append(footitem)
+        footitem = {'value': self.count_all}
+        footline.append(footitem)
+        yield footline
@@ -27,7 +27,6 @@ class Report(BrowserView):
     def __call__(self):
         # get all the data into datalines
 
-        sc = getToolByName(self.context, 'bika_setup_catalog')
         bc = getToolByName(self.context, 'bika_analysis_catalog')
         rc = getToolByName(self.context, 'reference_catalog')
         self.report_content = {}
@@ -146,12 +145,76 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        total_count_early = 0
-        total_count_late = 0
-        total_mins_early = 0
-        total_mins_late = 0
-        total_count_undefined = 0
-        datalines = []
+        self.report_content = {
+            'headings': headings,
+            'parms': parms,
+            'formats': formats,
+            'datalines': self.get_datalines(services),
+            'footings': self.get_footlines()}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        datalines = list(self.report_content['datalines'])
+        self.report_content['datalines'] = datalines
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
+
+        if self.request.get('output_format', '') == 'CSV':
+            import csv
+            import StringIO
+            import datetime
+
+            fieldnames = [
+                'Analysis',
+                'Count',
+                'Undefined',
+                'Late',
+                'Average late',
+                'Early',
+                'Average early',
+            ]
+            output = StringIO.StringIO()
+            dw = csv.DictWriter(output, extrasaction='ignore',
+                                fieldnames=fieldnames)
+            dw.writerow(dict((fn, fn) for fn in fieldnames))
+            for row in datalines:
+                if len(row) == 1:
+                    # category heading thingy
+                    continue
+                dw.writerow({
+                    'Analysis': row[0]['value'],
+                    'Count': row[1]['value'],
+                    'Undefined': row[2]['value'],
+                    'Late': row[3]['value'],
+                    'Average late': row[4]['value'],
+                    'Early': row[5]['value'],
+                    'Average early': row[6]['value'],
+                })
+            report_data = output.getvalue()
+            output.close()
+            date = datetime.datetime.now().strftime("%Y%m%d%H%M")
+            setheader = self.request.RESPONSE.setHeader
+            setheader('Content-Type', 'text/csv')
+            setheader("Content-Disposition",
+                      "attachment;filename=\"analysestats_%s.csv\"" % date)
+            self.request.RESPONSE.write(report_data)
+        else:
+            return {'report_title': title,
+                    'report_data': self.template()}
+
+    def get_datalines(self, services):
+        """Yields the report lines, a heading per category followed by one
+           line per analysis service
+        """
+        sc = getToolByName(self.context, 'bika_setup_catalog')
+        self.total_count_early = 0
+        self.total_count_late = 0
+        self.total_mins_early = 0
+        self.total_mins_late = 0
+        self.total_count_undefined = 0
 
         for cat in sc(portal_type='AnalysisCategory',
                       sort_on='sortable_title'):
@@ -174,7 +237,7 @@ class Report(BrowserView):
                     continue
 
                 if first_time:
-                    datalines.append(catline)
+                    yield catline
                     first_time = False
 
                 # analyses found
@@ -202,7 +265,7 @@ class Report(BrowserView):
                 dataline.append({'value': services[service.UID]['ave_early'],
                                  'class': 'number'})
 
-                datalines.append(dataline)
+                yield dataline
 
             # category totals
             dataline = [{'value': '%s - total' % (cat.Title),
@@ -240,95 +303,45 @@ class Report(BrowserView):
 
             dataline.append(dataitem)
 
-            total_count_early += cat_count_early
-            total_count_late += cat_count_late
-            total_count_undefined += cat_count_undefined
-            total_mins_early += cat_mins_early
-            total_mins_late += cat_mins_late
+            self.total_count_early += cat_count_early
+            self.total_count_late += cat_count_late
+            self.total_count_undefined += cat_count_undefined
+            self.total_mins_early += cat_mins_early
+            self.total_mins_late += cat_mins_late
 
-        # footer data
-        footlines = []
-        footline = []
+    def get_footlines(self):
+        """Yields the footer lines, once all the report lines are built
+        """
         footline = [{'value': _('Total'),
                      'class': 'total'}, ]
 
-        footline.append({'value': total_count_early +
-                                  total_count_late +
-                                  total_count_undefined,
+        footline.append({'value': self.total_count_early +
+                                  self.total_count_late +
+                                  self.total_count_undefined,
                          'class': 'total number'})
 
-        footline.append({'value': total_count_undefined,
+        footline.append({'value': self.total_count_undefined,
                          'class': 'total number'})
 
-        footline.append({'value': total_count_late,
+        footline.append({'value': self.total_count_late,
                          'class': 'total number'})
 
-        if total_count_late:
-            ave_mins = total_mins_late / total_count_late
+        if self.total_count_late:
+            ave_mins = self.total_mins_late / self.total_count_late
             footline.append({'value': formatDuration(self.context, ave_mins),
                              'class': 'total number'})
         else:
             footline.append({'value': ''})
 
-        footline.append({'value': total_count_early,
+        footline.append({'value': self.total_count_early,
                          'class': 'total number'})
 
-        if total_count_early:
-            ave_mins = total_mins_early / total_count_early
+        if self.total_count_early:
+            ave_mins = self.total_mins_early / self.total_count_early
             footline.append({'value': formatDuration(self.context, ave_mins),
                              'class': 'total number'})
         else:
             footline.append({'value': '',
                              'class': 'total number'})
 
-        footlines.append(footline)
-
-        self.report_content = {
-            'headings': headings,
-            'parms': parms,
-            'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
-
-        if self.request.get('output_format', '') == 'CSV':
-            import csv
-            import StringIO
-            import datetime
-
-            fieldnames = [
-                'Analysis',
-                'Count',
-                'Undefined',
-                'Late',
-                'Average late',
-                'Early',
-                'Average early',
-            ]
-            output = StringIO.StringIO()
-            dw = csv.DictWriter(output, extrasaction='ignore',
-                                fieldnames=fieldnames)
-            dw.writerow(dict((fn, fn) for fn in fieldnames))
-            for row in datalines:
-                if len(row) == 1:
-                    # category heading thingy
-                    continue
-                dw.writerow({
-                    'Analysis': row[0]['value'],
-                    'Count': row[1]['value'],
-                    'Undefined': row[2]['value'],
-                    'Late': row[3]['value'],
-                    'Average late': row[4]['value'],
-                    'Early': row[5]['value'],
-                    'Average early': row[6]['value'],
-                })
-            report_data = output.getvalue()
-            output.close()
-            date = datetime.datetime.now().strftime("%Y%m%d%H%M")
-            setheader = self.request.RESPONSE.setHeader
-            setheader('Content-Type', 'text/csv')
-            setheader("Content-Disposition",
-                      "attachment;filename=\"analysestats_%s.csv\"" % date)
-            self.request.RESPONSE.write(report_data)
-        else:
-            return {'report_title': t(headings['header']),
-                    'report_data': self.template()}
+        yield footline
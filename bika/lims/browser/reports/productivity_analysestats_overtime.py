@@ -133,45 +133,22 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        datalines = []
-
-        period_keys = periods.keys()
-        for period in period_keys:
-            dataline = [{'value': period,
-                         'class': ''}, ]
-            dataline.append({'value': periods[period]['duration'],
-                             'class': 'number'})
-            datalines.append(dataline)
-
-        if total_count > 0:
-            ave_total_duration = total_duration / total_count
-        else:
-            ave_total_duration = 0
-        ave_total_duration = formatDuration(self.context, ave_total_duration)
-
-        # footer data
-        footlines = []
-        footline = []
-        footline = [{'value': _('Total data points'),
-                     'class': 'total'}, ]
-
-        footline.append({'value': total_count,
-                         'class': 'total number'})
-        footlines.append(footline)
-
-        footline = [{'value': _('Average TAT'),
-                     'class': 'total'}, ]
-
-        footline.append({'value': ave_total_duration,
-                         'class': 'total number'})
-        footlines.append(footline)
-
         self.report_content = {
             'headings': headings,
             'parms': parms,
             'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
+            'datalines': self.get_datalines(periods),
+            'footings': self.get_footlines(total_count, total_duration)}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        datalines = list(self.report_content['datalines'])
+        self.report_content['datalines'] = datalines
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
 
         if self.request.get('output_format', '') == 'CSV':
             import csv
@@ -200,5 +177,40 @@ class Report(BrowserView):
                       "attachment;filename=\"analysesperservice_%s.csv\"" % date)
             self.request.RESPONSE.write(report_data)
         else:
-            return {'report_title': t(headings['header']),
+            return {'report_title': title,
                     'report_data': self.template()}
+
+    def get_datalines(self, periods):
+        """Yields the report lines, one per period
+        """
+        period_keys = periods.keys()
+        for period in period_keys:
+            dataline = [{'value': period,
+                         'class': ''}, ]
+            dataline.append({'value': periods[period]['duration'],
+                             'class': 'number'})
+            yield dataline
+
+    def get_footlines(self, total_count, total_duration):
+        """Yields the footer lines with the number of data points and the
+           average turnaround time
+        """
+        if total_count > 0:
+            ave_total_duration = total_duration / total_count
+        else:
+            ave_total_duration = 0
+        ave_total_duration = formatDuration(self.context, ave_total_duration)
+
+        footline = [{'value': _('Total data points'),
+                     'class': 'total'}, ]
+
+        footline.append({'value': total_count,
+                         'class': 'total number'})
+        yield footline
+
+        footline = [{'value': _('Average TAT'),
+                     'class': 'total'}, ]
+
+        footline.append({'value': ave_total_duration,
+                         'class': 'total number'})
+        yield footline
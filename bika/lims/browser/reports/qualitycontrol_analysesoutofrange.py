@@ -26,15 +26,12 @@ class Report(BrowserView):
 
     def __call__(self):
         bsc = getToolByName(self.context, 'bika_setup_catalog')
-        bac = getToolByName(self.context, 'bika_analysis_catalog')
         self.report_content = {}
         parms = []
         headings = {}
         headings['header'] = _("Analyses out of range")
         headings['subheader'] = _("Analyses results out of specified range")
 
-        count_all = 0
-
         query = {"portal_type": "Analysis",
                  "sort_order": "reverse"}
 
@@ -118,7 +115,42 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        datalines = []
+        # report footer data
+        footnotes = []
+        footline = []
+        footitem = {'value': _('Analysis result within error range'),
+                    'img_before': '++resource++bika.lims.images/exclamation.png'
+        }
+        footline.append(footitem)
+        footnotes.append(footline)
+
+        self.report_content = {
+            'headings': headings,
+            'parms': parms,
+            'formats': formats,
+            'datalines': self.get_datalines(query, spec_obj),
+            'footings': self.get_footlines(),
+            'footnotes': footnotes}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        self.report_content['datalines'] = \
+            list(self.report_content['datalines'])
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
+
+        return {'report_title': title,
+                'report_data': self.template()}
+
+    def get_datalines(self, query, spec_obj):
+        """Yields the report lines, one per analysis out of range
+        """
+        bac = getToolByName(self.context, 'bika_analysis_catalog')
+        wf_tool = getToolByName(self.context, 'portal_workflow')
+        self.count_all = 0
 
         for a_proxy in bac(query):
             analysis = a_proxy.getObject()
@@ -215,41 +247,18 @@ class Report(BrowserView):
             dataitem = {'value': review_state}
             dataline.append(dataitem)
 
-            datalines.append(dataline)
+            yield dataline
 
-            count_all += 1
+            self.count_all += 1
 
-        # table footer data
-        footlines = []
+    def get_footlines(self):
+        """Yields the table footer lines, once all the report lines are built
+        """
         footline = []
         footitem = {'value': _('Number of analyses out of range for period'),
                     'colspan': 9,
                     'class': 'total_label'}
         footline.append(footitem)
-        footitem = {'value': count_all}
-        footline.append(footitem)
-        footlines.append(footline)
-
-        # report footer data
-        footnotes = []
-        footline = []
-        footitem = {'value': _('Analysis result within error range'),
-                    'img_before': '++resource++bika.lims.images/exclamation.png'
-        }
+        footitem = {'value': self.count_all}
         footline.append(footitem)
-        footnotes.append(footline)
-
-        self.report_content = {
-            'headings': headings,
-            'parms': parms,
-            'formats': formats,
-            'datalines': datalines,
-            'footings': footlines,
-            'footnotes': footnotes}
-
-        title = t(headings['header'])
-
-        return {'report_title': title,
-                'report_data': self.template()}
-
-
+        yield footline
@@ -24,7 +24,6 @@ class Report(BrowserView):
         BrowserView.__init__(self, context, request)
 
     def __call__(self):
-        bac = getToolByName(self.context, 'bika_analysis_catalog')
         self.report_content = {}
         parm_lines = {}
         parms = []
@@ -32,8 +31,6 @@ class Report(BrowserView):
         headings['header'] = _("Analyses retested")
         headings['subheader'] = _("Analyses which have been retested")
 
-        count_all = 0
-
         query = {'portal_type': 'Analysis',
                  'getRetested': True,
                  'sort_order': 'reverse'}
@@ -100,12 +97,32 @@ class Report(BrowserView):
                    'class': '',
         }
 
-        datalines = []
-        clients = {}
-        sampletypes = {}
-        samplepoints = {}
-        categories = {}
-        services = {}
+        self.report_content = {
+            'headings': headings,
+            'parms': parms,
+            'formats': formats,
+            'datalines': self.get_datalines(query),
+            'footings': self.get_footlines()}
+
+        title = t(headings['header'])
+        if self.request.get('output_format', '') == 'XLSX':
+            # the lines are built while the export streams them
+            return {'report_title': title}
+
+        self.report_content['datalines'] = \
+            list(self.report_content['datalines'])
+        self.report_content['footings'] = \
+            list(self.report_content['footings'])
+
+        return {'report_title': title,
+                'report_data': self.template()}
+
+    def get_datalines(self, query):
+        """Yields the report lines, one per retested analysis
+        """
+        bac = getToolByName(self.context, 'bika_analysis_catalog')
+        wf_tool = getToolByName(self.context, 'portal_workflow')
+        self.count_all = 0
 
         for a_proxy in bac(query):
             analysis = a_proxy.getObject()
@@ -139,32 +156,18 @@ class Report(BrowserView):
             dataitem = {'value': review_state}
             dataline.append(dataitem)
 
-            datalines.append(dataline)
+            yield dataline
 
-            count_all += 1
+            self.count_all += 1
 
-        # table footer data
-        footlines = []
+    def get_footlines(self):
+        """Yields the table footer lines, once all the report lines are built
+        """
         footline = []
         footitem = {'value': _('Number of analyses retested for period'),
                     'colspan': 7,
                     'class': 'total_label'}
         footline.append(footitem)
-        footitem = {'value': count_all}
+        footitem = {'value': self.count_all}
         footline.append(footitem)
-        footlines.append(footline)
-
-        self.report_content = {
-            'headings': headings,
-            'parms': parms,
-            'formats': formats,
-            'datalines': datalines,
-            'footings': footlines}
-
-        title = t(headings['header'])
-
-        return {'report_title': title,
-                'report_data': self.template()}
-
-
-
+        yield footline
@@ -35,15 +35,16 @@ class SampleAnalysesView(AnalysesView):
         pos += 1
         self.review_states[0]['columns'].insert(pos, 'Priority')
 
-    def folderitems(self):
+    def before_folderitems(self):
         self.contentsMethod = self.context.getAnalyses
-        items = AnalysesView.folderitems(self)
-        for x in range(len(items)):
-            if not items[x].has_key('obj'):
-                continue
-            obj = items[x]['obj']
-            ar = obj.aq_parent
-            items[x]['replace']['Request'] = \
-                "<a href='%s'>%s</a>"%(ar.absolute_url(), ar.Title())
-            items[x]['replace']['Priority'] = ' ' #TODO this space is required for it to work
-        return items
+        AnalysesView.before_folderitems(self)
+
+    def folderitem(self, obj, item, index):
+        item = AnalysesView.folderitem(self, obj, item, index)
+        if not item:
+            return None
+        ar = item['obj'].aq_parent
+        item['replace']['Request'] = \
+            "<a href='%s'>%s</a>"%(ar.absolute_url(), ar.Title())
+        item['replace']['Priority'] = ' ' #TODO this space is required for it to work
+        return item
@@ -473,8 +473,7 @@ class SamplesView(BikaListingView):
             item['class']['getDatePreserved'] = 'provisional'
         return item
 
-    def folderitems(self, full_objects=False):
-        items = BikaListingView.folderitems(self, full_objects=False)
+    def after_folderitems(self, items):
         # Hide Preservation/Sampling workflow actions if the edit columns
         # are not displayed.
         # Hide schedule_sampling if user has no rights
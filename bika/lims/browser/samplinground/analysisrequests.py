@@ -21,6 +21,10 @@ class AnalysisRequestsView(_ARV, _ARAV):
     ar_add = ViewPageTemplateFile("../analysisrequest/templates/ar_add.pt")
     implements(IViewView)
 
+    # The partitions of the ARs are listed, portal_catalog has no metadata
+    # for them
+    metadata_only = False
+
     def __init__(self, context, request):
         super(AnalysisRequestsView, self).__init__(context, request)
         self.catalog = "portal_catalog"
@@ -81,11 +81,7 @@ class ContactsView(BikaListingView):
                          'getFax']},
         ]
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        for x in range(len(items)):
-            if not items[x].has_key('obj'): continue
-            items[x]['replace']['getFullname'] = "<a href='%s'>%s</a>" % \
-                 (items[x]['url'], items[x]['obj'].getFullname())
-
-        return items
+    def folderitem(self, obj, item, index):
+        item['replace']['getFullname'] = "<a href='%s'>%s</a>" % \
+             (item['url'], obj.getFullname())
+        return item
@@ -69,15 +69,15 @@ class SupplyOrderFolderView(BikaListingView):
             },
         ]
 
-    def folderitems(self):
-        items = BikaListingView.folderitems(self)
-        items.sort(key=itemgetter('OrderDate'), reverse=True)
-        for x in range(len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-            items[x]['OrderNumber'] = obj.getOrderNumber()
-            items[x]['OrderDate'] = self.ulocalized_time(obj.getOrderDate())
-            items[x]['DateDispatched'] = self.ulocalized_time(obj.getDateDispatched())
-            items[x]['replace']['OrderNumber'] = "<a href='%s'>%s</a>" % \
-                 (items[x]['url'], items[x]['OrderNumber'])
+    def folderitem(self, obj, item, index):
+        item['OrderNumber'] = obj.getOrderNumber()
+        item['sortable_date'] = obj.getOrderDate()
+        item['OrderDate'] = self.ulocalized_time(obj.getOrderDate())
+        item['DateDispatched'] = self.ulocalized_time(obj.getDateDispatched())
+        item['replace']['OrderNumber'] = "<a href='%s'>%s</a>" % \
+             (item['url'], item['OrderNumber'])
+        return item
+
+    def after_folderitems(self, items):
+        items.sort(key=itemgetter('sortable_date'), reverse=True)
         return items
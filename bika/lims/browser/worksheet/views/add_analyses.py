@@ -27,6 +27,8 @@ class AddAnalysesView(BikaListingView):
     implements(IViewView)
     template = ViewPageTemplateFile("../templates/add_analyses.pt")
 
+    metadata_only = True
+
     def __init__(self, context, request):
         BikaListingView.__init__(self, context, request)
         self.icon = self.portal_url + "/++resource++bika.lims.images/worksheet_big.png"
@@ -51,7 +53,8 @@ class AddAnalysesView(BikaListingView):
         self.columns = {
             'Client': {
                 'title': _('Client'),
-                'index':'getClientTitle'},
+                'index':'getClientTitle',
+                'metadata': 'getClientTitle'},
             'getClientOrderNumber': {
                 'title': _('Order'),
                 'index': 'getClientOrderNumber'},
@@ -63,7 +66,8 @@ class AddAnalysesView(BikaListingView):
                 'index': 'Priority'},
             'CategoryTitle': {
                 'title': _('Category'),
-                'index':'getCategoryTitle'},
+                'index':'getCategoryTitle',
+                'metadata': 'getCategoryTitle'},
             'Title': {
                 'title': _('Analysis'),
                 'index':'sortable_title'},
@@ -141,65 +145,68 @@ class AddAnalysesView(BikaListingView):
         department filter. If the analysis service is not assigned to a
         department, show it.
         If department filtering is disabled in bika_setup, will return True.
-        @Obj: it is an analysis object.
+        @Obj: it is an analysis brain.
         @return: boolean
         """
         if not self.context.bika_setup.getAllowDepartmentFiltering():
             return True
         # Gettin the department from analysis service
-        serv_dep = obj.getService().getDepartment()
+        if self.has_metadata(obj, 'getDepartmentUID'):
+            serv_dep_uid = self.get_metadata(obj, 'getDepartmentUID')
+        else:
+            serv_dep = self.get_object(obj).getService().getDepartment()
+            serv_dep_uid = serv_dep.UID() if serv_dep else None
         result = True
-        if serv_dep:
+        if serv_dep_uid:
             # Getting the cookie value
             cookie_dep_uid = self.request.get('filter_by_department_info', '')
             # Comparing departments' UIDs
-            result = True if serv_dep.UID() in\
+            result = True if serv_dep_uid in\
                 cookie_dep_uid.split(',') else False
         return result
 
-    def folderitems(self):
-
-        items = BikaListingView.folderitems(self)
+    def before_folderitems(self):
         mtool = getToolByName(self.context, 'portal_membership')
         member = mtool.getAuthenticatedMember()
         roles = member.getRoles()
-        hideclientlink = 'RegulatoryInspector' in roles \
+        self.hideclientlink = 'RegulatoryInspector' in roles \
             and 'Manager' not in roles \
             and 'LabManager' not in roles \
             and 'LabClerk' not in roles
 
-        for x in range(len(items)):
-            if not items[x].has_key('obj'):
-                continue
-            obj = items[x]['obj']
-            service = obj.getService()
-            client = obj.aq_parent.aq_parent
-            items[x]['getClientOrderNumber'] = obj.getClientOrderNumber()
-            items[x]['getDateReceived'] = self.ulocalized_time(obj.getDateReceived())
-            DueDate = obj.getDueDate()
-            items[x]['getDueDate'] = self.ulocalized_time(DueDate)
-            if DueDate < DateTime():
-                items[x]['after']['DueDate'] = '<img width="16" height="16" src="%s/++resource++bika.lims.images/late.png" title="%s"/>' % \
-                    (self.context.absolute_url(),
-                     t(_("Late Analysis")))
-            items[x]['CategoryTitle'] = service.getCategory() and service.getCategory().Title() or ''
-
-            if getSecurityManager().checkPermission(EditResults, obj.aq_parent):
-                url = obj.aq_parent.absolute_url() + "/manage_results"
-            else:
-                url = obj.aq_parent.absolute_url()
-            items[x]['getRequestID'] = obj.aq_parent.getRequestID()
-            items[x]['replace']['getRequestID'] = "<a href='%s'>%s</a>" % \
-                 (url, items[x]['getRequestID'])
-            items[x]['Priority'] = ''
-
-
-            items[x]['Client'] = client.Title()
-            if hideclientlink == False:
-                items[x]['replace']['Client'] = "<a href='%s'>%s</a>" % \
-                    (client.absolute_url(), client.Title())
-
-        return items
+    def folderitem(self, obj, item, index):
+        # The values are read from the catalog metadata of the brain
+        ar_url = item['url'].rsplit('/', 1)[0]
+        client_url = ar_url.rsplit('/', 1)[0]
+        item['getClientOrderNumber'] = \
+            self.get_value(obj, 'getClientOrderNumber')
+        item['getDateReceived'] = self.ulocalized_time(
+            self.get_value(obj, 'getDateReceived'))
+        DueDate = self.get_value(obj, 'getDueDate')
+        item['getDueDate'] = self.ulocalized_time(DueDate)
+        if DueDate and DueDate < DateTime():
+            item['after']['DueDate'] = '<img width="16" height="16" src="%s/++resource++bika.lims.images/late.png" title="%s"/>' % \
+                (self.context.absolute_url(),
+                 t(_("Late Analysis")))
+        item['CategoryTitle'] = \
+            self.get_value(obj, 'getCategoryTitle') or ''
+
+        # The analysis and its AR share the permission to edit results
+        if self.check_permission(EditResults, obj):
+            url = ar_url + "/manage_results"
+        else:
+            url = ar_url
+        item['getRequestID'] = self.get_value(obj, 'getRequestID')
+        item['replace']['getRequestID'] = "<a href='%s'>%s</a>" % \
+             (url, item['getRequestID'])
+        item['Priority'] = ''
+
+        item['Client'] = self.get_value(obj, 'getClientTitle')
+        if self.hideclientlink == False:
+            item['replace']['Client'] = "<a href='%s'>%s</a>" % \
+                (client_url, item['Client'])
+
+        return item
 
     def getServices(self):
         bsc = getToolByName(self.context, 'bika_setup_catalog')
@@ -74,47 +74,54 @@ class AnalysesView(BaseView):
              },
         ]
 
-    def folderitems(self):
+    def before_folderitems(self):
         self.analyst = self.context.getAnalyst().strip()
         self.instrument = self.context.getInstrument()
         self.contentsMethod = self.context.getFolderContents
-        items = BaseView.folderitems(self)
-        layout = self.context.getLayout()
-        highest_position = 0
-        new_items = []
-        for x, item in enumerate(items):
-            obj = item['obj']
-            pos = [slot['position'] for slot in layout if
-                   slot['analysis_uid'] == obj.UID()][0]
+        self.ws_layout = self.context.getLayout()
+        BaseView.before_folderitems(self)
 
-            # compensate for possible bad data (dbw#104)
-            if type(pos) in (list, tuple):
-                pos = pos[0]
-                if pos == 'new':
-                    continue
-            pos = int(pos)
+    def folderitem(self, obj, item, index):
+        item = BaseView.folderitem(self, obj, item, index)
+        if not item:
+            return None
+        obj = item['obj']
+        pos = [slot['position'] for slot in self.ws_layout if
+               slot['analysis_uid'] == obj.UID()][0]
 
-            highest_position = max(highest_position, pos)
-            items[x]['Pos'] = pos
-            items[x]['colspan'] = {'Pos':1}
-            service = obj.getService()
-            method = service.getMethod()
-            items[x]['Service'] = service.Title()
-            items[x]['Priority'] = ''
-            #items[x]['Method'] = method and method.Title() or ''
-            items[x]['class']['Service'] = 'service_title'
-            items[x]['Category'] = service.getCategory() and service.getCategory().Title() or ''
-            if obj.portal_type == "ReferenceAnalysis":
-                items[x]['DueDate'] = self.ulocalized_time(obj.aq_parent.getExpiryDate(), long_format=0)
-            else:
-                items[x]['DueDate'] = self.ulocalized_time(obj.getDueDate())
+        # compensate for possible bad data (dbw#104)
+        if type(pos) in (list, tuple):
+            pos = pos[0]
+            if pos == 'new':
+                return None
+        pos = int(pos)
 
-            items[x]['Order'] = ''
-            instrument = obj.getInstrument()
-            #items[x]['Instrument'] = instrument and instrument.Title() or ''
+        item['Pos'] = pos
+        item['colspan'] = {'Pos':1}
+        service = obj.getService()
+        method = service.getMethod()
+        item['Service'] = service.Title()
+        item['Priority'] = ''
+        #item['Method'] = method and method.Title() or ''
+        item['class']['Service'] = 'service_title'
+        item['Category'] = service.getCategory() and service.getCategory().Title() or ''
+        if obj.portal_type == "ReferenceAnalysis":
+            item['DueDate'] = self.ulocalized_time(obj.aq_parent.getExpiryDate(), long_format=0)
+        else:
+            item['DueDate'] = self.ulocalized_time(obj.getDueDate())
 
-            new_items.append(item)
-        items = new_items
+        item['Order'] = ''
+        instrument = obj.getInstrument()
+        #item['Instrument'] = instrument and instrument.Title() or ''
+
+        return item
+
+    def after_folderitems(self, items):
+        items = BaseView.after_folderitems(self, items)
+        layout = self.ws_layout
+        highest_position = 0
+        for item in items:
+            highest_position = max(highest_position, item['Pos'])
 
         # insert placeholder row items in the gaps
         # This is done badly to compensate for possible bad data (dbw#104)
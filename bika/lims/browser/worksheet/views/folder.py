@@ -432,7 +432,7 @@ class FolderView(BikaListingView):
 
         return item
 
-    def folderitems(self):
+    def before_folderitems(self):
         toggle_cols = self.request.cookies.get('toggle_cols')
         display_columns = None
         if toggle_cols:
@@ -440,8 +440,7 @@ class FolderView(BikaListingView):
             if 'WorksheetFolderlist' in display_columns.keys():
                 self.display_columns = display_columns['WorksheetFolderlist']
 
-        items = BikaListingView.folderitems(self)
-
+    def after_folderitems(self, items):
         # can_reassigned value is assigned in folderitem(obj,item,index) function
         if self.can_reassign:
             for x in range(len(self.review_states)):
@@ -58,37 +58,35 @@ class ReferenceSamplesView(BaseView):
             return t(_("No control type specified"))
         return super(ReferenceSamplesView, self).contents_table()
 
-    def folderitems(self):
-        translate = self.context.translate
+    def folderitem(self, obj, item, index):
+        item = super(ReferenceSamplesView, self).folderitem(obj, item, index)
+        if not item:
+            return None
         workflow = getToolByName(self.context, 'portal_workflow')
-        items = super(ReferenceSamplesView, self).folderitems()
-        new_items = []
-        for x in range(len(items)):
-            if not items[x].has_key('obj'): continue
-            obj = items[x]['obj']
-            if self.control_type == 'b' and not obj.getBlank(): continue
-            if self.control_type == 'c' and obj.getBlank(): continue
-            ref_services = obj.getServices()
-            ws_ref_services = [rs for rs in ref_services if
-                               rs.UID() in self.service_uids]
-            if ws_ref_services:
-                if workflow.getInfoFor(obj, 'review_state') != 'current':
-                    continue
-                services = [rs.Title() for rs in ws_ref_services]
-                items[x]['nr_services'] = len(services)
-                items[x]['Definition'] = (obj.getReferenceDefinition() and obj.getReferenceDefinition().Title()) or ''
-                services.sort(lambda x, y: cmp(x.lower(), y.lower()))
-                items[x]['Services'] = ", ".join(services)
-                items[x]['replace'] = {}
+        if self.control_type == 'b' and not obj.getBlank(): return None
+        if self.control_type == 'c' and obj.getBlank(): return None
+        ref_services = obj.getServices()
+        ws_ref_services = [rs for rs in ref_services if
+                           rs.UID() in self.service_uids]
+        if not ws_ref_services:
+            return None
+        if workflow.getInfoFor(obj, 'review_state') != 'current':
+            return None
+        services = [rs.Title() for rs in ws_ref_services]
+        item['nr_services'] = len(services)
+        item['Definition'] = (obj.getReferenceDefinition() and obj.getReferenceDefinition().Title()) or ''
+        services.sort(lambda x, y: cmp(x.lower(), y.lower()))
+        item['Services'] = ", ".join(services)
+        item['replace'] = {}
 
-                after_icons = "<a href='%s' target='_blank'><img src='++resource++bika.lims.images/referencesample.png' title='%s: %s'></a>" % \
-                    (obj.absolute_url(), \
-                     t(_("Reference sample")), obj.Title())
-                items[x]['before']['ID'] = after_icons
+        after_icons = "<a href='%s' target='_blank'><img src='++resource++bika.lims.images/referencesample.png' title='%s: %s'></a>" % \
+            (obj.absolute_url(), \
+             t(_("Reference sample")), obj.Title())
+        item['before']['ID'] = after_icons
+        return item
 
-                new_items.append(items[x])
-
-        new_items = sorted(new_items, key = itemgetter('nr_services'))
-        new_items.reverse()
-
-        return new_items
+    def after_folderitems(self, items):
+        items = super(ReferenceSamplesView, self).after_folderitems(items)
+        items = sorted(items, key = itemgetter('nr_services'))
+        items.reverse()
+        return items
@@ -13,6 +13,7 @@ from bika.lims.browser.referenceanalysis import AnalysesRetractedListReport
 from bika.lims.permissions import EditResults, EditWorksheet, ManageWorksheets
 from bika.lims.subscribers import doActionFor
 from bika.lims.subscribers import skip
+from bika.lims.workflow import doActionsFor
 from bika.lims.utils import isActive
 from Products.Archetypes.config import REFERENCE_CATALOG
 from Products.CMFCore.utils import getToolByName
@@ -172,6 +173,7 @@ class WorksheetWorkflowAction(WorkflowAction):
         sm = getSecurityManager()
 
         hasInterims = {}
+        submissable = []
         # XXX combine data from multiple bika listing tables.
         item_data = {}
         if 'item_data' in form:
@@ -261,7 +263,11 @@ class WorksheetWorkflowAction(WorkflowAction):
                 if can_submit:
                     # doActionFor transitions the analysis to verif pending,
                     # so must only be done when results are submitted.
-                    doActionFor(analysis, 'submit')
+                    submissable.append(analysis)
+
+        # Submit the analyses. The worksheet and the ARs are promoted once,
+        # after all the analyses are submitted.
+        doActionsFor(submissable, 'submit')
 
         # Maybe some analyses need to be retracted due to a QC failure
         # Done here because don't know if the last selected analysis is
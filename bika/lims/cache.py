@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import threading
+from collections import OrderedDict
+
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+
+_marker = object()
+
+
+class LRUCache(object):
+    """Thread safe, size bounded, least recently used cache.
+
+    Instances are meant to be module level (process wide) caches. Values must
+    not be acquisition wrapped or bound to a ZODB connection, because they are
+    shared between the worker threads.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Returns the value for key and marks it as recently used
+        """
+        with self._lock:
+            value = self._data.pop(key, _marker)
+            if value is _marker:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        """Stores the value, discarding the least recently used items when
+        the cache is full
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=_marker, predicate=None):
+        """Drops the given key, all the keys for which predicate(key) is True,
+        or everything if neither is given
+        """
+        with self._lock:
+            if key is not _marker:
+                self._data.pop(key, None)
+            elif predicate is not None:
+                for k in filter(predicate, self._data.keys()):
+                    del self._data[k]
+            else:
+                self._data.clear()
+
+    def stats(self):
+        """Returns a dictionary with the cache counters
+        """
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def get_request_cache(name, request=None):
+    """Returns a dictionary bound to the current request under `name`.
+
+    The dictionary lives as long as the request, so it can be used to memoize
+    values which are safe to reuse within a single request only.
+    """
+    if request is None:
+        request = api.get_request()
+    if request is None:
+        # e.g. scripts running without a request
+        return {}
+    annotations = IAnnotations(request)
+    cache = annotations.get(name)
+    if cache is None:
+        cache = annotations[name] = {}
+    return cache
@@ -14,6 +14,7 @@ from Products.ZCatalog.ZCatalog import ZCatalog
 from bika.lims.interfaces import IBikaCatalog
 from bika.lims.interfaces import IBikaAnalysisCatalog
 from bika.lims.interfaces import IBikaSetupCatalog
+from bika.lims import indexqueue
 from plone import api
 from zope.interface import implements
 
@@ -39,7 +40,57 @@ def getCatalog(instance, field='UID'):
         return catalog
 
 
-class BikaCatalog(CatalogTool):
+class QueuedIndexingMixin(object):
+
+    """Queues the indexing operations of the catalog until the end of the
+    transaction, merging the ones for the same object.
+    See bika.lims.indexqueue
+    """
+
+    def catalog_object(self, object, uid=None, idxs=None,
+                       update_metadata=1, pghandler=None):
+        if uid is None:
+            uid = '/'.join(object.getPhysicalPath())
+        if pghandler is None:
+            queue = indexqueue.get_queue()
+            if queue.add(self, object, uid, idxs, update_metadata):
+                return
+        self._indexObjectNow(object, uid, idxs, update_metadata, pghandler)
+
+    def _indexObjectNow(self, object, uid, idxs=None, update_metadata=1,
+                        pghandler=None):
+        """Indexes the object right away, bypassing the queue
+        """
+        super(QueuedIndexingMixin, self).catalog_object(
+            object, uid, idxs, update_metadata, pghandler)
+
+    def uncatalog_object(self, uid):
+        indexqueue.get_queue().discard(self, uid)
+        super(QueuedIndexingMixin, self).uncatalog_object(uid)
+
+    def searchResults(self, REQUEST=None, **kw):
+        indexqueue.flush(self)
+        return super(QueuedIndexingMixin, self).searchResults(REQUEST, **kw)
+
+    __call__ = searchResults
+
+    def unrestrictedSearchResults(self, REQUEST=None, **kw):
+        indexqueue.flush(self)
+        return super(QueuedIndexingMixin, self).unrestrictedSearchResults(
+            REQUEST, **kw)
+
+    # AdvancedQuery queries read the indexes without searchResults
+
+    def makeAdvancedQuery(self, *args, **kw):
+        indexqueue.flush(self)
+        return super(QueuedIndexingMixin, self).makeAdvancedQuery(*args, **kw)
+
+    def evalAdvancedQuery(self, *args, **kw):
+        indexqueue.flush(self)
+        return super(QueuedIndexingMixin, self).evalAdvancedQuery(*args, **kw)
+
+
+class BikaCatalog(QueuedIndexingMixin, CatalogTool):
 
     """Catalog for various transactional types"""
 
@@ -79,7 +130,7 @@ class BikaCatalog(CatalogTool):
 InitializeClass(BikaCatalog)
 
 
-class BikaAnalysisCatalog(CatalogTool):
+class BikaAnalysisCatalog(QueuedIndexingMixin, CatalogTool):
 
     """Catalog for analysis types"""
 
@@ -119,7 +170,7 @@ class BikaAnalysisCatalog(CatalogTool):
 InitializeClass(BikaAnalysisCatalog)
 
 
-class BikaSetupCatalog(CatalogTool):
+class BikaSetupCatalog(QueuedIndexingMixin, CatalogTool):
 
     """Catalog for all bika_setup objects"""
 
@@ -8,7 +8,6 @@
 "DuplicateAnalysis uses this as it's base.  This accounts for much confusion."
 
 import cgi
-import math
 from decimal import Decimal
 
 from DateTime import DateTime
@@ -47,6 +46,7 @@ from Products.CMFPlone.utils import safe_unicode
 
 from bika.lims import bikaMessageFactory as _
 from bika.lims import logger
+from bika.lims.analysiscounters import update_analysis
 from bika.lims.browser.fields import DurationField
 from bika.lims.browser.fields import HistoryAwareReferenceField
 from bika.lims.browser.fields import InterimFieldsField
@@ -66,8 +66,17 @@ from bika.lims.utils import drop_trailing_zeros_decimal
 from bika.lims.utils import formatDecimalMark
 from bika.lims.utils.analysis import format_numeric_result
 from bika.lims.utils.analysis import get_significant_digits
+from bika.lims.utils.calculationgraph import CalculationGraph
 from bika.lims.workflow import getTransitionActor
+from bika.lims.workflow import getTransitionDateTime
 from bika.lims.workflow import skip
+from bika.lims.workflow import promote
+from bika.lims.workflow import attach_ar_if_ready
+from bika.lims.workflow import attach_ws_if_ready
+from bika.lims.workflow import submit_ar_if_ready
+from bika.lims.workflow import submit_ws_if_ready
+from bika.lims.workflow import verify_ar_if_ready
+from bika.lims.workflow import verify_ws_if_ready
 
 
 @indexer(IAnalysis)
@@ -351,8 +360,8 @@ class Analysis(BaseContent):
 
     def getDepartmentUID(self):
         if getattr(self, "_DepartmentUID", None) is None:
-            service = self.getService()
-            self._DepartmentUID = service.getDepartment().UID()
+            department = self.getService().getDepartment()
+            self._DepartmentUID = department.UID() if department else ''
         return self._DepartmentUID
 
     def getKeyword(self):
@@ -433,6 +442,14 @@ class Analysis(BaseContent):
             self._Title = safe_unicode(s).encode('utf-8')
         return self._Title
 
+    def setDueDate(self, value):
+        self.getField('DueDate').set(self, value)
+        update_analysis(self)
+
+    def setResultCaptureDate(self, value):
+        self.getField('ResultCaptureDate').set(self, value)
+        update_analysis(self)
+
     def updateDueDate(self):
         # set the max hours allowed
 
@@ -802,25 +819,27 @@ class Analysis(BaseContent):
 
         return outspecs
 
-    def calculateResult(self, override=False, cascade=False):
-        """ Calculates the result for the current analysis if it depends of
-            other analysis/interim fields. Otherwise, do nothing
+    def getCalculationToApply(self):
+        """ Returns the calculation used to compute the result of this
+            analysis: the analysis' own calculation or the service's one
         """
-        if self.getResult() and override is False:
-            return False
-
-        serv = self.getService()
-        calc = self.getCalculation() if self.getCalculation() \
-            else serv.getCalculation()
+        calc = self.getCalculation()
         if not calc:
-            return False
-
+            calc = self.getService().getCalculation()
+        return calc
+
+    def getCalculationMapping(self, calc, dependencies):
+        """ Returns the mapping of keyword -> value used to evaluate the
+            formula of calc, made of the interims of this analysis and the
+            results of the dependencies.
+            Returns None if any interim or dependency result is not a number
+        """
         mapping = {}
 
         # Interims' priority order (from low to high):
         # Calculation < Analysis Service < Analysis
         interims = calc.getInterimFields() + \
-            serv.getInterimFields() + self.getInterimFields()
+            self.getService().getInterimFields() + self.getInterimFields()
 
         # Add interims to mapping
         for i in interims:
@@ -831,61 +850,69 @@ class Analysis(BaseContent):
                 mapping[i['keyword']] = ivalue
             except:
                 # Interim not float, abort
-                return False
+                return None
 
         # Add dependencies results to mapping
-        dependencies = self.getDependencies()
         for dependency in dependencies:
             result = dependency.getResult()
             if not result:
-                # Dependency without results found
-                if cascade:
-                    # Try to calculate the dependency result
-                    dependency.calculateResult(override, cascade)
-                    result = dependency.getResult()
-                else:
-                    return False
-            if result:
-                try:
-                    result = float(str(result))
-                    key = dependency.getKeyword()
-                    ldl = dependency.getLowerDetectionLimit()
-                    udl = dependency.getUpperDetectionLimit()
-                    bdl = dependency.isBelowLowerDetectionLimit()
-                    adl = dependency.isAboveUpperDetectionLimit()
-                    mapping[key] = result
-                    mapping['%s.%s' % (key, 'RESULT')] = result
-                    mapping['%s.%s' % (key, 'LDL')] = ldl
-                    mapping['%s.%s' % (key, 'UDL')] = udl
-                    mapping['%s.%s' % (key, 'BELOWLDL')] = int(bdl)
-                    mapping['%s.%s' % (key, 'ABOVEUDL')] = int(adl)
-                except:
-                    return False
+                return None
+            try:
+                result = float(str(result))
+                key = dependency.getKeyword()
+                ldl = dependency.getLowerDetectionLimit()
+                udl = dependency.getUpperDetectionLimit()
+                bdl = dependency.isBelowLowerDetectionLimit()
+                adl = dependency.isAboveUpperDetectionLimit()
+                mapping[key] = result
+                mapping['%s.%s' % (key, 'RESULT')] = result
+                mapping['%s.%s' % (key, 'LDL')] = ldl
+                mapping['%s.%s' % (key, 'UDL')] = udl
+                mapping['%s.%s' % (key, 'BELOWLDL')] = int(bdl)
+                mapping['%s.%s' % (key, 'ABOVEUDL')] = int(adl)
+            except:
+                return None
+        return mapping
 
-        # Calculate
-        formula = calc.getMinifiedFormula()
-        formula = formula.replace('[', '%(').replace(']', ')f')
+    def evaluateCalculation(self, calc, mapping):
+        """ Evaluates the formula of calc and returns the result as the
+            string to be stored in the Result field
+        """
         try:
-            formula = eval("'%s'%%mapping" % formula,
-                           {"__builtins__": None,
-                            'math': math,
-                            'context': self},
-                           {'mapping': mapping})
-            result = eval(formula, calc._getGlobals())
+            result = calc.evaluateFormula(mapping)
         except TypeError:
-            self.setResult("NA")
-            return True
+            return "NA"
         except ZeroDivisionError:
-            self.setResult('0/0')
-            return True
+            return "0/0"
         except KeyError:
-            self.setResult("NA")
-            return True
+            return "NA"
         except ImportError:
-            self.setResult("NA")
-            return True
+            return "NA"
+        return str(result)
 
-        self.setResult(str(result))
+    def calculateResult(self, override=False, cascade=False):
+        """ Calculates the result for the current analysis if it depends of
+            other analysis/interim fields. Otherwise, do nothing
+        """
+        if self.getResult() and override is False:
+            return False
+
+        calc = self.getCalculationToApply()
+        if not calc:
+            return False
+
+        dependencies = self.getDependencies()
+        if cascade:
+            for dependency in dependencies:
+                if not dependency.getResult():
+                    # Try to calculate the dependency result
+                    dependency.calculateResult(override, cascade)
+
+        mapping = self.getCalculationMapping(calc, dependencies)
+        if mapping is None:
+            return False
+
+        self.setResult(self.evaluateCalculation(calc, mapping))
         return True
 
     def getPriority(self):
@@ -1277,6 +1304,16 @@ class Analysis(BaseContent):
         """
         return getTransitionActor(self, 'submit')
 
+    def getDateSubmitted(self):
+        """Returns the date the result was last submitted
+        """
+        return getTransitionDateTime(self, 'submit')
+
+    def getDateVerified(self):
+        """Returns the date the result was last verified
+        """
+        return getTransitionDateTime(self, 'verify')
+
     def guard_sample_transition(self):
         workflow = getToolByName(self, "portal_workflow")
         if workflow.getInfoFor(self, "cancellation_state", "active") == "cancelled":
@@ -1384,11 +1421,13 @@ class Analysis(BaseContent):
             return False
         ar = self.aq_parent
         self.reindexObject(idxs=["review_state", ])
+        # The calculation dependencies of the AR are resolved once per request
+        graph = CalculationGraph.get(ar)
         # Dependencies are submitted already, ignore them.
         # ------------------------------------------------
         # Submit our dependents
         # Need to check for result and status of dependencies first
-        dependents = self.getDependents()
+        dependents = graph.get_dependents(self)
         for dependent in dependents:
             if not skip(dependent, "submit", peek=True):
                 can_submit = True
@@ -1403,7 +1442,7 @@ class Analysis(BaseContent):
                     if interim_fields:
                         can_submit = False
                 if can_submit:
-                    dependencies = dependent.getDependencies()
+                    dependencies = graph.get_dependencies(dependent)
                     for dependency in dependencies:
                         if workflow.getInfoFor(dependency, "review_state") in \
                            ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received"):
@@ -1413,32 +1452,13 @@ class Analysis(BaseContent):
 
         # If all analyses in this AR have been submitted
         # escalate the action to the parent AR
-        if not skip(ar, "submit", peek=True):
-            all_submitted = True
-            for a in ar.getAnalyses():
-                if a.review_state in \
-                   ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received"):
-                    all_submitted = False
-                    break
-            if all_submitted:
-                workflow.doActionFor(ar, "submit")
+        promote(ar, "submit", submit_ar_if_ready)
 
         # If assigned to a worksheet and all analyses on the worksheet have been submitted,
         # then submit the worksheet.
         ws = self.getBackReferences("WorksheetAnalysis")
         if ws:
-            ws = ws[0]
-            # if the worksheet analyst is not assigned, the worksheet can't  be transitioned.
-            if ws.getAnalyst() and not skip(ws, "submit", peek=True):
-                all_submitted = True
-                for a in ws.getAnalyses():
-                    if workflow.getInfoFor(a, "review_state") in \
-                       ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "assigned"):
-                        # Note: referenceanalyses and duplicateanalyses can still have review_state = "assigned".
-                        all_submitted = False
-                        break
-                if all_submitted:
-                    workflow.doActionFor(ws, "submit")
+            promote(ws[0], "submit", submit_ws_if_ready)
 
         # If no problem with attachments, do 'attach' action for this instance.
         can_attach = True
@@ -1447,7 +1467,7 @@ class Analysis(BaseContent):
             if service.getAttachmentOption() == "r":
                 can_attach = False
         if can_attach:
-            dependencies = self.getDependencies()
+            dependencies = graph.get_dependencies(self)
             for dependency in dependencies:
                 if workflow.getInfoFor(dependency, "review_state") in \
                    ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due"):
@@ -1574,37 +1594,12 @@ class Analysis(BaseContent):
         self.reindexObject(idxs=["review_state", ])
         # If all analyses in this AR are verified
         # escalate the action to the parent AR
-        ar = self.aq_parent
-        if not skip(ar, "verify", peek=True):
-            all_verified = True
-            for a in ar.getAnalyses():
-                if a.review_state in \
-                   ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due", "to_be_verified"):
-                    all_verified = False
-                    break
-            if all_verified:
-                if "verify all analyses" not in self.REQUEST['workflow_skiplist']:
-                    self.REQUEST["workflow_skiplist"].append("verify all analyses")
-                workflow.doActionFor(ar, "verify")
+        promote(self.aq_parent, "verify", verify_ar_if_ready)
         # If this is on a worksheet and all it's other analyses are verified,
         # then verify the worksheet.
         ws = self.getBackReferences("WorksheetAnalysis")
         if ws:
-            ws = ws[0]
-            ws_state = workflow.getInfoFor(ws, "review_state")
-            if ws_state == "to_be_verified" and not skip(ws, "verify", peek=True):
-                all_verified = True
-                for a in ws.getAnalyses():
-                    if workflow.getInfoFor(a, "review_state") in \
-                       ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due", "to_be_verified", "assigned"):
-                        # Note: referenceanalyses and duplicateanalyses can
-                        # still have review_state = "assigned".
-                        all_verified = False
-                        break
-                if all_verified:
-                    if "verify all analyses" not in self.REQUEST['workflow_skiplist']:
-                        self.REQUEST["workflow_skiplist"].append("verify all analyses")
-                    workflow.doActionFor(ws, "verify")
+            promote(ws[0], "verify", verify_ws_if_ready)
 
     def workflow_script_publish(self):
         workflow = getToolByName(self, "portal_workflow")
@@ -1668,37 +1663,15 @@ class Analysis(BaseContent):
             return
         if skip(self, "attach"):
             return
-        workflow = getToolByName(self, "portal_workflow")
         self.reindexObject(idxs=["review_state", ])
         # If all analyses in this AR have been attached
         # escalate the action to the parent AR
-        ar = self.aq_parent
-        ar_state = workflow.getInfoFor(ar, "review_state")
-        if ar_state == "attachment_due" and not skip(ar, "attach", peek=True):
-            can_attach = True
-            for a in ar.getAnalyses():
-                if a.review_state in \
-                   ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due"):
-                    can_attach = False
-                    break
-            if can_attach:
-                workflow.doActionFor(ar, "attach")
+        promote(self.aq_parent, "attach", attach_ar_if_ready)
         # If assigned to a worksheet and all analyses on the worksheet have been attached,
         # then attach the worksheet.
         ws = self.getBackReferences('WorksheetAnalysis')
         if ws:
-            ws = ws[0]
-            ws_state = workflow.getInfoFor(ws, "review_state")
-            if ws_state == "attachment_due" and not skip(ws, "attach", peek=True):
-                can_attach = True
-                for a in ws.getAnalyses():
-                    if workflow.getInfoFor(a, "review_state") in \
-                       ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due", "assigned"):
-                        # Note: referenceanalyses and duplicateanalyses can still have review_state = "assigned".
-                        can_attach = False
-                        break
-                if can_attach:
-                    workflow.doActionFor(ws, "attach")
+            promote(ws[0], "attach", attach_ws_if_ready)
 
     def workflow_script_assign(self):
         # DuplicateAnalysis doesn't have analysis_workflow.
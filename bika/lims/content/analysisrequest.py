@@ -67,10 +67,15 @@ from bika.lims.permissions import EditARContact
 from bika.lims.permissions import ManageInvoices
 from bika.lims.permissions import Verify as VerifyPermission
 
+# Bika Analysis Counters
+from bika.lims.analysiscounters import NOT_LATE_STATES
+from bika.lims.analysiscounters import get_summary
+
 # Bika Workflow
 from bika.lims.workflow import skip
 from bika.lims.workflow import doActionFor
 from bika.lims.workflow import getTransitionDate
+from bika.lims.workflow import getTransitionDateTime
 from bika.lims.workflow import isBasicTransitionAllowed
 
 # Bika Utils
@@ -108,7 +113,7 @@ def BatchUID(instance):
 
 @indexer(IAnalysisRequest)
 def getDatePublished(instance):
-    return getTransitionDate(instance, 'publish')
+    return getTransitionDateTime(instance, 'publish')
 
 
 @indexer(IAnalysisRequest)
@@ -1824,6 +1829,37 @@ class AnalysisRequest(BaseFolder):
     def getTemplateTitle(self):
         return self.getTemplate().Title() if self.getTemplate() else ''
 
+    def getContactPath(self):
+        contact = self.getContact()
+        return "/".join(contact.getPhysicalPath()) if contact else ''
+
+    def getBatchID(self):
+        return self.getBatch().getBatchID() if self.getBatch() else ''
+
+    def getBatchPath(self):
+        batch = self.getBatch()
+        return "/".join(batch.getPhysicalPath()) if batch else ''
+
+    def getSubGroupTitle(self):
+        subgroup = self.Schema().getField('SubGroup').get(self)
+        return subgroup.Title() if subgroup else ''
+
+    def getSamplingDeviationTitle(self):
+        deviation = self.getSamplingDeviation()
+        return deviation.Title() if deviation else ''
+
+    def getStorageLocationTitle(self):
+        location = self.getStorageLocation()
+        return location.Title() if location else ''
+
+    def getHazardous(self):
+        sampletype = self.getSampleType()
+        return sampletype.getHazardous() if sampletype else False
+
+    def isSamplingWorkflowEnabled(self):
+        sample = self.getSample()
+        return sample.getSamplingWorkflowEnabled() if sample else False
+
     def setPublicationSpecification(self, value):
         """Never contains a value; this field is here for the UI." \
         """
@@ -1908,14 +1944,24 @@ class AnalysisRequest(BaseFolder):
         """
         verified = 0
         total = 0
-        for analysis in self.getAnalyses():
-            review_state = analysis.review_state
+        states = get_summary(self)['states']
+        for review_state, number in states.items():
             if review_state in ['verified', 'published']:
-                verified += 1
-            if review_state not in 'retracted':
-                total += 1
+                verified += number
+            if review_state != 'retracted':
+                total += number
         return verified, total
 
+    def getDueDate(self):
+        """Return the earliest due date of the analyses without result
+        """
+        return get_summary(self)['due_date']
+
+    def getLateDate(self):
+        """Return the date from which the analyses are late, if any
+        """
+        return get_summary(self)['late_date']
+
     def getResponsible(self):
         """Return all manager info of responsible departments
         """
@@ -1994,25 +2040,10 @@ class AnalysisRequest(BaseFolder):
         """
         workflow = getToolByName(self, 'portal_workflow')
         review_state = workflow.getInfoFor(self, 'review_state', '')
-        resultdate = 0
-        if review_state in ['to_be_sampled', 'to_be_preserved',
-                            'sample_due', 'published']:
+        if review_state in NOT_LATE_STATES:
             return False
-
-        for analysis in self.objectValues('Analysis'):
-            review_state = workflow.getInfoFor(analysis, 'review_state', '')
-            if review_state == 'published':
-                continue
-            calculation = analysis.getService().getCalculation()
-            if not calculation or (calculation and not calculation.getDependentServices()):
-                resultdate = analysis.getResultCaptureDate()
-            duedate = analysis.getDueDate()
-            # noinspection PyCallingNonCallable
-            if (resultdate and resultdate > duedate) \
-                    or (not resultdate and DateTime() > duedate):
-                return True
-
-        return False
+        late_date = self.getLateDate()
+        return late_date is not None and DateTime() > late_date
 
     security.declareProtected(View, 'getBillableItems')
 
@@ -2517,6 +2548,11 @@ class AnalysisRequest(BaseFolder):
     def getDatePublished(self):
         return getTransitionDate(self, 'publish')
 
+    security.declarePublic('getDateVerified')
+
+    def getDateVerified(self):
+        return getTransitionDateTime(self, 'verify')
+
     def getSamplers(self):
         return getUsers(self, ['LabManager', 'Sampler'])
 
@@ -2693,6 +2729,10 @@ class AnalysisRequest(BaseFolder):
             # are not in a kind-of already verified state
             canbeverified = True
             omit = ['published', 'retracted', 'rejected', 'verified']
+            # Analyses in other states than to_be_verified can't be verified
+            states = get_summary(self)['active_states']
+            if [st for st in states if st not in omit + ['to_be_verified']]:
+                return False
             for a in self.getAnalyses(full_objects=True):
                 st = workflow.getInfoFor(a, 'cancellation_state', 'active')
                 if st == 'cancelled':
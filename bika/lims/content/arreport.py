@@ -37,6 +37,12 @@ schema = BikaSchema.copy() + Schema((
         subfields=('UID', 'Username', 'Fullname', 'EmailAddress',
                    'PublicationModes'),
     ),
+    # Digests of the data and of the template the report was rendered from,
+    # to reuse the PDF when the AR is republished without changes
+    StringField('ContentDigest',
+    ),
+    StringField('TemplateDigest',
+    ),
 ))
 
 schema['id'].required = False
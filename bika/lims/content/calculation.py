@@ -8,7 +8,6 @@
 import re
 import sys
 import math
-import inspect
 import importlib
 
 import transaction
@@ -41,6 +40,15 @@ from bika.lims.config import PROJECTNAME
 from bika.lims import bikaMessageFactory as _
 from bika.lims.interfaces import ICalculation
 from bika.lims.content.bikaschema import BikaSchema
+from bika.lims.cache import LRUCache
+from bika.lims.utils.formula import CompiledFormula
+from bika.lims.utils.formula import as_float_or_value
+from bika.lims.utils.formula import as_formula_value
+
+# Process wide caches of the parsed formulas, keyed by (UID, formula), and of
+# the resolved python imports, keyed by (UID, imports)
+compiled_formulas = LRUCache(maxsize=500)
+resolved_imports = LRUCache(maxsize=500)
 
 
 schema = BikaSchema.copy() + Schema((
@@ -206,6 +214,15 @@ class Calculation(BaseFolder, HistoryAwareMixin):
 
             self.getField('DependentServices').set(self, DependentServices)
             self.getField('Formula').set(self, Formula)
+        uid = self.UID()
+        compiled_formulas.invalidate(predicate=lambda key: key[0] == uid)
+
+    def setPythonImports(self, value):
+        """Set the python imports and drop the resolved ones
+        """
+        self.getField('PythonImports').set(self, value)
+        uid = self.UID()
+        resolved_imports.invalidate(predicate=lambda key: key[0] == uid)
 
     def getMinifiedFormula(self):
         """Return the current formula value as text.
@@ -214,6 +231,26 @@ class Calculation(BaseFolder, HistoryAwareMixin):
         value = " ".join(self.getFormula().splitlines())
         return value
 
+    def getCompiledFormula(self):
+        """Return the current formula parsed into a CompiledFormula.
+        The formula is only parsed once per calculation and formula text.
+        """
+        formula = self.getMinifiedFormula()
+        key = (self.UID(), formula)
+        compiled = compiled_formulas.get(key)
+        if compiled is None:
+            compiled = CompiledFormula(formula)
+            compiled_formulas.set(key, compiled)
+        return compiled
+
+    def evaluateFormula(self, mapping, convert=as_formula_value):
+        """Evaluate the formula with the values of mapping, a dictionary of
+        keyword -> value. Raises the errors of the evaluation, e.g. KeyError
+        for missing keywords or ZeroDivisionError.
+        """
+        compiled = self.getCompiledFormula()
+        return compiled.evaluate(mapping, self._getGlobals(), convert)
+
     def getCalculationDependencies(self, flat=False, deps=None):
         """ Recursively calculates all dependencies of this calculation.
             The return value is dictionary of dictionaries (of dictionaries....)
@@ -288,15 +325,11 @@ class Calculation(BaseFolder, HistoryAwareMixin):
         if not formula:
             return test_result_field.set(self, "")
 
-        formula = formula.replace('[', '{').replace(']', '}').replace('  ', '')
         result = 'Failure'
 
         try:
-            # print "pre: {}".format(formula)
-            formula = formula.format(**mapping)
-            # print "formatted: {}".format(formula)
-            result = eval(formula, self._getGlobals())
-            # print "result: {}".format(result)
+            # test parameters are taken as floats whenever possible
+            result = self.evaluateFormula(mapping, convert=as_float_or_value)
         except TypeError as e:
             # non-numeric arguments in interim mapping?
             result = "TypeError: {}".format(str(e.args[0]))
@@ -318,15 +351,28 @@ class Calculation(BaseFolder, HistoryAwareMixin):
         # Update with keyword arguments
         globs.update(kwargs)
         # Update with additional Python libraries
-        for imp in self.getPythonImports():
-            module = imp["module"]
-            func = imp["function"]
+        globs.update(self._getImportedMembers())
+        return globs
+
+    def _getImportedMembers(self):
+        """Return a dictionary of name -> member for the Python imports.
+        The members are resolved once and kept in a process wide cache.
+        """
+        imports = tuple([(imp["module"], imp["function"])
+                         for imp in self.getPythonImports()])
+        key = (self.UID(), imports)
+        members = resolved_imports.get(key)
+        if members is not None:
+            return members
+        members = {}
+        for module, func in imports:
             member = self._getModuleMember(module, func)
             if member is None:
                 raise ImportError("Could not find member {} of module {}".format(
                     func, module))
-            globs[func] = member
-        return globs
+            members[func] = member
+        resolved_imports.set(key, members)
+        return members
 
     def _getModuleMember(self, dotted_name, member):
         """Get the member object of a module.
@@ -342,8 +388,7 @@ class Calculation(BaseFolder, HistoryAwareMixin):
         except ImportError:
             return None
 
-        members = dict(inspect.getmembers(module))
-        return members.get(member)
+        return getattr(module, member, None)
 
     def workflow_script_activate(self):
         wf = getToolByName(self, 'portal_workflow')
@@ -9,6 +9,7 @@
 """
 from Products.CMFCore.WorkflowCore import WorkflowException
 from bika.lims.workflow import getTransitionActor
+from bika.lims.workflow import getTransitionDateTime
 from plone import api
 from AccessControl import ClassSecurityInfo
 from bika.lims import bikaMessageFactory as _
@@ -22,6 +23,10 @@ from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.interfaces import IReferenceAnalysis
 from bika.lims.permissions import Verify as VerifyPermission
 from bika.lims.subscribers import skip
+from bika.lims.workflow import promote
+from bika.lims.workflow import attach_ws_if_ready
+from bika.lims.workflow import submit_ws_if_ready
+from bika.lims.workflow import verify_ws_if_ready
 from bika.lims.utils.analysis import get_significant_digits
 from DateTime import DateTime
 from plone.app.blob.field import BlobField
@@ -424,6 +429,16 @@ class ReferenceAnalysis(BaseContent):
         """
         return getTransitionActor(self, 'submit')
 
+    def getDateSubmitted(self):
+        """Returns the date the result was last submitted
+        """
+        return getTransitionDateTime(self, 'submit')
+
+    def getDateVerified(self):
+        """Returns the date the result was last verified
+        """
+        return getTransitionDateTime(self, 'verify')
+
     def isVerifiable(self):
         """
         Checks it the current analysis can be verified. This is, its not a
@@ -528,17 +543,7 @@ class ReferenceAnalysis(BaseContent):
         # If all analyses on the worksheet have been submitted,
         # then submit the worksheet.
         ws = self.getBackReferences('WorksheetAnalysis')
-        ws = ws[0]
-        # if the worksheet analyst is not assigned, the worksheet can't  be transitioned.
-        if ws.getAnalyst() and not skip(ws, "submit", peek=True):
-            all_submitted = True
-            for a in ws.getAnalyses():
-                if workflow.getInfoFor(a, 'review_state') in \
-                   ('sample_due', 'sample_received', 'assigned',):
-                    all_submitted = False
-                    break
-            if all_submitted:
-                workflow.doActionFor(ws, 'submit')
+        promote(ws[0], "submit", submit_ws_if_ready)
         # If no problem with attachments, do 'attach' action.
         can_attach = True
         if not self.getAttachment():
@@ -551,23 +556,12 @@ class ReferenceAnalysis(BaseContent):
     def workflow_script_attach(self):
         if skip(self, "attach"):
             return
-        workflow = getToolByName(self, 'portal_workflow')
         self.reindexObject(idxs=["review_state", ])
 
         # If all analyses on the worksheet have been attached,
         # then attach the worksheet.
         ws = self.getBackReferences('WorksheetAnalysis')
-        ws = ws[0]
-        ws_state = workflow.getInfoFor(ws, 'review_state')
-        if ws_state == 'attachment_due' and not skip(ws, "attach", peek=True):
-            can_attach = True
-            for a in ws.getAnalyses():
-                if workflow.getInfoFor(a, 'review_state') in \
-                   ('sample_due', 'sample_received', 'attachment_due', 'assigned',):
-                    can_attach = False
-                    break
-            if can_attach:
-                workflow.doActionFor(ws, 'attach')
+        promote(ws[0], "attach", attach_ws_if_ready)
 
     def workflow_script_retract(self):
         if skip(self, "retract"):
@@ -588,26 +582,12 @@ class ReferenceAnalysis(BaseContent):
     def workflow_script_verify(self):
         if skip(self, "verify"):
             return
-        workflow = getToolByName(self, 'portal_workflow')
         self.reindexObject(idxs=["review_state", ])
-
         # If all other analyses on the worksheet are verified,
         # then verify the worksheet.
         ws = self.getBackReferences('WorksheetAnalysis')
-        if ws and len(ws) > 0:
-            ws = ws[0]
-            ws_state = workflow.getInfoFor(ws, 'review_state')
-            if ws_state == 'to_be_verified' and not skip(ws, "verify", peek=True):
-                all_verified = True
-                for a in ws.getAnalyses():
-                    if workflow.getInfoFor(a, 'review_state') in \
-                       ('sample_due', 'sample_received', 'attachment_due', 'to_be_verified', 'assigned'):
-                        all_verified = False
-                        break
-                if all_verified:
-                    if not "verify all analyses" in self.REQUEST['workflow_skiplist']:
-                        self.REQUEST["workflow_skiplist"].append("verify all analyses")
-                    workflow.doActionFor(ws, "verify")
+        if ws:
+            promote(ws[0], "verify", verify_ws_if_ready)
 
     def workflow_script_assign(self):
         if skip(self, "assign"):
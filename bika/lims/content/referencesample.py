@@ -356,6 +356,11 @@ class ReferenceSample(BaseFolder):
             services.append(service)
         return services
 
+    security.declarePublic('getSupportedServiceUIDs')
+    def getSupportedServiceUIDs(self):
+        """ UIDs of the services with reference values in this Sample """
+        return [spec['uid'] for spec in self.getReferenceResults()]
+
     security.declarePublic('getReferenceResultStr')
     def getReferenceResultStr(self, service_uid):
         specstr = ''
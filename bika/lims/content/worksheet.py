@@ -404,7 +404,6 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
             only be applied to those analyses for which the instrument
             is allowed
         """
-        rc = getToolByName(self, REFERENCE_CATALOG)
         bac = getToolByName(self, "bika_analysis_catalog")
         bc = getToolByName(self, 'bika_catalog')
 
@@ -426,24 +425,33 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
                          'sort_on': 'getDueDate'}
         if client_title and client_title != 'any':
             contentFilter['getClientTitle'] = client_title
-
-        analyses = bac(contentFilter)
+        instr = self.getInstrument() if self.getInstrument() else wst.getInstrument()
+        if instr:
+            # Exclude those analyses for which the ws selected
+            # instrument is not allowed
+            contentFilter['getAllowedInstruments'] = instr.UID()
+
+        # The ARs of the analyses due first, one per free slot. The brains
+        # are loaded lazily, only until the slots are filled
+        ar_ids = []
+        if nr_slots > 0:
+            for brain in bac(contentFilter):
+                ar_id = brain.getRequestID
+                if ar_id not in ar_ids:
+                    ar_ids.append(ar_id)
+                    if len(ar_ids) == nr_slots:
+                        break
 
         # ar_analyses is used to group analyses by AR.
         ar_analyses = {}
-        instr = self.getInstrument() if self.getInstrument() else wst.getInstrument()
-        for brain in analyses:
-            analysis = brain.getObject()
-            if instr and brain.getObject().isInstrumentAllowed(instr) is False:
-                # Exclude those analyses for which the ws selected
-                # instrument is not allowed
-                continue
-            ar_id = brain.getRequestID
-            if ar_id in ar_analyses:
-                ar_analyses[ar_id].append(analysis)
-            else:
-                if len(ar_analyses.keys()) < nr_slots:
-                    ar_analyses[ar_id] = [analysis, ]
+        if ar_ids:
+            contentFilter['getRequestID'] = ar_ids
+            for brain in bac(contentFilter):
+                analysis = brain.getObject()
+                # the allowed instruments indexed may be outdated
+                if instr and not analysis.isInstrumentAllowed(instr):
+                    continue
+                ar_analyses.setdefault(brain.getRequestID, []).append(analysis)
 
         # Add analyses, sorted by AR ID
         ars = sorted(ar_analyses.keys())
@@ -466,47 +474,25 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
                              getReferenceDefinitionUID=reference_definition_uid)
                 if not samples:
                     break
-                samples = [s.getObject() for s in samples]
-                if t == 'b':
-                    samples = [s for s in samples if s.getBlank()]
-                else:
-                    samples = [s for s in samples if not s.getBlank()]
-                complete_reference_found = False
-                references = {}
-                for reference in samples:
-                    reference_uid = reference.UID()
-                    references[reference_uid] = {}
-                    references[reference_uid]['services'] = []
-                    references[reference_uid]['count'] = 0
-                    specs = reference.getResultsRangeDict()
-                    for service_uid in wst_service_uids:
-                        if service_uid in specs:
-                            references[reference_uid]['services'].append(service_uid)
-                            references[reference_uid]['count'] += 1
-                    if references[reference_uid]['count'] == len(wst_service_uids):
-                        complete_reference_found = True
+                # The blank flag and the services with reference values are
+                # read from the metadata, only the chosen sample is woken up
+                samples = [s for s in samples if bool(s.getBlank) == (t == 'b')]
+                reference = None
+                supported_uids = []
+                for sample in samples:
+                    sample_uids = sample.getSupportedServiceUIDs or []
+                    uids = [uid for uid in wst_service_uids
+                            if uid in sample_uids]
+                    if len(uids) > len(supported_uids):
+                        reference = sample
+                        supported_uids = uids
+                    if len(uids) == len(wst_service_uids):
+                        # complete reference found
                         break
-                if complete_reference_found:
-                    supported_uids = wst_service_uids
+                if reference:
                     self.addReferences(int(row['pos']),
-                                     reference,
-                                     supported_uids)
-                else:
-                    # find the most complete reference sample instead
-                    reference_keys = references.keys()
-                    no_of_services = 0
-                    reference = None
-                    for key in reference_keys:
-                        if references[key]['count'] > no_of_services:
-                            no_of_services = references[key]['count']
-                            reference = key
-                    if reference:
-                        reference = rc.lookupObject(reference)
-                        supported_uids = [s.UID() for s in reference.getServices()
-                                          if s.UID() in wst_service_uids]
-                        self.addReferences(int(row['pos']),
-                                         reference,
-                                         supported_uids)
+                                       reference.getObject(),
+                                       supported_uids)
 
         # fill duplicate positions
         layout = self.getLayout()
@@ -12,10 +12,15 @@ from bika.lims.utils import t
 from bika.lims.exportimport.instruments.logger import Logger
 from bika.lims.idserver import renameAfterCreation
 from bika.lims.utils import tmpID
+from bika.lims.utils.calculationgraph import recalculate_analysisrequest
 from Products.Archetypes.config import REFERENCE_CATALOG
 from datetime import datetime
 from DateTime import DateTime
+import itertools
 import os
+import transaction
+
+_marker = object()
 
 class InstrumentResultsFileParser(Logger):
 
@@ -188,13 +193,93 @@ class InstrumentResultsFileParser(Logger):
             return False
         return True
 
+    def iterRawResults(self):
+        """ Yields the parsed results as (object id, values) tuples, where
+            values is one of the results rows described in getRawResults.
+            By default, the whole file is parsed with parse() and the rows
+            are yielded afterwards, so the parsers only implementing parse()
+            keep working with the importer. Parsers able to read the input
+            file incrementally override it to yield the rows as soon as they
+            are parsed, without keeping the whole file in memory.
+        """
+        self.parse()
+        if not self.resume():
+            return
+        for resid, rows in self.getRawResults().items():
+            for row in rows:
+                yield resid, row
+
 
 class InstrumentCSVResultsFileParser(InstrumentResultsFileParser):
 
+    # If True, the rows are handed over to the importer while the file is
+    # read, see iterRawResults. Only suitable for parsers whose _parseline
+    # adds each row once, without looking up or overriding the raw results
+    # from previous lines.
+    streamable = False
+
     def __init__(self, infile):
         InstrumentResultsFileParser.__init__(self, infile, 'CSV')
+        self._parsed = False
 
     def parse(self):
+        for numline in self._parseLines():
+            pass
+        if not self._parsed:
+            return False
+
+        self.log(
+            "End of file reached successfully: ${total_objects} objects, "
+            "${total_analyses} analyses, ${total_results} results",
+            mapping={"total_objects": self.getObjectsTotalCount(),
+                     "total_analyses": self.getAnalysesTotalCount(),
+                     "total_results":self.getResultsTotalCount()}
+        )
+        return True
+
+    def iterRawResults(self):
+        """ Yields the results rows as (object id, values) tuples.
+            If the parser is streamable, the rows added by each line are
+            yielded and discarded right after the line is parsed, so the
+            results never pile up in memory.
+        """
+        if not self.streamable:
+            for record in InstrumentResultsFileParser.iterRawResults(self):
+                yield record
+            return
+
+        objids = set()
+        keywords = set()
+        total = 0
+        for numline in self._parseLines():
+            rawresults = self.getRawResults()
+            self._emptyRawResults()
+            for resid, rows in rawresults.iteritems():
+                objids.add(resid)
+                for row in rows:
+                    keywords.update(row.keys())
+                    total += 1
+                    yield resid, row
+
+        if not self._parsed:
+            return
+        if total == 0:
+            self.err("No results found")
+            return
+        self.log(
+            "End of file reached successfully: ${total_objects} objects, "
+            "${total_analyses} analyses, ${total_results} results",
+            mapping={"total_objects": len(objids),
+                     "total_analyses": len(keywords),
+                     "total_results": total}
+        )
+
+    def _parseLines(self):
+        """ Reads the input file line by line and passes each line to
+            _parseline. Yields the current line number after each parsed
+            line, so the raw results can be consumed while reading.
+            self._parsed is set to False if a critical error was found
+        """
         infile = self.getInputFile()
         self.log("Parsing file ${file_name}", mapping={"file_name":infile.filename})
         jump = 0
@@ -203,12 +288,14 @@ class InstrumentCSVResultsFileParser(InstrumentResultsFileParser):
             f = open(infile.name, 'rU')
         except AttributeError:
             f = infile
-        for line in f.readlines():
+        self._parsed = True
+        for line in iter(f.readline, ''):
             self._numline += 1
             if jump == -1:
                 # Something went wrong. Finish
                 self.err("File processing finished due to critical errors")
-                return False
+                self._parsed = False
+                return
             if jump > 0:
                 # Jump some lines
                 jump -= 1
@@ -221,15 +308,7 @@ class InstrumentCSVResultsFileParser(InstrumentResultsFileParser):
             jump = 0
             if line:
                 jump = self._parseline(line)
-
-        self.log(
-            "End of file reached successfully: ${total_objects} objects, "
-            "${total_analyses} analyses, ${total_results} results",
-            mapping={"total_objects": self.getObjectsTotalCount(),
-                     "total_analyses": self.getAnalysesTotalCount(),
-                     "total_results":self.getResultsTotalCount()}
-        )
-        return True
+            yield self._numline
 
     def splitLine(self, line):
         sline = line.split(',')
@@ -247,6 +326,9 @@ class InstrumentCSVResultsFileParser(InstrumentResultsFileParser):
 
 class AnalysisResultsImporter(Logger):
 
+    # Number of parsed results rows processed between transaction savepoints
+    chunk_size = 100
+
     def __init__(self, parser, context,
                  idsearchcriteria=None,
                  override=[False, False],
@@ -278,6 +360,9 @@ class AnalysisResultsImporter(Logger):
         if not self._idsearch:
             self._idsearch=['getRequestID']
         self.instrument_uid=instrument_uid
+        # Candidates resolved in bulk before processing the results, see
+        # _resolveCandidates. None until resolved.
+        self._candidates = None
 
     def getParser(self):
         """ Returns the parser that will be used for the importer
@@ -323,14 +408,17 @@ class AnalysisResultsImporter(Logger):
         return []
 
     def process(self):
-        self._parser.parse()
-        parsed = self._parser.resume()
         self._errors = self._parser.errors
         self._warns = self._parser.warns
         self._logs = self._parser.logs
         self._priorizedsearchcriteria = ''
 
-        if parsed == False:
+        # The results are processed in chunks while the file is parsed
+        chunks = self._iterChunks(self._parser.iterRawResults())
+        try:
+            firstchunk = chunks.next()
+        except StopIteration:
+            # Nothing parsed
             return False
 
         # Allowed analysis states
@@ -341,33 +429,33 @@ class AnalysisResultsImporter(Logger):
         self.log("Allowed analysis states: ${allowed_states}",
                  mapping={'allowed_states': ', '.join(allowed_an_states_msg)})
 
-        # Exclude non existing ACODEs
-        acodes = []
         ancount = 0
         arprocessed = []
         instprocessed = []
         importedars = {}
         importedinsts = {}
-        rawacodes = self._parser.getAnalysisKeywords()
-        exclude = self.getKeywordsToBeExcluded()
-        for acode in rawacodes:
-            if acode in exclude or not acode:
-                continue
-            service = self.bsc(getKeyword=acode)
-            if not service:
-                self.warn('Service keyword ${analysis_keyword} not found',
-                            mapping={"analysis_keyword": acode})
-            else:
-                acodes.append(acode)
-        if len(acodes) == 0:
-            self.err("Service keywords: no matches found")
+        # The results file is stored once and linked to all the analyses
+        self._attachmenttypeuid = _marker
+        self._attachment = None
+        # Valid keywords found so far, the keywords of each chunk are checked
+        # against the services as they come
+        acodes = []
+        self._checkedkeywords = set()
 
         searchcriteria = self.getIdSearchCriteria();
         #self.log(_("Search criterias: %s") % (', '.join(searchcriteria)))
-        for objid, results in self._parser.getRawResults().iteritems():
+        for chunk in itertools.chain([firstchunk], chunks):
+            rawacodes = set()
+            for objid, result in chunk:
+                rawacodes.update(result.keys())
+            acodes.extend(self._getValidKeywords(rawacodes))
+            # Resolve the ids and their analyses in a few batched queries
+            self._resolveCandidates([objid for objid, result in chunk],
+                                    [acode for acode in rawacodes
+                                     if acode in acodes])
             # Allowed more than one result for the same sample and analysis.
             # Needed for calibration tests
-            for result in results:
+            for objid, result in chunk:
                 analyses = self._getZODBAnalyses(objid)
                 inst = None
                 if len(analyses) == 0 and self.instrument_uid:
@@ -430,13 +518,16 @@ class AnalysisResultsImporter(Logger):
                 capturedate = result.get('DateTime',{}).get('DateTime',None)
                 if capturedate:
                     del result['DateTime']
+                analyses_by_keyword = {}
+                for analysis in analyses:
+                    analyses_by_keyword.setdefault(
+                        analysis.getKeyword(), []).append(analysis)
                 for acode, values in result.iteritems():
                     if acode not in acodes:
                         # Analysis keyword doesn't exist
                         continue
 
-                    ans = [analysis for analysis in analyses \
-                           if analysis.getKeyword() == acode]
+                    ans = analyses_by_keyword.get(acode, [])
 
                     if len(ans) > 1:
                         self.err("More than one analysis found for ${object_id} and ${analysis_keyword}",
@@ -475,73 +566,36 @@ class AnalysisResultsImporter(Logger):
                                     importedar.append(acode)
                                 importedars[ar.getRequestID()] = importedar
 
-                        # Create the AttachmentType for mime type if not exists
-                        attuid = None
-                        attachmentType = self.bsc(portal_type="AttachmentType",
-                                                  title=self._parser.getAttachmentFileType())
-                        if len(attachmentType) == 0:
-                            try:
-                                folder = self.context.bika_setup.bika_attachmenttypes
-                                obj = _createObjectByType("AttachmentType", folder, tmpID())
-                                obj.edit(title=self._parser.getAttachmentFileType(),
-                                         description="Autogenerated file type")
-                                obj.unmarkCreationFlag()
-                                renameAfterCreation(obj)
-                                attuid = obj.UID()
-                            except:
-                                attuid = None
-                                self.err(
-                                    "Unable to create the Attachment Type ${mime_type}",
-                                    mapping={
-                                    "mime_type": self._parser.getFileMimeType()})
-                        else:
-                            attuid = attachmentType[0].UID
-
+                        # Link the results file to the Analysis
+                        attuid = self._getAttachmentTypeUID()
                         if attuid is not None:
                             try:
-                                # Attach the file to the Analysis
-                                wss = analysis.getBackReferences('WorksheetAnalysis')
-                                if wss and len(wss) > 0:
-                                    #TODO: Mirar si es pot evitar utilitzar el WS i utilitzar directament l'Anàlisi (útil en cas de CalibrationTest)
-                                    ws = wss[0]
-                                    attachment = _createObjectByType("Attachment", ws, tmpID())
-                                    attachment.edit(
-                                        AttachmentFile=self._parser.getInputFile(),
-                                        AttachmentType=attuid,
-                                        AttachmentKeys='Results, Automatic import')
-                                    attachment.reindexObject()
-                                    others = analysis.getAttachment()
-                                    attachments = []
-                                    for other in others:
-                                        if other.getAttachmentFile().filename != attachment.getAttachmentFile().filename:
-                                            attachments.append(other.UID())
-                                    attachments.append(attachment.UID())
-                                    analysis.setAttachment(attachments)
-
+                                self._attachResultsFile(analysis, attuid)
                             except:
     #                            self.err(_("Unable to attach results file '${file_name}' to AR ${request_id}",
     #                                       mapping={"file_name": self._parser.getInputFile().filename,
     #                                                "request_id": ar.getRequestID()}))
                                 pass
 
-        # Calculate analysis dependencies
+            # Release the objects modified so far from memory
+            transaction.savepoint(optimistic=True)
+
+        if len(acodes) == 0:
+            self.err("Service keywords: no matches found")
+
+        # Calculate analysis dependencies, each calculated analysis of the
+        # AR is evaluated once, after its dependencies
         for aruid in list(set(arprocessed)):
             ar = self.bc(portal_type='AnalysisRequest', UID=aruid)
             ar = ar[0].getObject()
-            analyses = ar.getAnalyses()
-            for analysis in analyses:
-                analysis = analysis.getObject()
-                initial_result = analysis.getResult()
-                calc_passed = analysis.calculateResult(override=True,
-                                                       cascade=True)
-                if calc_passed and initial_result != analysis.getResult():
-                    self.log(
-                        "${request_id}: calculated result for "
-                        "'${analysis_keyword}': '${analysis_result}'",
-                        mapping={"request_id": ar.getRequestID(),
-                                 "analysis_keyword": analysis.getKeyword(),
-                                 "analysis_result": str(analysis.getResult())}
-                    )
+            for analysis in recalculate_analysisrequest(ar):
+                self.log(
+                    "${request_id}: calculated result for "
+                    "'${analysis_keyword}': '${analysis_result}'",
+                    mapping={"request_id": ar.getRequestID(),
+                             "analysis_keyword": analysis.getKeyword(),
+                             "analysis_result": str(analysis.getResult())}
+                )
 
         for arid, acodes in importedars.iteritems():
             acodesmsg = '. '.join(["Analysis %s" % acod for acod in acodes])
@@ -571,7 +625,158 @@ class AnalysisResultsImporter(Logger):
                 mapping={"nr_updated_ars": str(len(importedars)),
                          "nr_updated_results": str(ancount)})
 
+    def _getAttachmentTypeUID(self):
+        """ Returns the UID of the AttachmentType for the results file type,
+            creating it if it doesn't exist yet. Resolved once per import.
+            Returns None if the AttachmentType cannot be created
+        """
+        if self._attachmenttypeuid is not _marker:
+            return self._attachmenttypeuid
+        attuid = None
+        attachmentType = self.bsc(portal_type="AttachmentType",
+                                  title=self._parser.getAttachmentFileType())
+        if len(attachmentType) == 0:
+            try:
+                folder = self.context.bika_setup.bika_attachmenttypes
+                obj = _createObjectByType("AttachmentType", folder, tmpID())
+                obj.edit(title=self._parser.getAttachmentFileType(),
+                         description="Autogenerated file type")
+                obj.unmarkCreationFlag()
+                renameAfterCreation(obj)
+                attuid = obj.UID()
+            except:
+                attuid = None
+                self.err(
+                    "Unable to create the Attachment Type ${mime_type}",
+                    mapping={"mime_type": self._parser.getFileMimeType()})
+        else:
+            attuid = attachmentType[0].UID
+        self._attachmenttypeuid = attuid
+        return attuid
+
+    def _attachResultsFile(self, analysis, attuid):
+        """ Links the results file to the analysis, replacing the previous
+            attachments with the same file name. Only analyses assigned to a
+            worksheet are linked. The Attachment is created once per import,
+            inside the worksheet of the first analysis linked, and shared by
+            all the analyses afterwards
+        """
+        wss = analysis.getBackReferences('WorksheetAnalysis')
+        if not wss:
+            return
+        attachment = self._attachment
+        if attachment is None:
+            #TODO: Mirar si es pot evitar utilitzar el WS i utilitzar directament l'Anàlisi (útil en cas de CalibrationTest)
+            ws = wss[0]
+            attachment = _createObjectByType("Attachment", ws, tmpID())
+            attachment.edit(
+                AttachmentFile=self._parser.getInputFile(),
+                AttachmentType=attuid,
+                AttachmentKeys='Results, Automatic import')
+            attachment.reindexObject()
+            self._attachment = attachment
+        filename = attachment.getAttachmentFile().filename
+        attachments = [other.UID() for other in analysis.getAttachment()
+                       if other.getAttachmentFile().filename != filename]
+        attachments.append(attachment.UID())
+        analysis.setAttachment(attachments)
+
+    def _iterChunks(self, records):
+        """ Groups the (object id, values) records yielded by the parser in
+            lists of chunk_size records
+        """
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _getValidKeywords(self, keywords):
+        """ Returns the keywords not checked yet that match with an analysis
+            service and are not excluded. Warns about the unknown ones
+        """
+        valid = []
+        exclude = self.getKeywordsToBeExcluded()
+        for acode in keywords:
+            if acode in self._checkedkeywords:
+                continue
+            self._checkedkeywords.add(acode)
+            if acode in exclude or not acode:
+                continue
+            service = self.bsc(getKeyword=acode)
+            if not service:
+                self.warn('Service keyword ${analysis_keyword} not found',
+                            mapping={"analysis_keyword": acode})
+            else:
+                valid.append(acode)
+        return valid
+
+    def _resolveCandidates(self, objids, keywords):
+        """ Resolves all the given object ids from the results file in batched
+            catalog queries, one per search criteria, instead of up to seven
+            queries for each id.
+            The routine analyses of the matched ARs are fetched once for all
+            the ARs, restricted to the keywords found in the file and to the
+            allowed analysis states, and mapped by AR ID and keyword.
+        """
+        objids = [objid for objid in objids if objid]
+        arstates = self.getAllowedARStates()
+        ar_indexes = [('arid', 'getRequestID'),
+                      ('sid', 'getSampleID'),
+                      ('csid', 'getClientSampleID'),
+                      ('aruid', 'UID')]
+        ref_indexes = [('rgid', 'getReferenceAnalysesGroupID'),
+                       ('rid', 'id'),
+                       ('ruid', 'UID')]
+        candidates = {}
+        if objids:
+            for criteria, index in ar_indexes:
+                query = {'portal_type': 'AnalysisRequest',
+                         index: objids,
+                         'review_state': arstates}
+                candidates[criteria] = self._mapBrains(self.bc(query), index)
+            for criteria, index in ref_indexes:
+                query = {'portal_type': ['ReferenceAnalysis',
+                                         'DuplicateAnalysis'],
+                         index: objids}
+                candidates[criteria] = self._mapBrains(self.bac(query), index)
+
+        # The analyses of all the matched ARs, by AR ID and keyword
+        arids = set()
+        for criteria, index in ar_indexes:
+            for brains in candidates.get(criteria, {}).values():
+                arids.update([brain.getRequestID for brain in brains])
+        analyses = {}
+        for keyword in (arids and keywords or []):
+            brains = self.bac(portal_type='Analysis',
+                              getRequestID=list(arids),
+                              getKeyword=keyword,
+                              review_state=self.getAllowedAnalysisStates())
+            for brain in brains:
+                byid = analyses.setdefault(brain.getRequestID, {})
+                byid.setdefault(keyword, []).append(brain)
+        candidates['analyses'] = analyses
+        self._candidates = candidates
+
+    def _mapBrains(self, brains, column):
+        """ Returns a dictionary of metadata column value -> brains
+        """
+        mapped = {}
+        for brain in brains:
+            mapped.setdefault(getattr(brain, column), []).append(brain)
+        return mapped
+
     def _getObjects(self, objid, criteria, states):
+        if self._candidates is not None and criteria in self._candidates:
+            # Resolved in bulk already
+            obj = self._candidates[criteria].get(objid, [])
+            if obj:
+                self._priorizedsearchcriteria = criteria
+            return obj
+
         #self.log("Criteria: %s %s") % (criteria, obji))
         obj = []
         if (criteria == 'arid'):
@@ -676,6 +881,13 @@ class AnalysisResultsImporter(Logger):
                      mapping={"object_id": objid})
             return []
 
+        if self._candidates is not None:
+            # Only the analyses for the keywords in the file, in an allowed
+            # state, have been fetched
+            byid = self._candidates['analyses'].get(ars[0].getRequestID, {})
+            return [brain.getObject() for brains in byid.values()
+                    for brain in brains]
+
         ar = ars[0].getObject()
         analyses = [analysis.getObject() for analysis in ar.getAnalyses()]
 
@@ -103,6 +103,9 @@ def Import(context, request):
 
 class TSVParser(InstrumentCSVResultsFileParser):
 
+    # Each line adds a single results row
+    streamable = True
+
     def __init__(self, csv):
         InstrumentCSVResultsFileParser.__init__(self, csv)
         self._currentresultsheader = []
@@ -8,6 +8,9 @@ from bika.lims.exportimport.instruments.resultsimport import \
 
 class QtegraCSVParser(InstrumentCSVResultsFileParser):
 
+    # Each line adds a single results row
+    streamable = True
+
     def __init__(self, csv):
         InstrumentCSVResultsFileParser.__init__(self, csv)
         self._column_header = []
@@ -9,6 +9,7 @@ import zLOG
 import urllib
 import transaction
 
+from BTrees.OIBTree import OIBTree
 from DateTime import DateTime
 from Products.ATContentTypes.utils import DT2dt
 
@@ -20,6 +21,17 @@ from bika.lims import logger
 from bika.lims.interfaces import IIdServer
 from bika.lims import bikaMessageFactory as _
 from bika.lims.numbergenerator import INumberGenerator
+from bika.lims.numbergenerator import get_portal_annotation
+
+
+# Catalogs searched for existing IDs of a portal type
+SEQUENCE_CATALOGS = ['portal_catalog', 'bika_setup_catalog', 'bika_catalog']
+
+# Annotation key of the persistent index of the highest sequence numbers
+SEQUENCE_INDEX = "bika.lims.sequence_index"
+
+# Objects woken up by the index rebuild between two savepoints
+REBUILD_SAVEPOINT_SIZE = 500
 
 
 class IDServerUnavailable(Exception):
@@ -212,16 +224,14 @@ def get_current_year():
 def search_catalogs(portal_type):
     """Returns brains which share the same portal_type
     """
-    catalog_names = ['portal_catalog', 'bika_setup_catalog', 'bika_catalog']
-    UIDs = []
+    UIDs = set()
     all_brains = []
-    for catalog_name in catalog_names:
-        catalog = api.get_tool(catalog_name)
+    for catalog_name in SEQUENCE_CATALOGS:
         brains = api.search({"portal_type": portal_type}, catalog=catalog_name)
         for brain in brains:
             if brain.UID not in UIDs:
                 all_brains.append(brain)
-                UIDs.append(brain.UID)
+                UIDs.add(brain.UID)
     return all_brains
 
 def search_by_prefix(portal_type, prefix):
@@ -250,6 +260,124 @@ def make_storage_key(portal_type, prefix=None):
     return key
 
 
+def get_prefix_template(config, **kw):
+    """Return the static part of the configured ID template
+    """
+    # separator where to split the ID
+    separator = kw.get('separator', '-')
+
+    # The ID format for string interpolation, e.g. WS-{seq:03d}
+    id_template = config.get("form", "")
+
+    # The split length defines where the variable part of the ID template begins
+    split_length = config.get("split_length", 1)
+
+    return slice(id_template, separator=separator, end=split_length)
+
+
+def get_prefix(config, variables, **kw):
+    """Return the normalized ID prefix for the given variables
+    """
+    prefix_template = get_prefix_template(config, **kw)
+    prefix = prefix_template.format(**variables)
+    # normalize out any unicode characters like Ö, É, etc. from the prefix
+    return api.normalize_filename(prefix)
+
+
+def get_sequence_index():
+    """Return the index of the highest sequence numbers in use
+
+    The index maps the number generator keys to the highest sequence number
+    found in the IDs of the existing objects. It returns None until it was
+    built with `rebuild_sequence_index`.
+    """
+    return get_portal_annotation().get(SEQUENCE_INDEX)
+
+
+def index_sequence_number(key, number):
+    """Record the sequence number of an ID in the sequence index
+    """
+    index = get_sequence_index()
+    if index is None or number <= index.get(key, 0):
+        return False
+    index[key] = number
+    return True
+
+
+def index_object_id(obj, id=None, **kw):
+    """Record the sequence number of the object ID in the sequence index
+
+    Objects whose portal type is not configured with a generated sequence
+    or whose ID doesn't start with the expected prefix are skipped.
+    """
+    portal_type = kw.get("portal_type") or api.get_portal_type(obj)
+    config = kw.get("config") or get_config(obj, portal_type=portal_type)
+    if config.get("sequence_type", "generated") != "generated":
+        return False
+    id = id or api.get_id(obj)
+    prefix = kw.get("prefix")
+    if prefix is None:
+        variables = get_variables(obj, portal_type=portal_type)
+        prefix = get_prefix(config, variables, **kw)
+    if not id.startswith(prefix):
+        return False
+    number = get_seq_number_from_id(id, config.get("form", ""), prefix, **kw)
+    key = make_storage_key(portal_type, prefix)
+    return index_sequence_number(key, number)
+
+
+def rebuild_sequence_index():
+    """Rebuild the sequence index in one pass over the catalogs
+
+    The brains are processed as they are returned by the catalogs. Objects
+    are only woken up when the ID prefix depends on their data, e.g. the
+    sample type of a Sample.
+    """
+    annotation = get_portal_annotation()
+    annotation[SEQUENCE_INDEX] = OIBTree()
+
+    seen = set()
+    woken = 0
+    for catalog_name in SEQUENCE_CATALOGS:
+        catalog = api.get_tool(catalog_name)
+        for portal_type in catalog.uniqueValuesFor("portal_type"):
+            config = get_config(None, portal_type=portal_type)
+            if config.get("sequence_type", "generated") != "generated":
+                continue
+            prefix_template = get_prefix_template(config)
+            static = "{" not in prefix_template
+            prefix = None
+            if static:
+                prefix = get_prefix(config, {})
+            for brain in catalog(portal_type=portal_type):
+                uid = brain.UID
+                if uid in seen:
+                    continue
+                seen.add(uid)
+                try:
+                    if static:
+                        index_object_id(brain, id=api.get_id(brain),
+                                        config=config,
+                                        portal_type=portal_type,
+                                        prefix=prefix)
+                        continue
+                    obj = api.get_object(brain)
+                    index_object_id(obj, config=config,
+                                    portal_type=portal_type)
+                except (AttributeError, KeyError, IndexError, ValueError):
+                    logger.warn("Could not index the ID of {}".format(
+                        brain.getPath()))
+                if static:
+                    continue
+                woken += 1
+                if woken % REBUILD_SAVEPOINT_SIZE == 0:
+                    transaction.savepoint(optimistic=True)
+
+    index = annotation[SEQUENCE_INDEX]
+    logger.info("Rebuilt the sequence index with {} keys".format(len(index)))
+    return index
+
+
 def get_seq_number_from_id(id, id_template, prefix, **kw):
     """Return the sequence number of the given ID
     """
@@ -293,41 +421,34 @@ def get_generated_number(context, config, variables, **kw):
     sequence type "Generated"
     """
 
-    # separator where to split the ID
-    separator = kw.get('separator', '-')
-
     # allow portal_type override
     portal_type = kw.get("portal_type") or api.get_portal_type(context)
 
     # The ID format for string interpolation, e.g. WS-{seq:03d}
     id_template = config.get("form", "")
 
-    # The split length defines where the variable part of the ID template begins
-    split_length = config.get("split_length", 1)
-
-    # The prefix tempalte is the static part of the ID
-    prefix_template = slice(id_template, separator=separator, end=split_length)
-
     # get the number generator
     number_generator = getUtility(INumberGenerator)
 
     # generate the key for the number generator storage
-    prefix = prefix_template.format(**variables)
-
-    # normalize out any unicode characters like Ö, É, etc. from the prefix
-    prefix = api.normalize_filename(prefix)
+    prefix = get_prefix(config, variables, **kw)
 
     # The key used for the storage
     key = make_storage_key(portal_type, prefix)
 
     # Handle flushed storage
     if key not in number_generator:
-        max_num = 0
-        existing = get_ids_with_prefix(portal_type, prefix)
-        numbers = map(lambda id: get_seq_number_from_id(id, id_template, prefix), existing)
-        # figure out the highest number in the sequence
-        if numbers:
-            max_num = max(numbers)
+        index = get_sequence_index()
+        if index is not None:
+            max_num = index.get(key, 0)
+        else:
+            # No index built yet, look up the existing IDs
+            max_num = 0
+            existing = get_ids_with_prefix(portal_type, prefix)
+            numbers = map(lambda id: get_seq_number_from_id(id, id_template, prefix), existing)
+            # figure out the highest number in the sequence
+            if numbers:
+                max_num = max(numbers)
         # set the number generator
         logger.info("*** SEEDING Prefix '{}' to {}".format(prefix, max_num))
         number_generator.set_number(key, max_num)
@@ -339,6 +460,9 @@ def get_generated_number(context, config, variables, **kw):
         #      >>> {sampleId}-R{seq:03d}'.format(sampleId="Water", seq=999999)
         #      'Water-R999999‘
         number = number_generator.generate_number(key=key)
+        # The storage is seeded from the index when it is flushed, so the
+        # index must know the numbers handed out since it was built
+        index_sequence_number(key, number)
     else:
         # => This allows us to "preview" the next generated ID in the UI
         # TODO Show the user the next generated number somewhere in the UI
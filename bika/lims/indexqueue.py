@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Per transaction queue for the indexing operations of the bika catalogs.
+
+The same object is usually reindexed several times within a transaction,
+e.g. a submitted analysis reindexes its review_state, then the AR, the
+worksheet and the dependents cascade reindex it again. The bika catalogs
+record these operations in a queue instead, merge the ones for the same
+object into a single operation with the union of indexes, and run them once
+before the transaction commits.
+
+The queue is flushed before any search on the catalog, so the results of a
+query always reflect the changes made so far. Code reading the catalog
+internals directly mid-transaction must call flush() first.
+
+The queue takes part in the savepoints of the transaction: rolling back to a
+savepoint restores the operations queued at that time, since the catalog
+changes of the operations run since then are rolled back too.
+"""
+
+import threading
+from collections import OrderedDict
+
+import transaction
+from transaction.interfaces import ISavepointDataManager
+from zope.interface import implements
+
+from bika.lims import logger
+
+# Pending operations are run as soon as the queue grows beyond this size
+MAX_QUEUE_SIZE = 1000
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {"queued": 0, "indexed": 0}
+
+
+class IndexQueue(object):
+    """The indexing operations requested within a transaction.
+
+    Each operation is stored as [catalog, object, indexes, update_metadata]
+    and keyed by the catalog id and the object path. An empty list of indexes
+    stands for all the indexes of the catalog.
+    """
+
+    def __init__(self, txn=None):
+        self.transaction = txn
+        self.operations = OrderedDict()
+        self.queued = 0
+        self.indexed = 0
+        # Set while the queue runs before the commit. Any operation requested
+        # afterwards is not queued, but run right away
+        self.closed = False
+        self.data_manager = QueueDataManager(self)
+        if txn is not None:
+            txn.addBeforeCommitHook(self.commit)
+            txn.join(self.data_manager)
+
+    def add(self, catalog, obj, uid, idxs=None, update_metadata=1):
+        """Queues the indexing of the object into the catalog, merged with
+        the operation already queued for the same object, if any.
+        Returns False if the queue is closed and the caller must index the
+        object itself
+        """
+        if self.closed:
+            return False
+        self.queued += 1
+        key = (catalog.getId(), uid)
+        idxs = list(idxs or [])
+        operation = self.operations.get(key)
+        if operation is None:
+            self.operations[key] = [catalog, obj, idxs, update_metadata]
+        else:
+            operation[1] = obj
+            if not operation[2] or not idxs:
+                operation[2] = []
+            else:
+                operation[2].extend([idx for idx in idxs
+                                     if idx not in operation[2]])
+            operation[3] = operation[3] or update_metadata
+        if len(self.operations) >= MAX_QUEUE_SIZE:
+            self.flush()
+        return True
+
+    def discard(self, catalog, uid):
+        """Drops the operation queued for the object, e.g. because it is
+        being uncatalogued
+        """
+        self.operations.pop((catalog.getId(), uid), None)
+
+    def flush(self, catalog=None):
+        """Runs the queued operations, only the ones for the given catalog
+        if any
+        """
+        catalog_id = catalog is not None and catalog.getId() or None
+        for key in self.operations.keys():
+            if catalog_id is not None and key[0] != catalog_id:
+                continue
+            operation = self.operations.pop(key, None)
+            if operation is None:
+                # Already run by a nested flush
+                continue
+            cat, obj, idxs, update_metadata = operation
+            cat._indexObjectNow(obj, key[1], idxs, update_metadata)
+            self.indexed += 1
+
+    def snapshot(self):
+        """Returns a copy of the pending operations
+        """
+        return OrderedDict(
+            (key, [cat, obj, list(idxs), update_metadata])
+            for key, (cat, obj, idxs, update_metadata)
+            in self.operations.items())
+
+    def restore(self, operations):
+        """Replaces the pending operations by a snapshot
+        """
+        self.operations = OrderedDict(
+            (key, [cat, obj, list(idxs), update_metadata])
+            for key, (cat, obj, idxs, update_metadata)
+            in operations.items())
+
+    def commit(self):
+        """Runs all the pending operations before the transaction commits
+        """
+        self.closed = True
+        self.flush()
+        with _stats_lock:
+            _stats["queued"] += self.queued
+            _stats["indexed"] += self.indexed
+        if self.queued:
+            logger.debug(
+                "Index queue: {} of {} indexing operations run, {} saved"
+                .format(self.indexed, self.queued,
+                        self.queued - self.indexed))
+
+
+class QueueSavepoint(object):
+    """The operations queued when a savepoint was made
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.operations = queue.snapshot()
+
+    def rollback(self):
+        self.queue.restore(self.operations)
+
+
+class QueueDataManager(object):
+    """Joins the queue to the transaction, so its savepoints and aborts
+    reach the queue. The operations are run by the before commit hook, there
+    is nothing to commit here.
+    """
+    implements(ISavepointDataManager)
+
+    transaction_manager = transaction.manager
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def savepoint(self):
+        return QueueSavepoint(self.queue)
+
+    def abort(self, txn):
+        self.queue.operations.clear()
+
+    def tpc_begin(self, txn):
+        pass
+
+    def commit(self, txn):
+        pass
+
+    def tpc_vote(self, txn):
+        pass
+
+    def tpc_finish(self, txn):
+        pass
+
+    def tpc_abort(self, txn):
+        self.queue.operations.clear()
+
+    def sortKey(self):
+        return "bika.lims.indexqueue"
+
+
+def get_queue():
+    """Returns the queue of the current transaction
+    """
+    txn = transaction.get()
+    queue = getattr(_local, "queue", None)
+    if queue is None or queue.transaction is not txn:
+        queue = _local.queue = IndexQueue(txn)
+    return queue
+
+
+def flush(catalog=None):
+    """Runs the pending indexing operations of the current transaction, only
+    the ones for the given catalog if any
+    """
+    queue = getattr(_local, "queue", None)
+    if queue is not None and queue.transaction is transaction.get():
+        queue.flush(catalog)
+
+
+def get_stats():
+    """Returns the number of indexing operations requested and actually run
+    by the committed transactions of this process
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["saved"] = stats["queued"] - stats["indexed"]
+    return stats
@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Persistent queue of the outgoing emails
+
+`MailHost.send(..., immediate=True)` opens an SMTP connection for every
+message, within the transaction, and the message is sent even if the
+transaction is aborted afterwards. queue_mail() stores the message in the
+portal annotation instead, so it is committed, or discarded, with the
+transaction. Once committed, a sender thread delivers the queued messages
+reusing the SMTP connections of a pool, and stores the status of each
+message: sent, retried with an increasing delay after temporary errors, or
+failed.
+
+Each message is claimed by the sender in a transaction of its own before it
+is handed to the SMTP server, so the senders of other Zope instances, or a
+conflict when storing the status, never deliver it twice. A message left
+claimed by a sender that stopped is marked as failed after CLAIM_TIMEOUT, it
+may have been delivered already.
+
+The SMTP settings are taken from the MailHost of the portal.
+"""
+
+import Queue
+import smtplib
+import socket
+import threading
+import time
+import uuid
+import weakref
+from email import message_from_string
+from email.Utils import formatdate
+from email.Utils import getaddresses
+from email.Utils import make_msgid
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from persistent import Persistent
+from Products.CMFCore.utils import getToolByName
+from ZODB.POSException import ConflictError
+
+from bika.lims import logger
+from bika.lims.numbergenerator import get_portal_annotation
+
+STORAGE_KEY = "bika.lims.mail_queue"
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# Attempts to deliver a message before giving up
+MAX_ATTEMPTS = 5
+
+# Seconds to wait before the first retry, doubled on each attempt
+RETRY_DELAY = 60
+
+# Seconds the sender waits before looking for messages to retry
+POLL_INTERVAL = 30
+
+# Seconds an unused SMTP connection is kept open
+MAX_IDLE = 60
+
+# Seconds the sent and failed messages are kept in the queue
+KEEP_SECONDS = 7 * 24 * 3600
+
+# Seconds after which a message claimed by a sender is considered abandoned
+CLAIM_TIMEOUT = 3600
+
+# Attempts to commit the delivery status of a message
+COMMIT_ATTEMPTS = 3
+
+# Attributes of a message set by its delivery
+DELIVERY_ATTRIBUTES = ["status", "attempts", "error", "next_attempt", "sent"]
+
+
+class QueuedMail(Persistent):
+    """An outgoing email and its delivery status
+    """
+
+    def __init__(self, id, message, mfrom, mto):
+        self.id = id
+        self.message = message
+        self.mfrom = mfrom
+        self.mto = mto
+        self.status = QUEUED
+        self.attempts = 0
+        self.error = ""
+        self.queued = time.time()
+        self.next_attempt = self.queued
+        self.sent = None
+        self.owner = None
+        self.claimed = None
+
+    def is_due(self, now):
+        return self.status == QUEUED and self.next_attempt <= now
+
+    def is_abandoned(self, now):
+        claimed = getattr(self, "claimed", None) or self.queued
+        return self.status == SENDING and now - claimed > CLAIM_TIMEOUT
+
+    def claim(self, owner, now):
+        """Marks the message as being sent by the owner
+        """
+        self.status = SENDING
+        self.owner = owner
+        self.claimed = now
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "from": self.mfrom,
+            "to": self.mto,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "queued": self.queued,
+            "next_attempt": self.next_attempt,
+            "sent": self.sent,
+            "owner": getattr(self, "owner", None),
+        }
+
+
+def get_storage(annotation=None, create=False):
+    """Returns the queue storage, message id -> QueuedMail, or None if no
+    message was queued yet
+    """
+    if annotation is None:
+        annotation = get_portal_annotation()
+    storage = annotation.get(STORAGE_KEY)
+    if storage is None and create:
+        storage = annotation[STORAGE_KEY] = OOBTree()
+    return storage
+
+
+def get_addresses(message, mfrom=None, mto=None):
+    """Returns the sender and the recipients of the message, from its headers
+    unless given
+    """
+    if not mfrom:
+        mfrom = getaddresses(message.get_all("From", []))
+        mfrom = mfrom and mfrom[0][1] or ""
+    if not mto:
+        headers = message.get_all("To", []) + message.get_all("Cc", []) + \
+            message.get_all("Bcc", [])
+        mto = [address for name, address in getaddresses(headers) if address]
+    elif isinstance(mto, basestring):
+        mto = [mto]
+    return mfrom, list(mto)
+
+
+def get_smtp_settings(context):
+    """Returns the SMTP settings of the MailHost
+    """
+    host = getToolByName(context, "MailHost")
+    return {
+        "host": getattr(host, "smtp_host", "localhost") or "localhost",
+        "port": int(getattr(host, "smtp_port", 25) or 25),
+        "userid": getattr(host, "smtp_uid", "") or None,
+        "password": getattr(host, "smtp_pwd", "") or None,
+        "tls": bool(getattr(host, "force_tls", False)),
+    }
+
+
+def set_headers(message):
+    """Dates the message when it is queued, not when it is delivered, and
+    gives it a Message-ID, so the retries are recognized as the same message
+    """
+    if "Date" not in message:
+        message["Date"] = formatdate(localtime=True)
+    if "Message-ID" not in message:
+        message["Message-ID"] = make_msgid()
+    return message
+
+
+def queue_mail(context, message, mfrom=None, mto=None):
+    """Queues the message, a string or an email Message, to be sent once the
+    current transaction is committed. Returns the id of the queued message
+    """
+    if isinstance(message, basestring):
+        message = message_from_string(message)
+    mfrom, mto = get_addresses(message, mfrom, mto)
+    if "Bcc" in message:
+        del message["Bcc"]
+    set_headers(message)
+    mail_id = uuid.uuid4().hex
+    storage = get_storage(create=True)
+    storage[mail_id] = QueuedMail(mail_id, message.as_string(), mfrom, mto)
+    get_sender().wake_up_on_commit(storage, get_smtp_settings(context))
+    return mail_id
+
+
+def get_status(mail_id):
+    """Returns the status of the queued message as a dictionary, or None
+    """
+    storage = get_storage()
+    mail = storage is not None and storage.get(mail_id) or None
+    return mail and mail.to_dict() or None
+
+
+class SMTPPool(object):
+    """Open SMTP connections to a server, reused for the next messages
+    """
+
+    def __init__(self, host="localhost", port=25, userid=None, password=None,
+                 tls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.userid = userid
+        self.password = password
+        self.tls = tls
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.tls:
+            connection.ehlo()
+            connection.starttls()
+            connection.ehlo()
+        if self.userid:
+            connection.login(self.userid, self.password)
+        return connection
+
+    def acquire(self):
+        """Returns an idle connection that still answers, or a new one
+        """
+        now = time.time()
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                connection, released = self.idle.pop()
+            if now - released > MAX_IDLE:
+                self.quit(connection)
+                continue
+            try:
+                connection.noop()
+                return connection
+            except (smtplib.SMTPException, socket.error):
+                self.quit(connection)
+        return self.connect()
+
+    def release(self, connection, broken=False):
+        if broken:
+            self.quit(connection)
+            return
+        with self.lock:
+            self.idle.append((connection, time.time()))
+
+    def quit(self, connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, socket.error):
+            connection.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, released in idle:
+            self.quit(connection)
+
+
+def is_permanent(error):
+    """Tells if the error won't go away by retrying later
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, msg in error.recipients.values()]
+        return min(codes) >= 500
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def deliver(mail, pool, now=None):
+    """Sends the message through a connection of the pool and updates its
+    status. Returns True if it was sent
+    """
+    now = now or time.time()
+    mail.attempts += 1
+    try:
+        connection = pool.acquire()
+    except (smtplib.SMTPException, socket.error) as e:
+        return retry(mail, e, now)
+    try:
+        refused = connection.sendmail(mail.mfrom, mail.mto, mail.message)
+    except (smtplib.SMTPServerDisconnected, socket.error) as e:
+        pool.release(connection, broken=True)
+        return retry(mail, e, now)
+    except smtplib.SMTPException as e:
+        # the connection is still usable after a rejection
+        pool.release(connection)
+        return retry(mail, e, now)
+    pool.release(connection)
+    mail.status = SENT
+    mail.sent = time.time()
+    mail.error = refused and "Refused: %s" % ", ".join(refused.keys()) or ""
+    return True
+
+
+def retry(mail, error, now):
+    """Schedules the next attempt to deliver the message, with a delay that
+    doubles on each attempt, or marks it as failed
+    """
+    mail.error = "%s: %s" % (error.__class__.__name__, error)
+    if is_permanent(error) or mail.attempts >= MAX_ATTEMPTS:
+        mail.status = FAILED
+        logger.error("Mail %s to %s failed: %s" %
+                     (mail.id, ", ".join(mail.mto), mail.error))
+    else:
+        mail.status = QUEUED
+        mail.next_attempt = now + RETRY_DELAY * 2 ** (mail.attempts - 1)
+        logger.warn("Mail %s to %s will be retried: %s" %
+                    (mail.id, ", ".join(mail.mto), mail.error))
+    return False
+
+
+def send_queued(storage, pool, commit=None, now=None, owner=None):
+    """Delivers the due messages of the storage. Returns the number of
+    messages sent
+
+    :param commit: function committing the current transaction, returns
+        False if it conflicted and was aborted. Each message is claimed and
+        committed before it is sent, and its status is committed after, so
+        a message is never sent twice
+    :param owner: id of the sender claiming the messages
+    """
+    now = now or time.time()
+    sent = 0
+    for mail_id in list(storage.keys()):
+        mail = storage.get(mail_id)
+        if mail is None:
+            continue
+        if mail.status in (SENT, FAILED) and \
+                now - (mail.sent or mail.queued) > KEEP_SECONDS:
+            del storage[mail_id]
+            continue
+        if mail.is_abandoned(now):
+            mail.status = FAILED
+            mail.error = "Interrupted while sending, it may have been sent"
+            logger.error("Mail %s to %s abandoned by %s" %
+                         (mail_id, ", ".join(mail.mto), mail.owner))
+            continue
+        if not mail.is_due(now):
+            continue
+        mail.claim(owner, now)
+        if commit is not None and not commit():
+            # claimed by another sender
+            continue
+        start = time.time()
+        if deliver(mail, pool, now):
+            sent += 1
+            logger.info("Mail %s to %s sent in %.2fs" %
+                        (mail_id, ", ".join(mail.mto), time.time() - start))
+        if commit is not None:
+            commit_delivery(storage, mail, commit)
+    return sent
+
+
+def commit_delivery(storage, mail, commit):
+    """Commits the delivery status of the message, applying it again on
+    conflicts
+    """
+    delivery = dict([(name, getattr(mail, name))
+                     for name in DELIVERY_ATTRIBUTES])
+    for attempt in range(COMMIT_ATTEMPTS):
+        if commit():
+            return True
+        mail = storage.get(mail.id)
+        if mail is None:
+            break
+        for name, value in delivery.items():
+            setattr(mail, name, value)
+    logger.error("Could not store the status of mail %s: %s" %
+                 (mail and mail.id, delivery["status"]))
+    return False
+
+
+class MailSender(object):
+    """Thread delivering the queued messages of the committed transactions,
+    and retrying the pending ones every POLL_INTERVAL seconds
+    """
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        # (db, storage oid) -> SMTP settings of the queues seen
+        self.storages = {}
+        self.pools = {}
+        # transactions that wake the sender up when committed
+        self.hooked = weakref.WeakKeyDictionary()
+        # id of this sender in the messages it claims
+        self.owner = "%s-%s" % (socket.gethostname(), uuid.uuid4().hex)
+
+    def wake_up_on_commit(self, storage, settings):
+        """Wakes the sender up once the current transaction is committed
+        """
+        txn = transaction.get()
+        if txn in self.hooked:
+            return
+        self.hooked[txn] = True
+
+        def wake_up(success):
+            if success:
+                self.start()
+                self.queue.put((storage._p_jar.db(), storage._p_oid,
+                                settings))
+        txn.addAfterCommitHook(wake_up)
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.work,
+                                           name="bika.lims.mailqueue")
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def work(self):
+        while True:
+            try:
+                db, oid, settings = self.queue.get(timeout=POLL_INTERVAL)
+                self.storages[(db, oid)] = settings
+            except Queue.Empty:
+                pass
+            for (db, oid), settings in self.storages.items():
+                try:
+                    self.send(db, oid, settings)
+                except Exception as e:
+                    logger.error("Mail queue failed: %s" % e)
+
+    def get_pool(self, settings):
+        key = tuple(sorted(settings.items()))
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = SMTPPool(**settings)
+        return pool
+
+    def send(self, db, oid, settings):
+        tm = transaction.TransactionManager()
+        connection = db.open(transaction_manager=tm)
+
+        def commit():
+            try:
+                tm.commit()
+                return True
+            except ConflictError:
+                tm.abort()
+                return False
+
+        try:
+            tm.begin()
+            storage = connection.get(oid)
+            send_queued(storage, self.get_pool(settings), commit,
+                        owner=self.owner)
+            commit()
+        finally:
+            tm.abort()
+            connection.close()
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = MailSender()
+        return _sender
@@ -3,9 +3,13 @@
 import thread
 import logging
 import datetime
+import App.config
+import transaction
 from bika.lims.interfaces import INumberGenerator
-from BTrees.OIBTree import OIBTree
+from BTrees.OOBTree import OOBTree
+from persistent import Persistent
 from plone import api
+from ZODB.POSException import ConflictError
 from zope.annotation.interfaces import IAnnotations
 from zope.component import getGlobalSiteManager
 from zope.interface import implements
@@ -21,6 +25,34 @@ STORAGE_HASH = "bika.lims.numbercounter.hash"
 
 NUMBER_STORAGE = "bika.lims.consecutive_numbers_storage"
 
+# Attempts to commit a block reservation before giving up
+RESERVE_ATTEMPTS = 10
+
+# Numbers reserved by this process and not handed out yet:
+# (database, site path, key) -> [next number, last number, serial of the
+# counter after the reservation]
+reserved_blocks = {}
+
+
+def get_block_size():
+    """ Numbers reserved at once for a key by each ZEO client, configured in
+        zope.conf:
+
+            <product-config bika.lims>
+                number_block_size 10
+            </product-config>
+
+        Defaults to 1, which takes every number from the storage within the
+        current transaction and doesn't leave gaps in the sequences
+    """
+    config = getattr(App.config.getConfiguration(), "product_config", None)
+    config = (config or {}).get("bika.lims", {})
+    try:
+        return max(int(config.get("number_block_size", 1)), 1)
+    except ValueError:
+        logger.error("number_block_size must be an integer")
+        return 1
+
 
 def get_storage_location():
     """ get the portal with the plone.api
@@ -36,6 +68,28 @@ def get_portal_annotation():
     return IAnnotations(get_storage_location())
 
 
+def get_block_key(key):
+    """ key of the numbers reserved by this process for the key of the
+        current site, which may share the process with other sites and
+        databases
+    """
+    site = api.portal.getSite()
+    jar = getattr(site, "_p_jar", None)
+    database = jar is not None and jar.db().database_name or ""
+    return (database, "/".join(site.getPhysicalPath()), key)
+
+
+class Counter(Persistent):
+    """ persistent number of a single key
+
+        Each key has its own counter object, so numbers for different keys
+        are stored apart and never conflict with each other
+    """
+
+    def __init__(self, value=0):
+        self.value = value
+
+
 class NumberGenerator(object):
     """ perisistent consecutive numbers
     """
@@ -47,7 +101,7 @@ class NumberGenerator(object):
         """
         annotation = get_portal_annotation()
         if annotation.get(NUMBER_STORAGE) is None:
-            annotation[NUMBER_STORAGE]  = OIBTree()
+            annotation[NUMBER_STORAGE] = OOBTree()
         return annotation[NUMBER_STORAGE]
 
     def flush(self):
@@ -56,6 +110,8 @@ class NumberGenerator(object):
         annotations = get_portal_annotation()
         if annotations.get(NUMBER_STORAGE) is not None:
             del annotations[NUMBER_STORAGE]
+        with lock:
+            reserved_blocks.clear()
 
     def keys(self):
         out = []
@@ -65,40 +121,126 @@ class NumberGenerator(object):
 
     def values(self):
         out = []
-        for value in self.storage.values():
-            out.append(value)
+        for counter in self.storage.values():
+            out.append(counter.value)
         return out
 
     def __iter__(self):
         return self.storage.__iter__()
 
+    def __contains__(self, key):
+        return key in self.storage
+
     def __getitem__(self, key):
-        return self.storage.__getitem__(key)
+        return self.storage.__getitem__(key).value
+
+    def __delitem__(self, key):
+        del self.storage[key]
+        with lock:
+            reserved_blocks.pop(get_block_key(key), None)
 
     def get(self, key, default=None):
-        return self.storage.get(key, default)
+        counter = self.storage.get(key)
+        if counter is None:
+            return default
+        return counter.value
 
     def get_number(self, key):
         """ get the next consecutive number
         """
+        block_size = get_block_size()
+        if block_size > 1:
+            number = self.get_reserved_number(key, block_size)
+            if number is not None:
+                return number
+
         storage = self.storage
 
-        logger.debug("NUMBER before => %s" % storage.get(key, '-'))
+        logger.debug("NUMBER before => %s" % self.get(key, '-'))
         try:
             logger.debug("*** consecutive number lock acquire ***")
             lock.acquire()
-            try:
-                counter = storage[key]
-                storage[key] = counter + 1
-            except KeyError:
-                storage[key] = 1
+            counter = storage.get(key)
+            if counter is None:
+                counter = storage[key] = Counter()
+            counter.value += 1
         finally:
             logger.debug("*** consecutive number lock release ***")
-            self.storage._p_changed = True
             lock.release()
 
-        logger.debug("NUMBER after => %s" % storage.get(key, '-'))
-        return storage[key]
+        logger.debug("NUMBER after => %s" % counter.value)
+        return counter.value
+
+    def get_reserved_number(self, key, block_size):
+        """ get the next number from the block reserved by this process,
+            reserving a new block when the current one is exhausted.
+            Returns None if no block could be reserved
+        """
+        block_key = get_block_key(key)
+        counter = self.storage.get(key)
+        with lock:
+            block = reserved_blocks.get(block_key)
+            if block and self.is_counter_reset(counter, block):
+                block = None
+            if not block or block[0] > block[1]:
+                block = self.reserve_block(key, block_size)
+                if block is None:
+                    return None
+                reserved_blocks[block_key] = block
+            number = block[0]
+            block[0] += 1
+        return number
+
+    def is_counter_reset(self, counter, block):
+        """ check if the counter was set back below the end of the block
+            after the block was reserved, e.g. by set_number in another
+            process. A counter read before the reservation is never reset
+        """
+        if counter is None:
+            return True
+        value = counter.value
+        serial = getattr(counter, "_p_serial", None)
+        return serial > block[2] and value < block[1]
+
+    def reserve_block(self, key, size):
+        """ reserve the next size numbers of the key
+
+            The reservation is committed right away in a transaction of its
+            own and retried on conflicts, so the numbers are never handed out
+            twice and the current transaction doesn't write the counter.
+            Numbers not handed out before the process stops are lost.
+            Returns [first, last, serial] or None if the counter is not
+            committed yet
+        """
+        storage = self.storage
+        counter = storage.get(key)
+        if getattr(counter, "_p_oid", None) is None:
+            # Seeded in the current transaction
+            return None
+
+        oid = counter._p_oid
+        tm = transaction.TransactionManager()
+        connection = counter._p_jar.db().open(transaction_manager=tm)
+        try:
+            for attempt in range(RESERVE_ATTEMPTS):
+                tm.begin()
+                counter = connection.get(oid)
+                first = counter.value + 1
+                counter.value += size
+                try:
+                    tm.commit()
+                except ConflictError:
+                    tm.abort()
+                    continue
+                logger.debug("Reserved numbers %s-%s for %s" %
+                             (first, first + size - 1, key))
+                return [first, first + size - 1, counter._p_serial]
+        finally:
+            tm.abort()
+            connection.close()
+
+        logger.warn("Could not reserve numbers for %s" % key)
+        return None
 
     def set_number(self, key, value):
         """ set a key's value
@@ -111,12 +253,16 @@ class NumberGenerator(object):
 
         try:
             lock.acquire()
-            storage[key] = value
+            counter = storage.get(key)
+            if counter is None:
+                counter = storage[key] = Counter()
+            counter.value = value
+            # Numbers reserved by this process before are discarded
+            reserved_blocks.pop(get_block_key(key), None)
         finally:
-            self.storage._p_changed = True
             lock.release()
 
-        return storage[key]
+        return counter.value
 
 
     def generate_number(self, key="default"):
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Bounded process pool converting the HTML of the reports to PDF
+
+WeasyPrint holds the GIL for the whole conversion, so publishing many ARs
+renders their PDFs one after another in the request thread. The pool runs
+the conversions in separate processes instead, while Zope keeps rendering
+the HTML and creating the reports. The worker processes never touch the
+ZODB: they get the HTML and the host, cookie and authorization needed to
+fetch the images and stylesheets, and return the PDF data.
+
+The pool is off by default. The number of worker processes is configured in
+zope.conf:
+
+    <product-config bika.lims>
+        pdf_workers 4
+        pdf_timeout 300
+        pdf_max_tasks 0
+    </product-config>
+
+With 0 workers the PDFs are rendered in the calling thread, as before.
+
+The pool is started once with the Zope process, before the threads serving
+the requests exist, so a change of pdf_workers needs a restart. The workers
+are forked by a separate manager process started at that moment, so neither
+they nor the ones replacing them later inherit the state of the threads of
+Zope.
+
+Each worker keeps the images and stylesheets it fetches in its own asset
+cache, see bika.lims.assetcache. The workers are kept as long as the pool
+by default, so the cache isn't thrown away. pdf_max_tasks replaces each
+worker after that many conversions, if WeasyPrint doesn't give the memory
+back.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+
+import App
+
+from bika.lims import assetcache
+from bika.lims import logger
+
+# Default number of worker processes, the PDFs are rendered in the calling
+# thread
+DEFAULT_WORKERS = 0
+
+# Default seconds to wait for a PDF before giving up
+DEFAULT_TIMEOUT = 300
+
+# Default conversions run by a worker before it is replaced, 0 to keep the
+# workers and their asset cache
+DEFAULT_MAX_TASKS = 0
+
+_manager = None
+_pool = None
+
+
+def get_config(name, default):
+    """Returns the integer value of the bika.lims product-config option
+    """
+    config = getattr(App.config.getConfiguration(), "product_config", None)
+    config = (config or {}).get("bika.lims", {})
+    try:
+        return max(int(config.get(name, default)), 0)
+    except ValueError:
+        logger.error("%s must be an integer" % name)
+        return default
+
+
+def get_worker_count():
+    """Number of processes converting the PDFs, 0 to convert them in the
+    calling thread
+    """
+    return get_config("pdf_workers", DEFAULT_WORKERS)
+
+
+def get_max_tasks():
+    """Conversions run by a worker before it is replaced, or None to keep
+    the workers
+    """
+    return get_config("pdf_max_tasks", DEFAULT_MAX_TASKS) or None
+
+
+def get_timeout():
+    """Seconds to wait for a PDF
+    """
+    return get_config("pdf_timeout", DEFAULT_TIMEOUT) or None
+
+
+def start_pool():
+    """Starts the process pool of this Zope process, if PDF workers are
+    configured. Returns the pool, or None if the PDFs are rendered in the
+    calling thread
+
+    Called when the process starts, see bika.lims.subscribers.pdfpool. The
+    pool lives in a manager process, which forks the workers.
+    """
+    global _manager, _pool
+    workers = get_worker_count()
+    if not workers or _pool is not None:
+        return _pool
+    try:
+        _manager = multiprocessing.Manager()
+        _pool = _manager.Pool(processes=workers,
+                              maxtasksperchild=get_max_tasks())
+    except OSError as e:
+        logger.error("Cannot start the PDF pool: %s" % e)
+        return None
+    logger.info("Started a pool of %s PDF workers" % workers)
+    return _pool
+
+
+def get_pool():
+    """Returns the process pool started with this Zope process, or None if
+    the PDFs are rendered in the calling thread
+    """
+    return _pool
+
+
+def render_pdf(html, fetch_options, keep_file=False):
+    """Converts the html to PDF. Returns the PDF data, the seconds it took,
+    the name of the PDF file if it was kept, for debugging, and the counters
+    of the asset cache for this conversion
+
+    This function runs in the worker processes.
+    """
+    # Imported here, so that the worker processes import WeasyPrint once
+    from bika.lims.utils import createPdf
+    from bika.lims.utils import get_url_fetcher
+
+    start = time.time()
+    before = assetcache.get_cache().get_counters()
+    pdf_fn = tempfile.mktemp(suffix=".pdf")
+    pdf = createPdf(htmlreport=html, outfile=pdf_fn,
+                    url_fetcher=get_url_fetcher(*fetch_options))
+    after = assetcache.get_cache().get_counters()
+    counters = dict([(name, value - before.get(name, 0))
+                     for name, value in after.items()])
+    if keep_file:
+        return pdf, time.time() - start, pdf_fn, counters
+    os.remove(pdf_fn)
+    return pdf, time.time() - start, None, counters
+
+
+class LocalResult(object):
+    """Result of a PDF rendered in the calling thread, with the interface of
+    multiprocessing's AsyncResult
+    """
+
+    def __init__(self, html, fetch_options, keep_file):
+        self.args = (html, fetch_options, keep_file)
+        self.value = None
+
+    def get(self, timeout=None):
+        if self.value is None:
+            # the asset cache of this process counted the conversion already
+            self.value = render_pdf(*self.args)[:3]
+        return self.value
+
+
+class PoolResult(object):
+    """Result of a PDF rendered by a worker. The counters of the asset cache
+    of the worker are added to the ones of this process on get()
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.value = None
+
+    def get(self, timeout=None):
+        if self.value is None:
+            pdf, secs, pdf_fn, counters = self.result.get(timeout)
+            assetcache.get_cache().add_counters(counters)
+            self.value = (pdf, secs, pdf_fn)
+        return self.value
+
+
+def submit(html, fetch_options, keep_file=False):
+    """Sends the html to be converted to PDF. Returns a result whose get()
+    returns the PDF data, the seconds it took to render and the name of the
+    file kept for debugging, if any
+
+    Without pool, the PDF is rendered in the calling thread on get().
+    """
+    pool = get_pool()
+    if pool is None:
+        return LocalResult(html, fetch_options, keep_file)
+    return PoolResult(
+        pool.apply_async(render_pdf, (html, fetch_options, keep_file)))
+
+
+def submit_many(htmls, fetch_options, keep_files=False):
+    """Sends the htmls to be converted to PDF, each distinct html once.
+    Returns the list of results, in the same order as the htmls
+    """
+    results = {}
+    for html in htmls:
+        if html not in results:
+            results[html] = submit(html, fetch_options, keep_files)
+    return [results[html] for html in htmls]
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Background generation of the reports
+
+Reports submitted in job mode are not rendered within the HTTP request. The
+parameters of the form are stored in a job and its id is handed to a queue.
+A worker renders the report with its own ZODB connection, so the whole
+report is computed from the consistent snapshot of the database seen by a
+single transaction. The PDF is stored as a Report object in the reports
+folder, like the reports generated synchronously, and the user who submitted
+the report is notified by email when it is ready.
+
+The status, progress and timing of the jobs are stored in the portal
+annotation. The worker records them with a connection of its own, so they
+are visible while the report is being computed.
+
+The default queue runs the jobs in a worker thread once the transaction that
+submitted them is committed. The jobs are lost when the process stops. Each
+job records the process that runs it, and when an instance starts again,
+the jobs left queued or running by its previous process are failed, so the
+users can submit them again. The jobs of other instances are only failed
+when their status was not updated for STALE_SECONDS. Tests install a LocalQueue with set_queue() and
+run the queued jobs in the current transaction by calling its process().
+"""
+
+import Queue
+import socket
+import threading
+import traceback
+import uuid
+from email.mime.text import MIMEText
+
+import App.config
+import transaction
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from BTrees.OOBTree import OOBTree
+from DateTime import DateTime
+from persistent import Persistent
+from Products.CMFCore.utils import getToolByName
+from Products.CMFPlone.utils import safe_unicode
+from Testing.makerequest import makerequest
+from ZODB.POSException import ConflictError
+from zope.component.hooks import setSite
+from zope.event import notify
+from zope.traversing.interfaces import BeforeTraverseEvent
+
+from bika.lims import logger
+from bika.lims.numbergenerator import get_portal_annotation
+
+STORAGE_KEY = "bika.lims.report_jobs"
+
+# Value of the output_format form field that submits the report as a job
+JOB_FORMAT = "JOB"
+
+# Form fields not stored with the parameters of a job
+IGNORED_PARAMS = ["submit", "_authenticator", "output_format", "form.submitted"]
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+STATUS_ATTEMPTS = 3
+
+# Seconds after which a queued or running job whose status was not updated
+# is failed, whatever process runs it
+STALE_SECONDS = 24 * 3600
+
+# Id of this process in the jobs it runs
+PROCESS_ID = uuid.uuid4().hex
+
+# Request environment the worker renders the reports with
+ENVIRON_KEYS = ["SERVER_NAME", "SERVER_PORT", "HTTP_HOST", "HTTPS",
+                "SERVER_URL"]
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class ReportJob(Persistent):
+    """The parameters, status and timing of a report generated in background
+    """
+
+    def __init__(self, id, report_id, userid, params):
+        self.id = id
+        self.report_id = report_id
+        self.userid = userid
+        self.params = params
+        self.status = QUEUED
+        self.progress = 0
+        self.message = ""
+        self.report_uid = None
+        self.report_url = None
+        self.submitted = DateTime()
+        self.started = None
+        self.finished = None
+        self.owner = get_owner()
+        self.updated = self.submitted
+
+    def get_duration(self):
+        """Returns the seconds the report took or took so far to compute
+        """
+        if self.started is None:
+            return None
+        finished = self.finished or DateTime()
+        return round((finished - self.started) * 86400, 3)
+
+    def get_wait(self):
+        """Returns the seconds the job waited in the queue
+        """
+        started = self.started or DateTime()
+        return round((started - self.submitted) * 86400, 3)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "report_id": self.report_id,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "report_uid": self.report_uid,
+            "report_url": self.report_url,
+            "submitted": self.submitted and self.submitted.ISO8601(),
+            "started": self.started and self.started.ISO8601(),
+            "finished": self.finished and self.finished.ISO8601(),
+            "wait": self.get_wait(),
+            "duration": self.get_duration(),
+        }
+
+
+def get_storage(annotation=None, create=False):
+    """Returns the jobs storage, job id -> ReportJob, or None if no job was
+    submitted yet
+    """
+    if annotation is None:
+        annotation = get_portal_annotation()
+    storage = annotation.get(STORAGE_KEY)
+    if storage is None and create:
+        storage = annotation[STORAGE_KEY] = OOBTree()
+    return storage
+
+
+def get_job(job_id):
+    """Returns the job with the given id or None
+    """
+    storage = get_storage()
+    if storage is None:
+        return None
+    return storage.get(job_id)
+
+
+def get_params(form):
+    """Returns the parameters of the report form to be stored in a job
+    """
+    params = {}
+    for key, value in form.items():
+        if key in IGNORED_PARAMS:
+            continue
+        if hasattr(value, "items"):
+            # ZPublisher records
+            value = dict(value.items())
+        params[key] = value
+    return params
+
+
+def get_instance_id():
+    """Returns the id of this Zope instance, the same after a restart
+    """
+    config = App.config.getConfiguration()
+    return "%s:%s" % (socket.gethostname(),
+                      getattr(config, "instancehome", ""))
+
+
+def get_owner():
+    """Returns the id of this process in the jobs it runs
+    """
+    return "%s:%s" % (get_instance_id(), PROCESS_ID)
+
+
+def is_interrupted(job, now=None):
+    """Tells if the queued or running job was left by a previous process of
+    this instance, or was not updated for STALE_SECONDS
+    """
+    if job.status not in (QUEUED, RUNNING):
+        return False
+    owner = getattr(job, "owner", None) or ""
+    instance, sep, process = owner.rpartition(":")
+    if instance == get_instance_id() and process != PROCESS_ID:
+        return True
+    now = now or DateTime()
+    updated = getattr(job, "updated", None) or job.started or job.submitted
+    return (now - updated) * 86400 > STALE_SECONDS
+
+
+def submit(portal, report_id, userid, form):
+    """Stores a job for the report with the parameters of the form and hands
+    it to the queue. Returns the job
+    """
+    job_id = uuid.uuid4().hex
+    job = ReportJob(job_id, report_id, userid, get_params(form))
+    get_storage(create=True)[job_id] = job
+    get_queue().put(portal, job_id)
+    logger.info("Report job %s queued: %s" % (job_id, report_id))
+    return job
+
+
+def set_status(job, **kw):
+    """Sets the status attributes of the job in the current transaction
+    """
+    for key, value in kw.items():
+        setattr(job, key, value)
+    job.updated = DateTime()
+
+
+def fail_interrupted_jobs(annotation=None, now=None):
+    """Fails the jobs left queued or running by a process that stopped, see
+    is_interrupted. Returns the number of failed jobs
+    """
+    storage = get_storage(annotation)
+    if storage is None:
+        return 0
+    failed = 0
+    for job in storage.values():
+        if not is_interrupted(job, now):
+            continue
+        set_status(job, status=FAILED, finished=DateTime(),
+                   message="Interrupted by a restart, please submit the "
+                           "report again")
+        failed += 1
+    return failed
+
+
+def run_job(portal, job_id, status=None):
+    """Renders the report of the job with the request of the portal and stores
+    it in the reports folder. Returns the Report object, or None if the job
+    doesn't exist
+
+    :param status: function called with the job and the attributes of its
+        status each time they change. Defaults to set_status
+    """
+    # Imported here, the views import this module
+    from bika.lims.browser.reports import SubmitForm
+
+    status = status or set_status
+    job = get_job(job_id)
+    if job is None:
+        logger.warn("Report job %s not found" % job_id)
+        return None
+    started = DateTime()
+    status(job, status=RUNNING, started=started, owner=get_owner(),
+           progress=10, message="Computing the report")
+
+    request = portal.REQUEST
+    request.form.update(job.params)
+    request.other.update(job.params)
+    request["report_job"] = job_id
+
+    view = SubmitForm(portal.reports, request)
+    view.additional_reports = []
+    report_class = view.get_report_class(job.report_id)
+    if report_class is None:
+        raise ValueError("Report %s not found" % job.report_id)
+    view.setup_report()
+    output = report_class(portal.reports, request)()
+    if not isinstance(output, dict):
+        raise ValueError("Report %s returned no PDF data" % job.report_id)
+    status(job, progress=60, message="Rendering the PDF")
+
+    pdf, report = view.store_report(output)
+    if report is None:
+        raise ValueError("PDF of report %s could not be created" %
+                         job.report_id)
+    status(job, progress=90, message="Storing the report")
+    logger.info("Report job %s computed in %.3fs" %
+                (job_id, (DateTime() - started) * 86400))
+    return report
+
+
+def finish_job(portal, job, report, status=None):
+    """Records the job as done and notifies the user. Called once the report
+    is committed
+    """
+    status = status or set_status
+    status(job, status=DONE, progress=100, finished=DateTime(),
+           report_uid=report.UID(), report_url=report.absolute_url(),
+           message="")
+    notify_user(portal, job, report)
+
+
+def notify_user(portal, job, report):
+    """Emails the user who submitted the job that the report is ready
+    """
+    mtool = getToolByName(portal, "portal_membership")
+    member = mtool.getMemberById(job.userid)
+    email = member and member.getProperty("email") or None
+    if not email:
+        return
+    lab = portal.bika_setup.laboratory
+    body = "The report '%s' you requested is ready: %s" % (
+        safe_unicode(report.Title()), report.absolute_url())
+    msg = MIMEText(safe_unicode(body).encode("utf-8"))
+    msg["Subject"] = "Report ready: %s" % safe_unicode(
+        report.Title()).encode("utf-8")
+    msg["From"] = lab.getEmailAddress() or \
+        portal.getProperty("email_from_address", "")
+    msg["To"] = email
+    try:
+        host = getToolByName(portal, "MailHost")
+        host.send(msg.as_string(), immediate=True)
+    except Exception as e:
+        logger.warn("Unable to notify %s of report job %s: %s" %
+                    (job.userid, job.id, e))
+
+
+class LocalQueue(object):
+    """Queue that runs the jobs in the current transaction on process()
+    """
+
+    def __init__(self):
+        self.jobs = []
+
+    def put(self, portal, job_id):
+        self.jobs.append((portal, job_id))
+
+    def process(self):
+        """Runs the queued jobs, returns the Report objects
+        """
+        reports = []
+        while self.jobs:
+            portal, job_id = self.jobs.pop(0)
+            report = run_job(portal, job_id)
+            if report is not None:
+                finish_job(portal, get_job(job_id), report)
+            reports.append(report)
+        return reports
+
+
+class ThreadQueue(object):
+    """Queue that runs the jobs in a worker thread, one at a time, once the
+    transaction that submitted them is committed
+    """
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, portal, job_id):
+        db = portal._p_jar.db()
+        path = "/".join(portal.getPhysicalPath())
+        # the report is rendered with the host of the submitting request
+        environ = dict([(key, value) for key, value
+                        in portal.REQUEST.environ.items()
+                        if key in ENVIRON_KEYS])
+
+        def enqueue(success):
+            if success:
+                self.start()
+                self.queue.put((db, path, environ, job_id))
+        transaction.get().addAfterCommitHook(enqueue)
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.work,
+                                           name="bika.lims.reportjobs")
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def work(self):
+        while True:
+            db, path, environ, job_id = self.queue.get()
+            try:
+                self.run(db, path, environ, job_id)
+            except Exception:
+                logger.error("Report job %s failed: %s" %
+                             (job_id, traceback.format_exc()))
+
+    def run(self, db, path, environ, job_id):
+        """Runs the job with a connection of its own, and commits the status
+        of the job with another one
+        """
+        status = StatusWriter(db)
+        connection = db.open()
+        try:
+            app = makerequest(connection.root()["Application"],
+                              environ=environ)
+            portal = app.unrestrictedTraverse(path)
+            setSite(portal)
+            notify(BeforeTraverseEvent(portal, app.REQUEST))
+            job = get_job(job_id)
+            if job is None:
+                logger.warn("Report job %s not found" % job_id)
+                return
+            try:
+                # the report is computed with the roles of the user who
+                # submitted it
+                acl_users = portal.acl_users
+                user = acl_users.getUserById(job.userid)
+                if user is None:
+                    acl_users = app.acl_users
+                    user = acl_users.getUserById(job.userid)
+                if user is None:
+                    raise ValueError("User %s not found" % job.userid)
+                newSecurityManager(None, user.__of__(acl_users))
+                report = run_job(portal, job_id, status)
+                transaction.commit()
+            except Exception as e:
+                transaction.abort()
+                status(job, status=FAILED, finished=DateTime(),
+                       message=safe_unicode(str(e)))
+                raise
+            if report is not None:
+                finish_job(portal, job, report, status)
+        finally:
+            transaction.abort()
+            noSecurityManager()
+            setSite(None)
+            connection.close()
+
+
+class StatusWriter(object):
+    """Commits the status of the jobs right away with a connection and a
+    transaction of its own, so the connection running the report keeps its
+    snapshot of the database
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __call__(self, job, **kw):
+        # the job is left untouched in the connection of the worker, which
+        # would conflict with this commit otherwise
+        tm = transaction.TransactionManager()
+        connection = self.db.open(transaction_manager=tm)
+        try:
+            for attempt in range(STATUS_ATTEMPTS):
+                tm.begin()
+                stored = connection.get(job._p_oid)
+                set_status(stored, **kw)
+                try:
+                    tm.commit()
+                    return
+                except ConflictError:
+                    tm.abort()
+            logger.warn("Could not store the status of report job %s" %
+                        job.id)
+        finally:
+            tm.abort()
+            connection.close()
+
+
+def get_queue():
+    """Returns the queue the report jobs are handed to
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ThreadQueue()
+        return _queue
+
+
+def set_queue(queue):
+    """Sets the queue the report jobs are handed to, e.g. a LocalQueue in
+    tests. None restores the default queue
+    """
+    global _queue
+    with _queue_lock:
+        _queue = queue
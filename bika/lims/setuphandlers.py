@@ -496,6 +496,8 @@ class BikaGenerator:
         addIndex(bac, 'getDateReceived', 'DateIndex')
         addIndex(bac, 'getResultCaptureDate', 'DateIndex')
         addIndex(bac, 'getDateAnalysisPublished', 'DateIndex')
+        addIndex(bac, 'getDateSubmitted', 'DateIndex')
+        addIndex(bac, 'getDateVerified', 'DateIndex')
 
         addIndex(bac, 'getClientUID', 'FieldIndex')
         addIndex(bac, 'getAnalyst', 'FieldIndex')
@@ -505,6 +507,7 @@ class BikaGenerator:
         addIndex(bac, 'getKeyword', 'FieldIndex')
         addIndex(bac, 'getServiceTitle', 'FieldIndex')
         addIndex(bac, 'getServiceUID', 'FieldIndex')
+        addIndex(bac, 'getAllowedInstruments', 'KeywordIndex')
         addIndex(bac, 'getCategoryUID', 'FieldIndex')
         addIndex(bac, 'getCategoryTitle', 'FieldIndex')
         addIndex(bac, 'getPointOfCapture', 'FieldIndex')
@@ -530,10 +533,20 @@ class BikaGenerator:
         addColumn(bac, 'description')
         addColumn(bac, 'review_state')
         addColumn(bac, 'cancellation_state')
+        addColumn(bac, 'worksheetanalysis_review_state')
         addColumn(bac, 'getRequestID')
         addColumn(bac, 'getReferenceAnalysesGroupID')
         addColumn(bac, 'getResultCaptureDate')
+        addColumn(bac, 'getDateSubmitted')
+        addColumn(bac, 'getDateVerified')
+        addColumn(bac, 'getSubmittedBy')
         addColumn(bac, 'Priority')
+        addColumn(bac, 'getClientTitle')
+        addColumn(bac, 'getClientOrderNumber')
+        addColumn(bac, 'getCategoryTitle')
+        addColumn(bac, 'getDateReceived')
+        addColumn(bac, 'getDueDate')
+        addColumn(bac, 'getDepartmentUID')
 
         # bika_catalog
 
@@ -597,6 +610,8 @@ class BikaGenerator:
         addIndex(bc, 'getDatePublished', 'DateIndex')
         addIndex(bc, 'getDateReceived', 'DateIndex')
         addIndex(bc, 'getDateSampled', 'DateIndex')
+        addIndex(bc, 'getDateVerified', 'DateIndex')
+        addIndex(bc, 'getLateDate', 'DateIndex')
         addIndex(bc, 'getDisposalDate', 'DateIndex')
         addIndex(bc, 'getDueDate', 'DateIndex')
         addIndex(bc, 'getExpiryDate', 'DateIndex')
@@ -631,6 +646,7 @@ class BikaGenerator:
         addColumn(bc, 'review_state')
         addColumn(bc, 'inactive_state')
         addColumn(bc, 'cancellation_state')
+        addColumn(bc, 'worksheetanalysis_review_state')
         addColumn(bc, 'getAnalysts')
         addColumn(bc, 'getSampleID')
         addColumn(bc, 'getRequestID')
@@ -647,6 +663,28 @@ class BikaGenerator:
         addColumn(bc, 'getDatePublished')
         addColumn(bc, 'getDateReceived')
         addColumn(bc, 'getDateSampled')
+        addColumn(bc, 'getDateVerified')
+        addColumn(bc, 'getAnalysesNum')
+        addColumn(bc, 'getDueDate')
+        addColumn(bc, 'getLateDate')
+        addColumn(bc, 'getBlank')
+        addColumn(bc, 'getSupportedServiceUIDs')
+        addColumn(bc, 'Creator')
+        addColumn(bc, 'created')
+        addColumn(bc, 'getSamplingDate')
+        addColumn(bc, 'getSampler')
+        addColumn(bc, 'getAdHoc')
+        addColumn(bc, 'getInvoiceExclude')
+        addColumn(bc, 'getBatchID')
+        addColumn(bc, 'getBatchPath')
+        addColumn(bc, 'getContactPath')
+        addColumn(bc, 'getSubGroupTitle')
+        addColumn(bc, 'getSamplingDeviationTitle')
+        addColumn(bc, 'getStorageLocationTitle')
+        addColumn(bc, 'getTemplateTitle')
+        addColumn(bc, 'getHazardous')
+        addColumn(bc, 'isSamplingWorkflowEnabled')
+        addColumn(bc, 'getDepartmentUIDs')
         addColumn(bc, 'review_state')
 
         # bika_setup_catalog
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Persistent counters of objects per creation day, portal type and state
+
+The dashboard charts read the number of objects created each day from these
+counters instead of waking up every object of the period. The counters are
+kept up to date by the subscribers in bika.lims.subscribers.statecounters, once they were
+built with `rebuild_counters`.
+
+The days are the UTC dates of creation, as stored by the `created` DateIndex.
+"""
+
+from BTrees.Length import Length
+from BTrees.OOBTree import OOBTree
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.numbergenerator import get_portal_annotation
+from bika.lims.utils.catalogcount import get_indexed_date
+
+STORAGE_KEY = "bika.lims.state_counters"
+
+# Counted portal types and the catalog they are indexed in
+COUNTED_TYPES = {
+    "Analysis": "bika_analysis_catalog",
+    "AnalysisRequest": "bika_catalog",
+    "Worksheet": "bika_catalog",
+}
+
+# State of the objects not in the "active" cancellation state
+INACTIVE = "inactive"
+
+
+def get_storage():
+    """Returns the counters storage or None if the counters were not built
+    """
+    return get_portal_annotation().get(STORAGE_KEY)
+
+
+def get_state(review_state, cancellation_state="active"):
+    """Returns the counted state of an object
+    """
+    if cancellation_state and cancellation_state != "active":
+        return INACTIVE
+    return review_state
+
+
+def get_day(date):
+    """Returns the UTC day of the given DateTime as a string
+    """
+    return date.toZone("UTC").strftime("%Y-%m-%d")
+
+
+def get_indexed_day(catalog, brain):
+    """Returns the UTC creation day of the brain from the `created` index
+    """
+    index = catalog._catalog.getIndex("created")
+    value = index.getEntryForObject(brain.getRID())
+    if not value:
+        return None
+    return get_indexed_date(value).strftime("%Y-%m-%d")
+
+
+def is_counted(obj):
+    """Checks if the object is counted
+    """
+    if getattr(obj, "portal_type", None) not in COUNTED_TYPES:
+        return False
+    portal_factory = api.get_tool("portal_factory")
+    return not portal_factory.isTemporary(obj)
+
+
+def count(portal_type, day, state, delta=1):
+    """Changes the counter of the given portal type, day and state
+    """
+    storage = get_storage()
+    if storage is None:
+        return
+    key = (portal_type, day, state)
+    counter = storage.get(key)
+    if counter is None:
+        counter = storage[key] = Length()
+    # Length resolves concurrent changes, they don't conflict
+    counter.change(delta)
+
+
+def get_counts(portal_type, date_from, date_to):
+    """Returns a list of (day, state, number) tuples of the objects created
+    within the date range, sorted by day
+    """
+    storage = get_storage()
+    if storage is None:
+        return []
+    min_key = (portal_type, get_day(date_from))
+    max_key = (portal_type, get_day(date_to + 1))
+    items = storage.items(min=min_key, max=max_key, excludemax=True)
+    return [(key[1], key[2], counter()) for key, counter in items
+            if counter()]
+
+
+def rebuild_counters():
+    """Rebuilds the counters from the catalogs
+
+    The creation day and the states are read from the catalog indexes and
+    metadata, the objects are not woken up.
+    """
+    counts = {}
+    for portal_type, catalog_name in COUNTED_TYPES.items():
+        catalog = api.get_tool(catalog_name)
+        for brain in catalog(portal_type=portal_type):
+            day = get_indexed_day(catalog, brain)
+            if day is None:
+                continue
+            state = get_state(brain.review_state,
+                              getattr(brain, "cancellation_state", None))
+            key = (portal_type, day, state)
+            counts[key] = counts.get(key, 0) + 1
+
+    storage = OOBTree()
+    for key, number in counts.items():
+        storage[key] = Length(number)
+    get_portal_annotation()[STORAGE_KEY] = storage
+    logger.info("Rebuilt {} state counters".format(len(storage)))
+    return storage
+
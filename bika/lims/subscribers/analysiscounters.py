@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims.analysiscounters import remove_analysis
+from bika.lims.analysiscounters import update_analysis
+
+
+def AfterTransitionEventHandler(instance, event):
+    """Counts the analysis in its new state
+    """
+    update_analysis(instance)
+
+
+def ObjectRemovedEventHandler(instance, event):
+    """Removes the analysis from the counters of its AR
+    """
+    # The counters are removed along with the AR
+    if event.object is not instance:
+        return
+    remove_analysis(instance, event.oldParent)
@@ -5,6 +5,8 @@
 # Copyright 2011-2017 by it's authors.
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
+from bika.lims.idserver import get_sequence_index
+from bika.lims.idserver import index_object_id
 from bika.lims.idserver import renameAfterCreation
 
 
@@ -12,3 +14,20 @@ def rename_after_creation(obj, event):
     """Rename with the IDServer
     """
     renameAfterCreation(obj)
+
+
+def index_renamed_object(obj, event):
+    """Record the sequence number of the new ID in the sequence index
+    """
+    # skip the events dispatched to the contents of a renamed container
+    if event.object is not obj:
+        return
+    # only renames, no additions or removals
+    if event.oldParent is None or event.newParent is None:
+        return
+    if event.oldName == event.newName:
+        return
+    # nothing to maintain until the index was built
+    if get_sequence_index() is None:
+        return
+    index_object_id(obj)
@@ -8,6 +8,26 @@
 from Products.CMFCore.utils import getToolByName
 from Products.CMFCore import permissions
 from bika.lims.permissions import ManageSupplyOrders, ManageLoginDetails
+from bika.lims.browser.fields.historyawarereferencefield import \
+    invalidate_revisions
+from bika.lims.config import VERSIONABLE_TYPES
+
+
+def reindex_allowed_instruments(context, services):
+    """Reindexes the allowed instruments of the analyses of the services that
+    can still be assigned to a worksheet, the worksheet templates look them up
+    by instrument
+    """
+    service_uids = list(set([service.UID() for service in services]))
+    if not service_uids:
+        return
+    bac = getToolByName(context, 'bika_analysis_catalog')
+    brains = bac(portal_type='Analysis',
+                 getServiceUID=service_uids,
+                 worksheetanalysis_review_state='unassigned',
+                 cancellation_state='active')
+    for brain in brains:
+        bac.catalog_object(brain.getObject(), idxs=['getAllowedInstruments'])
 
 
 def ObjectModifiedEventHandler(obj, event):
@@ -16,6 +36,10 @@ def ObjectModifiedEventHandler(obj, event):
     if not hasattr(obj, 'portal_type'):
         return
 
+    if obj.portal_type in VERSIONABLE_TYPES:
+        # The object is re-versioned on edit, drop its cached revisions
+        invalidate_revisions(obj.UID())
+
     if obj.portal_type == 'Calculation':
         pr = getToolByName(obj, 'portal_repository')
         uc = getToolByName(obj, 'uid_catalog')
@@ -74,6 +98,28 @@ def ObjectModifiedEventHandler(obj, event):
                 member.setMemberProperties(properties)
         obj.reindexObject()
 
+    elif obj.portal_type == 'Sample':
+        # The AR listing shows the sampling data of the sample
+        bc = getToolByName(obj, 'bika_catalog')
+        for ar in obj.getAnalysisRequests():
+            bc.catalog_object(ar, idxs=["getSamplingDate", "getDateSampled",
+                                        "getSampler"])
+
+    elif obj.portal_type == 'AnalysisService':
+        reindex_allowed_instruments(obj, [obj])
+
+    elif obj.portal_type == 'Method':
+        reindex_allowed_instruments(
+            obj, obj.getBackReferences('AnalysisServiceMethods'))
+
+    elif obj.portal_type == 'Instrument':
+        # The instrument is allowed by the services it is assigned to, and
+        # by the services of its methods
+        services = obj.getBackReferences('AnalysisServiceInstruments')
+        for method in obj.getMethods():
+            services += method.getBackReferences('AnalysisServiceMethods')
+        reindex_allowed_instruments(obj, services)
+
     elif obj.portal_type == 'AnalysisCategory':
         for analysis in obj.getBackReferences('AnalysisServiceAnalysisCategory'):
             analysis.reindexObject(idxs=["getCategoryTitle", "getCategoryUID", ])
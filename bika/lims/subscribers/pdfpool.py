@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims import pdfpool
+
+
+def ProcessStartingEventHandler(event):
+    """Starts the PDF workers once the process is set up, before the
+    threads serving the requests exist
+    """
+    pdfpool.start_pool()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import transaction
+from ZODB.POSException import ConflictError
+from zope.component.hooks import setSite
+
+from bika.lims import logger
+from bika.lims.numbergenerator import get_portal_annotation
+from bika.lims.reportjobs import fail_interrupted_jobs
+
+
+def DatabaseOpenedEventHandler(event):
+    """Fails the report jobs of the sites that were left queued or running
+    by the previous process of this instance, or were abandoned by another
+    instance long ago
+    """
+    tm = transaction.TransactionManager()
+    connection = event.database.open(transaction_manager=tm)
+    try:
+        app = connection.root().get("Application")
+        if app is None:
+            return
+        for site in app.objectValues("Plone Site"):
+            setSite(site)
+            failed = fail_interrupted_jobs(get_portal_annotation())
+            if failed:
+                logger.warn("%s report jobs of %s were interrupted" %
+                            (failed, site.getId()))
+        tm.commit()
+    except ConflictError:
+        # another instance started at the same time did it already
+        tm.abort()
+    finally:
+        setSite(None)
+        tm.abort()
+        connection.close()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims import api
+from bika.lims.statecounters import count
+from bika.lims.statecounters import get_day
+from bika.lims.statecounters import get_state
+from bika.lims.statecounters import get_storage
+from bika.lims.statecounters import is_counted
+
+
+def AfterTransitionEventHandler(instance, event):
+    """Moves the object from the counter of the old state to the new one
+    """
+    if not is_counted(instance) or get_storage() is None:
+        return
+
+    portal_type = instance.portal_type
+    state_var = event.workflow.state_var
+    day = get_day(api.get_creation_date(instance))
+
+    # creation doesn't have a 'transition'
+    if not event.transition:
+        if state_var == "review_state":
+            count(portal_type, day, get_state(event.new_state.id))
+        return
+
+    if state_var == "review_state":
+        cancellation_state = api.get_cancellation_status(instance)
+        old_state = get_state(event.old_state.id, cancellation_state)
+        new_state = get_state(event.new_state.id, cancellation_state)
+    elif state_var == "cancellation_state":
+        review_state = api.get_review_status(instance)
+        old_state = get_state(review_state, event.old_state.id)
+        new_state = get_state(review_state, event.new_state.id)
+    else:
+        return
+
+    if old_state == new_state:
+        return
+    count(portal_type, day, old_state, -1)
+    count(portal_type, day, new_state)
+
+
+def ObjectRemovedEventHandler(instance, event):
+    """Removes the object from the counter of its state
+    """
+    if not is_counted(instance) or get_storage() is None:
+        return
+    state = get_state(api.get_review_status(instance),
+                      api.get_cancellation_status(instance))
+    day = get_day(api.get_creation_date(instance))
+    count(instance.portal_type, day, state, -1)
@@ -7,6 +7,7 @@ from DateTime import DateTime
 from Products.CMFPlone.utils import _createObjectByType
 from bika.lims import logger
 from bika.lims.exportimport.instruments.shimadzu.nexera.LC2040C import Import
+from bika.lims.exportimport.instruments.shimadzu.nexera.LC2040C import TSVParser
 from bika.lims.testing import BIKA_SIMPLE_FIXTURE
 from bika.lims.tests.base import BikaSimpleTestCase
 from bika.lims.utils import tmpID
@@ -156,6 +157,22 @@ Total price excl Tax,,,,,,,,,,,,,,
         if '0.8' and '0.123' not in content:
             self.fail("AR Result did not get updated")
 
+    def test_Shimadzu_NexeraLC2040CStreamingParser(self):
+        path = os.path.dirname(__file__)
+        data = open('%s/files/nexera' % path, 'r').read()
+        parser = TSVParser(FileUpload(TestFile(cStringIO.StringIO(data))))
+        parser.parse()
+        expected = parser.getRawResults()
+
+        parser = TSVParser(FileUpload(TestFile(cStringIO.StringIO(data))))
+        streamed = {}
+        for resid, row in parser.iterRawResults():
+            streamed.setdefault(resid, []).append(row)
+            # Rows are not kept by the parser once handed over
+            self.assertNotIn(resid, parser.getRawResults())
+        self.assertEqual(streamed, expected)
+        self.assertEqual(parser.errors, [])
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestInstrumentImport))
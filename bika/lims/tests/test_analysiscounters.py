@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from DateTime import DateTime
+from ZODB import DB
+from ZODB.MappingStorage import MappingStorage
+from bika.lims.analysiscounters import summarize
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class TestAnalysisCounters(unittest.TestCase):
+
+    def test_states(self):
+        summary = summarize([
+            ('sample_received', 'active', None, None),
+            ('to_be_verified', 'active', None, None),
+            ('to_be_verified', 'cancelled', None, None),
+        ])
+        self.assertEqual(summary['states'],
+                         {'sample_received': 1, 'to_be_verified': 2})
+        self.assertEqual(summary['active_states'],
+                         {'sample_received': 1, 'to_be_verified': 1})
+        self.assertEqual(summary['due_date'], None)
+        self.assertEqual(summary['late_date'], None)
+
+    def test_due_dates(self):
+        summary = summarize([
+            # result captured in time
+            ('to_be_verified', 'active', DateTime('2017-01-01'),
+             DateTime('2016-12-31')),
+            # waiting for a result
+            ('sample_received', 'active', DateTime('2017-01-05'), None),
+            ('sample_received', 'active', DateTime('2017-01-03'), None),
+            # never late
+            ('sample_received', 'cancelled', DateTime('2016-01-01'), None),
+            ('published', 'active', DateTime('2016-01-01'),
+             DateTime('2016-02-01')),
+        ])
+        self.assertEqual(summary['due_date'], DateTime('2017-01-03'))
+        self.assertEqual(summary['late_date'], DateTime('2017-01-03'))
+
+    def test_late_result(self):
+        summary = summarize([
+            ('to_be_verified', 'active', DateTime('2017-01-02'),
+             DateTime('2017-01-04')),
+            ('sample_received', 'active', DateTime('2017-01-05'), None),
+        ])
+        # the analyses are late since the result was due
+        self.assertEqual(summary['due_date'], DateTime('2017-01-05'))
+        self.assertEqual(summary['late_date'], DateTime('2017-01-02'))
+
+    def test_concurrent_updates(self):
+        db = DB(MappingStorage())
+        tm1 = transaction.TransactionManager()
+        tm2 = transaction.TransactionManager()
+        conn1 = db.open(transaction_manager=tm1)
+        conn1.root()['counters'] = OOBTree(
+            {'uid1': ('sample_received', 'active', None, None),
+             'uid2': ('sample_received', 'active', None, None)})
+        tm1.commit()
+        conn2 = db.open(transaction_manager=tm2)
+        # two analyses of the same AR submitted at the same time
+        conn1.root()['counters']['uid1'] = \
+            ('to_be_verified', 'active', None, None)
+        conn2.root()['counters']['uid2'] = \
+            ('to_be_verified', 'active', None, None)
+        tm1.commit()
+        tm2.commit()
+        tm2.begin()
+        summary = summarize(conn2.root()['counters'].values())
+        self.assertEqual(summary['states'], {'to_be_verified': 2})
+        conn1.close()
+        conn2.close()
+        db.close()
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestAnalysisCounters))
+    return suite
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import BaseHTTPServer
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from bika.lims import assetcache
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+LAST_MODIFIED = "Mon, 02 Jan 2017 10:00:00 GMT"
+
+
+class AssetHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves /logo.png, answering 304 to the conditional requests
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write("PNG data")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAssetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        assetcache.register_resource_directory("test.assets", self.directory)
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0),
+                                                AssetHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%s" % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        del assetcache.RESOURCE_DIRECTORIES["test.assets"]
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "wb") as f:
+            f.write(data)
+        return filename
+
+    def test_resource_path(self):
+        filename = self.write("style.css", "body {}")
+        url = self.url + "/++resource++test.assets/style.css"
+        self.assertEqual(assetcache.get_resource_path(url),
+                         os.path.abspath(filename))
+        self.assertEqual(assetcache.get_resource_path(
+            self.url + "/++resource++test.assets/../style.css"), None)
+        self.assertEqual(assetcache.get_resource_path(
+            self.url + "/++resource++other/style.css"), None)
+        self.assertEqual(assetcache.get_resource_path(
+            self.url + "/logo.png"), None)
+
+    def test_fetch_file(self):
+        cache = assetcache.AssetCache()
+        filename = self.write("style.css", "body {}")
+        url = self.url + "/++resource++test.assets/style.css"
+        asset = cache.fetch(url)
+        self.assertEqual(asset.data, "body {}")
+        self.assertEqual(asset.mime_type, "text/css")
+        self.assertEqual(cache.fetch(url).data, "body {}")
+        # the file is read again once modified
+        self.write("style.css", "p {}")
+        mtime = os.path.getmtime(filename) + 10
+        os.utime(filename, (mtime, mtime))
+        self.assertEqual(cache.fetch(url).data, "p {}")
+        counters = cache.get_counters()
+        self.assertEqual(counters["hits"], 1)
+        self.assertEqual(counters["misses"], 2)
+        # served from disk, without requests
+        self.assertEqual(self.server.requests, [])
+
+    def test_fetch_url(self):
+        cache = assetcache.AssetCache(max_age=60)
+        url = self.url + "/logo.png"
+        asset = cache.fetch(url, scope="user1")
+        self.assertEqual(asset.data, "PNG data")
+        self.assertEqual(asset.mime_type, "image/png")
+        self.assertEqual(cache.fetch(url, scope="user1").data, "PNG data")
+        self.assertEqual(len(self.server.requests), 1)
+        # other credentials, other asset
+        cache.fetch(url, scope="user2")
+        self.assertEqual(len(self.server.requests), 2)
+        # revalidated once too old
+        cache.max_age = 0
+        self.assertEqual(cache.fetch(url, scope="user1").data, "PNG data")
+        self.assertEqual(len(self.server.requests), 3)
+        counters = cache.get_counters()
+        self.assertEqual(counters["hits"], 2)
+        self.assertEqual(counters["misses"], 2)
+        self.assertEqual(counters["revalidated"], 1)
+
+    def test_max_size(self):
+        cache = assetcache.AssetCache(max_size=10)
+        cache.set("a", assetcache.Asset("a", "12345"))
+        cache.set("b", assetcache.Asset("b", "12345"))
+        cache.get("a")
+        cache.set("c", assetcache.Asset("c", "123"))
+        # the least recently used is dropped
+        self.assertEqual(cache.get("b"), None)
+        self.assertNotEqual(cache.get("a"), None)
+        self.assertEqual(cache.get_stats()["size"], 8)
+        # too big to be cached
+        cache.set("d", assetcache.Asset("d", "12345678901"))
+        self.assertEqual(cache.get("d"), None)
+
+    def test_add_counters(self):
+        cache = assetcache.AssetCache()
+        cache.add_counters({"hits": 3, "misses": 1})
+        cache.add_counters({"hits": 2})
+        counters = cache.get_counters()
+        self.assertEqual(counters["hits"], 5)
+        self.assertEqual(counters["misses"], 1)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestAssetCache))
+    return suite
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims.workflow import BulkTransition
+from bika.lims.workflow import promote
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummyContent(object):
+
+    def __init__(self, uid, request):
+        self.uid = uid
+        self.REQUEST = request
+
+    def UID(self):
+        return self.uid
+
+
+class TestBulkTransition(unittest.TestCase):
+
+    def setUp(self):
+        self.request = {}
+        self.checked = []
+
+    def check(self, parent):
+        self.checked.append(parent.UID())
+
+    def test_promote_now(self):
+        ar = DummyContent("ar-1", self.request)
+        promote(ar, "submit", self.check)
+        promote(ar, "submit", self.check)
+        self.assertEqual(self.checked, ["ar-1", "ar-1"])
+
+    def test_promote_deferred(self):
+        ar1 = DummyContent("ar-1", self.request)
+        ar2 = DummyContent("ar-2", self.request)
+        ws = DummyContent("ws-1", self.request)
+        with BulkTransition(self.request):
+            for parent in [ar1, ws, ar1, ar2, ws, ar2]:
+                promote(parent, "submit", self.check)
+            promote(ar1, "verify", self.check)
+            self.assertEqual(self.checked, [])
+        # each parent is checked once per action, in order
+        self.assertEqual(self.checked, ["ar-1", "ws-1", "ar-2", "ar-1"])
+        # no bulk transition in progress anymore
+        promote(ar1, "submit", self.check)
+        self.assertEqual(len(self.checked), 5)
+
+    def test_nested(self):
+        ar = DummyContent("ar-1", self.request)
+        ws = DummyContent("ws-1", self.request)
+
+        def check_ar(parent):
+            self.check(parent)
+            # promoting the AR defers the promotion of the worksheet
+            promote(ws, "submit", self.check)
+
+        with BulkTransition(self.request):
+            with BulkTransition(self.request):
+                promote(ar, "submit", check_ar)
+            # the outermost bulk transition promotes the parents
+            self.assertEqual(self.checked, [])
+        self.assertEqual(self.checked, ["ar-1", "ws-1"])
+
+    def test_error(self):
+        ar = DummyContent("ar-1", self.request)
+        try:
+            with BulkTransition(self.request):
+                promote(ar, "submit", self.check)
+                raise ValueError()
+        except ValueError:
+            pass
+        # parents aren't promoted after an error
+        self.assertEqual(self.checked, [])
+        promote(ar, "submit", self.check)
+        self.assertEqual(self.checked, ["ar-1"])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBulkTransition))
+    return suite
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims.cache import LRUCache
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        self.assertEqual(cache.get("a"), None)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_least_recently_used_is_discarded(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # touch "a", so "b" becomes the least recently used
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        cache.set(("uid1", 0), "rev0")
+        cache.set(("uid1", 1), "rev1")
+        cache.set(("uid2", 0), "rev0")
+        cache.invalidate(("uid2", 0))
+        self.assertNotIn(("uid2", 0), cache)
+        cache.invalidate(predicate=lambda key: key[0] == "uid1")
+        self.assertEqual(len(cache), 0)
+        cache.set("a", 1)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestLRUCache))
+    return suite
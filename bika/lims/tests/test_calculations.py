@@ -13,7 +13,9 @@ from bika.lims.utils.analysisrequest import create_analysisrequest
 from bika.lims.workflow import doActionFor
 from plone.app.testing import login, logout
 from plone.app.testing import TEST_USER_NAME
+from bika.lims.utils import tmpID
 from Products.CMFCore.utils import getToolByName
+from Products.CMFPlone.utils import _createObjectByType
 import unittest
 
 try:
@@ -508,6 +510,105 @@ class TestCalculations(BikaFunctionalTestCase):
                 calcanalysis.calculateResult(override=True, cascade=True)
                 self.assertEqual(calcanalysis.getFormattedResult(), case['expected_result'])
 
+    def test_calculation_graph(self):
+        # Recalculation of the AR evaluates the calculated analyses once,
+        # after their dependencies, and only reports the changed results
+        from bika.lims.utils.calculationgraph import CalculationGraph
+        self.calculation.setFormula('[Ca] + [Mg]')
+        self.calculation.setInterimFields([])
+        client = self.portal.clients['client-1']
+        sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
+        values = {'Client': client.UID(),
+                  'Contact': client.getContacts()[0].UID(),
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        services = [s.UID() for s in self.services] + [self.calcservice.UID()]
+        ar = create_analysisrequest(client, {}, values, services)
+        wf = getToolByName(ar, 'portal_workflow')
+        wf.doActionFor(ar, 'receive')
+
+        analyses = dict([(an.getKeyword(), an.getObject())
+                         for an in ar.getAnalyses()])
+        calcanalysis = analyses[self.calcservice.getKeyword()]
+        analyses['Ca'].setResult('10')
+        analyses['Mg'].setResult('15')
+
+        graph = CalculationGraph(ar)
+        deps = [an.getKeyword() for an in graph.get_dependencies(calcanalysis)]
+        self.assertEqual(sorted(deps), ['Ca', 'Mg'])
+        dependents = graph.get_dependents(analyses['Ca'])
+        self.assertEqual(dependents, [calcanalysis])
+        order = graph.sorted_uids()
+        self.assertTrue(order.index(calcanalysis.UID()) >
+                        order.index(analyses['Ca'].UID()))
+
+        changed = graph.recalculate()
+        self.assertEqual(changed, [calcanalysis])
+        self.assertEqual(float(calcanalysis.getResult()), 25)
+        # Nothing changed, nothing is written back
+        self.assertEqual(graph.recalculate(), [])
+        analyses['Mg'].setResult('5')
+        changed = graph.recalculate([analyses['Mg'].UID()])
+        self.assertEqual(changed, [calcanalysis])
+        self.assertEqual(float(calcanalysis.getResult()), 15)
+
+    def test_worksheet_calculation_graph(self):
+        # The worksheet graph covers the analyses of all its ARs, also the
+        # ones not in the worksheet, and its duplicates, without linking the
+        # analyses of different ARs
+        from bika.lims.utils.calculationgraph import WorksheetCalculationGraph
+        from bika.lims.utils.calculationgraph import recalculate_worksheet
+        self.calculation.setFormula('[Ca] + [Mg]')
+        self.calculation.setInterimFields([])
+        client = self.portal.clients['client-1']
+        sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
+        values = {'Client': client.UID(),
+                  'Contact': client.getContacts()[0].UID(),
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        services = [s.UID() for s in self.services] + [self.calcservice.UID()]
+        ws = _createObjectByType("Worksheet", self.portal.worksheets, tmpID())
+        ws.processForm()
+        ws.setResultsLayout(self.portal.bika_setup.getWorksheetLayout())
+        self.request['context_uid'] = ws.UID()
+        calcanalyses = []
+        for ca, mg in (('10', '15'), ('1', '2')):
+            ar = create_analysisrequest(client, {}, values, services)
+            sp = _createObjectByType('SamplePartition', ar.getSample(),
+                                     tmpID())
+            wf = getToolByName(ar, 'portal_workflow')
+            wf.doActionFor(ar, 'receive')
+            analyses = dict([(an.getKeyword(), an.getObject())
+                             for an in ar.getAnalyses()])
+            analyses['Ca'].setResult(ca)
+            analyses['Mg'].setResult(mg)
+            for keyword in ('Ca', 'Mg'):
+                analyses[keyword].setSamplePartition(sp)
+                ws.addAnalysis(analyses[keyword])
+            calcanalyses.append(analyses[self.calcservice.getKeyword()])
+        ws.addDuplicateAnalyses('1', None)
+        duplicates = [an for an in ws.getAnalyses()
+                      if an.portal_type == 'DuplicateAnalysis']
+        self.assertEqual(len(duplicates), 2)
+
+        graph = WorksheetCalculationGraph(ws)
+        for duplicate in duplicates:
+            self.assertTrue(duplicate.UID() in graph.analyses)
+            self.assertEqual(graph.get_dependencies(duplicate), [])
+        for calcanalysis in calcanalyses:
+            # not in the worksheet, but graphed with its AR
+            deps = graph.get_dependencies(calcanalysis)
+            self.assertEqual(sorted([an.getKeyword() for an in deps]),
+                             ['Ca', 'Mg'])
+            for dep in deps:
+                self.assertEqual(dep.aq_parent, calcanalysis.aq_parent)
+
+        changed = recalculate_worksheet(ws)
+        self.assertEqual(sorted(changed), sorted(calcanalyses))
+        self.assertEqual(float(calcanalyses[0].getResult()), 25)
+        self.assertEqual(float(calcanalyses[1].getResult()), 3)
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestCalculations))
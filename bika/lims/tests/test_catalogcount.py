@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from BTrees.IIBTree import IITreeSet
+from BTrees.IIBTree import multiunion
+from bika.lims.utils import catalogcount
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummyFieldIndex(object):
+
+    def __init__(self, id, values):
+        self.id = id
+        self._index = {}
+        self._unindex = dict(values)
+        for rid, value in values.items():
+            rids = self._index.get(value)
+            if rids is None:
+                # single record ids are stored unwrapped, as UnIndex does
+                self._index[value] = rid
+            elif isinstance(rids, int):
+                self._index[value] = IITreeSet((rids, rid))
+            else:
+                rids.insert(rid)
+
+    def getEntryForObject(self, rid):
+        return self._unindex.get(rid)
+
+    def uniqueValues(self):
+        return self._index.keys()
+
+    def _apply_index(self, request):
+        if self.id not in request:
+            return None
+        values = request[self.id]
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        sets = [catalogcount.get_value_rids(self, value) for value in values]
+        return multiunion(sets), (self.id, )
+
+
+class DummyCatalog(object):
+
+    def __init__(self, data, schema, **indexes):
+        self._catalog = self
+        self.data = data
+        self.schema = schema
+        self.indexes = indexes
+
+    def getIndex(self, name):
+        return self.indexes[name]
+
+    def __len__(self):
+        return 5
+
+
+class TestCatalogCount(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = DummyCatalog(
+            {1: ("1.5", ), 2: ("2.5", ), 3: ("", ), 4: ("4", ), 5: ("5", )},
+            {"getResult": 0},
+            portal_type=DummyFieldIndex("portal_type", {
+                1: "AnalysisRequest",
+                2: "AnalysisRequest",
+                3: "AnalysisRequest",
+                4: "Worksheet",
+                5: "AnalysisRequest",
+            }),
+            review_state=DummyFieldIndex("review_state", {
+                1: "sample_due",
+                2: "sample_due",
+                3: "verified",
+                4: "open",
+                5: "published",
+            }),
+        )
+
+    def test_count(self):
+        count = catalogcount.count
+        self.assertEqual(count(self.catalog, {}), 5)
+        self.assertEqual(
+            count(self.catalog, {"portal_type": "AnalysisRequest"}), 4)
+        self.assertEqual(
+            count(self.catalog, {"portal_type": "AnalysisRequest",
+                                 "review_state": ["sample_due", "open"]}), 2)
+        self.assertEqual(
+            count(self.catalog, {"portal_type": "Worksheet",
+                                 "review_state": "verified"}), 0)
+        # unknown indexes are ignored, as the catalog does
+        self.assertEqual(
+            count(self.catalog, {"portal_type": "Worksheet",
+                                 "getDepartmentUIDs": "dep-1"}), 1)
+
+    def test_count_by(self):
+        counts = catalogcount.count_by(
+            self.catalog, {"portal_type": "AnalysisRequest"}, "review_state",
+            ["sample_due", "verified", "open", "to_be_verified"])
+        self.assertEqual(counts, {"sample_due": 2,
+                                  "verified": 1,
+                                  "open": 0,
+                                  "to_be_verified": 0})
+        counts = catalogcount.count_by(self.catalog, {}, "portal_type")
+        self.assertEqual(counts, {"AnalysisRequest": 4, "Worksheet": 1})
+
+    def test_aggregate(self):
+        results = catalogcount.aggregate(
+            self.catalog, {"portal_type": "AnalysisRequest"},
+            "review_state",
+            filters={"due": {"review_state": "sample_due"}},
+            columns=["getResult"])
+        self.assertEqual(sorted(results.keys()),
+                         ["published", "sample_due", "verified"])
+        due = results["sample_due"]
+        self.assertEqual(due["count"], 2)
+        self.assertEqual(due["filters"], {"due": 2})
+        self.assertEqual(due["sum"], {"getResult": 4.0})
+        self.assertEqual(due["avg"], {"getResult": 2.0})
+        # non numeric values are not averaged
+        self.assertEqual(results["verified"]["avg"], {"getResult": 0})
+        self.assertEqual(results["verified"]["filters"], {"due": 0})
+
+    def test_aggregate_two_indexes(self):
+        results = catalogcount.aggregate(
+            self.catalog, {}, ("portal_type", "review_state"),
+            values={"portal_type": ["Worksheet"]},
+            keys={"review_state": lambda value: value[0]})
+        self.assertEqual(results.keys(), [("Worksheet", "o")])
+        self.assertEqual(results[("Worksheet", "o")]["count"], 1)
+
+    def test_aggregate_missing(self):
+        self.catalog.indexes["getDepartmentUID"] = DummyFieldIndex(
+            "getDepartmentUID", {1: "dep-1", 2: "", 3: "dep-1"})
+        query = {"portal_type": "AnalysisRequest"}
+        results = catalogcount.aggregate(self.catalog, query,
+                                         "getDepartmentUID")
+        self.assertEqual(sorted(results.keys()), ["", "dep-1"])
+        self.assertEqual(results[""]["count"], 1)
+        # records without a value are grouped with the empty ones
+        results = catalogcount.aggregate(self.catalog, query,
+                                         "getDepartmentUID",
+                                         missing={"getDepartmentUID": ""})
+        self.assertEqual(sorted(results.keys()), ["", "dep-1"])
+        self.assertEqual(results[""]["count"], 2)
+        self.assertEqual(results["dep-1"]["count"], 2)
+
+    def test_indexed_date(self):
+        value = ((((2017 * 12 + 12) * 31 + 31) * 24 + 23) * 60 + 59)
+        date = catalogcount.get_indexed_date(value)
+        self.assertEqual(date.strftime("%Y-%m-%d %H:%M"), "2017-12-31 23:59")
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCatalogCount))
+    return suite
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+from bika.lims.utils.digest import data_digest
+from bika.lims.utils.digest import text_digest
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummyContent(object):
+
+    def __init__(self, uid):
+        self.uid = uid
+
+    def UID(self):
+        return self.uid
+
+
+class TestDigest(unittest.TestCase):
+
+    def get_data(self, result="1.5", published="2017-01-01"):
+        return {
+            'id': 'W-0001-R01',
+            'obj': DummyContent('ar-1'),
+            'date_published': published,
+            'date_received': DateTime('2017-01-01 10:00 GMT+0'),
+            'categories': ['Metals', u'Micro\xeflogy'],
+            'analyses': [{'obj': DummyContent('an-1'),
+                          'keyword': 'Ca',
+                          'result': result,
+                          'isnumber': True,
+                          'specs': {'min': '1', 'max': '2'}}],
+            'sample': {'sample_type': DummyContent('st-1')},
+            'worksheet_url': DummyContent('ws-1').UID,
+        }
+
+    def test_stable(self):
+        self.assertEqual(data_digest(self.get_data()),
+                         data_digest(self.get_data()))
+        # volatile keys are ignored
+        self.assertEqual(data_digest(self.get_data()),
+                         data_digest(self.get_data(published="2018-01-01")))
+
+    def test_changes(self):
+        digest = data_digest(self.get_data())
+        self.assertNotEqual(digest, data_digest(self.get_data(result="1.6")))
+        data = self.get_data()
+        data['sample']['sample_type'] = DummyContent('st-2')
+        self.assertNotEqual(digest, data_digest(data))
+        data = self.get_data()
+        data['categories'].reverse()
+        self.assertNotEqual(digest, data_digest(data))
+        # a string is not its number
+        self.assertNotEqual(data_digest({'a': '1'}), data_digest({'a': 1}))
+
+    def test_text_digest(self):
+        self.assertEqual(text_digest('default.pt', u'<p>\xe9</p>', True),
+                         text_digest('default.pt', u'<p>\xe9</p>', True))
+        self.assertNotEqual(text_digest('ab', 'c'), text_digest('a', 'bc'))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestDigest))
+    return suite
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+from bika.lims.utils import export
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummyResponse(object):
+
+    def __init__(self):
+        self.headers = {}
+        self.chunks = []
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
+
+    def write(self, data):
+        self.chunks.append(data)
+
+
+class TestExport(unittest.TestCase):
+
+    def test_cells(self):
+        self.assertEqual(export.to_cell(None), "")
+        self.assertEqual(export.to_cell(3), 3)
+        self.assertEqual(export.to_cell(u"Água"), "\xc3\x81gua")
+        self.assertEqual(export.to_cell(["a", "b"]), "a, b")
+        self.assertEqual(
+            export.to_cell(DateTime("2017/03/01 10:30:00 GMT+0")),
+            "2017-03-01 10:30")
+
+    def test_csv_chunks(self):
+        response = DummyResponse()
+
+        def rows():
+            for i in range(10000):
+                yield [i, "Analysis %s" % i]
+
+        export.stream_rows(response, "csv", "analyses", ["Nr", "Title"],
+                           rows())
+        self.assertEqual(response.headers["Content-Type"], "text/csv")
+        self.assertEqual(response.headers["Content-Disposition"],
+                         "attachment;filename=\"analyses.csv\"")
+        # written in several chunks, none larger than a chunk and a row
+        self.assertTrue(len(response.chunks) > 1)
+        self.assertTrue(max(map(len, response.chunks)) < export.CHUNK_SIZE + 100)
+        lines = "".join(response.chunks).splitlines()
+        self.assertEqual(len(lines), 10001)
+        self.assertEqual(lines[0], "Nr,Title")
+        self.assertEqual(lines[-1], "9999,Analysis 9999")
+
+    def test_xlsx(self):
+        response = DummyResponse()
+        export.stream_rows(response, "xlsx", "analyses", ["Nr"],
+                           [[1], [2]])
+        data = "".join(response.chunks)
+        self.assertEqual(response.headers["Content-Length"], len(data))
+        # xlsx files are zip containers
+        self.assertEqual(data[:2], "PK")
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, export.get_stream, DummyResponse(),
+                          "pdf", "analyses")
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestExport))
+    return suite
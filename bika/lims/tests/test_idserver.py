@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Generated IDs are recorded in the sequence index, so a flushed number
+generator is seeded past the IDs in use
+"""
+from bika.lims.idserver import rebuild_sequence_index
+from bika.lims.numbergenerator import INumberGenerator
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils import tmpID
+from DateTime.DateTime import DateTime
+from plone.app.testing import login
+from plone.app.testing import TEST_USER_NAME
+from Products.CMFPlone.utils import _createObjectByType
+from zope.component import getUtility
+
+import transaction
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestIDServer(BikaFunctionalTestCase):
+
+    def addthing(self, folder, portal_type, **kwargs):
+        thing = _createObjectByType(portal_type, folder, tmpID())
+        thing.unmarkCreationFlag()
+        thing.edit(**kwargs)
+        thing._renameAfterCreation()
+        return thing
+
+    def setUp(self):
+        # @formatter:off
+        super(TestIDServer, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        self.client = self.addthing(self.portal.clients, 'Client', title='Happy Hills', ClientID='HH')
+        self.contact = self.addthing(self.client, 'Contact', Firstname='Rita', Lastname='Mohale')
+        container = self.addthing(self.portal.bika_setup.bika_containers, 'Container', title='Bottle', capacity="10ml")
+        sampletype = self.addthing(self.portal.bika_setup.bika_sampletypes, 'SampleType', title='Water', Prefix='H2O')
+        self.service = self.addthing(self.portal.bika_setup.bika_analysisservices, 'AnalysisService', title='Ecoli', Keyword='ECO')
+        self.sample = self.addthing(self.client, 'Sample', SampleType=sampletype)
+        self.addthing(self.sample, 'SamplePartition', Container=container)
+        # @formatter:on
+        transaction.commit()
+
+    def add_ar(self):
+        return self.addthing(self.client, 'AnalysisRequest',
+                             Contact=self.contact, Sample=self.sample,
+                             Analyses=[self.service, ],
+                             SamplingDate=DateTime())
+
+    def test_id_not_reused_after_flush(self):
+        # the index is built by the upgrade to 3.4.0
+        rebuild_sequence_index()
+        ar1 = self.add_ar()
+        getUtility(INumberGenerator).flush()
+        ar2 = self.add_ar()
+        self.assertNotEqual(ar1.getId(), ar2.getId())
+        self.assertIn(ar1.getId(), self.client.objectIds())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestIDServer))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims.indexqueue import IndexQueue
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummyCatalog(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.indexed = []
+
+    def getId(self):
+        return self.id
+
+    def _indexObjectNow(self, obj, uid, idxs=None, update_metadata=1):
+        self.indexed.append((uid, idxs, update_metadata))
+
+
+class TestIndexQueue(unittest.TestCase):
+
+    def test_operations_are_merged(self):
+        catalog = DummyCatalog("bika_analysis_catalog")
+        queue = IndexQueue()
+        queue.add(catalog, "an", "/an", ["review_state"], 0)
+        queue.add(catalog, "an", "/an", ["getDueDate", "review_state"], 1)
+        queue.add(catalog, "ar", "/ar", ["review_state"], 0)
+        self.assertEqual(catalog.indexed, [])
+        queue.flush()
+        self.assertEqual(catalog.indexed,
+                         [("/an", ["review_state", "getDueDate"], 1),
+                          ("/ar", ["review_state"], 0)])
+        self.assertEqual(queue.queued, 3)
+        self.assertEqual(queue.indexed, 2)
+
+    def test_all_indexes_wins(self):
+        catalog = DummyCatalog("bika_catalog")
+        queue = IndexQueue()
+        queue.add(catalog, "ar", "/ar", ["review_state"], 0)
+        queue.add(catalog, "ar", "/ar", [], 1)
+        queue.flush()
+        self.assertEqual(catalog.indexed, [("/ar", [], 1)])
+
+    def test_flush_catalog_and_discard(self):
+        bc = DummyCatalog("bika_catalog")
+        bac = DummyCatalog("bika_analysis_catalog")
+        queue = IndexQueue()
+        queue.add(bc, "ar", "/ar")
+        queue.add(bac, "an", "/an")
+        queue.add(bac, "old", "/old")
+        queue.discard(bac, "/old")
+        queue.flush(bac)
+        self.assertEqual(bc.indexed, [])
+        self.assertEqual(bac.indexed, [("/an", [], 1)])
+
+    def test_savepoint_rollback(self):
+        catalog = DummyCatalog("bika_catalog")
+        queue = IndexQueue()
+        queue.add(catalog, "ar", "/ar", ["review_state"], 0)
+        savepoint = queue.data_manager.savepoint()
+        queue.add(catalog, "ar", "/ar", ["getDueDate"], 0)
+        queue.add(catalog, "ar2", "/ar2")
+        savepoint.rollback()
+        queue.flush()
+        self.assertEqual(catalog.indexed, [("/ar", ["review_state"], 0)])
+
+    def test_rollback_after_flush(self):
+        # the catalog changes are rolled back along with the savepoint
+        catalog = DummyCatalog("bika_catalog")
+        queue = IndexQueue()
+        queue.add(catalog, "ar", "/ar")
+        savepoint = queue.data_manager.savepoint()
+        queue.flush()
+        savepoint.rollback()
+        self.assertEqual(queue.operations.keys(),
+                         [("bika_catalog", "/ar")])
+
+    def test_closed_queue(self):
+        catalog = DummyCatalog("bika_catalog")
+        queue = IndexQueue()
+        queue.commit()
+        self.assertFalse(queue.add(catalog, "ar", "/ar"))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestIndexQueue))
+    return suite
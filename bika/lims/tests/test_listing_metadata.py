@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""The AR listing is built from the catalog metadata, without waking up the
+listed ARs
+"""
+from bika.lims.browser.analysisrequest import AnalysisRequestsView
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils import tmpID
+from DateTime.DateTime import DateTime
+from plone.app.testing import login
+from plone.app.testing import TEST_USER_NAME
+from Products.CMFPlone.utils import _createObjectByType
+
+import transaction
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestListingMetadata(BikaFunctionalTestCase):
+
+    def addthing(self, folder, portal_type, **kwargs):
+        thing = _createObjectByType(portal_type, folder, tmpID())
+        thing.unmarkCreationFlag()
+        thing.edit(**kwargs)
+        thing._renameAfterCreation()
+        return thing
+
+    def setUp(self):
+        # @formatter:off
+        super(TestListingMetadata, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        self.client = self.addthing(self.portal.clients, 'Client', title='Happy Hills', ClientID='HH')
+        contact = self.addthing(self.client, 'Contact', Firstname='Rita', Lastname='Mohale')
+        container = self.addthing(self.portal.bika_setup.bika_containers, 'Container', title='Bottle', capacity="10ml")
+        sampletype = self.addthing(self.portal.bika_setup.bika_sampletypes, 'SampleType', title='Water', Prefix='H2O')
+        service = self.addthing(self.portal.bika_setup.bika_analysisservices, 'AnalysisService', title='Ecoli', Keyword='ECO')
+        sample = self.addthing(self.client, 'Sample', SampleType=sampletype)
+        self.addthing(sample, 'SamplePartition', Container=container)
+        self.ar1 = self.addthing(self.client, 'AnalysisRequest', Contact=contact, Sample=sample, Analyses=[service, ], SamplingDate=DateTime())
+        self.ar2 = self.addthing(self.client, 'AnalysisRequest', Contact=contact, Sample=sample, Analyses=[service, ], SamplingDate=DateTime())
+        # @formatter:on
+        transaction.commit()
+
+    def get_items(self):
+        view = AnalysisRequestsView(self.portal.analysisrequests, self.request)
+        view.workflow = self.portal.portal_workflow
+        view.mtool = self.portal.portal_membership
+        view._process_request()
+        return view, view.folderitems()
+
+    def test_no_object_woken_up(self):
+        view, items = self.get_items()
+        self.assertEqual(len(items), 2)
+        self.assertEqual(view.woken_objects, 0)
+
+    def test_values_from_metadata(self):
+        view, items = self.get_items()
+        item = [i for i in items if i['uid'] == self.ar1.UID()][0]
+        self.assertEqual(item['getRequestID'], self.ar1.getRequestID())
+        self.assertEqual(item['Client'], 'Happy Hills')
+        self.assertEqual(item['ClientContact'], self.ar1.getContact().Title())
+        sample = self.ar1.getSample()
+        self.assertIn(sample.absolute_url(), item['replace']['getSample'])
+        self.assertIn(self.client.absolute_url(), item['replace']['Client'])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestListingMetadata))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
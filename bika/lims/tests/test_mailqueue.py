@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import asyncore
+import smtpd
+import threading
+from email import message_from_string
+from email.mime.text import MIMEText
+
+from bika.lims import mailqueue
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummySMTPServer(smtpd.SMTPServer):
+    """Local SMTP server collecting the messages it receives
+    """
+
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ("127.0.0.1", 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+        self.refuse = []
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        if set(rcpttos) & set(self.refuse):
+            return "550 No such user"
+        self.messages.append((mailfrom, rcpttos, data))
+
+
+class TestMailQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.server = DummySMTPServer()
+        self.thread = threading.Thread(
+            target=asyncore.loop, kwargs={"timeout": 0.1})
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.pool = mailqueue.SMTPPool("127.0.0.1", self.server.port)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.close()
+        self.thread.join(1)
+
+    def make_mail(self, mail_id, to="client@example.com"):
+        msg = MIMEText("Results")
+        msg["From"] = "Lab <lab@example.com>"
+        msg["To"] = "Client <%s>" % to
+        mfrom, mto = mailqueue.get_addresses(msg)
+        return mailqueue.QueuedMail(mail_id, msg.as_string(), mfrom, mto)
+
+    def test_addresses(self):
+        msg = message_from_string(
+            "From: Lab <lab@example.com>\nTo: a@example.com, B <b@example.com>"
+            "\nCc: c@example.com\n\nBody")
+        self.assertEqual(mailqueue.get_addresses(msg),
+                         ("lab@example.com",
+                          ["a@example.com", "b@example.com", "c@example.com"]))
+        self.assertEqual(mailqueue.get_addresses(msg, mto="d@example.com"),
+                         ("lab@example.com", ["d@example.com"]))
+
+    def test_send_queued(self):
+        storage = {}
+        for i in range(5):
+            storage["mail-%s" % i] = self.make_mail("mail-%s" % i)
+        commits = []
+
+        def commit():
+            commits.append([mail.status for mail in storage.values()])
+            return True
+
+        sent = mailqueue.send_queued(storage, self.pool, commit,
+                                     owner="sender-1")
+        self.assertEqual(sent, 5)
+        # each message is claimed and committed before it is sent
+        self.assertEqual(len(commits), 10)
+        self.assertEqual(commits[0].count(mailqueue.SENDING), 1)
+        self.assertEqual(len(self.server.messages), 5)
+        # a single connection was used for all the messages
+        self.assertEqual(self.server.connections, 1)
+        for mail in storage.values():
+            self.assertEqual(mail.status, mailqueue.SENT)
+            self.assertEqual(mail.attempts, 1)
+        # sent messages are not sent again
+        self.assertEqual(mailqueue.send_queued(storage, self.pool), 0)
+
+    def test_claimed_by_another_sender(self):
+        storage = {"mail-1": self.make_mail("mail-1")}
+        # the claim conflicts, the message is left to the other sender
+        sent = mailqueue.send_queued(storage, self.pool, lambda: False)
+        self.assertEqual(sent, 0)
+        self.assertEqual(self.server.messages, [])
+        # claimed messages are not sent again
+        self.assertEqual(storage["mail-1"].status, mailqueue.SENDING)
+        self.assertEqual(mailqueue.send_queued(storage, self.pool), 0)
+
+    def test_abandoned_claim(self):
+        mail = self.make_mail("mail-1")
+        mail.claim("sender-1", 1000)
+        storage = {"mail-1": mail}
+        mailqueue.send_queued(storage, self.pool, now=1001)
+        self.assertEqual(mail.status, mailqueue.SENDING)
+        mailqueue.send_queued(storage, self.pool,
+                              now=1001 + mailqueue.CLAIM_TIMEOUT)
+        self.assertEqual(mail.status, mailqueue.FAILED)
+        self.assertEqual(self.server.messages, [])
+
+    def test_headers(self):
+        msg = mailqueue.set_headers(MIMEText("Results"))
+        self.assertTrue(msg["Date"])
+        self.assertTrue(msg["Message-ID"])
+        # the headers of the caller are kept
+        msg = MIMEText("Results")
+        msg["Message-ID"] = "<1@example.com>"
+        self.assertEqual(mailqueue.set_headers(msg)["Message-ID"],
+                         "<1@example.com>")
+
+    def test_permanent_error(self):
+        self.server.refuse = ["nobody@example.com"]
+        mail = self.make_mail("mail-1", to="nobody@example.com")
+        self.assertFalse(mailqueue.deliver(mail, self.pool))
+        self.assertEqual(mail.status, mailqueue.FAILED)
+        self.assertTrue("550" in mail.error)
+
+    def test_retry(self):
+        mail = self.make_mail("mail-1")
+        self.server.close()
+        self.assertFalse(mailqueue.deliver(mail, self.pool, now=1000))
+        self.assertEqual(mail.status, mailqueue.QUEUED)
+        self.assertEqual(mail.next_attempt, 1000 + mailqueue.RETRY_DELAY)
+        self.assertFalse(mail.is_due(1000))
+        self.assertFalse(mailqueue.deliver(mail, self.pool, now=2000))
+        self.assertEqual(mail.next_attempt,
+                         2000 + mailqueue.RETRY_DELAY * 2)
+        mail.attempts = mailqueue.MAX_ATTEMPTS - 1
+        self.assertFalse(mailqueue.deliver(mail, self.pool, now=3000))
+        self.assertEqual(mail.status, mailqueue.FAILED)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestMailQueue))
+    return suite
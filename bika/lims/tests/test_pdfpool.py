@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import App.config
+from bika.lims import pdfpool
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class TestPDFPool(unittest.TestCase):
+
+    def setUp(self):
+        self.config = App.config.getConfiguration()
+        self.product_config = getattr(self.config, "product_config", None)
+        self.submit = pdfpool.submit
+
+    def tearDown(self):
+        self.config.product_config = self.product_config
+        pdfpool.submit = self.submit
+
+    def test_worker_count(self):
+        self.config.product_config = {"bika.lims": {"pdf_workers": "3"}}
+        self.assertEqual(pdfpool.get_worker_count(), 3)
+        self.config.product_config = {"bika.lims": {"pdf_workers": "0"}}
+        self.assertEqual(pdfpool.get_worker_count(), 0)
+        # without workers no pool is started, the PDFs are rendered in the
+        # calling thread
+        self.assertEqual(pdfpool.start_pool(), None)
+        self.assertEqual(pdfpool.get_pool(), None)
+        self.config.product_config = {"bika.lims": {"pdf_timeout": "0"}}
+        self.assertEqual(pdfpool.get_timeout(), None)
+        self.config.product_config = {}
+        self.assertEqual(pdfpool.get_timeout(), pdfpool.DEFAULT_TIMEOUT)
+        # the pool is off and its workers are never replaced by default
+        self.assertEqual(pdfpool.get_worker_count(), 0)
+        self.assertEqual(pdfpool.get_max_tasks(), None)
+        self.config.product_config = {"bika.lims": {"pdf_max_tasks": "500"}}
+        self.assertEqual(pdfpool.get_max_tasks(), 500)
+
+    def test_submit_many(self):
+        submitted = []
+
+        def submit(html, fetch_options, keep_file=False):
+            submitted.append(html)
+            return html.upper()
+
+        pdfpool.submit = submit
+        results = pdfpool.submit_many(["a", "b", "a"], ("localhost", "", None))
+        # each distinct html is converted once
+        self.assertEqual(sorted(submitted), ["a", "b"])
+        self.assertEqual(results, ["A", "B", "A"])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPDFPool))
+    return suite
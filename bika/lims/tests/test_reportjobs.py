@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+from bika.lims import reportjobs
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummyRecord(object):
+
+    def __init__(self, **kw):
+        self.values = kw
+
+    def items(self):
+        return self.values.items()
+
+
+class TestReportJobs(unittest.TestCase):
+
+    def tearDown(self):
+        reportjobs.set_queue(None)
+
+    def test_params(self):
+        params = reportjobs.get_params({
+            "report_id": "productivity_analysesperclient",
+            "output_format": "JOB",
+            "submit": "Submit",
+            "_authenticator": "secret",
+            "Requested_fromdate": "2017-01-01",
+            "Period": DummyRecord(start="2017-01-01", end="2017-12-31"),
+        })
+        self.assertEqual(sorted(params.keys()),
+                         ["Period", "Requested_fromdate", "report_id"])
+        self.assertEqual(params["Period"],
+                         {"start": "2017-01-01", "end": "2017-12-31"})
+
+    def test_timing(self):
+        job = reportjobs.ReportJob("job-1", "productivity_analysesperclient",
+                                   "analyst1", {})
+        self.assertEqual(job.status, reportjobs.QUEUED)
+        self.assertEqual(job.get_duration(), None)
+        job.submitted = DateTime("2017/01/01 10:00:00 UTC")
+        job.started = DateTime("2017/01/01 10:00:30 UTC")
+        job.finished = DateTime("2017/01/01 10:02:00 UTC")
+        self.assertEqual(job.get_wait(), 30)
+        self.assertEqual(job.get_duration(), 90)
+        data = job.to_dict()
+        self.assertEqual(data["id"], "job-1")
+        self.assertEqual(data["progress"], 0)
+        self.assertEqual(data["duration"], 90)
+
+    def test_storage_not_created_on_read(self):
+        annotation = {}
+        self.assertEqual(reportjobs.get_storage(annotation), None)
+        self.assertEqual(annotation, {})
+        storage = reportjobs.get_storage(annotation, create=True)
+        self.assertTrue(annotation[reportjobs.STORAGE_KEY] is storage)
+
+    def make_job(self, job_id, status, owner):
+        job = reportjobs.ReportJob(job_id, "productivity_analysesperclient",
+                                   "analyst1", {})
+        job.status = status
+        job.owner = owner
+        return job
+
+    def test_fail_interrupted_jobs(self):
+        annotation = {}
+        self.assertEqual(reportjobs.fail_interrupted_jobs(annotation), 0)
+        storage = reportjobs.get_storage(annotation, create=True)
+        instance = reportjobs.get_instance_id()
+        previous = "%s:%s" % (instance, "previous-process")
+        other = "otherhost:/srv/instance2:process"
+        for job_id, status, owner in (
+                ("job-1", reportjobs.QUEUED, previous),
+                ("job-2", reportjobs.RUNNING, previous),
+                ("job-3", reportjobs.DONE, previous),
+                ("job-4", reportjobs.RUNNING, reportjobs.get_owner()),
+                ("job-5", reportjobs.RUNNING, other)):
+            storage[job_id] = self.make_job(job_id, status, owner)
+        # the jobs of the previous process of this instance are failed
+        self.assertEqual(reportjobs.fail_interrupted_jobs(annotation), 2)
+        self.assertEqual(storage["job-1"].status, reportjobs.FAILED)
+        self.assertEqual(storage["job-2"].status, reportjobs.FAILED)
+        self.assertEqual(storage["job-3"].status, reportjobs.DONE)
+        self.assertTrue(storage["job-1"].finished is not None)
+        # the jobs of this process and of other live instances are kept
+        self.assertEqual(storage["job-4"].status, reportjobs.RUNNING)
+        self.assertEqual(storage["job-5"].status, reportjobs.RUNNING)
+        # unless they were not updated for a long time
+        later = DateTime() + 2.0 * reportjobs.STALE_SECONDS / 86400
+        self.assertEqual(
+            reportjobs.fail_interrupted_jobs(annotation, now=later), 2)
+        self.assertEqual(storage["job-5"].status, reportjobs.FAILED)
+
+    def test_local_queue(self):
+        queue = reportjobs.LocalQueue()
+        reportjobs.set_queue(queue)
+        self.assertTrue(reportjobs.get_queue() is queue)
+        queue.put(None, "job-1")
+        queue.put(None, "job-2")
+        self.assertEqual([job_id for portal, job_id in queue.jobs],
+                         ["job-1", "job-2"])
+        reportjobs.set_queue(None)
+        self.assertTrue(
+            isinstance(reportjobs.get_queue(), reportjobs.ThreadQueue))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestReportJobs))
+    return suite
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims.statecounters import get_indexed_day
+from bika.lims.statecounters import get_state
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+def convert(yr, mo, dy, hr, mn):
+    """Same conversion as DateIndex._convert
+    """
+    return ((((yr * 12 + mo) * 31 + dy) * 24 + hr) * 60 + mn)
+
+
+class DummyIndex(object):
+
+    def __init__(self, values):
+        self.values = values
+
+    def getEntryForObject(self, rid):
+        return self.values.get(rid)
+
+
+class DummyCatalog(object):
+
+    def __init__(self, values):
+        self._catalog = self
+        self.index = DummyIndex(values)
+
+    def getIndex(self, name):
+        return self.index
+
+
+class DummyBrain(object):
+
+    def __init__(self, rid):
+        self.rid = rid
+
+    def getRID(self):
+        return self.rid
+
+
+class TestStateCounters(unittest.TestCase):
+
+    def test_indexed_day(self):
+        catalog = DummyCatalog({
+            1: convert(2017, 1, 1, 0, 0),
+            2: convert(2017, 12, 31, 23, 59),
+            3: convert(2016, 2, 29, 12, 30),
+        })
+        self.assertEqual(get_indexed_day(catalog, DummyBrain(1)), "2017-01-01")
+        self.assertEqual(get_indexed_day(catalog, DummyBrain(2)), "2017-12-31")
+        self.assertEqual(get_indexed_day(catalog, DummyBrain(3)), "2016-02-29")
+        self.assertEqual(get_indexed_day(catalog, DummyBrain(4)), None)
+
+    def test_state(self):
+        self.assertEqual(get_state("sample_due"), "sample_due")
+        self.assertEqual(get_state("sample_due", "active"), "sample_due")
+        self.assertEqual(get_state("open", None), "open")
+        self.assertEqual(get_state("verified", "cancelled"), "inactive")
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestStateCounters))
+    return suite
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+from bika.lims.workflow import get_last_transitions
+from bika.lims.workflow import getTransitionActor
+from bika.lims.workflow import getTransitionDateTime
+
+try:
+    import unittest2 as unittest
+except ImportError: # Python 2.7
+    import unittest
+
+
+class DummyContent(object):
+
+    def __init__(self, workflow_history=None):
+        if workflow_history is not None:
+            self.workflow_history = workflow_history
+
+
+def event(action, time, actor):
+    return {'action': action,
+            'time': DateTime(time),
+            'actor': actor,
+            'review_state': 'state'}
+
+
+class TestTransitionLog(unittest.TestCase):
+
+    def get_history(self):
+        return {
+            'bika_analysis_workflow': (
+                event(None, '2017-01-01 10:00', 'labman'),
+                event('submit', '2017-01-02 10:00', 'analyst1'),
+                event('retract', '2017-01-03 10:00', 'labman'),
+                event('submit', '2017-01-04 10:00', 'analyst2'),
+            ),
+            'bika_cancellation_workflow': (
+                event(None, '2017-01-01 10:00', 'labman'),
+                event('cancel', '2017-01-05 10:00', 'labman'),
+                event('reinstate', '2017-01-06 10:00', 'labclerk'),
+            ),
+        }
+
+    def test_last_transitions(self):
+        last = get_last_transitions(self.get_history())
+        self.assertEqual(sorted(last.keys()),
+                         ['cancel', 'reinstate', 'retract', 'submit'])
+        self.assertEqual(last['submit'],
+                         (DateTime('2017-01-04 10:00'), 'analyst2'))
+        self.assertEqual(last['reinstate'],
+                         (DateTime('2017-01-06 10:00'), 'labclerk'))
+
+    def test_history_fallback(self):
+        # objects without a transition log read their history
+        obj = DummyContent(self.get_history())
+        self.assertEqual(getTransitionDateTime(obj, 'submit'),
+                         DateTime('2017-01-04 10:00'))
+        self.assertEqual(getTransitionActor(obj, 'cancel'), 'labman')
+        self.assertEqual(getTransitionDateTime(obj, 'verify'), None)
+        self.assertEqual(getTransitionActor(obj, 'verify'), '')
+
+    def test_missing_history(self):
+        obj = DummyContent()
+        self.assertEqual(getTransitionDateTime(obj, 'submit'), None)
+        self.assertEqual(getTransitionActor(obj, 'submit'), '')
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTransitionLog))
+    return suite
@@ -5,13 +5,25 @@
 # Copyright 2011-2017 by it's authors.
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
+import transaction
+
 from Acquisition import aq_inner
 from Acquisition import aq_parent
+from bika.lims import analysiscounters
 from bika.lims import logger
 from bika.lims.idserver import generateUniqueId
+from bika.lims.idserver import rebuild_sequence_index
+from bika.lims.numbergenerator import Counter
 from bika.lims.numbergenerator import INumberGenerator
+from bika.lims.numbergenerator import NUMBER_STORAGE
+from bika.lims.numbergenerator import get_portal_annotation
+from bika.lims.statecounters import rebuild_counters
+from bika.lims.workflow import rebuild_transition_log
+from BTrees.OIBTree import OIBTree
+from BTrees.OOBTree import OOBTree
 from DateTime import DateTime
 from Products.ATContentTypes.utils import DT2dt
+from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import _createObjectByType
 from zope.component import getUtility
 
@@ -35,12 +47,68 @@ def upgrade(tool):
     setup.runImportStepFromProfile('profile-bika.lims:default', 'rolemap')
     setup.runImportStepFromProfile('profile-bika.lims:default', 'propertiestool')
     
+    # One persistent counter per key in the number generator
+    migrate_number_storage(portal)
+
     # Sync the empty number generator with existing content
     prepare_number_generator(portal)
 
+    # Index the highest sequence numbers of the existing IDs
+    rebuild_sequence_index()
+
+    # Count the existing objects shown in the dashboard charts
+    rebuild_counters()
+
+    # Group the listed items by their workflow states
+    add_worksheetanalysis_state_column(portal)
+
+    # Read the transition dates and actors from the objects, not the history
+    index_transition_dates(portal)
+
+    # Count the analyses of each AR by state
+    count_ar_analyses(portal)
+
+    # Apply the worksheet templates from the catalog metadata
+    index_worksheet_template_data(portal)
+
+    # List the ARs and the analyses to assign from the catalog metadata
+    add_listing_metadata(portal)
+
     return True
 
 
+def add_worksheetanalysis_state_column(portal):
+    """Adds the worksheetanalysis_review_state metadata column, read by the
+    listings to compute the workflow actions without waking up the objects
+    """
+    column = 'worksheetanalysis_review_state'
+    for catalog_id, portal_type in [('bika_analysis_catalog', 'Analysis'),
+                                    ('bika_catalog', 'AnalysisRequest')]:
+        catalog = getToolByName(portal, catalog_id)
+        if column in catalog.schema():
+            continue
+        logger.info("Adding column %s to %s" % (column, catalog_id))
+        catalog.addColumn(column)
+        for brain in catalog(portal_type=portal_type):
+            obj = brain.getObject()
+            catalog.catalog_object(obj, idxs=[column])
+
+
+def migrate_number_storage(portal):
+    """Moves the numbers stored in a single OIBTree to a counter object per
+    key, so the numbers of different keys don't conflict with each other
+    """
+    annotation = get_portal_annotation()
+    storage = annotation.get(NUMBER_STORAGE)
+    if not isinstance(storage, OIBTree):
+        return
+    logger.info("Migrating %s number generator keys" % len(storage))
+    counters = OOBTree()
+    for key, value in storage.items():
+        counters[key] = Counter(value)
+    annotation[NUMBER_STORAGE] = counters
+
+
 def prepare_number_generator(portal):
     number_generator = getUtility(INumberGenerator)
     if len(number_generator.keys()) > 1:
@@ -140,3 +208,127 @@ def prepare_number_generator(portal):
     pc = portal.portal_catalog
     for brain in pc():
         generateUniqueId(brain.getObject())
+
+
+def index_transition_dates(portal):
+    """Records the last date and actor of the transitions of the analyses and
+    ARs, and indexes the dates they were submitted, verified and published
+    """
+    catalogs = [
+        ('bika_analysis_catalog',
+         ['getDateSubmitted', 'getDateVerified'],
+         ['getDateSubmitted', 'getDateVerified', 'getSubmittedBy']),
+        ('bika_catalog',
+         ['getDateVerified'],
+         ['getDateVerified']),
+    ]
+    for catalog_id, indexes, columns in catalogs:
+        catalog = getToolByName(portal, catalog_id)
+        for index in indexes:
+            if index not in catalog.indexes():
+                catalog.addIndex(index, 'DateIndex')
+        for column in columns:
+            if column not in catalog.schema():
+                catalog.addColumn(column)
+
+    bac = getToolByName(portal, 'bika_analysis_catalog')
+    brains = bac(portal_type=['Analysis',
+                              'DuplicateAnalysis',
+                              'ReferenceAnalysis'])
+    logger.info("Recording the transitions of %s analyses" % len(brains))
+    for num, brain in enumerate(brains):
+        obj = brain.getObject()
+        rebuild_transition_log(obj)
+        bac.catalog_object(obj, idxs=['getDateSubmitted', 'getDateVerified'])
+        if num and num % 1000 == 0:
+            logger.info("Recorded the transitions of %s analyses" % num)
+            transaction.savepoint(optimistic=True)
+
+    bc = getToolByName(portal, 'bika_catalog')
+    brains = bc(portal_type='AnalysisRequest')
+    logger.info("Recording the transitions of %s ARs" % len(brains))
+    for num, brain in enumerate(brains):
+        obj = brain.getObject()
+        rebuild_transition_log(obj)
+        bc.catalog_object(obj, idxs=['getDatePublished', 'getDateVerified'])
+        if num and num % 1000 == 0:
+            logger.info("Recorded the transitions of %s ARs" % num)
+            transaction.savepoint(optimistic=True)
+
+
+def count_ar_analyses(portal):
+    """Adds the catalog columns of the analysis counters of the ARs and
+    counts the analyses of the existing ARs
+    """
+    bc = getToolByName(portal, 'bika_catalog')
+    if 'getLateDate' not in bc.indexes():
+        bc.addIndex('getLateDate', 'DateIndex')
+    for column in ['getAnalysesNum', 'getDueDate', 'getLateDate']:
+        if column not in bc.schema():
+            bc.addColumn(column)
+    analysiscounters.rebuild_counters()
+
+
+def index_worksheet_template_data(portal):
+    """Indexes the instruments allowed for the unassigned analyses, and the
+    blank flag and services of the reference samples
+    """
+    bac = getToolByName(portal, 'bika_analysis_catalog')
+    if 'getAllowedInstruments' not in bac.indexes():
+        bac.addIndex('getAllowedInstruments', 'KeywordIndex')
+    # Only the analyses waiting for a worksheet are looked up by instrument
+    brains = bac(portal_type='Analysis',
+                 review_state='sample_received',
+                 worksheetanalysis_review_state='unassigned',
+                 cancellation_state='active')
+    logger.info("Indexing the allowed instruments of %s analyses"
+                % len(brains))
+    for num, brain in enumerate(brains):
+        obj = brain.getObject()
+        bac.catalog_object(obj, idxs=['getAllowedInstruments'])
+        if num and num % 1000 == 0:
+            transaction.savepoint(optimistic=True)
+
+    bc = getToolByName(portal, 'bika_catalog')
+    for column in ['getBlank', 'getSupportedServiceUIDs']:
+        if column not in bc.schema():
+            bc.addColumn(column)
+    for brain in bc(portal_type='ReferenceSample'):
+        obj = brain.getObject()
+        bc.catalog_object(obj, idxs=['UID'])
+
+
+def add_listing_metadata(portal):
+    """Adds the metadata columns the AR listing and the listing of the
+    analyses to assign to worksheets are built from, and fills them for the
+    existing ARs and unassigned analyses
+    """
+    columns = [
+        ('bika_catalog',
+         ['Creator', 'created', 'getSamplingDate', 'getSampler', 'getAdHoc',
+          'getInvoiceExclude', 'getBatchID', 'getBatchPath',
+          'getContactPath', 'getSubGroupTitle', 'getSamplingDeviationTitle',
+          'getStorageLocationTitle', 'getTemplateTitle', 'getHazardous',
+          'isSamplingWorkflowEnabled', 'getDepartmentUIDs'],
+         dict(portal_type='AnalysisRequest')),
+        ('bika_analysis_catalog',
+         ['getClientTitle', 'getClientOrderNumber', 'getCategoryTitle',
+          'getDateReceived', 'getDueDate', 'getDepartmentUID'],
+         dict(portal_type='Analysis',
+              review_state='sample_received',
+              worksheetanalysis_review_state='unassigned',
+              cancellation_state='active')),
+    ]
+    for catalog_id, names, query in columns:
+        catalog = getToolByName(portal, catalog_id)
+        for column in names:
+            if column not in catalog.schema():
+                catalog.addColumn(column)
+        brains = catalog(query)
+        logger.info("Updating the metadata of %s objects in %s"
+                    % (len(brains), catalog_id))
+        for num, brain in enumerate(brains):
+            obj = brain.getObject()
+            catalog.catalog_object(obj, idxs=['UID'])
+            if num and num % 1000 == 0:
+                transaction.savepoint(optimistic=True)
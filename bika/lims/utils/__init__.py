@@ -5,10 +5,10 @@
 # Copyright 2011-2017 by it's authors.
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
+import hashlib
 import os
 import re
 import types
-import urllib2
 import tempfile
 from time import time
 from email import Encoders
@@ -351,6 +351,10 @@ def changeWorkflowState(content, wf_id, state_id, acquire_permissions=False,
 
     # Map changes to the catalogs
     content.reindexObject(idxs=['allowedRolesAndUsers', 'review_state'])
+
+    # No transition event is fired, count the analysis in its new state
+    from bika.lims.analysiscounters import update_analysis
+    update_analysis(content)
     return
 
 
@@ -367,34 +371,52 @@ def isnumber(s):
         return False
 
 
-def bika_url_fetcher(url):
-    """Basically the same as the default_url_fetcher from WeasyPrint,
-    but injects the __ac cookie to make an authenticated request to the resource.
+def get_url_fetcher(host, ac_cookie="", auth=None):
+    """Returns a WeasyPrint url fetcher which injects the __ac cookie and
+    the authorization in the requests to the given host.
+
+    The fetcher doesn't need the Zope request, so it can be used in a
+    separate process too. The assets of the host are served from the asset
+    cache of the process, for each user.
     """
     from weasyprint import VERSION_STRING
-    from weasyprint.compat import Request
-    from weasyprint.compat import urlopen_contenttype
+    from bika.lims import assetcache
+
+    headers = {
+        'Cookie': "__ac={}".format(ac_cookie),
+        'User-Agent': VERSION_STRING,
+    }
+    if auth:
+        headers['Authorization'] = auth
+    scope = hashlib.sha1("{}\0{}".format(ac_cookie, auth or "")).hexdigest()
 
-    request = api.get_request()
-    __ac = request.cookies.get("__ac", "")
+    def url_fetcher(url):
+        if host and host in url:
+            return assetcache.fetch(url, headers, scope).to_fetch_result()
+        return default_url_fetcher(url)
+    return url_fetcher
 
-    if request.get_header("HOST") in url:
-        result, mime_type, charset = urlopen_contenttype(
-            Request(url,
-                    headers={
-                        'Cookie': "__ac={}".format(__ac),
-                        'User-Agent': VERSION_STRING,
-                        'Authorization': request._auth,
-                    }))
-        return dict(file_obj=result,
-                    redirected_url=result.geturl(),
-                    mime_type=mime_type,
-                    encoding=charset)
 
-    return default_url_fetcher(url)
+def get_request_fetch_options(request=None):
+    """Returns the host, the __ac cookie and the authorization of the current
+    request, to be passed to get_url_fetcher
+    """
+    if request is None:
+        request = api.get_request()
+    return (request.get_header("HOST"),
+            request.cookies.get("__ac", ""),
+            request._auth)
+
+
+def bika_url_fetcher(url):
+    """Basically the same as the default_url_fetcher from WeasyPrint,
+    but injects the __ac cookie to make an authenticated request to the resource.
+    """
+    return get_url_fetcher(*get_request_fetch_options())(url)
 
 
-def createPdf(htmlreport, outfile=None, css=None, images={}):
+def createPdf(htmlreport, outfile=None, css=None, images={},
+              url_fetcher=None):
     """create a PDF from some HTML.
     htmlreport: rendered html
     outfile: pdf filename; if supplied, caller is responsible for creating
@@ -402,6 +424,7 @@ def createPdf(htmlreport, outfile=None, css=None, images={}):
     css: remote URL of css file to download
     images: A dictionary containing possible URLs (keys) and local filenames
             (values) with which they may to be replaced during rendering.
+    url_fetcher: WeasyPrint url fetcher, bika_url_fetcher by default
     # WeasyPrint will attempt to retrieve images directly from the URL
     # referenced in the HTML report, which may refer back to a single-threaded
     # (and currently occupied) zeoclient, hanging it.  All image source
@@ -412,17 +435,12 @@ def createPdf(htmlreport, outfile=None, css=None, images={}):
     css_def = ''
     if css:
         if css.startswith("http://") or css.startswith("https://"):
-            # Download css file in temp dir
-            u = urllib2.urlopen(css)
-            _cssfile = tempfile.mktemp(suffix='.css')
-            localFile = open(_cssfile, 'w')
-            localFile.write(u.read())
-            localFile.close()
-            cleanup.append(_cssfile)
+            # Remote css files are kept in the asset cache
+            from bika.lims import assetcache
+            css_def = assetcache.fetch(css).data
         else:
-            _cssfile = css
-        cssfile = open(_cssfile, 'r')
-        css_def = cssfile.read()
+            cssfile = open(css, 'r')
+            css_def = cssfile.read()
 
     htmlreport = to_utf8(htmlreport)
 
@@ -431,7 +449,9 @@ def createPdf(htmlreport, outfile=None, css=None, images={}):
 
     # render
     htmlreport = to_utf8(htmlreport)
-    renderer = HTML(string=htmlreport, url_fetcher=bika_url_fetcher, encoding='utf-8')
+    renderer = HTML(string=htmlreport,
+                    url_fetcher=url_fetcher or bika_url_fetcher,
+                    encoding='utf-8')
     pdf_fn = outfile if outfile else tempfile.mktemp(suffix=".pdf")
     if css:
         renderer.write_pdf(pdf_fn, stylesheets=[CSS(string=css_def)])
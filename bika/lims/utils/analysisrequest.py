@@ -10,6 +10,7 @@ from Products.CMFPlone.utils import _createObjectByType
 from Products.CMFPlone.utils import safe_unicode
 from bika.lims import bikaMessageFactory as _
 from bika.lims import logger
+from bika.lims import mailqueue
 from bika.lims.idserver import renameAfterCreation, generateUniqueId
 from bika.lims.interfaces import ISample, IAnalysisService, IAnalysis
 from bika.lims.utils import tmpID
@@ -27,7 +28,6 @@ from email.Utils import formataddr
 from os.path import join
 from plone import api
 from Products.CMFPlone.utils import _createObjectByType
-from smtplib import SMTPServerDisconnected, SMTPRecipientsRefused
 import os
 import tempfile
 
@@ -325,10 +325,6 @@ def notify_rejection(analysisrequest):
     if pdf:
         attachPdf(mime_msg, pdf, filename)
 
-    try:
-        host = getToolByName(analysisrequest, 'MailHost')
-        host.send(mime_msg.as_string(), immediate=True)
-    except:
-        pass
+    mailqueue.queue_mail(analysisrequest, mime_msg)
 
     return True
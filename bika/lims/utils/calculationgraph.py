@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from collections import OrderedDict
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.cache import get_request_cache
+
+# Request annotation key for the graphs built in the current request
+REQUEST_CACHE_KEY = "bika.lims.calculationgraph"
+
+
+class CalculationGraph(object):
+    """The calculation dependencies between the analyses of an Analysis Request.
+
+    The graph is built once from the analyses of the AR: an analysis depends
+    on the sibling analyses whose services are used by its calculation.
+    Recalculating the AR evaluates every calculated analysis exactly once, in
+    topological order, so shared dependencies are not recomputed.
+    """
+
+    def __init__(self, ar):
+        self.context = ar
+        self.analyses = OrderedDict()
+        self.calculations = {}
+        self.dependencies = {}
+        self.dependents = {}
+        self._build(self.get_groups())
+
+    @classmethod
+    def get(cls, ar):
+        """Returns the graph of the AR, built once per request.
+
+        The graph only depends on the analyses of the AR and their
+        calculations, so it is safe to reuse it while the results change.
+        """
+        cache = get_request_cache(REQUEST_CACHE_KEY)
+        key = (api.get_uid(ar), tuple(ar.objectIds("Analysis")))
+        graph = cache.get(key)
+        if graph is None:
+            graph = cache[key] = cls(ar)
+        return graph
+
+    def get_groups(self):
+        """Returns the lists of analyses whose calculations use each other's
+        results: the analyses of the AR
+        """
+        return [self.context.getAnalyses(full_objects=True, retracted=False)]
+
+    def _build(self, groups):
+        for analyses in groups:
+            self._build_group(analyses)
+
+    def _build_group(self, analyses):
+        by_service = {}
+        uids = []
+        for analysis in analyses:
+            uid = api.get_uid(analysis)
+            if uid in self.analyses:
+                continue
+            uids.append(uid)
+            self.analyses[uid] = analysis
+            self.dependencies[uid] = []
+            self.dependents[uid] = []
+            by_service.setdefault(analysis.getServiceUID(), []).append(uid)
+
+        for uid in uids:
+            calc = self.analyses[uid].getCalculationToApply()
+            if not calc:
+                continue
+            self.calculations[uid] = calc
+            for service in calc.getDependentServices():
+                for dep_uid in by_service.get(api.get_uid(service), []):
+                    if dep_uid == uid:
+                        continue
+                    self.dependencies[uid].append(dep_uid)
+                    self.dependents[dep_uid].append(uid)
+
+    def get_dependencies(self, analysis):
+        """Returns the analyses the given analysis depends on
+        """
+        uids = self.dependencies.get(api.get_uid(analysis), [])
+        return [self.analyses[uid] for uid in uids]
+
+    def get_dependents(self, analysis):
+        """Returns the analyses which directly depend on the given analysis
+        """
+        uids = self.dependents.get(api.get_uid(analysis), [])
+        return [self.analyses[uid] for uid in uids]
+
+    def get_calculation(self, analysis):
+        """Returns the calculation applied to the analysis, if any
+        """
+        return self.calculations.get(api.get_uid(analysis))
+
+    def sorted_uids(self, uids=None):
+        """Returns the UIDs of the analyses in topological order, so each
+        analysis comes after all its dependencies.
+
+        If uids is given, only these analyses and the ones depending on them,
+        directly or not, are returned.
+        """
+        if uids is None:
+            selected = set(self.analyses.keys())
+        else:
+            selected = set()
+            pending = [uid for uid in uids if uid in self.analyses]
+            while pending:
+                uid = pending.pop()
+                if uid in selected:
+                    continue
+                selected.add(uid)
+                pending.extend(self.dependents[uid])
+
+        # Kahn's algorithm, restricted to the selected analyses
+        indegree = dict.fromkeys(selected, 0)
+        for uid in selected:
+            for dep_uid in self.dependencies[uid]:
+                if dep_uid in selected:
+                    indegree[uid] += 1
+        ready = [uid for uid in self.analyses if indegree.get(uid) == 0]
+        ordered = []
+        while ready:
+            uid = ready.pop(0)
+            ordered.append(uid)
+            for dependent_uid in self.dependents[uid]:
+                if dependent_uid not in indegree:
+                    continue
+                indegree[dependent_uid] -= 1
+                if indegree[dependent_uid] == 0:
+                    ready.append(dependent_uid)
+
+        if len(ordered) != len(selected):
+            cyclic = [uid for uid in selected if uid not in ordered]
+            logger.warn("Circular calculation dependencies in {}: {}".format(
+                api.get_id(self.context),
+                ", ".join([api.get_id(self.analyses[uid]) for uid in cyclic])))
+        return ordered
+
+    def recalculate(self, uids=None):
+        """Recalculates the calculated analyses in topological order.
+
+        If uids is given, only these analyses and their dependents are
+        recalculated. Only the results that changed are written back.
+        Returns the list of analyses whose result changed.
+        """
+        changed = []
+        for uid in self.sorted_uids(uids):
+            calc = self.calculations.get(uid)
+            if not calc:
+                continue
+            analysis = self.analyses[uid]
+            dependencies = [self.analyses[dep_uid]
+                            for dep_uid in self.dependencies[uid]]
+            mapping = analysis.getCalculationMapping(calc, dependencies)
+            if mapping is None:
+                continue
+            result = analysis.evaluateCalculation(calc, mapping)
+            if result == analysis.getResult():
+                continue
+            analysis.setResult(result)
+            changed.append(analysis)
+        return changed
+
+
+class WorksheetCalculationGraph(CalculationGraph):
+    """The calculation dependencies between the analyses of a Worksheet.
+
+    The graph covers all the analyses of the ARs with routine analyses in the
+    worksheet, including the ones not assigned to it, and the duplicates of
+    the worksheet. The analyses of each AR only depend on each other, as the
+    duplicates of each duplicate group do. Reference analyses are not
+    graphed, they are calculated on their own.
+    """
+
+    @classmethod
+    def get(cls, worksheet):
+        """Returns the graph of the worksheet, built once per request
+        """
+        cache = get_request_cache(REQUEST_CACHE_KEY)
+        key = (api.get_uid(worksheet),
+               tuple(sorted(worksheet.getRawAnalyses())))
+        graph = cache.get(key)
+        if graph is None:
+            graph = cache[key] = cls(worksheet)
+        return graph
+
+    def get_groups(self):
+        """Returns the analyses of each AR of the worksheet and the
+        duplicates of each duplicate group
+        """
+        workflow = api.get_tool("portal_workflow")
+        ars = OrderedDict()
+        duplicates = OrderedDict()
+        for analysis in self.context.getAnalyses():
+            portal_type = api.get_portal_type(analysis)
+            if portal_type == "Analysis":
+                ar = analysis.aq_parent
+                ars.setdefault(api.get_uid(ar), ar)
+            elif portal_type == "DuplicateAnalysis":
+                state = workflow.getInfoFor(analysis, "review_state", "")
+                if state == "retracted":
+                    continue
+                group = analysis.getReferenceAnalysesGroupID()
+                duplicates.setdefault(group, []).append(analysis)
+        groups = [ar.getAnalyses(full_objects=True, retracted=False)
+                  for ar in ars.values()]
+        return groups + duplicates.values()
+
+
+def recalculate_analysisrequest(ar, uids=None):
+    """Recalculates the calculated analyses of the AR.
+    Returns the list of analyses whose result changed.
+    """
+    return CalculationGraph.get(ar).recalculate(uids)
+
+
+def recalculate_worksheet(worksheet, uids=None):
+    """Recalculates the calculated analyses of the ARs and the duplicates of
+    the worksheet, see WorksheetCalculationGraph.
+    Returns the list of analyses whose result changed.
+    """
+    return WorksheetCalculationGraph.get(worksheet).recalculate(uids)
+
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Counting of catalog records straight from the index internals
+
+`len(catalog(query))` builds the result set and the lazy brains sequence of
+every query. These helpers intersect the record id sets of the indexes
+instead, so the counts of many states are computed from a single query, and
+reports are aggregated by one or two indexes without a query per group.
+"""
+
+from AccessControl import getSecurityManager
+from BTrees.IIBTree import IITreeSet
+from BTrees.IIBTree import difference
+from BTrees.IIBTree import intersection
+from BTrees.IIBTree import union
+from DateTime import DateTime
+
+from bika.lims import indexqueue
+
+
+def get_index(catalog, name):
+    """Returns the index of the catalog with the given name or None
+    """
+    indexes = catalog._catalog.indexes
+    if name not in indexes:
+        return None
+    return catalog._catalog.getIndex(name)
+
+
+def get_value_rids(index, value):
+    """Returns the record ids indexed under the value of a FieldIndex or a
+    KeywordIndex
+    """
+    rids = index._index.get(value)
+    if rids is None:
+        return IITreeSet()
+    if isinstance(rids, int):
+        # single record ids are stored unwrapped
+        return IITreeSet((rids, ))
+    return rids
+
+
+def get_query_rids(catalog, query):
+    """Returns the set of record ids matching all the criteria of the query
+
+    The allowedRolesAndUsers of the current user are added to the query, as
+    searchResults does. Criteria for indexes the catalog doesn't have are
+    ignored. Returns None for a query without any criteria.
+    """
+    # index the objects queued in this transaction, as searchResults does
+    indexqueue.flush(catalog)
+
+    query = dict(query)
+    query.pop("sort_on", None)
+    if "allowedRolesAndUsers" not in query and \
+            get_index(catalog, "allowedRolesAndUsers") is not None:
+        user = getSecurityManager().getUser()
+        query["allowedRolesAndUsers"] = catalog._listAllowedRolesAndUsers(user)
+
+    rids = None
+    for name, value in query.items():
+        index = get_index(catalog, name)
+        if index is None:
+            continue
+        result = index._apply_index({name: value})
+        if result is None:
+            continue
+        rids = result[0] if rids is None else intersection(rids, result[0])
+        if not rids:
+            return IITreeSet()
+    return rids
+
+
+def count(catalog, query):
+    """Returns the number of catalog records matching the query
+    """
+    rids = get_query_rids(catalog, query)
+    if rids is None:
+        return len(catalog)
+    return len(rids)
+
+
+def count_by(catalog, query, name, values=None):
+    """Returns a dictionary of value -> number of catalog records matching
+    the query with that value in the FieldIndex `name`
+
+    The record ids of the query are computed once and intersected with the
+    records of each value. All the indexed values are counted if no values
+    are given.
+    """
+    rids = get_query_rids(catalog, query)
+    counts = {}
+    for value, value_rids in split_rids(catalog, rids, name, values):
+        counts[value] = len(value_rids)
+    return counts
+
+
+def get_indexed_date(value):
+    """Returns the UTC DateTime of a value stored by a DateIndex
+    """
+    # Revert DateIndex._convert: ((((yr*12 + mo)*31 + dy)*24 + hr)*60 + mn
+    hours, minute = divmod(value, 60)
+    days, hour = divmod(hours, 24)
+    months, day = divmod(days - 1, 31)
+    year, month = divmod(months - 1, 12)
+    return DateTime(year, month + 1, day + 1, hour, minute, 0, "UTC")
+
+
+def split_rids(catalog, rids, name, values=None, key=None, missing=None):
+    """Yields (group, record ids) for the records of rids grouped by the value
+    they have in the index `name`
+
+    Without key, the record ids of each value are intersected with rids. The
+    values default to all the values of the index, and groups without
+    records are skipped then. With a key, each record is grouped by the key
+    of its indexed value, e.g. the month of a DateIndex value.
+
+    The records without any of the values in the index are skipped, or
+    grouped under `missing` when given.
+    """
+    index = get_index(catalog, name)
+    if rids is None and missing is not None:
+        rids = IITreeSet(catalog._catalog.data.keys())
+    if key is not None:
+        if rids is None:
+            rids = catalog._catalog.data.keys()
+        groups = {}
+        for rid in rids:
+            value = index.getEntryForObject(rid)
+            if value is not None:
+                group = key(value)
+            elif missing is not None:
+                group = missing
+            else:
+                continue
+            groups.setdefault(group, []).append(rid)
+        for group, group_rids in groups.items():
+            yield group, IITreeSet(group_rids)
+        return
+
+    skip_empty = values is None
+    if values is None:
+        values = index.uniqueValues()
+    grouped = IITreeSet()
+    for value in values:
+        value_rids = get_value_rids(index, value)
+        if rids is not None:
+            value_rids = intersection(rids, value_rids)
+        if missing is not None and value != missing:
+            grouped = union(grouped, value_rids)
+        if skip_empty and not value_rids:
+            continue
+        if value == missing:
+            # merged with the records without a value below
+            continue
+        yield value, value_rids
+    if missing is not None:
+        missing_rids = difference(rids, grouped)
+        if missing_rids or not skip_empty:
+            yield missing, missing_rids
+
+
+def get_metadata_sum(catalog, rids, column):
+    """Returns the sum and the number of the numeric values of the metadata
+    column for the given records
+    """
+    position = catalog._catalog.schema[column]
+    data = catalog._catalog.data
+    total = 0.0
+    number = 0
+    for rid in rids:
+        try:
+            total += float(data[rid][position])
+        except (TypeError, ValueError):
+            continue
+        number += 1
+    return total, number
+
+
+def aggregate(catalog, query, groupby, values=None, keys=None, filters=None,
+              columns=None, missing=None):
+    """Aggregates the catalog records matching the query by one or two
+    indexes
+
+    :param groupby: index name or a tuple of one or two index names
+    :param values: dictionary of index name -> values to group by. The
+        groups of all the indexed values are returned by default
+    :param keys: dictionary of index name -> function returning the group of
+        an indexed value, for indexes without discrete values like dates
+    :param filters: dictionary of name -> query. The records of each group
+        matching the query are counted too
+    :param columns: metadata columns summed and averaged for each group
+    :param missing: dictionary of index name -> group of the records without
+        a value in the index. These records are left out by default
+    :returns: dictionary of group -> aggregates. The groups are the values of
+        the index, or tuples of values when grouping by two indexes. The
+        aggregates are a dictionary with the keys 'count', 'filters' (name
+        -> count), 'sum' and 'avg' (column -> value)
+    """
+    if isinstance(groupby, basestring):
+        groupby = (groupby, )
+    values = values or {}
+    keys = keys or {}
+    filters = filters or {}
+    columns = columns or []
+    missing = missing or {}
+
+    rids = get_query_rids(catalog, query)
+    filter_rids = dict([(name, get_query_rids(catalog, filter_query))
+                        for name, filter_query in filters.items()])
+
+    def split(rids, name):
+        return split_rids(catalog, rids, name, values.get(name),
+                          keys.get(name), missing.get(name))
+
+    groups = []
+    for value, value_rids in split(rids, groupby[0]):
+        if len(groupby) == 1:
+            groups.append((value, value_rids))
+            continue
+        for second, second_rids in split(value_rids, groupby[1]):
+            groups.append(((value, second), second_rids))
+
+    results = {}
+    for group, group_rids in groups:
+        result = {'count': len(group_rids),
+                  'filters': {},
+                  'sum': {},
+                  'avg': {}}
+        for name, name_rids in filter_rids.items():
+            if name_rids is not None:
+                result['filters'][name] = len(
+                    intersection(group_rids, name_rids))
+            else:
+                result['filters'][name] = len(group_rids)
+        for column in columns:
+            total, number = get_metadata_sum(catalog, group_rids, column)
+            result['sum'][column] = total
+            result['avg'][column] = number and total / number or 0
+        results[group] = result
+    return results
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Stable digests of the data trees the reports are rendered from
+
+The digest only depends on the values of the tree: dictionaries are walked
+in the order of their keys, content objects are identified by their UID and
+the keys that change on every rendering, like the publication date, are left
+out. Two trees with the same values give the same digest, in any process.
+"""
+
+import hashlib
+
+from DateTime import DateTime
+
+# Keys of the publication data left out of the digest: the content objects
+# themselves, whose values are already in the tree, and the values that
+# change every time the data is built
+VOLATILE_KEYS = frozenset(["obj", "date_published"])
+
+
+def _walk(value, update, exclude):
+    if value is None or isinstance(value, (bool, int, long, float)):
+        update(repr(value))
+    elif isinstance(value, unicode):
+        update("u:" + value.encode("utf-8"))
+    elif isinstance(value, str):
+        update("s:" + value)
+    elif isinstance(value, DateTime):
+        update("d:" + value.ISO8601())
+    elif isinstance(value, dict):
+        update("{")
+        for key in sorted(value.keys()):
+            if key in exclude:
+                continue
+            _walk(key, update, exclude)
+            update(":")
+            _walk(value[key], update, exclude)
+            update(",")
+        update("}")
+    elif isinstance(value, (list, tuple)):
+        update("[")
+        for item in value:
+            _walk(item, update, exclude)
+            update(",")
+        update("]")
+    elif isinstance(value, (set, frozenset)):
+        _walk(sorted(value), update, exclude)
+    elif callable(getattr(value, "UID", None)):
+        update("o:" + value.UID())
+    else:
+        # e.g. methods and files: their repr holds memory addresses
+        update("t:" + value.__class__.__name__)
+
+
+def data_digest(data, exclude=VOLATILE_KEYS):
+    """Returns the hex SHA1 digest of the data tree, made of dictionaries,
+    lists and plain values. The dictionary keys in exclude are ignored
+    """
+    sha = hashlib.sha1()
+    _walk(data, sha.update, exclude)
+    return sha.hexdigest()
+
+
+def text_digest(*texts):
+    """Returns the hex SHA1 digest of the texts
+    """
+    sha = hashlib.sha1()
+    for text in texts:
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        sha.update(str(text or ""))
+        sha.update("\0")
+    return sha.hexdigest()
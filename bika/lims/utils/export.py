@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""Streaming of tabular exports to the response
+
+The rows are written to the response as they are produced instead of being
+collected first. The CSV output is flushed every CHUNK_SIZE bytes, so the
+response is sent in chunks without a Content-Length. The XLSX workbook is
+written in openpyxl's write-only mode, which keeps the rows in a temporary
+file, and the file is streamed once the last row is added, because the zip
+container can't be sent before it is complete.
+"""
+
+import csv
+import os
+import tempfile
+from cStringIO import StringIO
+
+import Missing
+from DateTime import DateTime
+from openpyxl import Workbook
+
+from bika.lims.utils import to_utf8
+
+# Bytes buffered before they are written to the response
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument."
+            "spreadsheetml.sheet",
+}
+
+
+def to_cell(value):
+    """Returns the value as written to a cell of the export
+    """
+    if value is None or value is Missing.Value:
+        return ""
+    if isinstance(value, DateTime):
+        return value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, (list, tuple)):
+        return ", ".join([str(to_cell(v)) for v in value])
+    if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+        return value
+    if not isinstance(value, basestring):
+        value = str(value)
+    return to_utf8(value)
+
+
+class CSVStream(object):
+    """Writes CSV rows to the response in chunks
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.buffer = StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def writerow(self, values):
+        self.writer.writerow([to_cell(value) for value in values])
+        if self.buffer.tell() >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        data = self.buffer.getvalue()
+        if data:
+            self.response.write(data)
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def close(self):
+        self.flush()
+
+
+class XLSXStream(object):
+    """Adds the rows to a write-only workbook and streams the workbook file
+    on close
+    """
+
+    def __init__(self, response, title="Export"):
+        self.response = response
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title=title[:31])
+
+    def writerow(self, values):
+        cells = []
+        for value in values:
+            value = to_cell(value)
+            if isinstance(value, str):
+                value = value.decode("utf-8")
+            cells.append(value)
+        self.sheet.append(cells)
+
+    def close(self):
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            self.workbook.save(path)
+            self.response.setHeader("Content-Length", os.path.getsize(path))
+            with open(path, "rb") as f:
+                while True:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    self.response.write(data)
+        finally:
+            os.remove(path)
+
+
+def get_stream(response, format, filename):
+    """Sets the headers of the export in the response and returns the stream
+    to write the rows to. The format is "csv" or "xlsx"
+    """
+    format = format.lower()
+    if format not in CONTENT_TYPES:
+        raise ValueError("Unsupported export format: %s" % format)
+    response.setHeader("Content-Type", CONTENT_TYPES[format])
+    response.setHeader("Content-Disposition",
+                       "attachment;filename=\"%s.%s\"" % (filename, format))
+    if format == "xlsx":
+        return XLSXStream(response)
+    return CSVStream(response)
+
+
+def stream_rows(response, format, filename, header, rows):
+    """Writes the header and the rows to the response as they are yielded
+    """
+    stream = get_stream(response, format, filename)
+    if header:
+        stream.writerow(header)
+    for row in rows:
+        stream.writerow(row)
+    stream.close()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import re
+
+# Matches the variables of a formula, e.g. [Ca] or [Ca.LDL]
+VARIABLE_RX = re.compile(r"\[([^\]]+)\]")
+
+
+def as_formula_value(value):
+    """Converts a mapping value the way the formula interpolation always did:
+    formatted as a float with six decimals. Non numeric values raise a
+    TypeError.
+    """
+    return float("%f" % value)
+
+
+def as_float_or_value(value):
+    """Converts the value to a float if possible, returns it untouched
+    otherwise
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class CompiledFormula(object):
+    """A calculation formula parsed into a python code object.
+
+    The keywords in square brackets are rewritten to plain local names, so
+    the formula is parsed once and evaluated with the values given by name:
+
+        >>> formula = CompiledFormula("[Ca] + [Mg.LDL] * 2")
+        >>> formula.variables
+        ['Ca', 'Mg.LDL']
+        >>> formula.evaluate({"Ca": 1, "Mg.LDL": 2.5}, {"__builtins__": None})
+        6.0
+    """
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.variables = []
+        self._names = {}
+
+        def replace(match):
+            keyword = match.group(1)
+            if keyword not in self._names:
+                self._names[keyword] = "_v{}".format(len(self.variables))
+                self.variables.append(keyword)
+            return self._names[keyword]
+
+        source = VARIABLE_RX.sub(replace, formula)
+        self.source = source
+        self.code = compile(source.strip(), "<formula>", "eval")
+
+    def get_locals(self, mapping, convert=as_formula_value):
+        """Returns the local names for the evaluation from the mapping.
+
+        Raises a KeyError for any variable missing in the mapping.
+        """
+        local_vars = {}
+        for keyword in self.variables:
+            value = mapping[keyword]
+            if convert is not None:
+                value = convert(value)
+            local_vars[self._names[keyword]] = value
+        return local_vars
+
+    def evaluate(self, mapping, globs, convert=as_formula_value):
+        """Evaluates the formula with the values of mapping.
+
+        :param mapping: keyword -> value of the formula variables
+        :param globs: the globals, as returned by Calculation._getGlobals
+        :param convert: callable applied to every value, or None
+        """
+        return eval(self.code, globs, self.get_locals(mapping, convert))
@@ -15,7 +15,6 @@ from bika.lims.utils import t
 from bika.lims import logger
 from bika.lims import api
 from Products.CMFCore.interfaces import IContentish
-from Products.CMFCore.WorkflowCore import WorkflowException
 from Products.CMFPlone.interfaces import IWorkflowChain
 from Products.CMFPlone.workflow import ToolWorkflowChain
 from zope.component import adapts
@@ -23,6 +22,21 @@ from zope.interface import implementer
 from zope.interface import implements
 from zope.interface import Interface
 from plone import api as ploneapi
+from collections import OrderedDict
+from Acquisition import aq_base
+from persistent.mapping import PersistentMapping
+from zope.annotation.interfaces import IAnnotations
+
+# Annotation key of the last date and actor of the actions performed on an
+# object, read instead of the review history
+TRANSITIONS_KEY = "bika.lims.transitions"
+
+# Date indexes of the catalogs to update after each action
+TRANSITION_DATE_INDEXES = {
+    "publish": ["getDatePublished"],
+    "submit": ["getDateSubmitted"],
+    "verify": ["getDateVerified"],
+}
 
 def skip(instance, action, peek=False, unskip=False):
     """Returns True if the transition is to be SKIPPED
@@ -63,6 +77,184 @@ def doActionFor(instance, action_id):
     return actionperformed, message
 
 
+# Request key of the bulk transition in progress
+BULK_TRANSITION_KEY = "bika.lims.bulk_transition"
+
+
+class BulkTransition(object):
+    """Context manager deferring the promotion of the parents of the objects
+    transitioned within it, e.g. the submission of an AR once all its
+    analyses are submitted. Each parent is checked once per action when the
+    outermost bulk transition ends, instead of after each child.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.deferred = OrderedDict()
+        self.outermost = False
+
+    def __enter__(self):
+        if self.request.get(BULK_TRANSITION_KEY) is None:
+            self.request[BULK_TRANSITION_KEY] = self
+            self.outermost = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if not self.outermost:
+            return
+        try:
+            if exc_type is None:
+                self.promote_parents()
+        finally:
+            self.request[BULK_TRANSITION_KEY] = None
+
+    def defer(self, parent, action_id, check):
+        key = (parent.UID(), action_id)
+        if key not in self.deferred:
+            self.deferred[key] = (parent, check)
+
+    def promote_parents(self):
+        # promoting a parent may defer the promotion of its own parents
+        while self.deferred:
+            key, (parent, check) = self.deferred.popitem(last=False)
+            check(parent)
+
+
+def get_bulk_transition(instance):
+    """Returns the bulk transition in progress, or None
+    """
+    request = getattr(instance, "REQUEST", None)
+    if request is None:
+        return None
+    return request.get(BULK_TRANSITION_KEY)
+
+
+def promote(parent, action_id, check):
+    """Calls check(parent), which transitions the parent with action_id if
+    all its children allow it. Within a bulk transition the check is done
+    once, after all the children are transitioned
+    """
+    bulk = get_bulk_transition(parent)
+    if bulk is None:
+        check(parent)
+    else:
+        bulk.defer(parent, action_id, check)
+
+
+def doActionsFor(instances, action_id):
+    """Performs the action on each instance, as doActionFor does, and then
+    promotes their parents once. Returns the list of (actionperformed,
+    message) of the instances
+    """
+    if not instances:
+        return []
+    with BulkTransition(instances[0].REQUEST):
+        return [doActionFor(instance, action_id) for instance in instances]
+
+
+def _skip_all_analyses(parent, action_id):
+    """Tells the parent's workflow script not to cascade the action to its
+    analyses again
+    """
+    key = "%s all analyses" % action_id
+    if 'workflow_skiplist' not in parent.REQUEST:
+        parent.REQUEST['workflow_skiplist'] = []
+    if key not in parent.REQUEST['workflow_skiplist']:
+        parent.REQUEST['workflow_skiplist'].append(key)
+
+
+def _has_analyses_in(worksheet, states):
+    workflow = ploneapi.portal.get_tool("portal_workflow")
+    for analysis in worksheet.getAnalyses():
+        if workflow.getInfoFor(analysis, "review_state") in states:
+            return True
+    return False
+
+
+def submit_ar_if_ready(ar):
+    """Submits the AR if all its analyses have been submitted
+    """
+    if skip(ar, "submit", peek=True):
+        return
+    for analysis in ar.getAnalyses():
+        if analysis.review_state in \
+           ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received"):
+            return
+    ploneapi.portal.get_tool("portal_workflow").doActionFor(ar, "submit")
+
+
+def submit_ws_if_ready(ws):
+    """Submits the worksheet if all its analyses have been submitted
+    """
+    # if the worksheet analyst is not assigned, the worksheet can't be
+    # transitioned.
+    if not ws.getAnalyst() or skip(ws, "submit", peek=True):
+        return
+    # Note: referenceanalyses and duplicateanalyses can still have
+    # review_state = "assigned".
+    if _has_analyses_in(ws, ("to_be_sampled", "to_be_preserved", "sample_due",
+                             "sample_received", "assigned")):
+        return
+    ploneapi.portal.get_tool("portal_workflow").doActionFor(ws, "submit")
+
+
+def attach_ar_if_ready(ar):
+    """Attaches the AR if all its analyses have been attached
+    """
+    workflow = ploneapi.portal.get_tool("portal_workflow")
+    if workflow.getInfoFor(ar, "review_state") != "attachment_due" \
+            or skip(ar, "attach", peek=True):
+        return
+    for analysis in ar.getAnalyses():
+        if analysis.review_state in \
+           ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received",
+            "attachment_due"):
+            return
+    workflow.doActionFor(ar, "attach")
+
+
+def attach_ws_if_ready(ws):
+    """Attaches the worksheet if all its analyses have been attached
+    """
+    workflow = ploneapi.portal.get_tool("portal_workflow")
+    if workflow.getInfoFor(ws, "review_state") != "attachment_due" \
+            or skip(ws, "attach", peek=True):
+        return
+    if _has_analyses_in(ws, ("to_be_sampled", "to_be_preserved", "sample_due",
+                             "sample_received", "attachment_due", "assigned")):
+        return
+    workflow.doActionFor(ws, "attach")
+
+
+def verify_ar_if_ready(ar):
+    """Verifies the AR if all its analyses have been verified
+    """
+    if skip(ar, "verify", peek=True):
+        return
+    for analysis in ar.getAnalyses():
+        if analysis.review_state in \
+           ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received",
+            "attachment_due", "to_be_verified"):
+            return
+    _skip_all_analyses(ar, "verify")
+    ploneapi.portal.get_tool("portal_workflow").doActionFor(ar, "verify")
+
+
+def verify_ws_if_ready(ws):
+    """Verifies the worksheet if all its analyses have been verified
+    """
+    workflow = ploneapi.portal.get_tool("portal_workflow")
+    if workflow.getInfoFor(ws, "review_state") != "to_be_verified" \
+            or skip(ws, "verify", peek=True):
+        return
+    if _has_analyses_in(ws, ("to_be_sampled", "to_be_preserved", "sample_due",
+                             "sample_received", "attachment_due",
+                             "to_be_verified", "assigned")):
+        return
+    _skip_all_analyses(ws, "verify")
+    workflow.doActionFor(ws, "verify")
+
+
 def BeforeTransitionEventHandler(instance, event):
     """This will run the workflow_before_* on any
     content type that has one.
@@ -78,12 +270,22 @@ def BeforeTransitionEventHandler(instance, event):
 
 def AfterTransitionEventHandler(instance, event):
     """This will run the workflow_script_* on any
-    content type that has one.
+    content type that has one, once the date and actor of the transition
+    are recorded.
     """
     # creation doesn't have a 'transition'
     if not event.transition:
         return
-    key = 'workflow_script_' + event.transition.id
+    action_id = event.transition.id
+    workflow = api.get_tool("portal_workflow")
+    status = workflow.getStatusOf(event.workflow.getId(), instance) or {}
+    record_transition(instance, action_id, status.get("time"),
+                      status.get("actor"))
+    indexes = TRANSITION_DATE_INDEXES.get(action_id)
+    if indexes:
+        instance.reindexObject(idxs=indexes)
+
+    key = 'workflow_script_' + action_id
     method = getattr(instance, key, False)
     if method:
         method()
@@ -128,43 +330,96 @@ def getCurrentState(obj, stateflowid):
     workflow = ploneapi.portal.get_tool("portal_workflow")
     return workflow.getInfoFor(obj, stateflowid, '')
 
+def get_transition_log(obj, create=False):
+    """Returns the mapping of the actions performed on the object to the
+    (date, actor) of their last occurrence, or None if it was not recorded
+    """
+    annotations = IAnnotations(aq_base(obj), None)
+    if annotations is None:
+        return None
+    log = annotations.get(TRANSITIONS_KEY)
+    if log is None and create:
+        log = annotations[TRANSITIONS_KEY] = PersistentMapping()
+    return log
+
+
+def get_last_transitions(workflow_history):
+    """Returns the (date, actor) of the last occurrence of each action of the
+    workflow history, a mapping of workflow ids to lists of events
+    """
+    out = {}
+    for history in workflow_history.values():
+        for event in history or []:
+            action = event.get("action")
+            if not action:
+                continue
+            time = event.get("time")
+            last = out.get(action)
+            if last is None or last[0] is None or \
+                    (time is not None and time >= last[0]):
+                out[action] = (time, event.get("actor"))
+    return out
+
+
+def rebuild_transition_log(obj):
+    """Records the last date and actor of the actions in the workflow
+    history of the object
+    """
+    workflow_history = getattr(aq_base(obj), "workflow_history", None) or {}
+    log = get_transition_log(obj, create=True)
+    if log is None:
+        return None
+    log.clear()
+    log.update(get_last_transitions(workflow_history))
+    return log
+
+
+def record_transition(obj, action_id, time, actor):
+    """Records the date and actor of the action just performed on the object
+    """
+    log = get_transition_log(obj)
+    if log is None:
+        # The history of the objects created before the log includes the
+        # action already
+        rebuild_transition_log(obj)
+        return
+    log[action_id] = (time, actor)
+
+
+def get_transition(obj, action_id):
+    """Returns the (date, actor) of the last time the action was performed
+    on the object, or (None, None)
+    """
+    log = get_transition_log(obj)
+    if log is None:
+        workflow_history = getattr(aq_base(obj), "workflow_history", None)
+        if not workflow_history:
+            # https://jira.bikalabs.com/browse/LIMS-2242:
+            # Sometimes the workflow history is inexplicably missing!
+            return None, None
+        log = get_last_transitions(workflow_history)
+    return log.get(action_id, (None, None))
+
+
+def getTransitionDateTime(obj, action_id):
+    """Returns the DateTime the action was last performed on the object
+    """
+    return get_transition(obj, action_id)[0]
+
+
 def getTransitionDate(obj, action_id):
-    workflow = ploneapi.portal.get_tool("portal_workflow")
-    try:
-        # https://jira.bikalabs.com/browse/LIMS-2242:
-        # Sometimes the workflow history is inexplicably missing!
-        review_history = list(workflow.getInfoFor(obj, 'review_history'))
-    except WorkflowException as e:
-        message = str(e)
-        logger.error("Cannot retrieve review_history on {}: {}".format(
-                obj, message))
+    time = getTransitionDateTime(obj, action_id)
+    if time is None:
         return None
-    # invert the list, so we always see the most recent matching event
-    review_history.reverse()
-    for event in review_history:
-        if event['action'] == action_id:
-            value = ulocalized_time(event['time'], long_format=True,
-                                    time_only=False, context=obj)
-            return value
-    return None
+    return ulocalized_time(time, long_format=True, time_only=False,
+                           context=obj)
+
 
 def getTransitionActor(obj, action_id):
     """Returns the identifier of the user who last performed the action
     on the object.
     """
-    workflow = ploneapi.portal.get_tool("portal_workflow")
-    try:
-        review_history = list(workflow.getInfoFor(obj, "review_history"))
-        review_history.reverse()
-        for event in review_history:
-            if event.get("action") == action_id:
-                return event.get("actor")
-        return ''
-    except WorkflowException as e:
-        message = str(e)
-        logger.error("Cannot retrieve review_history on {}: {}".format(
-            obj, message))
-    return ''
+    return get_transition(obj, action_id)[1] or ''
 
 
 # Enumeration of the available status flows